@@ -1,8 +1,29 @@
 from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from bookmarks.admin import BackgroundDeletionAdmin
+from .deletion import delete_user
 from .models import Profile
 # Register your models here.
 
 @admin.register(Profile)
 class ProfileAdmin(admin.ModelAdmin):
-    list_display = ['user','date_of_birth','photo']
-    raw_id_fields = ['user']
\ No newline at end of file
+    list_display = ['user','date_of_birth','photo','deleted']
+    raw_id_fields = ['user']
+
+
+admin.site.unregister(get_user_model())
+
+
+@admin.register(get_user_model())
+class UserAdmin(BackgroundDeletionAdmin, BaseUserAdmin):
+    """
+    Deleting users deactivates them and purges their data in the background
+    (see account.deletion).
+    """
+
+    def soft_delete(self, queryset):
+        users = list(queryset.exclude(profile__deleted__isnull=False))
+        for user in users:
+            delete_user(user)
+        return len(users)
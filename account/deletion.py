@@ -0,0 +1,92 @@
+"""
+Account deletion: the account is hidden at once and purged in the background.
+
+Deleting a User cascades, in one transaction, through its profile, its
+images and their likes, its likes of other images, its contacts and its
+actions, which locks those tables for seconds for an active account (and
+leaves the actions targeting the user, and all the media files, behind).
+Instead ``delete_user``:
+
+- deactivates the user and makes its password unusable, which also ends
+  its sessions (their auth hash no longer matches)
+- marks its profile and images deleted (one UPDATE each), so they drop
+  out of lists, pages and feeds (see ActionQuerySet.visible)
+
+and, once that commits, queues ``account.tasks.purge_user``, which deletes, a batch of
+DELETION_BATCH_SIZE rows per transaction (see images.deletion):
+
+1. each of its images, with their likes and the actions targeting them
+2. its likes of other images (updating their like counts)
+3. its contacts, its actions and the actions targeting it
+4. finally the user row, and queues the deletion of the profile photo
+"""
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from actions.models import Action
+from images.deletion import delete_in_batches, is_shared, media_names, purge_batches as purge_image_batches, \
+    recount_likes
+from images import cards
+from images.models import Image
+
+from .models import Contact, Profile
+
+
+def delete_user(user):
+    """
+    Hide ``user`` and its content now and queue the purge.
+    """
+    from .tasks import purge_user
+    now = timezone.now()
+    with transaction.atomic():
+        user.is_active = False
+        user.set_unusable_password()
+        user.save(update_fields=['is_active', 'password'])
+        if not Profile.objects.filter(user=user).update(deleted=now):
+            Profile.objects.create(user=user, deleted=now)
+        image_ids = list(Image.objects.filter(user=user).values_list('id', flat=True))
+        Image.objects.filter(id__in=image_ids).update(deleted=now)
+        cards.invalidate(image_ids)
+        # Not before the account is hidden for good: the purge runs in the background
+        transaction.on_commit(lambda: purge_user.enqueue(args=[user.id], dedup_key=f'purge_user:{user.id}'))
+
+
+def delete_likes(user_id, batch_size):
+    Like = Image.users_like.through
+    while True:
+        batch = list(Like.objects.filter(user_id=user_id).values_list('id', 'image_id')[:batch_size])
+        if not batch:
+            return
+        with transaction.atomic():
+            Like.objects.filter(id__in=[like_id for like_id, _ in batch]).delete()
+            recount_likes({image_id for _, image_id in batch})
+        yield len(batch)
+
+
+def purge_batches(user_id, batch_size):
+    """
+    Purge a deleted account, yielding after each batch (see module).
+    """
+    from images.tasks import delete_media
+    profile = Profile.objects.filter(user_id=user_id).exclude(deleted=None).first()
+    if profile is None:
+        return
+    for image_id in Image.all_objects.filter(user_id=user_id).values_list('id', flat=True).iterator():
+        yield from purge_image_batches(image_id, batch_size)
+    yield from delete_likes(user_id, batch_size)
+    yield from delete_in_batches(Contact.objects.filter(Q(user_from_id=user_id) | Q(user_to_id=user_id)), batch_size)
+    yield from delete_in_batches(Action.objects.filter(user_id=user_id), batch_size)
+    user_ct = ContentType.objects.get_for_model(get_user_model())
+    yield from delete_in_batches(Action.objects.filter(target_ct=user_ct, target_id=user_id), batch_size)
+    names = [] if not profile.photo or is_shared(profile.photo.name) \
+        else media_names(profile.photo, profile.photo_derivatives)
+    with transaction.atomic():
+        # Only the profile (and rows added since) are left to cascade
+        get_user_model().objects.filter(id=user_id).delete()
+        if names:
+            delete_media.enqueue(args=[names])
+    yield 1
@@ -0,0 +1,149 @@
+"""
+Export of everything a user bookmarked, as a zip streamed while it is built.
+
+The archive holds:
+
+- ``profile.json``: the account (username, names, email, birth date)
+- ``bookmarks.jsonl``: one line per image with its fields and ``file``,
+  the path of the original in the archive; the username, url, title and
+  description columns are what ``import_bookmarks --bookmarks`` reads
+- ``images/<id><ext>``: the original image files
+- ``actions.jsonl``: the user's activity history (verb, date, target)
+- ``contacts.jsonl``: who follows whom (user_from, user_to, created),
+  both directions, as ``import_bookmarks --follows`` reads them
+- ``missing.txt``: originals that could not be read, if any
+
+Nothing is held whole: rows are read with ``.iterator(chunk_size=...)``
+(EXPORT_CHUNK_SIZE), files in EXPORT_READ_SIZE pieces, and the zip is
+written to a buffer that ``export_zip`` empties every time it holds
+EXPORT_YIELD_SIZE bytes. The zip is written without seeking (sizes and
+CRCs in data descriptors, ZIP64 where needed), so its bytes can go out
+as soon as they are produced. Originals are stored as is (they are
+already compressed); the JSON files are deflated.
+"""
+
+import json
+import logging
+import os
+import time
+import zipfile
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+
+from actions.models import Action
+from images.models import Image
+
+from .models import Contact
+
+logger = logging.getLogger(__name__)
+
+BOOKMARK_FIELDS = ['id', 'title', 'slug', 'url', 'description', 'created', 'updated', 'total_likes', 'image']
+
+
+class StreamBuffer:
+    """
+    Write-only file the zip is written to: keeps the written bytes until
+    ``pop`` takes them. No ``seek``, so zipfile writes a streamable zip.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+        self.offset = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        self.size = 0
+        return data
+
+
+def json_line(row):
+    return (json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n').encode()
+
+
+def archive_name(image_id, name):
+    return f'images/{image_id}{os.path.splitext(name)[1].lower()}'
+
+
+def export_zip(user):
+    """
+    Yield the bytes of ``user``'s export zip, in pieces of about
+    EXPORT_YIELD_SIZE bytes.
+    """
+    buffer = StreamBuffer()
+    missing = []
+
+    def drain(force=False):
+        if buffer.size >= settings.EXPORT_YIELD_SIZE or (force and buffer.size):
+            yield buffer.pop()
+
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        profile = getattr(user, 'profile', None)
+        archive.writestr('profile.json', json.dumps({
+            'username': user.username, 'first_name': user.first_name, 'last_name': user.last_name,
+            'email': user.email, 'date_joined': user.date_joined,
+            'date_of_birth': profile.date_of_birth if profile is not None else None,
+        }, cls=DjangoJSONEncoder, indent=2))
+
+        images = Image.objects.filter(user=user).order_by('id')
+        with archive.open('bookmarks.jsonl', 'w', force_zip64=True) as entry:
+            for row in images.values(*BOOKMARK_FIELDS).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+                name = row.pop('image')
+                entry.write(json_line(dict(row, username=user.username,
+                                           file=archive_name(row['id'], name) if name else None)))
+                yield from drain()
+
+        for image_id, name in images.values_list('id', 'image').iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+            if not name:
+                continue
+            try:
+                source = default_storage.open(name)
+            except OSError:
+                missing.append(name)
+                continue
+            info = zipfile.ZipInfo(archive_name(image_id, name), date_time=time.localtime()[:6])
+            info.external_attr = 0o644 << 16
+            with source, archive.open(info, 'w', force_zip64=True) as entry:
+                for chunk in source.chunks(settings.EXPORT_READ_SIZE):
+                    entry.write(chunk)
+                    yield from drain()
+
+        actions = Action.objects.filter(user=user).order_by('created') \
+            .values('verb', 'created', 'target_id', target_type=F('target_ct__model'))
+        with archive.open('actions.jsonl', 'w', force_zip64=True) as entry:
+            for row in actions.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+                entry.write(json_line(row))
+                yield from drain()
+
+        contacts = (Contact.objects.filter(user_from=user) | Contact.objects.filter(user_to=user)).order_by('created') \
+            .values('created', user_from_name=F('user_from__username'), user_to_name=F('user_to__username'))
+        with archive.open('contacts.jsonl', 'w', force_zip64=True) as entry:
+            for row in contacts.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+                entry.write(json_line({'user_from': row['user_from_name'], 'user_to': row['user_to_name'],
+                                       'created': row['created']}))
+                yield from drain()
+
+        if missing:
+            logger.warning('Export of %s: %d images could not be read', user.username, len(missing))
+            archive.writestr('missing.txt', '\n'.join(missing) + '\n')
+    yield from drain(force=True)
+
+
+def export_filename(user, today):
+    return f'bookmarks-{user.username}-{today:%Y%m%d}.zip'
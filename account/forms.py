@@ -1,6 +1,8 @@
 from django import forms
 from django.contrib.auth.models import User
 from .models import Profile
+from django.core.files.uploadedfile import UploadedFile
+from images.derivatives import normalize_upload
 
 # -------------------------------
 # Login Form
@@ -78,3 +80,12 @@ class ProfileEditForm(forms.ModelForm):
     class Meta:
         model = Profile
         fields = ['date_of_birth', 'photo']
+
+    def clean_photo(self):
+        """
+        Strip EXIF and downsize newly uploaded photos.
+        """
+        photo = self.cleaned_data['photo']
+        if isinstance(photo, UploadedFile):
+            photo = normalize_upload(photo)
+        return photo
@@ -0,0 +1,44 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from account.export import export_filename, export_zip
+
+
+class Command(BaseCommand):
+    """
+    Write a user's export zip (bookmarks, original images, activity and
+    contacts, see account/export.py) to a file, or to stdout with -:
+
+        python manage.py export_user alice
+        python manage.py export_user alice --output - | ssh backup 'cat > alice.zip'
+
+    Memory use doesn't grow with the number of bookmarks.
+    """
+    help = "Export a user's bookmarks, images, activity and contacts as a zip"
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--output', help='file to write (default: bookmarks-<username>-<date>.zip), - for stdout')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.select_related('profile').get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'No user {options["username"]}')
+        output = options['output'] or export_filename(user, timezone.localdate())
+        if output == '-':
+            self.write(user, sys.stdout.buffer)
+            return
+        with open(output, 'wb') as destination:
+            written = self.write(user, destination)
+        self.stdout.write(f'{written} bytes written to {output}')
+
+    def write(self, user, destination):
+        written = 0
+        for chunk in export_zip(user):
+            destination.write(chunk)
+            written += len(chunk)
+        return written
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from account.deletion import purge_batches as purge_user_batches
+from account.models import Profile
+from actions.utils import sweep_dangling_actions
+from images.deletion import purge_batches as purge_image_batches
+from images.models import Image
+
+
+class Command(BaseCommand):
+    """
+    Purge every deleted account and image now, then delete the actions
+    whose target no longer exists.
+
+    The purge_user/purge_image tasks normally do this in the background
+    (and the hourly purge_deleted task catches up on failures); this runs
+    the same batches in the foreground, e.g. when no worker is running:
+
+        python manage.py purge_deleted
+        python manage.py purge_deleted --batch-size 200
+
+    See images/deletion.py and account/deletion.py.
+    """
+    help = 'Purge deleted accounts and images and sweep dangling actions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.DELETION_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        user_ids = list(Profile.objects.exclude(deleted=None).values_list('user_id', flat=True))
+        for user_id in user_ids:
+            rows = sum(purge_user_batches(user_id, batch_size))
+            self.stdout.write(f'user {user_id}: {rows} rows deleted')
+        for image_id in list(Image.all_objects.exclude(deleted=None).values_list('id', flat=True)):
+            rows = sum(purge_image_batches(image_id, batch_size))
+            self.stdout.write(f'image {image_id}: {rows} rows deleted')
+        rows = sum(sweep_dangling_actions(batch_size))
+        self.stdout.write(f'{rows} dangling actions deleted')
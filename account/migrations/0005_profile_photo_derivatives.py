@@ -0,0 +1,18 @@
+# Generated by Django 4.2.3 on 2026-10-19 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0004_profile_updated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='photo_derivatives',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
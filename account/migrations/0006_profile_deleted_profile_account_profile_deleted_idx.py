@@ -0,0 +1,22 @@
+# Generated by Django 4.2.3 on 2026-10-19 16:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0005_profile_photo_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='deleted',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(condition=models.Q(('deleted__isnull', False)), fields=['deleted'], name='account_profile_deleted_idx'),
+        ),
+    ]
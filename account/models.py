@@ -13,10 +13,24 @@ class Profile(models.Model):
         user (OneToOneField): Links Profile to Django's built-in User model.
         date_of_birth (DateField): Optional date of birth of the user.
         photo (ImageField): Optional profile picture, stored in 'users/YYYY/MM/DD/'.
+        updated (DateTimeField): Last modification time, used as an HTTP validator.
+        photo_derivatives (JSONField): Names of the AVIF/WebP/JPEG thumbnail variants (see images.derivatives).
+        deleted (DateTimeField): Set when the account is deleted; it is purged in the background
+            (see account.deletion).
     """
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     date_of_birth = models.DateField(blank=True, null=True)
     photo = models.ImageField(upload_to='users/%Y/%m/%d/', blank=True)
+    updated = models.DateTimeField(auto_now=True)
+    photo_derivatives = models.JSONField(default=dict, blank=True, editable=False)
+    deleted = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Only the few accounts waiting to be purged (see Action.objects.visible)
+            models.Index(fields=['deleted'], condition=models.Q(deleted__isnull=False),
+                         name='account_profile_deleted_idx'),
+        ]
 
     def __str__(self):
         return f'Profile of {self.user.username}'
@@ -0,0 +1,17 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from images.tasks import queue_derivatives
+from .models import Profile
+
+@receiver(post_save, sender=Profile)
+def profile_saved(sender, instance, **kwargs):
+    """
+    Signal handler to queue the rendering of the responsive derivatives of a
+    new or changed profile photo.
+
+    Args:
+        sender: The Profile model class.
+        instance: The Profile instance that was saved.
+        **kwargs: Additional keyword arguments from the signal.
+    """
+    queue_derivatives(instance, 'photo')
@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+from django.conf import settings
+
+from actions.utils import sweep_dangling_actions
+from images.models import Image
+from images.tasks import purge_image, run_for_a_while
+from tasks.queue import task
+
+from . import deletion
+from .models import Profile
+
+
+@task()
+def purge_user(user_id):
+    """
+    Purge a deleted account, continuing in a new run if it takes longer
+    than DELETION_TASK_SECONDS.
+    """
+    if not run_for_a_while(deletion.purge_batches(user_id, settings.DELETION_BATCH_SIZE)):
+        purge_user.enqueue(args=[user_id], dedup_key=f'purge_user:{user_id}')
+
+
+@task(every=timedelta(hours=1), max_attempts=1)
+def purge_deleted():
+    """
+    Queue the purge of anything deleted but not purged yet (e.g. its task
+    failed for good), and delete the actions whose target is gone.
+    """
+    deleted_users = list(Profile.objects.exclude(deleted=None).values_list('user_id', flat=True))
+    for user_id in deleted_users:
+        purge_user.enqueue(args=[user_id], dedup_key=f'purge_user:{user_id}')
+    # Images of deleted accounts are purged with the account
+    for image_id in Image.all_objects.exclude(deleted=None).exclude(user_id__in=deleted_users) \
+            .values_list('id', flat=True).iterator():
+        purge_image.enqueue(args=[image_id], dedup_key=f'purge_image:{image_id}')
+    if not run_for_a_while(sweep_dangling_actions(settings.DELETION_BATCH_SIZE)):
+        # Go on in the next run rather than hold the worker
+        purge_deleted.enqueue(dedup_key=f'periodic:{purge_deleted.name}')
@@ -1,3 +1,210 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import zipfile
+from datetime import date
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.admin.sites import site
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from actions.models import Action
+from bookmarks.admin import BackgroundDeletionAdmin
+from bookmarks.testing import mock_redis
+from images.models import Image, ImageStats
+from tasks.models import Task
+
+from .deletion import delete_user, purge_batches
+from .export import export_zip
+from .models import Contact, Profile
+
+
+class ExportZipTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        # Small pieces, so the zip is built across many yields
+        override = override_settings(MEDIA_ROOT=media.name, MEDIA_CACHE_MAX_BYTES=0,
+                                     EXPORT_CHUNK_SIZE=1, EXPORT_READ_SIZE=1000, EXPORT_YIELD_SIZE=4096)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = User.objects.create_user('exporter', email='exporter@example.com', first_name='Ex')
+        Profile.objects.create(user=self.user, date_of_birth=date(1990, 5, 17))
+        friend = User.objects.create_user('friend')
+        os.makedirs(os.path.join(media.name, 'images'))
+        self.original = os.urandom(50000)
+        with open(os.path.join(media.name, 'images', 'stored.JPG'), 'wb') as f:
+            f.write(self.original)
+        # bulk_create: no thumbnail or stats signals
+        self.stored, self.lost = Image.objects.bulk_create([
+            Image(user=self.user, title='Stored', slug='stored', url='https://example.com/stored.jpg',
+                  image='images/stored.JPG', description='Kept #forever'),
+            Image(user=self.user, title='Lost', slug='lost', url='https://example.com/lost.png',
+                  image='images/lost.png'),
+            Image(user=friend, title='Not mine', slug='not-mine', url='https://example.com/other.jpg',
+                  image='images/other.jpg'),
+        ])[:2]
+        Action.objects.create(user=self.user, verb='bookmarked image', target=self.stored)
+        Contact.objects.create(user_from=self.user, user_to=friend)
+        Contact.objects.create(user_from=friend, user_to=self.user)
+
+    def export(self):
+        pieces = list(export_zip(self.user))
+        self.assertGreater(len(pieces), 1)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(pieces)))
+        self.addCleanup(archive.close)
+        self.assertIsNone(archive.testzip())
+        return archive
+
+    def lines(self, archive, name):
+        return [json.loads(line) for line in archive.read(name).decode().splitlines()]
+
+    def test_round_trip(self):
+        with self.assertLogs('account.export', 'WARNING'):
+            archive = self.export()
+        self.assertEqual(set(archive.namelist()), {
+            'profile.json', 'bookmarks.jsonl', f'images/{self.stored.id}.jpg',
+            'actions.jsonl', 'contacts.jsonl', 'missing.txt',
+        })
+
+        profile = json.loads(archive.read('profile.json'))
+        self.assertEqual((profile['username'], profile['email'], profile['date_of_birth']),
+                         ('exporter', 'exporter@example.com', '1990-05-17'))
+
+        bookmarks = self.lines(archive, 'bookmarks.jsonl')
+        self.assertEqual([bookmark['title'] for bookmark in bookmarks], ['Stored', 'Lost'])
+        self.assertEqual(bookmarks[0]['file'], f'images/{self.stored.id}.jpg')
+        self.assertEqual((bookmarks[0]['username'], bookmarks[0]['description']), ('exporter', 'Kept #forever'))
+        self.assertEqual(archive.read(bookmarks[0]['file']), self.original)
+        self.assertEqual(archive.getinfo(bookmarks[0]['file']).compress_type, zipfile.ZIP_STORED)
+
+        self.assertEqual(archive.read('missing.txt').decode(), 'images/lost.png\n')
+
+        actions = self.lines(archive, 'actions.jsonl')
+        self.assertEqual([(action['verb'], action['target_type'], action['target_id']) for action in actions],
+                         [('bookmarked image', 'image', self.stored.id)])
+
+        contacts = self.lines(archive, 'contacts.jsonl')
+        self.assertEqual([(contact['user_from'], contact['user_to']) for contact in contacts],
+                         [('exporter', 'friend'), ('friend', 'exporter')])
+
+    def test_user_without_data(self):
+        self.user = User.objects.create_user('newcomer')
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(export_zip(self.user))))
+        self.assertEqual(archive.namelist(), ['profile.json', 'bookmarks.jsonl', 'actions.jsonl', 'contacts.jsonl'])
+        self.assertIsNone(json.loads(archive.read('profile.json'))['date_of_birth'])
+        self.assertEqual(archive.read('bookmarks.jsonl'), b'')
+
+
+@override_settings(TASKS_EAGER=False)
+class AccountDeletionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('leaving', password='secret')
+        cls.friend = User.objects.create_user('friend')
+        # bulk_create: no thumbnail or stats signals
+        cls.mine = Image.objects.bulk_create([
+            Image(user=cls.user, title=f'Mine {number}', slug=f'mine-{number}',
+                  url=f'https://example.com/mine-{number}.jpg', image=f'images/mine-{number}.jpg', total_likes=1)
+            for number in range(3)
+        ])
+        cls.theirs, = Image.objects.bulk_create([Image(user=cls.friend, title='Theirs', slug='theirs',
+                                                      url='https://example.com/theirs.jpg',
+                                                      image='images/theirs.jpg')])
+        Like = Image.users_like.through
+        Like.objects.bulk_create([Like(image=image, user=cls.friend) for image in cls.mine] +
+                                 [Like(image=cls.theirs, user=cls.user), Like(image=cls.theirs, user=cls.friend)])
+        Image.objects.filter(id=cls.theirs.id).update(total_likes=2)
+        Contact.objects.create(user_from=cls.user, user_to=cls.friend)
+        Contact.objects.create(user_from=cls.friend, user_to=cls.user)
+        Action.objects.create(user=cls.user, verb='likes', target=cls.theirs)
+        Action.objects.create(user=cls.friend, verb='likes', target=cls.mine[0])
+        Action.objects.create(user=cls.friend, verb='is following', target=cls.user)
+        cls.kept_action = Action.objects.create(user=cls.friend, verb='bookmarked image', target=cls.theirs)
+
+    def setUp(self):
+        mock_redis(self)
+
+    def purge(self):
+        return sum(purge_batches(self.user.id, 2))
+
+    def test_delete_user_hides_now_and_queues_the_purge_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            delete_user(self.user)
+            self.assertFalse(Task.objects.exists())
+
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertFalse(self.user.has_usable_password())
+        self.assertIsNotNone(self.user.profile.deleted)
+        self.assertEqual(list(Image.objects.all()), [self.theirs])
+        self.assertEqual(list(Action.objects.visible()), [self.kept_action])
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(list(Task.objects.values_list('name', 'dedup_key')),
+                         [('account.tasks.purge_user', f'purge_user:{self.user.id}')])
+
+    def test_purge(self):
+        delete_user(self.user)
+        self.assertGreater(self.purge(), 0)
+
+        self.assertFalse(User.objects.filter(id=self.user.id).exists())
+        self.assertFalse(Profile.objects.filter(user_id=self.user.id).exists())
+        self.assertEqual(list(Image.all_objects.all()), [self.theirs])
+        self.assertEqual(list(Image.users_like.through.objects.values_list('image_id', 'user_id')),
+                         [(self.theirs.id, self.friend.id)])
+        self.assertFalse(Contact.objects.exists())
+        self.assertEqual(list(Action.objects.all()), [self.kept_action])
+        # Like counts of the images the user liked are recomputed
+        self.assertEqual(Image.objects.get(id=self.theirs.id).total_likes, 1)
+        self.assertEqual(ImageStats.objects.get(image=self.theirs).likes, 1)
+        media = Task.objects.filter(name='images.tasks.delete_media').values_list('args', flat=True)
+        self.assertEqual(sorted(args[0][0] for args in media), [image.image.name for image in self.mine])
+
+        # A second run has nothing left to do
+        self.assertEqual(self.purge(), 0)
+        self.assertEqual(list(Action.objects.all()), [self.kept_action])
+
+    def test_active_users_are_not_purged(self):
+        self.assertEqual(self.purge(), 0)
+        self.assertEqual(Image.all_objects.count(), 4)
+
+    def test_admin_deletes_in_the_background(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.defaults['HTTP_USER_AGENT'] = 'Mozilla/5.0 Firefox'
+        self.client.force_login(admin)
+        url = f'/admin/auth/user/{self.user.id}/delete/'
+        self.assertContains(self.client.get(url), 'leaving')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(url, {'post': 'yes'}).status_code, 302)
+        self.assertTrue(User.objects.filter(id=self.user.id, is_active=False).exists())
+        self.assertEqual(list(Task.objects.values_list('args', flat=True)), [[self.user.id]])
+
+
+class BackgroundDeletionAdminTests(TestCase):
+
+    def test_purge_task_or_soft_delete_is_required(self):
+        class ProfileAdmin(BackgroundDeletionAdmin):
+            pass
+
+        errors = ProfileAdmin(Profile, site).check()
+        self.assertEqual([error.id for error in errors], ['bookmarks.E001'])
+
+    def test_default_soft_delete(self):
+        purge = mock.Mock()
+
+        class ProfileAdmin(BackgroundDeletionAdmin):
+            purge_task = purge
+
+        profile = Profile.objects.create(user=User.objects.create_user('someone'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(ProfileAdmin(Profile, site).soft_delete(Profile.objects.all()), 1)
+        self.assertIsNotNone(Profile.objects.get(id=profile.id).deleted)
+        purge.enqueue.assert_called_once_with(args=[profile.id], dedup_key=f'purge_profile:{profile.id}')
+        self.assertEqual(ProfileAdmin(Profile, site).soft_delete(Profile.objects.all()), 0)
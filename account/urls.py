@@ -1,4 +1,5 @@
 from django.urls import path, include
+from django.conf import settings
 from . import views
 from django.contrib.auth import views as auth_views
 
@@ -19,11 +20,14 @@ urlpatterns = [
     # Edit logged-in user's profile
     path('edit/', views.edit, name='edit'),
 
+    # Download all the user's bookmarks, images, activity and contacts as a zip
+    path('export/', views.export, name='export'),
+
     # List all users
     path('users/', views.user_list, name='user_list'),
 
-    # Follow/unfollow functionality
-    path('users/follow/', views.user_follow, name='user_follow'),
+    # Follow/unfollow functionality (async version when served under ASGI)
+    path('users/follow/', views.user_follow_async if settings.ASYNC_AJAX_VIEWS else views.user_follow, name='user_follow'),
 
     # User detail page by username
     path('users/<username>/', views.user_detail, name='user_detail'),
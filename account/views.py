@@ -1,14 +1,27 @@
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.contrib.auth import authenticate, login
 from .forms import LoginForm, UserRegistrationForm, UserEditForm, ProfileEditForm
 from django.contrib.auth.decorators import login_required
+from .export import export_filename, export_zip
 from .models import Profile, Contact
 from django.contrib import messages
 from django.contrib.auth.models import User
 from django.views.decorators.http import require_POST
-from actions.utils import create_action
+from actions.utils import create_action, prefetch_pictures
+from actions import firehose
 from actions.models import Action
+from asgiref.sync import sync_to_async
+from bookmarks.decorators import async_login_required, async_require_POST
+from bookmarks.conditional import conditional_page
+from bookmarks.partials import render_partial
+from bookmarks.routers import read_replica
+from django.utils import timezone
+from django.db.models import Count, Exists, IntegerField, Max, OuterRef, Subquery
+from images.cards import get_cards
+from images.thumbnail_urls import prefetch
+from images.models import Image
 
 # -------------------------------
 # User authentication views
@@ -44,23 +57,29 @@ def user_login(request):
 # -------------------------------
 
 @login_required
+@read_replica
 def dashboard(request):
     """
     Displays the dashboard for logged-in users.
-    Shows recent actions by people the user is following.
+    Shows recent actions by people the user is following, or by everyone
+    (from the firehose, see actions.firehose) when they follow nobody.
     """
-    actions = Action.objects.exclude(user=request.user)
     following_ids = request.user.following.values_list('id', flat=True)
 
     if following_ids:
-        actions = actions.filter(user_id__in=following_ids)
-
-    # Optimize queries: join user and profile, prefetch target objects
-    actions = actions.select_related('user', 'user__profile').prefetch_related('target')[:10]
+        actions = Action.objects.visible().exclude(user=request.user).filter(user_id__in=following_ids)
+        # Optimize queries: join user and profile, prefetch target objects
+        actions = actions.select_related('user', 'user__profile').prefetch_related('target')[:10]
+    else:
+        # Everyone's latest actions, from the firehose rather than the whole table
+        actions = firehose.recent(request.user, limit=10)
+    actions = prefetch_pictures(actions)
 
     context = {
         'section': 'dashboard',
-        'actions': actions
+        'actions_html': render_partial('actions/action/list.html', {'actions': actions}),
+        # the feed stream only exists under ASGI (see bookmarks/urls.py)
+        'live_updates': settings.ASYNC_AJAX_VIEWS,
     }
     return render(request, 'account/dashboard.html', context)
 
@@ -125,17 +144,32 @@ def edit(request):
     return render(request, 'account/edit.html', context)
 
 
+@login_required
+def export(request):
+    """
+    Download everything the logged-in user bookmarked as a zip, streamed
+    while it is built (see account.export).
+    """
+    response = StreamingHttpResponse(export_zip(request.user), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(request.user, timezone.localdate())}"'
+    # Let proxies pass the bytes on as they come
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 # -------------------------------
 # User listing and detail
 # -------------------------------
 
 @login_required
+@read_replica
 def user_list(request):
     """
     Lists all active users.
     Used for social features like following.
     """
-    users = User.objects.filter(is_active=True)
+    users = list(User.objects.filter(is_active=True).select_related('profile'))
+    prefetch((user.profile.photo, 'people') for user in users if hasattr(user, 'profile'))
     context = {
         'section': 'people',
         'users': users
@@ -143,7 +177,32 @@ def user_list(request):
     return render(request, 'account/user/list.html', context)
 
 
+def user_detail_stamp(request, username):
+    """
+    Version stamp of a profile page, fetched in a single query: the profile,
+    the follower count, whether the viewer follows the user, and the user's
+    images (latest update and count).
+    """
+    followers = Contact.objects.filter(user_to=OuterRef('pk')).order_by() \
+                               .values('user_to').annotate(total=Count('pk')).values('total')
+    images = Image.objects.filter(user=OuterRef('pk')).order_by() \
+                          .values('user').annotate(updated=Max('updated'), total=Count('pk'))
+    stamp = User.objects.filter(username=username, is_active=True).annotate(
+        followers_count=Subquery(followers, output_field=IntegerField()),
+        followed_by_viewer=Exists(Contact.objects.filter(user_from=request.user, user_to=OuterRef('pk'))),
+        images_updated=Subquery(images.values('updated')),
+        images_count=Subquery(images.values('total'), output_field=IntegerField()),
+    ).values_list('profile__updated', 'followers_count', 'followed_by_viewer',
+                  'images_updated', 'images_count').first()
+    if stamp is None:
+        return None
+    last_modified = max(filter(None, [stamp[0], stamp[3]]), default=None)
+    return stamp, last_modified
+
+
 @login_required
+@read_replica
+@conditional_page(user_detail_stamp)
 def user_detail(request, username):
     """
     Shows detailed profile for a given username.
@@ -151,7 +210,10 @@ def user_detail(request, username):
     user = get_object_or_404(User, username=username, is_active=True)
     context = {
         'section': 'people',
-        'user': user
+        'user': user,
+        'images_html': render_partial('images/image/list_images.html', {
+            'images': get_cards(user.images_created.values_list('id', flat=True)),
+        }),
     }
     return render(request, 'account/user/detail.html', context)
 
@@ -184,3 +246,31 @@ def user_follow(request):
             return JsonResponse({'status': 'error'})
 
     return JsonResponse({'status': 'error'})
+
+
+
+@async_require_POST
+@async_login_required
+async def user_follow_async(request):
+    """
+    Async version of user_follow using the async ORM methods.
+    Used instead of user_follow when the project is served under ASGI.
+    """
+    user_id = request.POST.get('id')
+    action = request.POST.get('action')
+
+    if user_id and action:
+        try:
+            user = await User.objects.aget(id=user_id)
+        except User.DoesNotExist:
+            return JsonResponse({'status': 'error'})
+
+        if action == 'follow':
+            await Contact.objects.aget_or_create(user_from=request.user, user_to=user)
+            await sync_to_async(create_action)(request.user, 'is following', user)
+        else:
+            await Contact.objects.filter(user_from=request.user, user_to=user).adelete()
+
+        return JsonResponse({'status': 'ok'})
+
+    return JsonResponse({'status': 'error'})
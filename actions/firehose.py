@@ -0,0 +1,113 @@
+"""
+The firehose: the most recent actions of everyone, for the dashboard of
+users who follow nobody.
+
+Those dashboards used to read ``Action.objects.exclude(user=viewer)``
+newest first, a scan of the biggest table that every new account runs on
+its first page. Instead the newest ACTIONS_FIREHOSE_SIZE actions are kept
+in a capped Redis list, ``actions:firehose``, newest first: each entry is
+``{action id}:{user id}``, pushed (LPUSHX + LTRIM) when record_action or
+create_actions stores an action.
+
+``recent(viewer)`` reads the head of the list, leaves out the viewer's
+own actions in memory and loads the remaining ones by primary key (one
+query, plus the user and target lookups the dashboard always made). Users
+are not cached, so renames, new photos and deletions show at once;
+actions hidden or purged since they were pushed are skipped, which is why
+a few more entries than shown are read. Should that still leave too few
+(a prolific viewer, a burst of deletions), or Redis be unavailable, the
+dashboard queries the table as it used to.
+
+When the list is missing (Redis restarted or evicted it, or the first page
+after deploying) it is refilled from the ``-created`` index in one query.
+Pushes only add to an existing list, so a new action can't start a short
+list that would never be refilled. With
+ACTIONS_FIREHOSE_SIZE = 0 the dashboard queries the table as before.
+"""
+
+import logging
+
+import redis
+from django.conf import settings
+
+from bookmarks.instrumentation import InstrumentedRedis
+
+from .models import Action
+
+logger = logging.getLogger(__name__)
+
+# connect redis database
+r = InstrumentedRedis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB)
+
+FIREHOSE_KEY = 'actions:firehose'
+
+
+def enabled():
+    return settings.ACTIONS_FIREHOSE_SIZE > 0
+
+
+def entry(action_id, user_id):
+    return f'{action_id}:{user_id}'
+
+
+def push(actions):
+    """
+    Add newly stored actions at the head of the firehose, oldest first.
+
+    Nothing is added while the list is missing: the next read refills it
+    from the table, these actions included.
+    """
+    entries = [entry(action.id, action.user_id) for action in actions if action.id]
+    if not entries or not enabled():
+        return
+    pipe = r.pipeline(transaction=False)
+    pipe.lpushx(FIREHOSE_KEY, *entries)
+    pipe.ltrim(FIREHOSE_KEY, 0, settings.ACTIONS_FIREHOSE_SIZE - 1)
+    pipe.execute()
+
+
+def refill():
+    """
+    Rebuild the firehose from the newest stored actions.
+
+    Returns:
+        The entries, newest first.
+    """
+    rows = Action.objects.visible().order_by('-created') \
+        .values_list('id', 'user_id')[:settings.ACTIONS_FIREHOSE_SIZE]
+    entries = [entry(action_id, user_id) for action_id, user_id in rows]
+    pipe = r.pipeline()
+    pipe.delete(FIREHOSE_KEY)
+    if entries:
+        pipe.rpush(FIREHOSE_KEY, *entries)
+    pipe.execute()
+    return entries
+
+
+def recent(viewer, limit=10):
+    """
+    The newest actions not performed by ``viewer``, with their user,
+    profile and target loaded, newest first.
+    """
+    actions = Action.objects.visible().select_related('user', 'user__profile').prefetch_related('target')
+    fallback = actions.exclude(user=viewer)
+    if not enabled():
+        return list(fallback[:limit])
+    # Room for the viewer's own actions and the hidden ones
+    window = limit * 2 + 20
+    try:
+        entries = [data.decode() for data in r.lrange(FIREHOSE_KEY, 0, window - 1)] or refill()[:window]
+    except redis.RedisError:
+        logger.warning('Could not read the firehose', exc_info=True)
+        return list(fallback[:limit])
+    action_ids = []
+    for data in entries:
+        action_id, user_id = data.split(':')
+        if int(user_id) != viewer.id:
+            action_ids.append(int(action_id))
+    found = list(actions.filter(id__in=action_ids)[:limit]) if action_ids else []
+    if len(found) < limit and len(entries) >= min(window, settings.ACTIONS_FIREHOSE_SIZE):
+        # The window was mostly the viewer's own or hidden actions, and the
+        # table has more: query it as if there were no firehose
+        return list(fallback[:limit])
+    return found
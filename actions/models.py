@@ -1,7 +1,31 @@
+from django.apps import apps
+from django.conf import settings
 from django.db import models
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 
+
+class ActionQuerySet(models.QuerySet):
+
+    def visible(self):
+        """
+        Leave out the actions of deleted accounts and those targeting a
+        deleted image or account, until the purge removes them (see
+        images.deletion and account.deletion).
+
+        Both subqueries read a partial index holding only the rows
+        waiting to be purged.
+        """
+        Image = apps.get_model('images', 'Image')
+        User = apps.get_model(settings.AUTH_USER_MODEL)
+        deleted_users = apps.get_model('account', 'Profile').objects.exclude(deleted=None).values('user_id')
+        deleted_images = Image.all_objects.exclude(deleted=None).values('id')
+        return self.exclude(user_id__in=deleted_users) \
+            .exclude(target_ct=ContentType.objects.get_for_model(Image), target_id__in=deleted_images) \
+            .exclude(target_ct=ContentType.objects.get_for_model(User),
+                     target_id__in=deleted_users)
+
+
 class Action(models.Model):
     """
     Represents an action performed by a user for activity streams.
@@ -35,6 +59,8 @@ class Action(models.Model):
     target_id = models.PositiveIntegerField(blank=True, null=True)
     target = GenericForeignKey('target_ct', 'target_id')
 
+    objects = ActionQuerySet.as_manager()
+
     class Meta:
         """
         Meta options:
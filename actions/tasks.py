@@ -0,0 +1,30 @@
+import datetime
+
+from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
+
+from images.models import Image
+from images.stats import record_actions
+from live.utils import publish_action
+from tasks.queue import task
+
+from . import firehose
+from .models import Action
+
+
+@task()
+def record_action(user_id, verb, target_ct_id=None, target_id=None):
+    """
+    Store an action queued by create_action, unless a similar one was
+    stored within the last minute, and push it to live dashboards.
+    """
+    last_minute = timezone.now() - datetime.timedelta(seconds=60)
+    similar_actions = Action.objects.filter(user_id=user_id, verb=verb, created__gte=last_minute,
+                                            target_ct_id=target_ct_id, target_id=target_id)
+    if similar_actions.exists():
+        return
+    action = Action.objects.create(user_id=user_id, verb=verb, target_ct_id=target_ct_id, target_id=target_id)
+    if target_ct_id is not None and target_ct_id == ContentType.objects.get_for_model(Image).id:
+        record_actions([target_id])
+    firehose.push([action])
+    publish_action(action)
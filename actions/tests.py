@@ -1,3 +1,92 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+import redis
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from bookmarks.testing import mock_redis
+from images.models import Image
+
+from . import firehose
+from .firehose import FIREHOSE_KEY
+from .models import Action
+
+
+@override_settings(ACTIONS_FIREHOSE_SIZE=5)
+class FirehoseTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user('viewer')
+        cls.other = User.objects.create_user('other')
+        # Oldest first, a second apart
+        cls.actions = Action.objects.bulk_create([
+            Action(user=cls.viewer if number % 2 else cls.other, verb=f'action {number}') for number in range(8)
+        ])
+        now = timezone.now()
+        for number, action in enumerate(cls.actions):
+            Action.objects.filter(id=action.id).update(created=now - timedelta(seconds=8 - number))
+        cls.newest_first = cls.actions[::-1]
+
+    def setUp(self):
+        self.r = mock_redis(self)['actions.firehose']
+        self.pipe = self.r.pipeline.return_value
+
+    def entries(self, actions):
+        return [firehose.entry(action.id, action.user_id).encode() for action in actions]
+
+    def test_push_adds_to_an_existing_list_and_caps_it(self):
+        firehose.push(self.actions[:2])
+        self.pipe.lpushx.assert_called_once_with(FIREHOSE_KEY, *[f'{action.id}:{action.user_id}'
+                                                                 for action in self.actions[:2]])
+        self.pipe.ltrim.assert_called_once_with(FIREHOSE_KEY, 0, 4)
+        self.pipe.execute.assert_called_once_with()
+
+    def test_push_skips_unsaved_actions_and_a_disabled_firehose(self):
+        firehose.push([Action(user=self.viewer, verb='unsaved')])
+        with override_settings(ACTIONS_FIREHOSE_SIZE=0):
+            firehose.push(self.actions)
+        self.r.pipeline.assert_not_called()
+
+    def test_refill_from_the_newest_actions(self):
+        entries = [entry.decode() for entry in self.entries(self.newest_first[:5])]
+        self.assertEqual(firehose.refill(), entries)
+        self.pipe.delete.assert_called_once_with(FIREHOSE_KEY)
+        self.pipe.rpush.assert_called_once_with(FIREHOSE_KEY, *entries)
+
+    def test_recent_leaves_out_the_viewer(self):
+        self.r.lrange.return_value = self.entries(self.newest_first[:5])
+        with self.assertNumQueries(1):  # With their users and profiles; no targets
+            recent = firehose.recent(self.viewer, limit=2)
+        self.assertEqual(recent, [self.actions[6], self.actions[4]])
+        self.r.lrange.assert_called_once_with(FIREHOSE_KEY, 0, 23)
+
+    def test_recent_refills_a_missing_list(self):
+        self.r.lrange.return_value = []
+        self.assertEqual(firehose.recent(self.viewer, limit=2), [self.actions[6], self.actions[4]])
+        self.pipe.rpush.assert_called_once()
+
+    def test_recent_skips_hidden_actions(self):
+        image, = Image.objects.bulk_create([Image(user=self.other, title='Gone', slug='gone', image='images/gone.jpg',
+                                                  url='https://example.com/gone.jpg', deleted=timezone.now())])
+        self.actions[6].target = image
+        self.actions[6].save()
+        self.r.lrange.return_value = self.entries(self.newest_first[:5])
+        self.assertEqual(firehose.recent(self.viewer, limit=2), [self.actions[4], self.actions[2]])
+
+    def test_recent_queries_the_table_when_too_few_remain(self):
+        # A full list of the viewer's own actions
+        self.r.lrange.return_value = self.entries(self.newest_first[::2])
+        with override_settings(ACTIONS_FIREHOSE_SIZE=4):
+            self.assertEqual(firehose.recent(self.viewer, limit=2), [self.actions[6], self.actions[4]])
+
+    def test_recent_queries_the_table_without_redis(self):
+        self.r.lrange.side_effect = redis.ConnectionError('down')
+        with self.assertLogs('actions.firehose', 'WARNING'):
+            self.assertEqual(firehose.recent(self.viewer, limit=2), [self.actions[6], self.actions[4]])
+
+    @override_settings(ACTIONS_FIREHOSE_SIZE=0)
+    def test_disabled(self):
+        self.assertEqual(firehose.recent(self.viewer, limit=2), [self.actions[6], self.actions[4]])
+        self.r.lrange.assert_not_called()
@@ -1,5 +1,13 @@
 from django.contrib.contenttypes.models import ContentType
+from django.db.models import Exists, OuterRef
+from . import firehose
 from .models import Action
+from .tasks import record_action
+from live.utils import publish_action
+from images.deletion import delete_in_batches
+from images.models import Image
+from images.stats import record_actions
+from images.thumbnail_urls import prefetch
 from django.utils import timezone
 import datetime
 
@@ -7,32 +15,107 @@ def create_action(user, verb, target=None):
     """
     Logs a user action, preventing duplicate actions in a short time window.
 
+    The action is written by a background task (see actions.tasks); an
+    identical action still waiting in the queue is not queued twice, and
+    the task skips it if a similar action was stored in the last minute.
+
     Args:
         user: User instance performing the action.
         verb: Description of the action (e.g., 'liked', 'followed').
         target: Optional model instance that is the target of the action.
 
     Returns:
-        True if a new action was created, False if a similar action already exists.
+        True if the action was queued, False if the same action already is.
+    """
+    target_ct_id = ContentType.objects.get_for_model(target).id if target else None
+    target_id = target.id if target else None
+    queued = record_action.enqueue(
+        args=[user.id, verb, target_ct_id, target_id],
+        dedup_key=f'action:{user.id}:{verb}:{target_ct_id}:{target_id}',
+    )
+    return queued is not None
+
+
+def create_actions(user, verb, targets):
+    """
+    Bulk version of create_action for many targets of the same model.
+
+    Runs one query to find recent similar actions and one bulk insert,
+    whatever the number of targets.
+
+    Args:
+        user: User instance performing the actions.
+        verb: Description of the action (e.g., 'likes').
+        targets: Model instances of a single model class.
+
+    Returns:
+        List of the Action instances that were created.
     """
-    now = timezone.now()
-    last_minute = now - datetime.timedelta(seconds=60)
+    targets = list(targets)
+    if not targets:
+        return []
 
-    # Filter for recent similar actions by the same user
-    similar_actions = Action.objects.filter(
+    last_minute = timezone.now() - datetime.timedelta(seconds=60)
+    target_ct = ContentType.objects.get_for_model(targets[0])
+    recent_ids = set(Action.objects.filter(
         user_id=user.id,
         verb=verb,
-        created__gte=last_minute
-    )
+        created__gte=last_minute,
+        target_ct=target_ct,
+        target_id__in=[target.id for target in targets]
+    ).values_list('target_id', flat=True))
+
+    actions = Action.objects.bulk_create([
+        Action(user=user, verb=verb, target=target)
+        for target in targets if target.id not in recent_ids
+    ])
+    if targets[0]._meta.model is Image:
+        record_actions([action.target_id for action in actions])
+    # oldest first, so the newest ends up at the head
+    firehose.push(reversed(actions))
+    for action in actions:
+        # ids are only returned by backends supporting RETURNING
+        if action.id:
+            publish_action(action)
+    return actions
+
+
+def sweep_dangling_actions(batch_size):
+    """
+    Delete the actions whose target no longer exists, in batches of
+    ``batch_size`` (a generic relation doesn't cascade); yields the size
+    of each batch.
+
+    Targets soft-deleted but not purged yet still exist: their actions are
+    removed by the purge, and hidden until then (see ActionQuerySet.visible).
+    """
+    target_ct_ids = Action.objects.exclude(target_ct=None).order_by() \
+        .values_list('target_ct', flat=True).distinct()
+    for target_ct_id in list(target_ct_ids):
+        model = ContentType.objects.get_for_id(target_ct_id).model_class()
+        actions = Action.objects.filter(target_ct_id=target_ct_id)
+        if model is not None:
+            # Else the model itself is gone and so are all the targets
+            actions = actions.filter(~Exists(model._base_manager.filter(pk=OuterRef('target_id'))))
+        yield from delete_in_batches(actions, batch_size)
 
-    # If a target object is specified, filter by it
-    if target:
-        target_ct = ContentType.objects.get_for_model(target)
-        similar_actions = similar_actions.filter(target_ct=target_ct, target_id=target.id)
 
-    # Only create a new action if no similar recent action exists
-    if not similar_actions.exists():
-        Action.objects.create(user=user, verb=verb, target=target)
-        return True
+def prefetch_pictures(actions):
+    """
+    Resolve the avatars a page of actions shows (actor photos, target
+    images) in one go; see images.thumbnail_urls.
 
-    return False
+    Returns:
+        the actions, as a list.
+    """
+    actions = list(actions)
+    pairs = []
+    for action in actions:
+        profile = getattr(action.user, 'profile', None)
+        if profile is not None:
+            pairs.append((profile.photo, 'avatar'))
+        image = getattr(action.target, 'image', None)
+        if image:
+            pairs.append((image, 'avatar'))
+    prefetch(pairs)
+    return actions
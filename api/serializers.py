@@ -0,0 +1,160 @@
+"""
+Field definitions for the JSON API resources.
+
+Each resource maps a public field name to a Field holding the getter and
+the model columns it needs. Views only load the columns (and joins) of the
+requested sparse fieldset, and fields that need extra data (``liked``,
+follower counts) add a fixed number of queries only when asked for.
+"""
+
+from collections import namedtuple
+
+from django.contrib.auth.models import User
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from account.models import Contact
+from images.models import Image
+
+Field = namedtuple('Field', ['getter', 'columns'])
+
+
+def only_columns(queryset, fields, names):
+    """
+    Restrict ``queryset`` to the columns and joins the requested fields need.
+    """
+    columns = {'id'}
+    for name in names:
+        columns.update(fields[name].columns)
+    related = {column.rsplit('__', 1)[0] for column in columns if '__' in column}
+    if related:
+        queryset = queryset.select_related(*related)
+    return queryset.only(*columns)
+
+
+def _file_url(file):
+    return file.url if file else None
+
+
+# -------------------------------
+# Images
+# -------------------------------
+
+IMAGE_FIELDS = {
+    'id': Field(lambda image, ctx: image.id, ['id']),
+    'title': Field(lambda image, ctx: image.title, ['title']),
+    'slug': Field(lambda image, ctx: image.slug, ['slug']),
+    'url': Field(lambda image, ctx: image.url, ['url']),
+    'description': Field(lambda image, ctx: image.description, ['description']),
+    'created': Field(lambda image, ctx: image.created, ['created']),
+    'total_likes': Field(lambda image, ctx: image.total_likes, ['total_likes']),
+    'image': Field(lambda image, ctx: _file_url(image.image), ['image']),
+    'absolute_url': Field(lambda image, ctx: image.get_absolute_url(), ['slug']),
+    'user': Field(lambda image, ctx: image.user.username if image.user_id else None, ['user__username']),
+    # Whether the requesting user likes the image (one extra query per page)
+    'liked': Field(lambda image, ctx: image.id in ctx['liked_ids'], []),
+}
+
+IMAGE_DEFAULT_FIELDS = ['id', 'title', 'slug', 'image', 'absolute_url', 'total_likes', 'user']
+
+
+def image_context(user, images, names):
+    """
+    Load the per-page data some image fields need.
+    """
+    context = {}
+    if 'liked' in names:
+        context['liked_ids'] = set(
+            Image.users_like.through.objects.filter(
+                user_id=user.id, image_id__in=[image.id for image in images]
+            ).values_list('image_id', flat=True)
+        )
+    return context
+
+
+# -------------------------------
+# Profiles (users with their Profile)
+# -------------------------------
+
+def _profile_attr(user, attr):
+    # Users created outside registration may not have a Profile yet
+    profile = getattr(user, 'profile', None)
+    return getattr(profile, attr) if profile is not None else None
+
+
+PROFILE_FIELDS = {
+    'id': Field(lambda user, ctx: user.id, ['id']),
+    'username': Field(lambda user, ctx: user.username, ['username']),
+    'first_name': Field(lambda user, ctx: user.first_name, ['first_name']),
+    'last_name': Field(lambda user, ctx: user.last_name, ['last_name']),
+    'date_of_birth': Field(lambda user, ctx: _profile_attr(user, 'date_of_birth'), ['profile__date_of_birth']),
+    'photo': Field(lambda user, ctx: _file_url(_profile_attr(user, 'photo')), ['profile__photo']),
+    'absolute_url': Field(lambda user, ctx: user.get_absolute_url(), ['username']),
+    'followers': Field(lambda user, ctx: user.followers_count, []),
+    'following': Field(lambda user, ctx: user.following_count, []),
+    'images': Field(lambda user, ctx: user.images_count, []),
+}
+
+PROFILE_DEFAULT_FIELDS = ['id', 'username', 'first_name', 'last_name', 'photo', 'absolute_url']
+
+
+def _count_subquery(queryset, outer_field):
+    # Correlated COUNT(*) so several counts don't multiply each other's joins
+    counts = queryset.filter(**{outer_field: OuterRef('pk')}).order_by() \
+                     .values(outer_field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def profile_queryset(names):
+    """
+    Active users with the columns and counters the requested fields need.
+    """
+    queryset = only_columns(User.objects.filter(is_active=True), PROFILE_FIELDS, names)
+    if 'followers' in names:
+        queryset = queryset.annotate(followers_count=_count_subquery(Contact.objects.all(), 'user_to'))
+    if 'following' in names:
+        queryset = queryset.annotate(following_count=_count_subquery(Contact.objects.all(), 'user_from'))
+    if 'images' in names:
+        queryset = queryset.annotate(images_count=_count_subquery(Image.objects.all(), 'user'))
+    return queryset
+
+
+# -------------------------------
+# Actions
+# -------------------------------
+
+def _target(action, ctx):
+    target = action.target
+    if target is None:
+        return None
+    return {
+        'type': action.target_ct.model,
+        'id': action.target_id,
+        'title': str(target),
+        'absolute_url': target.get_absolute_url() if hasattr(target, 'get_absolute_url') else None,
+    }
+
+
+ACTION_FIELDS = {
+    'id': Field(lambda action, ctx: action.id, ['id']),
+    'verb': Field(lambda action, ctx: action.verb, ['verb']),
+    'created': Field(lambda action, ctx: action.created, ['created']),
+    'user': Field(lambda action, ctx: action.user.username, ['user__username']),
+    'target': Field(_target, ['target_ct__app_label', 'target_ct__model', 'target_id']),
+}
+
+ACTION_DEFAULT_FIELDS = ['id', 'verb', 'created', 'user', 'target']
+
+
+# -------------------------------
+# Contacts
+# -------------------------------
+
+CONTACT_FIELDS = {
+    'id': Field(lambda contact, ctx: contact.id, ['id']),
+    'user_from': Field(lambda contact, ctx: contact.user_from.username, ['user_from__username']),
+    'user_to': Field(lambda contact, ctx: contact.user_to.username, ['user_to__username']),
+    'created': Field(lambda contact, ctx: contact.created, ['created']),
+}
+
+CONTACT_DEFAULT_FIELDS = ['id', 'user_from', 'user_to', 'created']
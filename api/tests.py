@@ -0,0 +1,90 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from images.models import Image
+
+from .utils import decode_cursor, encode_cursor
+
+
+class ApiTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', password='secret')
+        # bulk_create: no thumbnail or stats signals
+        cls.images = Image.objects.bulk_create([
+            Image(user=cls.user, title=f'Image {number}', slug=f'image-{number}',
+                  url=f'https://example.com/{number}.jpg', image=f'images/{number}.jpg')
+            for number in range(5)
+        ])
+
+    def setUp(self):
+        self.client.defaults['HTTP_USER_AGENT'] = 'Mozilla/5.0 Firefox'
+        self.client.force_login(self.user)
+
+    def get(self, **params):
+        return self.client.get('/api/images/', params)
+
+
+class CursorPaginationTests(ApiTestCase):
+
+    def test_pages_follow_the_cursor_newest_first(self):
+        ids, params = [], {'limit': 2}
+        for _ in range(3):
+            data = self.get(**params).json()
+            ids += [image['id'] for image in data['results']]
+            params['cursor'] = data['next']
+        self.assertIsNone(data['next'])
+        self.assertEqual(ids, sorted((image.id for image in self.images), reverse=True))
+
+    def test_new_rows_do_not_shift_the_next_page(self):
+        first = self.get(limit=2).json()
+        Image.objects.bulk_create([Image(user=self.user, title='Newer', slug='newer',
+                                         url='https://example.com/newer.jpg', image='images/newer.jpg')])
+        second = self.get(limit=2, cursor=first['next']).json()
+        newest_first = sorted((image.id for image in self.images), reverse=True)
+        self.assertEqual([image['id'] for image in second['results']], newest_first[2:4])
+
+    def test_limit_is_capped(self):
+        self.assertEqual(len(self.get(limit=1000).json()['results']), 5)
+        self.assertEqual(self.get(limit='many').status_code, 400)
+
+    def test_invalid_cursor(self):
+        response = self.get(cursor='not a cursor!')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Invalid cursor')
+
+    def test_cursor_round_trip(self):
+        self.assertEqual(decode_cursor(encode_cursor(12345)), 12345)
+
+    def test_login_required(self):
+        self.client.logout()
+        self.assertEqual(self.get().status_code, 401)
+
+
+class SparseFieldsetTests(ApiTestCase):
+
+    def test_default_fields(self):
+        image = self.get(limit=1).json()['results'][0]
+        self.assertEqual(set(image), {'id', 'title', 'slug', 'image', 'absolute_url', 'total_likes', 'user'})
+        self.assertEqual(image['user'], 'reader')
+
+    def test_requested_fields_only(self):
+        image = self.get(limit=1, fields='id,title').json()['results'][0]
+        self.assertEqual(image, {'id': self.images[-1].id, 'title': 'Image 4'})
+
+    def test_unknown_field(self):
+        response = self.get(fields='id,password')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Unknown fields: password')
+
+    def test_liked(self):
+        self.images[0].users_like.add(self.user)
+        results = self.get(fields='id,liked').json()['results']
+        self.assertEqual({image['id']: image['liked'] for image in results},
+                         {image.id: image == self.images[0] for image in self.images})
+
+    def test_not_modified(self):
+        response = self.get(fields='id')
+        self.assertEqual(self.client.get('/api/images/', {'fields': 'id'},
+                                         HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
@@ -0,0 +1,25 @@
+from django.urls import path
+from . import views
+
+app_name = 'api'
+
+urlpatterns = [
+    # Images: list/fetch many (?ids=) and create
+    path('images/', views.image_list, name='image_list'),
+
+    # Like/unlike many images in one request
+    path('images/like/', views.image_like_batch, name='image_like_batch'),
+
+    # Single image
+    path('images/<int:id>/', views.image_detail, name='image_detail'),
+
+    # Users with their profiles
+    path('profiles/', views.profile_list, name='profile_list'),
+    path('profiles/<username>/', views.profile_detail, name='profile_detail'),
+
+    # Follow relationships
+    path('contacts/', views.contact_list, name='contact_list'),
+
+    # Activity feed of the requesting user
+    path('actions/', views.action_list, name='action_list'),
+]
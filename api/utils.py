@@ -0,0 +1,186 @@
+import base64
+import hashlib
+import json
+from functools import wraps
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils.http import parse_etags, quote_etag
+
+# Page size used when the client does not send ?limit=
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+class ApiError(Exception):
+    """
+    Raised by views and helpers to return a JSON error response.
+
+    Attributes:
+        message (str): Human readable error description.
+        status (int): HTTP status code of the response.
+    """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+# -------------------------------
+# Decorators
+# -------------------------------
+
+def api_view(view_func):
+    """
+    Turn ApiError exceptions into JSON error responses.
+    """
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        try:
+            return view_func(request, *args, **kwargs)
+        except ApiError as e:
+            return JsonResponse({'status': 'error', 'error': e.message}, status=e.status)
+    return _wrapped_view
+
+
+def api_login_required(view_func):
+    """
+    Like login_required, but answers 401 instead of redirecting to the login page.
+    """
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            raise ApiError('Authentication required', status=401)
+        return view_func(request, *args, **kwargs)
+    return _wrapped_view
+
+
+# -------------------------------
+# Request parsing
+# -------------------------------
+
+def json_body(request):
+    """
+    Decode the JSON request body into a dict.
+    """
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        raise ApiError('Request body is not valid JSON')
+    if not isinstance(data, dict):
+        raise ApiError('Request body must be a JSON object')
+    return data
+
+
+def parse_ids(values, limit=MAX_LIMIT):
+    """
+    Validate a list of integer ids (from a JSON body or a comma separated string).
+    """
+    if isinstance(values, str):
+        values = [value for value in values.split(',') if value]
+    try:
+        ids = list(dict.fromkeys(int(value) for value in values))
+    except (TypeError, ValueError):
+        raise ApiError('ids must be a list of integers')
+    if len(ids) > limit:
+        raise ApiError(f'At most {limit} ids are allowed per request')
+    return ids
+
+
+def parse_fields(request, fields, default):
+    """
+    Read the sparse fieldset from ?fields=a,b,c.
+
+    Args:
+        fields (dict): All fields the resource exposes.
+        default (list): Fields returned when ?fields= is absent.
+
+    Returns:
+        list of requested field names.
+    """
+    requested = request.GET.get('fields')
+    if not requested:
+        return list(default)
+    names = [name.strip() for name in requested.split(',') if name.strip()]
+    unknown = [name for name in names if name not in fields]
+    if unknown:
+        raise ApiError(f'Unknown fields: {", ".join(unknown)}')
+    return names
+
+
+def parse_limit(request):
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ApiError('limit must be an integer')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+# -------------------------------
+# Cursor pagination
+# -------------------------------
+
+def encode_cursor(pk):
+    return base64.urlsafe_b64encode(str(pk).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise ApiError('Invalid cursor')
+
+
+def paginate(request, queryset):
+    """
+    Keyset-paginate a queryset on descending primary key.
+
+    Unlike OFFSET pagination the cost of a page does not grow with its
+    depth, and rows inserted meanwhile do not shift the pages.
+
+    Returns:
+        tuple (list of objects, next cursor or None).
+    """
+    limit = parse_limit(request)
+    cursor = request.GET.get('cursor')
+    queryset = queryset.order_by('-pk')
+    if cursor:
+        queryset = queryset.filter(pk__lt=decode_cursor(cursor))
+    objects = list(queryset[:limit + 1])
+    next_cursor = encode_cursor(objects[limit - 1].pk) if len(objects) > limit else None
+    return objects[:limit], next_cursor
+
+
+# -------------------------------
+# Serialization and conditional responses
+# -------------------------------
+
+def serialize(obj, fields, names, context):
+    """
+    Build a dict with the requested ``names`` using the ``fields`` getters.
+    """
+    return {name: fields[name].getter(obj, context) for name in names}
+
+
+def conditional_json(request, data, status=200):
+    """
+    Return ``data`` as JSON with a strong ETag, or 304 if the client has it.
+
+    The ETag is a hash of the encoded body, so it changes exactly when the
+    representation does; If-None-Match saves the transfer and the client
+    side parsing.
+    """
+    body = json.dumps(data, cls=DjangoJSONEncoder).encode()
+    etag = quote_etag(hashlib.md5(body).hexdigest())
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if request.method in ('GET', 'HEAD') and if_none_match:
+        etags = parse_etags(if_none_match)
+        if '*' in etags or etag in etags:
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+    response = HttpResponse(body, status=status, content_type='application/json')
+    response['ETag'] = etag
+    return response
@@ -0,0 +1,229 @@
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_GET, require_http_methods, require_POST
+
+from account.models import Contact
+from actions.models import Action
+from actions.utils import create_action, create_actions
+from images import cards
+from images.forms import ImageCreateForm
+from images.models import Image
+from images.remote import RemoteFetchError
+from images.stats import record_likes
+from live.utils import publish_like_count
+from . import serializers as s
+from .utils import (ApiError, api_login_required, api_view, conditional_json,
+                    json_body, paginate, parse_fields, parse_ids, serialize)
+
+
+def page_response(request, objects, fields, names, next_cursor, context=None):
+    """
+    Serialize one page of results with its continuation cursor.
+    """
+    data = {
+        'results': [serialize(obj, fields, names, context or {}) for obj in objects],
+        'next': next_cursor,
+    }
+    return conditional_json(request, data)
+
+
+# -------------------------------
+# Images
+# -------------------------------
+
+@api_view
+@api_login_required
+@require_http_methods(['GET', 'POST'])
+def image_list(request):
+    """
+    GET: images, newest first, cursor paginated; ?ids=1,2,3 fetches those
+    images in one call (missing ids are reported).
+    POST: bookmark a new image from JSON {title, url, description}.
+
+    Queries: one for the images, plus one if the ``liked`` field is requested.
+    """
+    if request.method == 'POST':
+        return image_create(request)
+
+    names = parse_fields(request, s.IMAGE_FIELDS, s.IMAGE_DEFAULT_FIELDS)
+    queryset = s.only_columns(Image.objects.all(), s.IMAGE_FIELDS, names)
+    ids = request.GET.get('ids')
+    if ids is None:
+        images, next_cursor = paginate(request, queryset)
+        return page_response(request, images, s.IMAGE_FIELDS, names, next_cursor,
+                             s.image_context(request.user, images, names))
+
+    ids = parse_ids(ids)
+    by_id = {image.id: image for image in queryset.filter(id__in=ids)}
+    images = [by_id[image_id] for image_id in ids if image_id in by_id]
+    context = s.image_context(request.user, images, names)
+    return conditional_json(request, {
+        'results': [serialize(image, s.IMAGE_FIELDS, names, context) for image in images],
+        'missing': [image_id for image_id in ids if image_id not in by_id],
+    })
+
+
+def image_create(request):
+    form = ImageCreateForm(data=json_body(request))
+    if not form.is_valid():
+        return conditional_json(request, {'status': 'error', 'errors': form.errors}, status=400)
+    try:
+        image = form.save(commit=False)
+    except RemoteFetchError as exc:
+        # The image's server failed, not the client
+        return conditional_json(request, {'status': 'error', 'errors': {'url': [str(exc)]}}, status=502)
+    image.user = request.user
+    image.save()
+    create_action(request.user, 'bookmarked image', image)
+    return conditional_json(request, serialize(image, s.IMAGE_FIELDS, s.IMAGE_DEFAULT_FIELDS, {}), status=201)
+
+
+@api_view
+@api_login_required
+@require_GET
+def image_detail(request, id):
+    names = parse_fields(request, s.IMAGE_FIELDS, s.IMAGE_DEFAULT_FIELDS)
+    image = get_object_or_404(s.only_columns(Image.objects.all(), s.IMAGE_FIELDS, names), id=id)
+    context = s.image_context(request.user, [image], names)
+    return conditional_json(request, serialize(image, s.IMAGE_FIELDS, names, context))
+
+
+@api_view
+@api_login_required
+@require_POST
+def image_like_batch(request):
+    """
+    Like or unlike many images at once from JSON {"ids": [...], "action": "like"|"unlike"}.
+
+    The M2M rows are inserted/deleted in bulk and total_likes is recomputed
+    with a single UPDATE, so the query count doesn't depend on len(ids).
+    """
+    data = json_body(request)
+    action = data.get('action')
+    if action not in ('like', 'unlike'):
+        raise ApiError("action must be 'like' or 'unlike'")
+    ids = parse_ids(data.get('ids', []))
+
+    through = Image.users_like.through
+    images = list(Image.objects.filter(id__in=ids).only('id', 'slug', 'title'))
+    found_ids = [image.id for image in images]
+
+    with transaction.atomic():
+        if action == 'like':
+            through.objects.bulk_create(
+                [through(image_id=image_id, user_id=request.user.id) for image_id in found_ids],
+                ignore_conflicts=True,
+            )
+        else:
+            through.objects.filter(user_id=request.user.id, image_id__in=found_ids).delete()
+
+        # Bulk M2M writes bypass m2m_changed, so refresh the counters here
+        likes = through.objects.filter(image_id=OuterRef('pk')).order_by() \
+                               .values('image_id').annotate(total=Count('pk')).values('total')
+        Image.objects.filter(id__in=found_ids).update(
+            total_likes=Coalesce(Subquery(likes, output_field=IntegerField()), 0),
+            updated=timezone.now(),
+        )
+        totals = dict(Image.objects.filter(id__in=found_ids).values_list('id', 'total_likes'))
+        record_likes(totals)
+        cards.invalidate(found_ids)
+
+    for image in images:
+        image.total_likes = totals[image.id]
+        publish_like_count(image)
+    if action == 'like':
+        create_actions(request.user, 'likes', images)
+
+    return conditional_json(request, {
+        'status': 'ok',
+        'results': [{'id': image.id, 'total_likes': image.total_likes} for image in images],
+        'missing': [image_id for image_id in ids if image_id not in totals],
+    })
+
+
+# -------------------------------
+# Profiles
+# -------------------------------
+
+@api_view
+@api_login_required
+@require_GET
+def profile_list(request):
+    """
+    Active users with their profiles; ?usernames=a,b fetches those users.
+    Follower/following/image counts are correlated subqueries, so the
+    endpoint always runs in a single query.
+    """
+    names = parse_fields(request, s.PROFILE_FIELDS, s.PROFILE_DEFAULT_FIELDS)
+    queryset = s.profile_queryset(names)
+    usernames = request.GET.get('usernames')
+    if usernames:
+        usernames = [username for username in usernames.split(',') if username][:100]
+        users = list(queryset.filter(username__in=usernames))
+        return conditional_json(request, {
+            'results': [serialize(user, s.PROFILE_FIELDS, names, {}) for user in users],
+        })
+    users, next_cursor = paginate(request, queryset)
+    return page_response(request, users, s.PROFILE_FIELDS, names, next_cursor)
+
+
+@api_view
+@api_login_required
+@require_GET
+def profile_detail(request, username):
+    names = parse_fields(request, s.PROFILE_FIELDS, s.PROFILE_DEFAULT_FIELDS)
+    user = get_object_or_404(s.profile_queryset(names), username=username)
+    return conditional_json(request, serialize(user, s.PROFILE_FIELDS, names, {}))
+
+
+# -------------------------------
+# Contacts
+# -------------------------------
+
+@api_view
+@api_login_required
+@require_GET
+def contact_list(request):
+    """
+    Follow relationships of ?user=<username> (default: the requesting user).
+    ?direction=following (default) or followers.
+    """
+    names = parse_fields(request, s.CONTACT_FIELDS, s.CONTACT_DEFAULT_FIELDS)
+    username = request.GET.get('user', request.user.username)
+    direction = request.GET.get('direction', 'following')
+    if direction == 'following':
+        queryset = Contact.objects.filter(user_from__username=username)
+    elif direction == 'followers':
+        queryset = Contact.objects.filter(user_to__username=username)
+    else:
+        raise ApiError("direction must be 'following' or 'followers'")
+    contacts, next_cursor = paginate(request, s.only_columns(queryset, s.CONTACT_FIELDS, names))
+    return page_response(request, contacts, s.CONTACT_FIELDS, names, next_cursor)
+
+
+# -------------------------------
+# Actions
+# -------------------------------
+
+@api_view
+@api_login_required
+@require_GET
+def action_list(request):
+    """
+    The requesting user's activity feed, same selection as the dashboard.
+
+    Queries: following ids, the page, and one per target content type.
+    """
+    names = parse_fields(request, s.ACTION_FIELDS, s.ACTION_DEFAULT_FIELDS)
+    actions = Action.objects.visible().exclude(user=request.user)
+    following_ids = list(request.user.following.values_list('id', flat=True))
+    if following_ids:
+        actions = actions.filter(user_id__in=following_ids)
+    actions = s.only_columns(actions, s.ACTION_FIELDS, names)
+    if 'target' in names:
+        actions = actions.prefetch_related('target')
+    actions, next_cursor = paginate(request, actions)
+    return page_response(request, actions, s.ACTION_FIELDS, names, next_cursor)
@@ -0,0 +1,320 @@
+"""
+Minimal asyncio HTTP/1.1 load generator.
+
+Each virtual client keeps one keep-alive connection open and fires requests
+back to back, so the numbers reflect the server rather than connection setup.
+Only the standard library is used, which keeps the harness runnable against
+any deployment (``runserver``, gunicorn for WSGI, uvicorn/daphne for ASGI).
+"""
+
+import asyncio
+import http.cookiejar
+import itertools
+import json
+import re
+import statistics
+import time
+import urllib.parse
+import urllib.request
+from collections import Counter
+from dataclasses import dataclass, field
+
+
+# Query count in a Server-Timing header: db;dur=1.2;desc="9 queries"
+DB_QUERIES = re.compile(r'\bdb;[^,]*desc="(\d+) queries"')
+
+# The clients stand in for people: a tool's user agent would make the
+# server treat them as crawlers (see bookmarks/bots.py)
+USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) bookmarks-loadtest'
+
+
+# -------------------------------
+# Requests and results
+# -------------------------------
+
+@dataclass
+class Request:
+    """
+    A single request to send.
+
+    Attributes:
+        method (str): HTTP method.
+        path (str): Path plus query string.
+        body (dict): Optional form data, sent url-encoded.
+        headers (dict): Extra request headers.
+    """
+    method: str
+    path: str
+    body: dict = None
+    headers: dict = field(default_factory=dict)
+
+
+@dataclass
+class Result:
+    """
+    Aggregated outcome of one load-test run.
+    """
+    name: str
+    concurrency: int
+    elapsed: float
+    latencies: list
+    statuses: Counter
+    errors: int
+    server_timing: list = field(default_factory=list)
+
+    def percentile(self, p):
+        """Return the p-th latency percentile in milliseconds."""
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return ordered[index] * 1000
+
+    def queries(self):
+        """
+        Database queries per request, from the ``db`` entry of the
+        Server-Timing headers (see bookmarks.instrumentation), or None.
+        """
+        counts = sorted(int(match.group(1)) for match in
+                        (DB_QUERIES.search(value) for value in self.server_timing) if match)
+        if not counts:
+            return None
+        return {
+            'p50': counts[len(counts) // 2],
+            'max': counts[-1],
+            'mean': round(statistics.fmean(counts), 2),
+        }
+
+    def as_dict(self):
+        """Summary suitable for JSON output."""
+        total = len(self.latencies)
+        return {
+            'name': self.name,
+            'concurrency': self.concurrency,
+            'requests': total,
+            'errors': self.errors,
+            'statuses': {str(k): v for k, v in sorted(self.statuses.items())},
+            'elapsed_s': round(self.elapsed, 3),
+            'throughput_rps': round(total / self.elapsed, 1) if self.elapsed else 0.0,
+            'latency_ms': {
+                'mean': round(statistics.fmean(self.latencies) * 1000, 2) if total else 0.0,
+                'p50': round(self.percentile(50), 2),
+                'p95': round(self.percentile(95), 2),
+                'p99': round(self.percentile(99), 2),
+                'max': round(max(self.latencies) * 1000, 2) if total else 0.0,
+            },
+            'queries': self.queries(),
+        }
+
+
+# -------------------------------
+# Session helpers
+# -------------------------------
+
+def login(base_url, username, password, login_path='/account/login/'):
+    """
+    Log in through the regular login form and return the session cookies.
+
+    Args:
+        base_url (str): Server root, e.g. 'http://127.0.0.1:8000'.
+        username (str): Username (or email, see EmailAuthBackend).
+        password (str): Password.
+
+    Returns:
+        dict mapping cookie names to values (sessionid, csrftoken).
+    """
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    opener.addheaders = [('User-Agent', USER_AGENT)]
+    url = base_url.rstrip('/') + login_path
+    opener.open(url).read()
+    cookies = {c.name: c.value for c in jar}
+    data = urllib.parse.urlencode({
+        'username': username,
+        'password': password,
+        'csrfmiddlewaretoken': cookies.get('csrftoken', ''),
+    }).encode()
+    request = urllib.request.Request(url, data=data, headers={'Referer': url})
+    opener.open(request).read()
+    cookies = {c.name: c.value for c in jar}
+    if 'sessionid' not in cookies:
+        raise ValueError(f'Login failed for {username!r}')
+    return cookies
+
+
+# -------------------------------
+# HTTP/1.1 over asyncio streams
+# -------------------------------
+
+class Connection:
+    """
+    A persistent HTTP/1.1 connection to one host.
+    """
+
+    def __init__(self, host, port, cookies=None):
+        self.host = host
+        self.port = port
+        self.cookie_header = '; '.join(f'{k}={v}' for k, v in (cookies or {}).items())
+        self.csrftoken = (cookies or {}).get('csrftoken')
+        self.reader = None
+        self.writer = None
+
+    async def open(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except ConnectionError:
+                pass
+            self.writer = None
+
+    async def send(self, request):
+        """
+        Send a request and read the full response.
+
+        Returns:
+            tuple (status, headers dict, body bytes).
+        """
+        if self.writer is None:
+            await self.open()
+        body = b''
+        headers = {
+            'Host': f'{self.host}:{self.port}',
+            'Connection': 'keep-alive',
+            'User-Agent': USER_AGENT,
+        }
+        if self.cookie_header:
+            headers['Cookie'] = self.cookie_header
+        if request.body is not None:
+            body = urllib.parse.urlencode(request.body).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            if self.csrftoken:
+                headers['X-CSRFToken'] = self.csrftoken
+        headers['Content-Length'] = str(len(body))
+        headers.update(request.headers)
+        head = f'{request.method} {request.path} HTTP/1.1\r\n'
+        head += ''.join(f'{k}: {v}\r\n' for k, v in headers.items())
+        self.writer.write(head.encode('latin-1') + b'\r\n' + body)
+        await self.writer.drain()
+        return await self._read_response(request.method)
+
+    async def _read_response(self, method):
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('Connection closed by server')
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if method == 'HEAD' or status in (204, 304):
+            body = b''
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            body = b''.join(chunks)
+        elif 'content-length' in headers:
+            body = await self.reader.readexactly(int(headers['content-length']))
+        else:
+            body = await self.reader.read()
+            await self.close()
+
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status, headers, body
+
+
+# -------------------------------
+# Runner
+# -------------------------------
+
+async def _run(name, base_url, requests, total, concurrency, cookies, timeout):
+    parsed = urllib.parse.urlsplit(base_url)
+    host, port = parsed.hostname, parsed.port or 80
+    prefix = parsed.path.rstrip('/')
+    # Requests are handed out round-robin from a shared iterator
+    source = itertools.islice(itertools.cycle(requests), total)
+    latencies, statuses, server_timing = [], Counter(), []
+    errors = 0
+
+    async def client():
+        nonlocal errors
+        connection = Connection(host, port, cookies)
+        try:
+            for request in source:
+                request = Request(request.method, prefix + request.path, request.body, request.headers)
+                started = time.perf_counter()
+                try:
+                    status, headers, _ = await asyncio.wait_for(connection.send(request), timeout)
+                except (OSError, ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+                    errors += 1
+                    await connection.close()
+                    continue
+                latencies.append(time.perf_counter() - started)
+                statuses[status] += 1
+                if 'server-timing' in headers:
+                    server_timing.append(headers['server-timing'])
+        finally:
+            await connection.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return Result(name, concurrency, elapsed, latencies, statuses, errors, server_timing)
+
+
+def run(name, base_url, requests, total=1000, concurrency=50, cookies=None, timeout=30.0, warmup=0):
+    """
+    Drive ``requests`` against ``base_url`` with ``concurrency`` clients.
+
+    Args:
+        name (str): Label for the result.
+        base_url (str): Server root, e.g. 'http://127.0.0.1:8000'.
+        requests (list): Request instances, cycled until ``total`` are sent.
+        total (int): Number of measured requests.
+        concurrency (int): Number of simultaneous keep-alive clients.
+        cookies (dict): Session cookies from login().
+        timeout (float): Per-request timeout in seconds.
+        warmup (int): Requests sent (and discarded) before measuring.
+
+    Returns:
+        Result instance.
+    """
+    if warmup:
+        asyncio.run(_run(name, base_url, requests, warmup, concurrency, cookies, timeout))
+    return asyncio.run(_run(name, base_url, requests, total, concurrency, cookies, timeout))
+
+
+def format_table(results):
+    """Render results as a fixed-width text table."""
+    lines = [f'{"target":<24}{"conc":>6}{"reqs":>8}{"err":>6}{"rps":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}'
+             f'{"queries":>9}']
+    for result in results:
+        data = result.as_dict()
+        latency = data['latency_ms']
+        queries = data['queries']['p50'] if data['queries'] else '-'
+        lines.append(
+            f'{data["name"]:<24}{data["concurrency"]:>6}{data["requests"]:>8}{data["errors"]:>6}'
+            f'{data["throughput_rps"]:>10}{latency["p50"]:>10}{latency["p95"]:>10}{latency["p99"]:>10}'
+            f'{queries:>9}'
+        )
+    return '\n'.join(lines)
+
+
+def dump_json(results, path):
+    """Write result summaries to ``path`` as JSON."""
+    with open(path, 'w') as f:
+        json.dump([result.as_dict() for result in results], f, indent=2)
@@ -0,0 +1,116 @@
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.template import Context, Template
+from django.template.loader import render_to_string
+from django.test.utils import CaptureQueriesContext
+
+from images import cards
+from images.models import Image
+from images.views import IMAGES_PER_PAGE
+
+# The grid cells as they were rendered before image cards: from Image objects
+MODEL_GRID = """{% load responsive %}{% for image in images %}
+    <div class="image">
+        <a href="{{ image.get_absolute_url }}">
+            {% picture image.image 'grid' %}
+        </a>
+        <div class="info">
+            <a href="{{ image.get_absolute_url }}" class='title'>
+                {{ image.title }}
+            </a>
+        </div>
+    </div>
+{% endfor %}"""
+
+
+class Command(BaseCommand):
+    """
+    Compare the CPU time and memory of rendering image grid pages from
+    ``Image`` objects and from the image cards in Redis (images/cards.py).
+
+    Each of the first --pages pages of the newest images is rendered
+    --repeat times per path:
+
+    - models: the page's Image rows, reverse() and {% picture %} per cell
+    - cards (cold): get_cards with no card in Redis (built and stored)
+    - cards (warm): get_cards reading every card with one MGET
+
+    Figures are per page: median CPU (process) time, median peak of the
+    memory allocated while rendering (tracemalloc) and queries.
+
+        python manage.py bench_grid --pages 20 --repeat 5
+
+    Requires Redis and msgpack; the cards of the benchmarked images are
+    dropped afterwards.
+    """
+    help = 'Benchmark grid rendering from Image objects vs image cards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=10)
+        parser.add_argument('--per-page', type=int, default=IMAGES_PER_PAGE)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def measure(self, render, repeat):
+        """
+        Median (CPU ms, peak KB, queries) of ``repeat`` calls of ``render``.
+        """
+        timings, peaks, queries = [], [], []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as captured:
+                tracemalloc.start()
+                start = time.process_time()
+                render()
+                timings.append((time.process_time() - start) * 1000)
+                peaks.append(tracemalloc.get_traced_memory()[1] / 1024)
+                tracemalloc.stop()
+            queries.append(len(captured))
+        return statistics.median(timings), statistics.median(peaks), statistics.median(queries)
+
+    def handle(self, *args, **options):
+        if not cards.enabled():
+            raise CommandError('Image cards are disabled (settings.IMAGE_CARDS) or msgpack is not installed')
+        per_page = options['per_page']
+        ids = list(Image.objects.values_list('id', flat=True)[:options['pages'] * per_page])
+        pages = [ids[start:start + per_page] for start in range(0, len(ids), per_page)]
+        if not pages:
+            raise CommandError('No images: seed some with seed_benchmark')
+        model_grid = Template(MODEL_GRID)
+
+        def render_models(page):
+            images = Image.objects.filter(id__in=page)
+            return model_grid.render(Context({'images': images}))
+
+        def render_cards(page):
+            return render_to_string('images/image/list_images.html', {'images': cards.get_cards(page)})
+
+        def drop_cards(page):
+            cards.r.delete(*[cards.card_key(image_id) for image_id in page])
+
+        # Warm up template loading, thumbnail lookups and connections
+        render_models(pages[0])
+        render_cards(pages[0])
+
+        results = {'models': [], 'cards (cold)': [], 'cards (warm)': []}
+        try:
+            for page in pages:
+                results['models'].append(self.measure(lambda: render_models(page), options['repeat']))
+                cold = []
+                for _ in range(options['repeat']):
+                    drop_cards(page)
+                    cold.append(self.measure(lambda: render_cards(page), 1))
+                results['cards (cold)'].append(tuple(statistics.median(values) for values in zip(*cold)))
+                results['cards (warm)'].append(self.measure(lambda: render_cards(page), options['repeat']))
+        finally:
+            for page in pages:
+                drop_cards(page)
+
+        self.stdout.write(f'{len(pages)} pages of {per_page} images, {options["repeat"]} runs each\n')
+        self.stdout.write(f'{"path":<14} {"cpu ms":>9} {"peak KB":>9} {"queries":>8}')
+        base = statistics.median(timing for timing, _, _ in results['models'])
+        for name, figures in results.items():
+            cpu, peak, queries = (statistics.median(values) for values in zip(*figures))
+            self.stdout.write(f'{name:<14} {cpu:>9.2f} {peak:>9.1f} {queries:>8g}  {base / cpu if cpu else 0:>5.1f}x')
@@ -0,0 +1,124 @@
+from html.parser import HTMLParser
+from urllib.parse import unquote, urlsplit
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from images.derivatives import FALLBACK, MIME_TYPES
+
+
+class PictureParser(HTMLParser):
+    """
+    Collect the candidates of every <picture> (and plain <img>) on a page.
+
+    ``images`` is a list of {format: {density: url}}; plain images and the
+    <img> of a <picture> are stored under FALLBACK.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.images = []
+        self.current = None
+
+    @staticmethod
+    def parse_srcset(value, src=None):
+        candidates = {}
+        for candidate in filter(None, (part.strip() for part in (value or '').split(','))):
+            url, _, descriptor = candidate.partition(' ')
+            candidates[int(float(descriptor.strip().rstrip('x') or 1))] = url
+        if not candidates and src:
+            candidates[1] = src
+        return candidates
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'picture':
+            self.current = {}
+        elif tag == 'source' and self.current is not None:
+            fmt = next((fmt for fmt, mime in MIME_TYPES.items() if mime == attrs.get('type')), None)
+            if fmt:
+                self.current[fmt] = self.parse_srcset(attrs.get('srcset'))
+        elif tag == 'img' and attrs.get('src'):
+            image = self.current if self.current is not None else {}
+            image[FALLBACK] = self.parse_srcset(attrs.get('srcset'), attrs['src'])
+            self.images.append(image)
+
+    def handle_endtag(self, tag):
+        if tag == 'picture':
+            self.current = None
+
+
+def media_size(url):
+    """
+    Size in bytes of a media URL, or None if it isn't a stored file.
+    """
+    path = unquote(urlsplit(url).path)
+    if not path.startswith(settings.MEDIA_URL):
+        return None
+    name = path[len(settings.MEDIA_URL):]
+    return default_storage.size(name) if default_storage.exists(name) else None
+
+
+class Command(BaseCommand):
+    """
+    Measure the image bytes a browser downloads per page.
+
+    For each page, every <picture> is resolved the way a browser would: the
+    first format in --accept that is offered, at --density. The baseline is
+    the 1x JPEG/PNG fallback, i.e. the single thumbnail the templates used
+    to emit. Run ``generate_derivatives`` first so the variants exist.
+
+        python manage.py bench_page_bytes --username bob --density 2 \\
+            --page /images/ --page /account/users/
+    """
+    help = 'Compare image bytes per page: single-size fallback vs picture/srcset'
+
+    default_pages = ['/images/?images_only=1', '/account/users/', '/account/']
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True, help='user the pages are rendered for')
+        parser.add_argument('--page', action='append', help='path to measure, may be given several times')
+        parser.add_argument('--accept', default='avif,webp',
+                            help='formats the simulated browser supports, in order of preference')
+        parser.add_argument('--density', type=int, default=1, help='device pixel ratio')
+        parser.add_argument('--host', default='localhost', help='Host header (must be in ALLOWED_HOSTS)')
+
+    def choose(self, image, accept, density):
+        for fmt in accept + [FALLBACK]:
+            candidates = image.get(fmt)
+            if candidates:
+                # the smallest density covering the screen, else the largest available
+                best = min((d for d in candidates if d >= density), default=max(candidates))
+                return candidates[best]
+        return None
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'No user {options["username"]!r}')
+        accept = [fmt for fmt in options['accept'].split(',') if fmt]
+        client = Client()
+        client.force_login(user)
+
+        rows = []
+        for page in options['page'] or self.default_pages:
+            response = client.get(page, HTTP_HOST=options['host'])
+            if response.status_code != 200:
+                raise CommandError(f'{page} returned {response.status_code}')
+            parser = PictureParser()
+            parser.feed(response.content.decode())
+            before = after = 0
+            for image in parser.images:
+                fallback = image.get(FALLBACK, {})
+                before += media_size(fallback.get(1) or next(iter(fallback.values()), '')) or 0
+                after += media_size(self.choose(image, accept, options['density']) or '') or 0
+            rows.append((page, len(parser.images), before, after))
+
+        self.stdout.write(f'{"page":<30} {"images":>7} {"before":>10} {"after":>10} {"saved":>7}')
+        for page, count, before, after in rows:
+            saved = f'{(1 - after / before) * 100:.0f}%' if before else '-'
+            self.stdout.write(f'{page:<30} {count:>7} {before:>10} {after:>10} {saved:>7}')
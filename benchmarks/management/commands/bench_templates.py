@@ -0,0 +1,85 @@
+import difflib
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.template import engines
+
+from actions.models import Action
+from images.cards import build_cards
+from images.models import Image
+from images.views import IMAGES_PER_PAGE
+
+ENGINES = ['django', 'jinja2']
+
+
+class Command(BaseCommand):
+    """
+    Render the hot partials (see bookmarks/partials.py) with the Django
+    and Jinja2 engines, compare their HTML and time them.
+
+    The contexts are built once from the database: --count image cards for
+    the grid and the ranking, --count dashboard actions (with their users,
+    profiles and targets) for the activity stream. Times are medians over
+    --repeat renders, after a warm-up render.
+
+        python manage.py bench_templates --count 50 --repeat 20
+
+    Fails if the engines produce different HTML, showing the first lines
+    that differ.
+    """
+    help = 'Check the Django and Jinja2 partials render identical HTML and compare their render times'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=IMAGES_PER_PAGE * 4, help='items per partial')
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def contexts(self, count):
+        ids = list(Image.objects.values_list('id', flat=True)[:count])
+        cards = build_cards(ids)
+        cards = [cards[image_id] for image_id in ids if image_id in cards]
+        actions = list(Action.objects.visible().select_related('user', 'user__profile')
+                       .prefetch_related('target')[:count])
+        return {
+            'images/image/list_images.html': {'images': cards},
+            'images/image/ranking_list.html': {
+                'most_viewed': [(card, count - rank) for rank, card in enumerate(cards)], 'by': 'views',
+            },
+            'actions/action/list.html': {'actions': actions},
+        }
+
+    def handle(self, *args, **options):
+        missing = [name for name in ENGINES if name not in engines]
+        if missing:
+            raise CommandError(f'No {", ".join(missing)} template engine configured (is Jinja2 installed?)')
+        mismatches = []
+        self.stdout.write(f'{options["repeat"]} renders each, partials engine: {settings.PARTIALS_ENGINE}\n')
+        self.stdout.write(f'{"partial":<32} {"items":>6} ' + ' '.join(f'{name + " ms":>10}' for name in ENGINES) +
+                          f' {"speedup":>8} {"identical":>10}')
+        for template_name, context in self.contexts(options['count']).items():
+            timings = {}
+            outputs = {}
+            for name in ENGINES:
+                template = engines[name].get_template(template_name)
+                outputs[name] = template.render(context)
+                runs = []
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    template.render(context)
+                    runs.append((time.perf_counter() - start) * 1000)
+                timings[name] = statistics.median(runs)
+            identical = outputs['django'] == outputs['jinja2']
+            if not identical:
+                mismatches.append((template_name, outputs))
+            items = len(next(iter(context.values())))
+            self.stdout.write(
+                f'{template_name:<32} {items:>6} ' + ' '.join(f'{timings[name]:>10.2f}' for name in ENGINES) +
+                f' {timings["django"] / timings["jinja2"]:>7.1f}x {"yes" if identical else "NO":>10}'
+            )
+        for template_name, outputs in mismatches:
+            diff = difflib.unified_diff(outputs['django'].splitlines(), outputs['jinja2'].splitlines(),
+                                        'django', 'jinja2', lineterm='', n=1)
+            self.stderr.write(f'\n{template_name}:\n' + '\n'.join(list(diff)[:20]))
+        if mismatches:
+            raise CommandError(f'{len(mismatches)} partial(s) render differently')
@@ -0,0 +1,162 @@
+import math
+import os
+import statistics
+import tempfile
+import time
+from io import BytesIO
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+from easy_thumbnails import engine
+from easy_thumbnails.alias import aliases
+from easy_thumbnails.conf import settings as thumbnail_settings
+from easy_thumbnails.options import ThumbnailOptions
+from easy_thumbnails.source_generators import pil_image
+from PIL import Image, ImageChops, ImageFilter, ImageStat
+
+from images.thumbnails import SharedSource, reduced_image
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+# Sizes of the generated sample corpus: phone photos, DSLR shots, screenshots
+SYNTHETIC_SIZES = [(4032, 3024, 'JPEG'), (6000, 4000, 'JPEG'), (2560, 1600, 'PNG')]
+
+
+def synthetic_corpus(directory, count):
+    """
+    Write ``count`` photo-like sample images (gradients plus noise) to ``directory``.
+    """
+    paths = []
+    for index in range(count):
+        width, height, image_format = SYNTHETIC_SIZES[index % len(SYNTHETIC_SIZES)]
+        gradient = Image.linear_gradient('L').resize((width, height))
+        noise = Image.effect_noise((width, height), 40 + index).filter(ImageFilter.GaussianBlur(2))
+        image = Image.merge('RGB', (gradient, noise, gradient.transpose(Image.Transpose.ROTATE_90).resize((width, height))))
+        path = os.path.join(directory, f'sample-{index}.{image_format.lower()}')
+        image.save(path, format=image_format, quality=90)
+        paths.append(path)
+    return paths
+
+
+def corpus_files(directory):
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            # skip thumbnails of the sources
+            if name.lower().endswith(IMAGE_EXTENSIONS) and name.count('.') == 1:
+                paths.append(os.path.join(root, name))
+    return sorted(paths)
+
+
+def psnr(a, b):
+    """
+    Peak signal-to-noise ratio of two thumbnails, in dB (higher is closer).
+    """
+    if a.size != b.size:
+        b = b.resize(a.size)
+    diff = ImageChops.difference(a.convert('RGB'), b.convert('RGB'))
+    mse = statistics.mean(value ** 2 for value in ImageStat.Stat(diff).rms)
+    return float('inf') if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+
+class Command(BaseCommand):
+    """
+    Micro-benchmark thumbnail generation strategies over a corpus of images.
+
+    For every source, all aliases of the target (x every density) are
+    rendered three ways:
+
+    - full: easy_thumbnails' default, a full-resolution decode per thumbnail
+    - reduced: draft()/reduce() decoding, still once per thumbnail
+    - shared: draft()/reduce() decoding once for all thumbnails
+
+    Times are per source (medians over --repeat runs); PSNR compares the
+    reduced output with the full-decode output.
+
+        python manage.py bench_thumbnails --corpus media/images --repeat 5
+        python manage.py bench_thumbnails --synthetic 6
+    """
+    help = 'Benchmark full vs reduced-size decoding for thumbnail generation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', help='directory of sample images (searched recursively)')
+        parser.add_argument('--synthetic', type=int, default=0,
+                            help='also generate this many large sample images')
+        parser.add_argument('--target', default='images.Image.image',
+                            help='THUMBNAIL_ALIASES target whose aliases are rendered')
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--encode', action='store_true', help='include JPEG encoding in the timings')
+
+    def variants(self, target):
+        alias_options = aliases.all(target=target, include_global=False)
+        if not alias_options:
+            raise CommandError(f'No aliases defined for {target!r}')
+        return [
+            ThumbnailOptions(dict(options, size=tuple(int(dim) * density for dim in options['size'])))
+            for options in alias_options.values()
+            for density in settings.RESPONSIVE_IMAGE_DENSITIES
+        ]
+
+    def render(self, image, options, encode):
+        thumbnail = engine.process_image(image, options, self.processors)
+        if encode:
+            engine.save_pil_image(thumbnail, BytesIO(), 'thumbnail.jpg', quality=options['quality'])
+        return thumbnail
+
+    def run_full(self, data, variants, encode):
+        return [self.render(pil_image(BytesIO(data), **options), options, encode) for options in variants]
+
+    def run_reduced(self, data, variants, encode):
+        return [self.render(reduced_image(BytesIO(data), **options), options, encode) for options in variants]
+
+    def run_shared(self, data, variants, encode):
+        source = SharedSource(variants)
+        return [self.render(source(BytesIO(data), **options), options, encode) for options in variants]
+
+    def handle(self, *args, **options):
+        self.processors = [import_string(name) for name in thumbnail_settings.THUMBNAIL_PROCESSORS]
+        variants = self.variants(options['target'])
+        for variant in variants:
+            variant.setdefault('quality', thumbnail_settings.THUMBNAIL_QUALITY)
+
+        with tempfile.TemporaryDirectory() as directory:
+            paths = corpus_files(options['corpus']) if options['corpus'] else []
+            paths += synthetic_corpus(directory, options['synthetic'])
+            if not paths:
+                raise CommandError('Empty corpus: pass --corpus and/or --synthetic')
+
+            strategies = [('full', self.run_full), ('reduced', self.run_reduced), ('shared', self.run_shared)]
+            self.stdout.write(f'{len(variants)} thumbnails per source, {options["repeat"]} runs\n')
+            self.stdout.write(f'{"source":<34} {"pixels":>9} ' +
+                              ' '.join(f'{name + " ms":>11}' for name, _ in strategies) +
+                              f' {"speedup":>8} {"psnr dB":>8}')
+            totals = {name: 0.0 for name, _ in strategies}
+            for path in paths:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                try:
+                    width, height = Image.open(BytesIO(data)).size
+                except Exception:
+                    self.stderr.write(f'skipping unreadable {path}')
+                    continue
+                timings = {}
+                outputs = {}
+                for name, run in strategies:
+                    runs = []
+                    for _ in range(options['repeat']):
+                        start = time.perf_counter()
+                        outputs[name] = run(data, variants, options['encode'])
+                        runs.append((time.perf_counter() - start) * 1000)
+                    timings[name] = statistics.median(runs)
+                    totals[name] += timings[name]
+                quality = min(psnr(full, reduced) for full, reduced in zip(outputs['full'], outputs['shared']))
+                self.stdout.write(
+                    f'{os.path.basename(path)[:34]:<34} {width * height / 1e6:>8.1f}M ' +
+                    ' '.join(f'{timings[name]:>11.1f}' for name, _ in strategies) +
+                    f' {timings["full"] / timings["shared"]:>7.1f}x {quality:>8.1f}'
+                )
+            self.stdout.write(
+                f'{"total":<34} {"":>9} ' + ' '.join(f'{totals[name]:>11.1f}' for name, _ in strategies) +
+                f' {totals["full"] / totals["shared"]:>7.1f}x'
+            )
@@ -0,0 +1,152 @@
+import json
+import math
+import subprocess
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from actions.models import Action
+from benchmarks import loadtest, seed
+from images.models import Image
+from images.views import IMAGES_PER_PAGE
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=settings.BASE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    """
+    Benchmark the hot endpoints against a running server seeded with ``seed_benchmark``.
+
+        python manage.py seed_benchmark --clear
+        gunicorn bookmarks.wsgi -w 4 -b 127.0.0.1:8000 &
+        python manage.py benchmark --url http://127.0.0.1:8000 --concurrency 1 --concurrency 50 \\
+            --json bench-$(git rev-parse --short HEAD).json --compare bench-main.json
+
+    Every scenario is driven by concurrent keep-alive clients logged in as
+    --username. The JSON report holds throughput, p50/p95/p99 latency and
+    the database queries per request (read from the Server-Timing header),
+    with the git revision and data set size, so runs can be compared across
+    commits; --compare prints the change against an earlier report.
+    """
+    help = 'Measure throughput, latency percentiles and query counts of the hot endpoints'
+
+    scenarios = ['dashboard', 'image_list', 'image_detail', 'image_like', 'user_follow', 'image_ranking']
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='server root')
+        parser.add_argument('--scenario', action='append', choices=self.scenarios,
+                            help='scenario to run, may be given several times (default: all)')
+        parser.add_argument('--username', default=f'{seed.USERNAME_PREFIX}1',
+                            help='benchmark user the clients log in as')
+        parser.add_argument('--password', default='bench-password')
+        parser.add_argument('--requests', type=int, default=500, help='measured requests per run')
+        parser.add_argument('--concurrency', type=int, action='append',
+                            help='concurrency level, may be given several times (default 20)')
+        parser.add_argument('--warmup', type=int, default=50)
+        parser.add_argument('--deep-pages', type=int, default=5, help='last image list pages requested')
+        parser.add_argument('--json', dest='json_path', help='write the report to this file')
+        parser.add_argument('--compare', help='earlier JSON report to compare with')
+
+    def build_requests(self, scenario, user, options):
+        """
+        The requests cycled by a scenario, derived from the seeded data.
+        """
+        bench_users = User.objects.filter(username__startswith=seed.USERNAME_PREFIX).exclude(id=user.id)
+        popular_images = list(Image.objects.order_by('-total_likes', 'id')[:20])
+        if scenario == 'dashboard':
+            return [loadtest.Request('GET', reverse('dashboard'))]
+        if scenario == 'image_list':
+            # The deepest pages are the slowest to reach with OFFSET pagination
+            pages = max(1, math.ceil(Image.objects.count() / IMAGES_PER_PAGE))
+            first = max(1, pages - options['deep_pages'] + 1)
+            path = reverse('images:list')
+            return [
+                loadtest.Request('GET', f'{path}?page={page}{suffix}')
+                for page in range(first, pages + 1) for suffix in ('', '&images_only=1')
+            ]
+        if scenario == 'image_detail':
+            return [loadtest.Request('GET', image.get_absolute_url()) for image in popular_images]
+        if scenario == 'image_like':
+            # like then unlike, so the data set is unchanged afterwards
+            return [
+                loadtest.Request('POST', reverse('images:like'), {'id': image.id, 'action': action})
+                for image in popular_images[:5] for action in ('like', 'unlike')
+            ]
+        if scenario == 'user_follow':
+            return [
+                loadtest.Request('POST', reverse('user_follow'), {'id': followed.id, 'action': action})
+                for followed in bench_users.order_by('id')[:5] for action in ('follow', 'unfollow')
+            ]
+        return [loadtest.Request('GET', reverse('images:ranking'))]
+
+    def compare(self, results, path):
+        with open(path) as f:
+            baseline = {(item['name'], item['concurrency']): item for item in json.load(f)['results']}
+        self.stdout.write(f'\nChange against {path}')
+        self.stdout.write(f'{"scenario":<24}{"conc":>6}{"rps":>10}{"p95":>10}{"p99":>10}{"queries":>10}')
+
+        def change(new, old):
+            if not old:
+                return '-'
+            return f'{(new - old) / old * 100:+.0f}%'
+
+        for result in results:
+            data = result.as_dict()
+            old = baseline.get((data['name'], data['concurrency']))
+            if old is None:
+                continue
+            queries = data['queries'] or {}
+            old_queries = old.get('queries') or {}
+            self.stdout.write(
+                f'{data["name"]:<24}{data["concurrency"]:>6}'
+                f'{change(data["throughput_rps"], old["throughput_rps"]):>10}'
+                f'{change(data["latency_ms"]["p95"], old["latency_ms"]["p95"]):>10}'
+                f'{change(data["latency_ms"]["p99"], old["latency_ms"]["p99"]):>10}'
+                f'{change(queries.get("p50", 0), old_queries.get("p50")):>10}'
+            )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'No user {options["username"]!r}; run seed_benchmark first')
+        cookies = loadtest.login(options['url'], options['username'], options['password'])
+
+        results = []
+        for scenario in options['scenario'] or self.scenarios:
+            requests = self.build_requests(scenario, user, options)
+            for concurrency in options['concurrency'] or [20]:
+                results.append(loadtest.run(
+                    scenario, options['url'], requests, total=options['requests'],
+                    concurrency=concurrency, cookies=cookies, warmup=options['warmup'],
+                ))
+
+        self.stdout.write(loadtest.format_table(results))
+        report = {
+            'meta': {
+                'revision': git_revision(),
+                'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'url': options['url'],
+                'username': options['username'],
+                'data': {
+                    'users': User.objects.count(),
+                    'images': Image.objects.count(),
+                    'actions': Action.objects.count(),
+                },
+            },
+            'results': [result.as_dict() for result in results],
+        }
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(report, f, indent=2)
+        if options['compare']:
+            self.compare(results, options['compare'])
@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks import loadtest
+
+
+class Command(BaseCommand):
+    """
+    Compare throughput and tail latency of the AJAX endpoints across servers.
+
+    Start the same project twice, e.g.:
+
+        gunicorn bookmarks.wsgi -w 4 -b 127.0.0.1:8000
+        uvicorn bookmarks.asgi:application --workers 4 --port 8001
+
+    then run:
+
+        python manage.py loadtest --target wsgi=http://127.0.0.1:8000 \\
+            --target asgi=http://127.0.0.1:8001 --username bob --password ... \\
+            --scenario like --image-id 1 --concurrency 200
+    """
+    help = 'Load-test the like/follow/infinite-scroll endpoints against one or more servers'
+
+    scenarios = ['like', 'follow', 'images_only']
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', required=True,
+                            help='name=base_url, may be given several times')
+        parser.add_argument('--scenario', choices=self.scenarios, default='images_only')
+        parser.add_argument('--username', required=True)
+        parser.add_argument('--password', required=True)
+        parser.add_argument('--image-id', type=int, default=1, help='image liked in the like scenario')
+        parser.add_argument('--user-id', type=int, default=1, help='user followed in the follow scenario')
+        parser.add_argument('--pages', type=int, default=5, help='pages cycled in the images_only scenario')
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, action='append',
+                            help='concurrency level, may be given several times (default 50)')
+        parser.add_argument('--warmup', type=int, default=100)
+        parser.add_argument('--json', dest='json_path', help='also write results to this file')
+
+    def build_requests(self, options):
+        scenario = options['scenario']
+        if scenario == 'like':
+            # alternate like/unlike so the M2M row count stays stable
+            return [
+                loadtest.Request('POST', '/images/like/', {'id': options['image_id'], 'action': 'like'}),
+                loadtest.Request('POST', '/images/like/', {'id': options['image_id'], 'action': 'unlike'}),
+            ]
+        if scenario == 'follow':
+            return [
+                loadtest.Request('POST', '/account/users/follow/', {'id': options['user_id'], 'action': 'follow'}),
+                loadtest.Request('POST', '/account/users/follow/', {'id': options['user_id'], 'action': 'unfollow'}),
+            ]
+        return [
+            loadtest.Request('GET', f'/images/?images_only=1&page={page}')
+            for page in range(1, options['pages'] + 1)
+        ]
+
+    def handle(self, *args, **options):
+        requests = self.build_requests(options)
+        results = []
+        for target in options['target']:
+            name, sep, base_url = target.partition('=')
+            if not sep:
+                raise CommandError(f'--target must look like name=url, got {target!r}')
+            cookies = loadtest.login(base_url, options['username'], options['password'])
+            for concurrency in options['concurrency'] or [50]:
+                result = loadtest.run(
+                    f'{name}/{options["scenario"]}', base_url, requests,
+                    total=options['requests'], concurrency=concurrency,
+                    cookies=cookies, warmup=options['warmup'],
+                )
+                results.append(result)
+
+        self.stdout.write(loadtest.format_table(results))
+        if options['json_path']:
+            loadtest.dump_json(results, options['json_path'])
@@ -0,0 +1,133 @@
+import sqlite3
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+
+from account.models import Contact
+from bookmarks.routers import PRIMARY, STICKY_COOKIE
+from images.models import Image
+
+
+class QueryCounter:
+    """
+    Count the queries run on one database connection.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    """
+    Exercise replica routing with two SQLite files as primary and replica.
+
+        BOOKMARKS_DB=/tmp/primary.sqlite3 BOOKMARKS_REPLICA_DBS=/tmp/replica.sqlite3 \\
+            python manage.py replica_harness --setup
+
+    --setup migrates the primary and creates two users and a few images.
+    The primary is then copied to the replica with SQLite's online backup,
+    which stands in for replication; from there on the replica only
+    changes when the harness "replicates" again, so it lags like a real one.
+
+    Each step reports where its queries ran and checks the expectation:
+    read-only pages on the replica, writes on the primary, reads pinned
+    to the primary right after a write, back to the replica once the pin
+    is gone.
+    """
+    help = 'Check read-replica routing and read-your-writes stickiness on two SQLite files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--setup', action='store_true', help='migrate the primary and create sample data')
+
+    def replicate(self):
+        """
+        Copy the primary to every replica (SQLite online backup).
+        """
+        for alias in [PRIMARY] + settings.REPLICA_DATABASES:
+            connections[alias].close()
+        source = sqlite3.connect(settings.DATABASES[PRIMARY]['NAME'])
+        try:
+            for alias in settings.REPLICA_DATABASES:
+                destination = sqlite3.connect(settings.DATABASES[alias]['NAME'])
+                try:
+                    source.backup(destination)
+                finally:
+                    destination.close()
+        finally:
+            source.close()
+
+    def setup_data(self):
+        call_command('migrate', database=PRIMARY, verbosity=0)
+        viewer, _ = User.objects.get_or_create(username='harness-viewer')
+        author, _ = User.objects.get_or_create(username='harness-author')
+        Contact.objects.get_or_create(user_from=viewer, user_to=author)
+        for index in range(3):
+            Image.objects.get_or_create(
+                slug=f'harness-{index}',
+                defaults={'user': author, 'title': f'harness {index}', 'url': f'https://example.com/{index}.jpg'},
+            )
+
+    def step(self, name, request, expect):
+        counters = {alias: QueryCounter() for alias in [PRIMARY] + settings.REPLICA_DATABASES}
+        with ExitStack() as stack:
+            for alias, counter in counters.items():
+                stack.enter_context(connections[alias].execute_wrapper(counter))
+            response = request()
+        primary = counters[PRIMARY].count
+        replica = sum(counter.count for alias, counter in counters.items() if alias != PRIMARY)
+        ok = {'replica': replica > 0, 'primary': primary > 0 and replica == 0}[expect]
+        self.results.append(ok)
+        self.stdout.write(f'{name:<42} {response.status_code:>6} {primary:>8} {replica:>8} '
+                          f'{expect:>8} {"ok" if ok else "FAIL":>5}')
+        return response
+
+    def handle(self, *args, **options):
+        if not settings.REPLICA_DATABASES:
+            raise CommandError('No replica configured: set BOOKMARKS_REPLICA_DBS (see --help)')
+        for alias in [PRIMARY] + settings.REPLICA_DATABASES:
+            if settings.DATABASES[alias]['ENGINE'] != 'django.db.backends.sqlite3':
+                raise CommandError(f'{alias} is not SQLite; the harness only drives SQLite files')
+        if options['setup']:
+            self.setup_data()
+        self.replicate()
+
+        viewer = User.objects.get(username='harness-viewer')
+        image = Image.objects.filter(slug__startswith='harness-').first()
+        if image is None:
+            raise CommandError('No harness data: run with --setup')
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(viewer)
+        # force_login wrote the session (and last_login): start unpinned
+        client.cookies.pop(STICKY_COOKIE, None)
+        ajax = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+
+        self.results = []
+        self.stdout.write(f'{"step":<42} {"status":>6} {"primary":>8} {"replica":>8} {"expected":>8} {"":>5}')
+        self.step('image list', lambda: client.get('/images/'), 'replica')
+        self.step('people list', lambda: client.get('/account/users/'), 'replica')
+        self.step('dashboard', lambda: client.get('/account/'), 'replica')
+        self.step('like an image (write)', lambda: client.post('/images/like/', {'id': image.id, 'action': 'like'}, **ajax), 'primary')
+        self.step('image list right after the like', lambda: client.get('/images/'), 'primary')
+        self.step('profile page right after the like', lambda: client.get(f'/account/users/{image.user.username}/'), 'primary')
+
+        stale = Image.objects.using(settings.REPLICA_DATABASES[0]).get(id=image.id).total_likes
+        fresh = Image.objects.using(PRIMARY).get(id=image.id).total_likes
+        self.stdout.write(f'  total_likes: primary={fresh} replica={stale} (replica lags until replicated)')
+
+        client.cookies.pop(STICKY_COOKIE, None)  # the pin expires after REPLICA_STICKY_SECONDS
+        self.step('image list once the pin expired', lambda: client.get('/images/'), 'replica')
+        self.step('unlike (write)', lambda: client.post('/images/like/', {'id': image.id, 'action': 'unlike'}, **ajax), 'primary')
+
+        failed = self.results.count(False)
+        if failed:
+            raise CommandError(f'{failed} step(s) did not route as expected')
+        self.stdout.write('All steps routed as expected')
@@ -0,0 +1,41 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks import seed
+
+
+class Command(BaseCommand):
+    """
+    Seed the database with the benchmark data set (see benchmarks/seed.py).
+
+        python manage.py seed_benchmark --users 2000 --images 10000 --actions 50000 --clear
+
+    Users are named bench-0 ... bench-N and share --password; bench-0 is
+    the most followed. Run ``benchmark`` against a server using the same
+    database afterwards.
+    """
+    help = 'Create users, a power-law follow graph, images with likes and actions for benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--images', type=int, default=5000)
+        parser.add_argument('--actions', type=int, default=20000)
+        parser.add_argument('--follows', type=int, default=20, help='average number of users followed')
+        parser.add_argument('--exponent', type=float, default=1.1, help='Zipf exponent of popularity')
+        parser.add_argument('--seed', type=int, default=0, help='random seed (same seed, same data)')
+        parser.add_argument('--password', default='bench-password')
+        parser.add_argument('--clear', action='store_true', help='delete a previous benchmark data set first')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            seed.clear()
+        elif User.objects.filter(username__startswith=seed.USERNAME_PREFIX).exists():
+            raise CommandError('A benchmark data set already exists; pass --clear to replace it')
+        if options['users'] < 2:
+            raise CommandError('--users must be at least 2')
+        counts = seed.seed(
+            options['users'], options['images'], options['actions'], options['password'],
+            seed=options['seed'], follows=options['follows'], exponent=options['exponent'],
+            stdout=self.stdout,
+        )
+        self.stdout.write('Seeded ' + ', '.join(f'{count} {name}' for name, count in counts.items()))
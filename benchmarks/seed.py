@@ -0,0 +1,171 @@
+"""
+Synthetic data set for the benchmark suite.
+
+Social graphs are heavily skewed: a few users have most of the followers,
+most images get almost no likes while a few get thousands. The generator
+reproduces that with Zipf-distributed popularity, so the benchmarks hit
+the same hot rows and long lists production does.
+
+Everything is bulk-inserted (signals don't run), and a fixed seed makes
+the data set identical across runs, hence comparable across commits.
+"""
+
+import random
+from io import BytesIO
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image as PILImage, ImageDraw
+
+from account.models import Contact, Profile
+from actions.models import Action
+from images.derivatives import THUMBNAIL_ERRORS, generate_derivatives
+from images import stats
+from images.models import Image
+
+USERNAME_PREFIX = 'bench-'
+BATCH_SIZE = 2000
+# Distinct source files shared by the images; their thumbnails are generated once
+SAMPLE_IMAGES = 8
+
+
+def zipf_weights(count, exponent):
+    """
+    Popularity weights of ``count`` items, item i getting 1 / (i + 1) ** exponent.
+    """
+    return [1 / (rank + 1) ** exponent for rank in range(count)]
+
+
+def sample_file(index):
+    """
+    A small JPEG with a recognizable pattern, stored once under images/bench/.
+    """
+    name = f'images/bench/sample-{index}.jpg'
+    if not default_storage.exists(name):
+        image = PILImage.new('RGB', (1200, 900), (40 + index * 25 % 200, 90, 160))
+        draw = ImageDraw.Draw(image)
+        for step in range(0, 1200, 60):
+            draw.line([(step, 0), (1200 - step, 900)], fill=(255, 255 - index * 20, step % 255), width=8)
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', quality=85)
+        name = default_storage.save(name, ContentFile(buffer.getvalue()))
+    return name
+
+
+def clear():
+    """
+    Delete everything a previous run created (cascading to images, likes,
+    contacts and actions of the benchmark users).
+    """
+    User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+
+
+def seed(users, images, actions, password, seed=0, follows=20, exponent=1.1, stdout=None):
+    """
+    Create the benchmark data set.
+
+    Args:
+        users (int): Number of users, named bench-0 ... bench-<users - 1>.
+        images (int): Number of images, owners and likes following Zipf laws.
+        actions (int): Number of activity stream actions.
+        password (str): Password of every benchmark user.
+        seed (int): Random seed; the same seed gives the same data set.
+        follows (int): Average number of users each user follows.
+        exponent (float): Zipf exponent of user and image popularity.
+
+    Returns:
+        dict with the number of rows created per model.
+    """
+    rng = random.Random(seed)
+    log = stdout.write if stdout else (lambda message: None)
+    counts = {}
+
+    with transaction.atomic():
+        # Users and profiles. Hashing is slow on purpose: hash once, share it.
+        password_hash = make_password(password)
+        User.objects.bulk_create(
+            [User(username=f'{USERNAME_PREFIX}{index}', email=f'{USERNAME_PREFIX}{index}@example.com',
+                  password=password_hash) for index in range(users)],
+            batch_size=BATCH_SIZE,
+        )
+        user_ids = list(User.objects.filter(username__startswith=USERNAME_PREFIX)
+                        .order_by('id').values_list('id', flat=True))
+        Profile.objects.bulk_create([Profile(user_id=user_id) for user_id in user_ids], batch_size=BATCH_SIZE)
+        counts['users'] = len(user_ids)
+        log(f'{len(user_ids)} users')
+
+        # Follow graph: out-degrees are exponential around ``follows``,
+        # followees are picked by Zipf popularity (bench-0 is the celebrity)
+        popularity = zipf_weights(len(user_ids), exponent)
+        contacts = []
+        for user_id in user_ids:
+            degree = min(len(user_ids) - 1, int(rng.expovariate(1 / follows)) + 1)
+            followees = set(rng.choices(user_ids, weights=popularity, k=degree))
+            followees.discard(user_id)
+            contacts.extend(Contact(user_from_id=user_id, user_to_id=followee) for followee in followees)
+        Contact.objects.bulk_create(contacts, batch_size=BATCH_SIZE)
+        counts['contacts'] = len(contacts)
+        log(f'{len(contacts)} contacts')
+
+        # Images share a few real files, whose derivatives are rendered once
+        files = [sample_file(index) for index in range(SAMPLE_IMAGES)]
+        derivatives = {}
+        for name in files:
+            field_file = Image(image=name).image
+            try:
+                derivatives[name] = generate_derivatives(field_file)
+            except THUMBNAIL_ERRORS:
+                derivatives[name] = {'source': name, 'aliases': {}}
+        owners = rng.choices(user_ids, weights=popularity, k=images)
+        new_images = []
+        for index, owner in enumerate(owners):
+            name = files[index % len(files)]
+            new_images.append(Image(
+                user_id=owner, title=f'Benchmark image {index}', slug=f'benchmark-image-{index}',
+                url=f'https://example.com/bench/{index}.jpg', image=name, image_derivatives=derivatives[name],
+            ))
+        Image.objects.bulk_create(new_images, batch_size=BATCH_SIZE)
+        image_ids = list(Image.objects.filter(user_id__in=user_ids).order_by('id').values_list('id', flat=True))
+        counts['images'] = len(image_ids)
+        log(f'{len(image_ids)} images')
+
+        # Likes: image i gets about len(users) / (i + 1) ** exponent of them
+        Like = Image.users_like.through
+        likes = []
+        totals = {}
+        image_popularity = zipf_weights(len(image_ids), exponent)
+        for rank, image_id in enumerate(rng.sample(image_ids, len(image_ids))):
+            count = int(len(user_ids) * image_popularity[rank] * 0.5)
+            likers = rng.sample(user_ids, count)
+            totals[image_id] = len(likers)
+            likes.extend(Like(image_id=image_id, user_id=liker) for liker in likers)
+        Like.objects.bulk_create(likes, batch_size=BATCH_SIZE)
+        liked = [Image(id=image_id, total_likes=total) for image_id, total in totals.items() if total]
+        Image.objects.bulk_update(liked, ['total_likes'], batch_size=BATCH_SIZE)
+        counts['likes'] = len(likes)
+        log(f'{len(likes)} likes')
+
+        # Actions: bookmarks, likes and follows by active (popular) users
+        image_ct = ContentType.objects.get_for_model(Image)
+        user_ct = ContentType.objects.get_for_model(User)
+        kinds = [('bookmarked image', image_ct, image_ids), ('likes', image_ct, image_ids),
+                 ('is following', user_ct, user_ids)]
+        kinds = [kind for kind in kinds if kind[2]]
+        actors = rng.choices(user_ids, weights=popularity, k=actions)
+        new_actions = []
+        for actor in actors:
+            verb, content_type, targets = rng.choice(kinds)
+            new_actions.append(Action(user_id=actor, verb=verb, target_ct=content_type,
+                                      target_id=rng.choice(targets)))
+        Action.objects.bulk_create(new_actions, batch_size=BATCH_SIZE)
+        counts['actions'] = len(new_actions)
+        log(f'{len(new_actions)} actions')
+
+        # bulk inserts skipped the signals creating the statistics rows
+        stats.rebuild()
+
+    return counts
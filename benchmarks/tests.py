@@ -0,0 +1,61 @@
+import tempfile
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.db.models import F, Sum
+from django.test import TestCase, override_settings
+
+from account.models import Contact, Profile
+from actions.models import Action
+from bookmarks.testing import mock_redis, patch
+from images.models import Image, ImageStats
+
+from . import seed
+
+
+class SeedTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = override_settings(MEDIA_ROOT=media.name, MEDIA_CACHE_MAX_BYTES=0)
+        override.enable()
+        self.addCleanup(override.disable)
+        mock_redis(self)
+        # Thumbnails are another module's business
+        patch(self, seed, 'SAMPLE_IMAGES', 2)
+        patch(self, seed, 'generate_derivatives', lambda file: {'source': file.name, 'aliases': {}})
+
+    def run_seed(self):
+        return seed.seed(users=20, images=30, actions=50, password='secret', follows=3, stdout=StringIO())
+
+    def snapshot(self):
+        return (sorted(Contact.objects.values_list('user_from__username', 'user_to__username')),
+                sorted(Image.objects.values_list('title', 'user__username', 'total_likes')),
+                sorted(Action.objects.values_list('user__username', 'verb')))
+
+    def test_tiny_run(self):
+        counts = self.run_seed()
+        self.assertEqual({name: counts[name] for name in ('users', 'images', 'actions')},
+                         {'users': 20, 'images': 30, 'actions': 50})
+        benchmark_users = User.objects.filter(username__startswith=seed.USERNAME_PREFIX)
+        self.assertEqual(benchmark_users.count(), 20)
+        self.assertEqual(Profile.objects.count(), 20)
+        self.assertEqual(Contact.objects.count(), counts['contacts'])
+        self.assertFalse(Contact.objects.filter(user_from=F('user_to')).exists())
+        self.assertEqual(Image.objects.count(), 30)
+        self.assertEqual(Image.users_like.through.objects.count(), counts['likes'])
+        self.assertEqual(Image.objects.aggregate(total=Sum('total_likes'))['total'], counts['likes'])
+        self.assertEqual(Action.objects.count(), 50)
+        # Statistics rows skipped by bulk_create are rebuilt
+        self.assertEqual(ImageStats.objects.count(), 30)
+        self.assertEqual(ImageStats.objects.aggregate(likes=Sum('likes'))['likes'], counts['likes'])
+        self.assertEqual(len(set(Image.objects.values_list('image', flat=True))), 2)
+
+    def test_same_seed_same_data_set(self):
+        self.run_seed()
+        first = self.snapshot()
+        seed.clear()
+        self.assertFalse(User.objects.exists())
+        self.run_seed()
+        self.assertEqual(self.snapshot(), first)
@@ -0,0 +1,52 @@
+"""
+Admin base classes shared by the apps.
+"""
+
+from django.contrib import admin
+from django.core import checks
+from django.db import transaction
+from django.utils import timezone
+
+
+class BackgroundDeletionAdmin(admin.ModelAdmin):
+    """
+    Admin of a model whose deletions are purged in the background.
+
+    Deleting sets the rows' ``deleted`` timestamp (the model's default
+    manager hides them at once) and, once the transaction commits, queues
+    ``purge_task`` with the id of each row. Models needing more than that
+    override ``soft_delete(queryset)`` (see images.deletion, account.deletion).
+    """
+    purge_task = None
+
+    def check(self, **kwargs):
+        errors = super().check(**kwargs)
+        if self.purge_task is None and type(self).soft_delete is BackgroundDeletionAdmin.soft_delete:
+            errors.append(checks.Error(
+                f'{type(self).__name__} must set purge_task or override soft_delete().',
+                obj=type(self), id='bookmarks.E001',
+            ))
+        return errors
+
+    def soft_delete(self, queryset):
+        pks = list(queryset.filter(deleted=None).values_list('pk', flat=True))
+        self.model._base_manager.filter(pk__in=pks).update(deleted=timezone.now())
+        model_name = self.opts.model_name
+
+        def purge():
+            for pk in pks:
+                self.purge_task.enqueue(args=[pk], dedup_key=f'purge_{model_name}:{pk}')
+        transaction.on_commit(purge)
+        return len(pks)
+
+    def delete_model(self, request, obj):
+        self.soft_delete(self.model._default_manager.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        self.soft_delete(queryset)
+
+    def get_deleted_objects(self, objs, request):
+        # Nothing cascades now: don't collect (possibly many thousand) dependents
+        objs = list(objs)
+        perms_needed = set() if self.has_delete_permission(request) else {self.opts.verbose_name}
+        return [str(obj) for obj in objs], {self.opts.verbose_name_plural: len(objs)}, perms_needed, []
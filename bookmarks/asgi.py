@@ -13,4 +13,7 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bookmarks.settings')
 
+# Route the AJAX endpoints (like, follow, infinite scroll) to their async views
+os.environ.setdefault('BOOKMARKS_ASYNC_VIEWS', '1')
+
 application = get_asgi_application()
@@ -0,0 +1,213 @@
+"""
+Classification of automated requests (crawlers, link previews, prefetches).
+
+BotFilterMiddleware tags every request before the session is loaded:
+
+- ``request.bot`` is None for people, else the reason the request looks
+  automated: ``'user-agent'`` (a known crawler/tool or no user agent at
+  all), ``'prefetch'`` (HEAD, or a browser prefetch/prerender that nobody
+  may ever look at) or ``'rate'`` (the client address sent more than
+  BOT_RATE_LIMIT page requests in the last BOT_RATE_WINDOW seconds; see
+  ``client_address`` for deployments behind a reverse proxy).
+  Media and static files and the pages' own AJAX calls (likes, infinite
+  scroll) are not counted: a person browsing a grid quickly sends dozens.
+
+The checks only use the request headers and a sliding-window counter per
+address in the BOT_CACHE cache (local memory by default), never Redis or
+the database.
+
+Tagged requests don't touch the engagement counters (see
+images.stats.record_view), so crawlers following links to image pages no
+longer inflate views and rankings. Crawlers (tagged by user agent) are
+also answered from the cache for BOT_CACHE_SECONDS when they have no
+session and the page may be cached publicly, so repeated crawls don't
+render pages either. Prefetches and rate-tagged clients may be people
+(a prerendering browser, an office behind one address) who need their
+own CSRF cookie and form tokens, so they always get a fresh page.
+"""
+
+import hashlib
+import re
+import time
+from functools import lru_cache
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.urls import Resolver404, resolve
+
+from .instrumentation import registry
+
+registry.describe('bookmarks_bot_requests_total', 'counter', 'Requests tagged as automated, by reason.')
+registry.describe('bookmarks_bot_cache_hits_total', 'counter', 'Automated requests answered from the cache.')
+
+# Reasons whose requests are answered from the bot cache
+CACHED_REASONS = {'user-agent'}
+
+# Prefetch/prerender markers sent by browsers and link preview fetchers
+PREFETCH_HEADERS = {
+    'Purpose': ('prefetch', 'preview'),
+    'Sec-Purpose': ('prefetch', 'prerender'),
+    'X-Moz': ('prefetch',),
+    'X-Purpose': ('preview',),
+}
+
+
+@lru_cache(maxsize=1)
+def user_agent_pattern(patterns):
+    return re.compile('|'.join(patterns), re.IGNORECASE)
+
+
+def is_prefetch(request):
+    if request.method == 'HEAD':
+        return True
+    return any(any(marker in request.headers.get(header, '').lower() for marker in markers)
+               for header, markers in PREFETCH_HEADERS.items())
+
+
+def request_rate(address, now=None):
+    """
+    Requests from ``address`` over the last BOT_RATE_WINDOW seconds,
+    counting this one.
+
+    Sliding window approximation: the count of the current fixed window
+    plus the previous window's, weighted by how much of it still overlaps.
+    """
+    window = settings.BOT_RATE_WINDOW
+    now = now or time.time()
+    current = int(now // window)
+    cache = caches[settings.BOT_CACHE]
+    key = f'bot_rate:{address}:{current}'
+    # add() is a no-op if another request created the counter first
+    cache.add(key, 0, timeout=2 * window)
+    try:
+        count = cache.incr(key)
+    except ValueError:
+        # Expired (or evicted) between the two calls: start it again
+        cache.add(key, 1, timeout=2 * window)
+        count = 1
+    previous = cache.get(f'bot_rate:{address}:{current - 1}', 0)
+    return previous * (1 - (now % window) / window) + count
+
+
+def client_address(request):
+    """
+    Address of the client: REMOTE_ADDR, or behind TRUSTED_PROXY_COUNT
+    reverse proxies the address the outermost one saw, from
+    X-Forwarded-For (entries further left are up to the client to forge).
+    """
+    proxies = settings.TRUSTED_PROXY_COUNT
+    forwarded = [entry.strip() for entry in request.headers.get('X-Forwarded-For', '').split(',') if entry.strip()]
+    if not proxies or not forwarded:
+        return request.META.get('REMOTE_ADDR', '')
+    return forwarded[-min(proxies, len(forwarded))]
+
+
+def is_subresource(request):
+    """
+    Media/static files and AJAX calls (``X-Requested-With``, or a fetch
+    per ``Sec-Fetch-Dest``), which browsers send on their own for a page.
+    """
+    if request.path.startswith((f'/{settings.MEDIA_URL.lstrip("/")}', f'/{settings.STATIC_URL.lstrip("/")}')):
+        return True
+    return (request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+            or request.headers.get('Sec-Fetch-Dest') == 'empty')
+
+
+def classify(request):
+    """
+    Return why ``request`` looks automated, or None.
+    """
+    user_agent = request.headers.get('User-Agent', '')
+    if not user_agent or user_agent_pattern(tuple(settings.BOT_USER_AGENTS)).search(user_agent):
+        return 'user-agent'
+    if is_prefetch(request):
+        return 'prefetch'
+    address = client_address(request)
+    if (address not in settings.BOT_RATE_EXEMPT_IPS and not is_subresource(request)
+            and request_rate(address) > settings.BOT_RATE_LIMIT):
+        return 'rate'
+    return None
+
+
+def is_bot(request):
+    return getattr(request, 'bot', None) is not None
+
+
+# -------------------------------
+# Middleware
+# -------------------------------
+
+def cache_key(request):
+    # Scheme and host too: one process may serve several sites
+    return 'bot_page:' + hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+
+
+def is_shareable(request):
+    """
+    Only anonymous crawler reads may be served from (and stored in) the bot cache.
+    """
+    return (request.bot in CACHED_REASONS and request.method in ('GET', 'HEAD') and settings.BOT_CACHE_SECONDS
+            and settings.SESSION_COOKIE_NAME not in request.COOKIES)
+
+
+def is_cacheable_response(response):
+    # Same rules as Django's cache middleware: nothing streamed, private or setting cookies
+    return (response.status_code == 200 and not response.streaming and not response.cookies
+            and 'private' not in response.get('Cache-Control', ''))
+
+
+class BotFilterMiddleware:
+    """
+    Tag automated requests (``request.bot``) and answer them from the cache.
+
+    Goes right after SecurityMiddleware (so HTTPS redirects and security
+    headers apply to cache hits too), before the session and
+    authentication middleware, so cache hits cost no database query.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.start(request)
+        if response is None:
+            response = self.finish(request, self.get_response(request))
+        return response
+
+    async def __acall__(self, request):
+        response = self.start(request)
+        if response is None:
+            response = self.finish(request, await self.get_response(request))
+        return response
+
+    def start(self, request):
+        request.bot = classify(request)
+        if request.bot is None:
+            return None
+        registry.inc('bookmarks_bot_requests_total', {'reason': request.bot})
+        if not is_shareable(request):
+            return None
+        response = caches[settings.BOT_CACHE].get(cache_key(request))
+        if response is not None:
+            try:
+                # Label the hit in the request metrics like the view would be
+                request.resolver_match = resolve(request.path_info)
+            except Resolver404:
+                pass
+            registry.inc('bookmarks_bot_cache_hits_total', {})
+        return response
+
+    def finish(self, request, response):
+        if request.bot is not None and is_shareable(request):
+            # Crawlers never post forms; a CSRF cookie would make every page uncacheable
+            response.cookies.pop(settings.CSRF_COOKIE_NAME, None)
+            if is_cacheable_response(response):
+                caches[settings.BOT_CACHE].set(cache_key(request), response, settings.BOT_CACHE_SECONDS)
+        return response
@@ -0,0 +1,110 @@
+"""
+Conditional GET support for the HTML pages.
+
+Validators are derived from cheap version stamps (``updated`` timestamps,
+counters, ids) fetched with a single query, so a revalidation is answered
+with 304 before the page's own queries and template rendering run.
+
+Pages show per-user state (like/follow buttons, the header), so the ETag
+includes the viewer and authenticated responses are ``private``.
+"""
+
+import hashlib
+from collections import namedtuple
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .storage import url_epoch
+
+Validators = namedtuple('Validators', ['etag', 'last_modified'])
+
+
+def page_validators(request, version, last_modified=None):
+    """
+    Build the validators of a page for the requesting user.
+
+    Args:
+        version: Any value that changes whenever the page content does.
+        last_modified (datetime): Optional modification time of the content.
+
+    Returns:
+        Validators with a quoted ETag and a Unix timestamp (or None).
+    """
+    viewer = request.user.pk if request.user.is_authenticated else 'anonymous'
+    # Signed media URLs in the page change every signing period
+    digest = hashlib.md5(f'{version}|{viewer}|{url_epoch()}'.encode()).hexdigest()
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return Validators(quote_etag(digest), timestamp)
+
+
+def is_cacheable(request):
+    """
+    Only plain GET/HEAD requests are revalidated; pages with pending flash
+    messages must be rendered so the messages are shown and consumed.
+    """
+    return request.method in ('GET', 'HEAD') and not len(get_messages(request))
+
+
+def not_modified(request, validators):
+    """
+    Return a 304 response if the client's cached copy is current, else None.
+    """
+    if not is_cacheable(request):
+        return None
+    response = get_conditional_response(
+        request, etag=validators.etag, last_modified=validators.last_modified
+    )
+    if response is not None:
+        set_validators(request, response, validators)
+    return response
+
+
+def set_validators(request, response, validators):
+    """
+    Attach ETag, Last-Modified and the Cache-Control policy to a response.
+
+    Anonymous pages may be cached by shared caches for
+    settings.CONDITIONAL_ANONYMOUS_MAX_AGE seconds; authenticated pages are
+    private and always revalidated.
+    """
+    if response.status_code not in (200, 304) or not is_cacheable(request):
+        return response
+    response['ETag'] = validators.etag
+    if validators.last_modified is not None:
+        response['Last-Modified'] = http_date(validators.last_modified)
+    if request.user.is_authenticated:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, max_age=settings.CONDITIONAL_ANONYMOUS_MAX_AGE)
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+
+def conditional_page(stamp_func):
+    """
+    Decorator answering revalidations of a page from its version stamp.
+
+    Args:
+        stamp_func: Called with the view arguments; returns a tuple
+            (version, last_modified), or None when the object doesn't exist
+            (the view then runs and produces its usual 404).
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if not is_cacheable(request):
+                return view_func(request, *args, **kwargs)
+            stamp = stamp_func(request, *args, **kwargs)
+            if stamp is None:
+                return view_func(request, *args, **kwargs)
+            validators = page_validators(request, *stamp)
+            response = not_modified(request, validators)
+            if response is None:
+                response = set_validators(request, view_func(request, *args, **kwargs), validators)
+            return response
+        return _wrapped_view
+    return decorator
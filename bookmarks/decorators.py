@@ -0,0 +1,53 @@
+"""
+View decorators shared by the project apps.
+
+Django 4.2's ``login_required`` and ``require_http_methods`` only wrap
+synchronous views, so the async AJAX endpoints use the equivalents below.
+"""
+
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.http import HttpResponseNotAllowed
+
+
+# -------------------------------
+# Async view decorators
+# -------------------------------
+
+def async_require_http_methods(request_method_list):
+    """
+    Async counterpart of ``django.views.decorators.http.require_http_methods``.
+
+    Args:
+        request_method_list (list): Allowed HTTP methods, e.g. ['POST'].
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        async def _wrapped_view(request, *args, **kwargs):
+            if request.method not in request_method_list:
+                return HttpResponseNotAllowed(request_method_list)
+            return await view_func(request, *args, **kwargs)
+        return _wrapped_view
+    return decorator
+
+
+async_require_POST = async_require_http_methods(['POST'])
+
+
+def async_login_required(view_func):
+    """
+    Async counterpart of ``django.contrib.auth.decorators.login_required``.
+
+    ``request.user`` is a lazy object that hits the session store and the
+    database on first access, so it is resolved in a worker thread once;
+    afterwards the view can read it freely from the event loop.
+    """
+    @wraps(view_func)
+    async def _wrapped_view(request, *args, **kwargs):
+        is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+        if not is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view_func(request, *args, **kwargs)
+    return _wrapped_view
@@ -0,0 +1,425 @@
+"""
+Lightweight request instrumentation for production.
+
+For every request InstrumentationMiddleware records:
+
+- database queries and the time spent executing them (every alias)
+- Redis commands and their time (clients built from ``InstrumentedRedis``)
+- template rendering time (the ``DjangoTemplates`` backend below)
+- thumbnail time (``timed('thumbnail')`` around easy_thumbnails calls)
+
+The figures are sent back in a ``Server-Timing`` header, which browsers
+show in the network panel, and aggregated per view in an in-process
+registry served in the Prometheus text format by ``metrics``. Each worker
+process keeps its own registry; scrape the workers individually.
+
+Durations are inclusive: thumbnails generated by a template tag also
+count as template time, and so do the queries the template runs.
+
+settings.SERVER_TIMING (the default with DEBUG) adds the header; it tells
+every client how the request was served, so it's off in production.
+
+settings.QUERY_BUDGETS caps the queries of a view (by URL name); going
+over logs a warning, or raises QueryBudgetExceeded when
+settings.QUERY_BUDGET_ACTION is 'raise'. The check runs once the view
+has returned, its writes committed, so only the test runner raises (see
+bookmarks.testing): an N+1 regression fails the tests, not a request.
+
+``metrics`` only answers requests bearing METRICS_TOKEN, or from the
+addresses listed in METRICS_ALLOWED_IPS (none by default).
+"""
+
+import hmac
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import redis
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+from django.template.backends.django import DjangoTemplates as BaseDjangoTemplates
+
+try:
+    from django.template.backends.jinja2 import Jinja2 as BaseJinja2
+except ImportError:
+    BaseJinja2 = None
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    A view ran more queries than its settings.QUERY_BUDGETS entry allows.
+    """
+
+
+class RequestMetrics:
+    """
+    Counters of one request; shared (not copied) by the threads that
+    sync_to_async runs the request's sync code in.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.redis_calls = 0
+        self.redis_time = 0.0
+        self.template_time = 0.0
+        self.thumbnail_time = 0.0
+        self.thumbnails = 0
+        # kinds being timed; nested blocks (a template rendered by a tag) count once
+        self.timing = set()
+
+    @property
+    def total_time(self):
+        return time.perf_counter() - self.started
+
+
+_metrics = ContextVar('request_metrics', default=None)
+
+
+def current_metrics():
+    """
+    The RequestMetrics of the request being handled, or None.
+    """
+    return _metrics.get()
+
+
+@contextmanager
+def uncounted():
+    """
+    Leave the work of the block out of the current request's metrics and
+    query budget: tasks run eagerly (see tasks.queue), whose queries a
+    worker runs in production.
+    """
+    token = _metrics.set(None)
+    try:
+        yield
+    finally:
+        _metrics.reset(token)
+
+
+@contextmanager
+def timed(kind):
+    """
+    Add the time spent in the block to the current request's ``kind``
+    ('thumbnail' or 'template') counters.
+    """
+    metrics = _metrics.get()
+    if metrics is None or kind in metrics.timing:
+        yield
+        return
+    metrics.timing.add(kind)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.timing.discard(kind)
+        elapsed = time.perf_counter() - start
+        if kind == 'thumbnail':
+            metrics.thumbnail_time += elapsed
+            metrics.thumbnails += 1
+        else:
+            metrics.template_time += elapsed
+
+
+# -------------------------------
+# Database, Redis and template hooks
+# -------------------------------
+
+def _count_query(execute, sql, params, many, context):
+    metrics = _metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - start
+        metrics.db_queries += 1
+
+
+def install_query_counter(sender, connection, **kwargs):
+    """
+    Permanently wrap the queries of every new database connection.
+    """
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _count_query)
+
+
+connection_created.connect(install_query_counter, dispatch_uid='bookmarks.instrumentation')
+
+
+class InstrumentedRedis(redis.Redis):
+    """
+    ``redis.Redis`` counting its commands in the current request's metrics.
+    """
+
+    def execute_command(self, *args, **options):
+        metrics = _metrics.get()
+        if metrics is None:
+            return super().execute_command(*args, **options)
+        start = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            metrics.redis_time += time.perf_counter() - start
+            metrics.redis_calls += 1
+
+
+class TimedTemplate:
+    """
+    Wrapper of a backend template timing its ``render``.
+    """
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        with timed('template'):
+            return self.template.render(context, request)
+
+
+class DjangoTemplates(BaseDjangoTemplates):
+    """
+    The Django template backend, with rendering time recorded.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+if BaseJinja2 is not None:
+    class Jinja2(BaseJinja2):
+        """
+        The Jinja2 template backend (fast partials), with rendering time recorded.
+        """
+
+        def from_string(self, template_code):
+            return TimedTemplate(super().from_string(template_code))
+
+        def get_template(self, template_name):
+            return TimedTemplate(super().get_template(template_name))
+
+
+# -------------------------------
+# Aggregation and export
+# -------------------------------
+
+class Registry:
+    """
+    Process-wide counters and histograms, rendered in the Prometheus text format.
+
+    Gauges come from collectors: functions called at each scrape that
+    yield (name, labels, value) samples, e.g. read from the database.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.collectors = []
+        self.help = {}
+
+    def describe(self, name, kind, text):
+        self.help[name] = (kind, text)
+
+    def collector(self, func):
+        self.collectors.append(func)
+        return func
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {'buckets': buckets, 'counts': [0] * len(buckets),
+                                                    'sum': 0, 'count': 0}
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram['counts'][index] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    @staticmethod
+    def format_labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ''
+        escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+        return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+    def render(self):
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {key: dict(value, counts=list(value['counts'])) for key, value in self.histograms.items()}
+        gauges = [(name, tuple(sorted(labels.items())), value)
+                  for collect in self.collectors for name, labels, value in collect()]
+        lines = []
+        for name, (kind, text) in sorted(self.help.items()):
+            lines.append(f'# HELP {name} {text}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'counter':
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f'{name}{self.format_labels(labels)} {value:g}')
+            elif kind == 'gauge':
+                for metric, labels, value in sorted(gauges):
+                    if metric == name:
+                        lines.append(f'{name}{self.format_labels(labels)} {value:g}')
+            else:
+                for (metric, labels), histogram in sorted(histograms.items()):
+                    if metric != name:
+                        continue
+                    for bound, count in zip(histogram['buckets'], histogram['counts']):
+                        lines.append(f'{name}_bucket{self.format_labels(labels, [("le", f"{bound:g}")])} {count}')
+                    lines.append(f'{name}_bucket{self.format_labels(labels, [("le", "+Inf")])} {histogram["count"]}')
+                    lines.append(f'{name}_sum{self.format_labels(labels)} {histogram["sum"]:g}')
+                    lines.append(f'{name}_count{self.format_labels(labels)} {histogram["count"]}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+registry.describe('bookmarks_requests_total', 'counter', 'Requests handled, by view, method and status.')
+registry.describe('bookmarks_request_duration_seconds', 'histogram', 'Time to build the response, by view.')
+registry.describe('bookmarks_db_queries', 'histogram', 'Database queries per request, by view.')
+registry.describe('bookmarks_db_seconds_total', 'counter', 'Time spent executing database queries, by view.')
+registry.describe('bookmarks_redis_calls_total', 'counter', 'Redis commands, by view.')
+registry.describe('bookmarks_redis_seconds_total', 'counter', 'Time spent in Redis commands, by view.')
+registry.describe('bookmarks_template_seconds_total', 'counter', 'Time spent rendering templates, by view.')
+registry.describe('bookmarks_thumbnail_seconds_total', 'counter', 'Time spent getting thumbnails, by view.')
+registry.describe('bookmarks_query_budget_exceeded_total', 'counter', 'Requests over their query budget, by view.')
+
+
+def view_name(request):
+    """
+    Label of the view handling ``request``; unmatched URLs share one label
+    so scanners can't blow up the number of series.
+    """
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else '<unresolved>'
+
+
+def record(request, response, metrics):
+    view = view_name(request)
+    labels = {'view': view}
+    registry.inc('bookmarks_requests_total', dict(labels, method=request.method, status=response.status_code))
+    registry.observe('bookmarks_request_duration_seconds', labels, metrics.total_time, DURATION_BUCKETS)
+    registry.observe('bookmarks_db_queries', labels, metrics.db_queries, QUERY_BUCKETS)
+    registry.inc('bookmarks_db_seconds_total', labels, metrics.db_time)
+    if metrics.redis_calls:
+        registry.inc('bookmarks_redis_calls_total', labels, metrics.redis_calls)
+        registry.inc('bookmarks_redis_seconds_total', labels, metrics.redis_time)
+    if metrics.template_time:
+        registry.inc('bookmarks_template_seconds_total', labels, metrics.template_time)
+    if metrics.thumbnails:
+        registry.inc('bookmarks_thumbnail_seconds_total', labels, metrics.thumbnail_time)
+    check_budget(view, metrics)
+
+
+def check_budget(view, metrics):
+    budget = settings.QUERY_BUDGETS.get(view)
+    if budget is None or metrics.db_queries <= budget:
+        return
+    registry.inc('bookmarks_query_budget_exceeded_total', {'view': view})
+    message = f'{view} ran {metrics.db_queries} queries, over its budget of {budget}'
+    if settings.QUERY_BUDGET_ACTION == 'raise':
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+def server_timing(metrics):
+    """
+    The ``Server-Timing`` header value of a request (durations in ms).
+    """
+    entries = [f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.db_queries} queries"']
+    if metrics.redis_calls:
+        entries.append(f'redis;dur={metrics.redis_time * 1000:.1f};desc="{metrics.redis_calls} calls"')
+    if metrics.template_time:
+        entries.append(f'tpl;dur={metrics.template_time * 1000:.1f}')
+    if metrics.thumbnails:
+        entries.append(f'thumb;dur={metrics.thumbnail_time * 1000:.1f};desc="{metrics.thumbnails} thumbnails"')
+    entries.append(f'total;dur={metrics.total_time * 1000:.1f}')
+    return ', '.join(entries)
+
+
+class InstrumentationMiddleware:
+    """
+    Measure each request, add ``Server-Timing`` and feed the metrics registry.
+
+    Goes first in MIDDLEWARE so the session and authentication queries
+    are counted too. Streaming responses are measured up to the moment
+    streaming starts.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = server_timing(metrics)
+        record(request, response, metrics)
+        return response
+
+
+def metrics(request):
+    """
+    Prometheus scrape endpoint, open to requests bearing
+    ``Authorization: Bearer <METRICS_TOKEN>`` or from METRICS_ALLOWED_IPS.
+    """
+    token = settings.METRICS_TOKEN
+    authorized = bool(token) and hmac.compare_digest(request.headers.get('Authorization', '').encode(),
+                                                     f'Bearer {token}'.encode())
+    if not (authorized or request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS):
+        raise PermissionDenied
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,50 @@
+"""
+Jinja2 environment of the fast template partials (see bookmarks/partials.py).
+
+The partials under ``<app>/jinja2/`` mirror their Django counterparts
+under ``<app>/templates/`` and must render the same HTML, byte for byte
+(``manage.py bench_templates`` checks it), so the environment reproduces
+what Django templates do implicitly:
+
+- escaping: every ``{{ }}`` value goes through Django's
+  ``conditional_escape`` (``&#x27;`` for quotes, SafeString left alone)
+  rather than markupsafe's
+- helpers: ``picture()`` is the ``{% picture %}`` tag, ``url()`` the
+  ``{% url %}`` tag, ``absolute_url(obj)`` renders ``obj.get_absolute_url``
+  ('' for None, as Django renders a failed lookup) and ``static()``; the
+  ``timesince`` and ``pluralize`` filters are Django's
+
+Method calls are explicit, as usual in Jinja2: ``user.get_full_name()``.
+"""
+
+from django.template.defaultfilters import pluralize, timesince_filter
+from django.templatetags.static import static
+from django.urls import reverse
+from django.utils.html import conditional_escape
+from jinja2 import Environment
+
+from images.templatetags.responsive import picture
+
+
+def url(name, *args, **kwargs):
+    return reverse(name, args=args, kwargs=kwargs)
+
+
+def absolute_url(obj):
+    get_absolute_url = getattr(obj, 'get_absolute_url', None)
+    return get_absolute_url() if get_absolute_url is not None else ''
+
+
+def finalize(value):
+    # Escaped the Django way here; markupsafe then keeps the SafeString as is
+    return conditional_escape(value)
+
+
+def environment(**options):
+    options['finalize'] = finalize
+    # Django templates keep the final newline too
+    options['keep_trailing_newline'] = True
+    env = Environment(**options)
+    env.globals.update(picture=picture, url=url, absolute_url=absolute_url, static=static)
+    env.filters.update(timesince=timesince_filter, pluralize=pluralize)
+    return env
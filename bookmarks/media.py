@@ -0,0 +1,208 @@
+"""
+Serving of user-uploaded media (images, profile photos and thumbnails).
+
+Three modes, chosen with settings.MEDIA_SERVE_MODE:
+
+- 'python': Django streams the file with FileResponse. WSGI servers that
+  implement ``wsgi.file_wrapper`` with sendfile (gunicorn, uWSGI) send it
+  zero-copy, including byte ranges.
+- 'x-accel-redirect': the response only carries an ``X-Accel-Redirect``
+  header and nginx serves the file from an internal location.
+- 'x-sendfile': same with the ``X-Sendfile`` header (Apache, lighttpd).
+
+In every mode Django sets the caching headers, so thumbnails (whose names
+never change once written) get long-lived immutable caching.
+
+This view only serves the 'local' storage backend (see bookmarks/storage.py);
+remote object stores serve media from their own URLs.
+"""
+
+import io
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+from .storage import verify_signed_path
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile:
+    """
+    File wrapper exposing only the bytes [start, end] of an open file.
+
+    ``read`` never goes past the range, so WSGI servers that iterate the
+    file stop at the end of the range; ``fileno`` stays available so servers
+    that use sendfile (offset from the descriptor position, length from
+    Content-Length) still send it zero-copy.
+    """
+
+    def __init__(self, file, start, end):
+        self.file = file
+        self.start = start
+        self.end = end
+        self.file.seek(start)
+
+    def read(self, size=-1):
+        remaining = self.end + 1 - self.file.tell()
+        if remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        return self.file.read(size)
+
+    def tell(self):
+        return self.file.tell() - self.start
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_END:
+            position = self.end + 1 + offset
+        elif whence == io.SEEK_CUR:
+            position = self.file.tell() + offset
+        else:
+            position = self.start + offset
+        return self.file.seek(min(max(position, self.start), self.end + 1)) - self.start
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+# -------------------------------
+# Header helpers
+# -------------------------------
+
+def is_immutable(path):
+    """
+    Whether the file at ``path`` never changes once written.
+
+    Thumbnail names encode the source name and options, and uploads never
+    overwrite an existing name, so a thumbnail URL always maps to the same
+    bytes.
+    """
+    return any(re.search(pattern, path) for pattern in settings.MEDIA_IMMUTABLE_PATTERNS)
+
+
+def file_etag(stat):
+    return f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+
+
+def set_cache_headers(response, path, stat):
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['ETag'] = file_etag(stat)
+    if is_immutable(path):
+        patch_cache_control(response, public=True, max_age=settings.MEDIA_IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=settings.MEDIA_MAX_AGE)
+    return response
+
+
+def parse_range(header, size):
+    """
+    Parse a single-range ``Range`` header.
+
+    Returns:
+        (start, end) inclusive, None to ignore the header (missing, malformed
+        or multiple ranges: the full file is sent), or False when the range
+        can't be satisfied.
+    """
+    match = RANGE_RE.match(header.replace(' ', '')) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def range_applies(request, stat):
+    """
+    Honour If-Range: only send a partial response if the client's copy is current.
+    """
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == file_etag(stat)
+    date = parse_http_date_safe(if_range)
+    return date is not None and int(stat.st_mtime) <= date
+
+
+# -------------------------------
+# View
+# -------------------------------
+
+@require_safe
+def serve_media(request, path):
+    """
+    Serve a file from MEDIA_ROOT with caching, conditional and range support.
+
+    Only used with the 'local' storage backend; with settings.MEDIA_SIGNED_URLS
+    the URL's signature must be valid.
+    """
+    if settings.MEDIA_SIGNED_URLS and not verify_signed_path(path, request.GET):
+        return HttpResponseForbidden('Invalid or expired media URL')
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(fullpath)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404('Media file not found')
+    if not os.path.isfile(fullpath):
+        raise Http404('Media file not found')
+
+    # 304 (or 412 for a failed If-Match), with the RFC 9110 precedence rules
+    response = get_conditional_response(request, etag=file_etag(stat), last_modified=int(stat.st_mtime))
+    if response is not None:
+        return set_cache_headers(response, path, stat) if response.status_code == 304 else response
+
+    content_type, encoding = mimetypes.guess_type(fullpath)
+    content_type = content_type or 'application/octet-stream'
+
+    mode = settings.MEDIA_SERVE_MODE
+    if mode in ('x-accel-redirect', 'x-sendfile'):
+        # The front-end server sends the bytes and handles Range itself
+        response = HttpResponse(content_type=content_type)
+        if mode == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = quote(settings.MEDIA_ACCEL_REDIRECT_PREFIX + path)
+        else:
+            response['X-Sendfile'] = fullpath
+        return set_cache_headers(response, path, stat)
+
+    byte_range = parse_range(request.META.get('HTTP_RANGE'), stat.st_size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        return response
+
+    file = open(fullpath, 'rb')
+    if byte_range is None or not range_applies(request, stat):
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        response = FileResponse(RangeFile(file, start, end), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    response['Accept-Ranges'] = 'bytes'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return set_cache_headers(response, path, stat)
@@ -0,0 +1,38 @@
+"""
+Fast render path of the hot template partials.
+
+The image grid cells, the activity stream items and the ranking list are
+rendered many times per page (or pushed to every live dashboard), and
+Django template rendering dominated the list and dashboard profiles: a
+``{% with %}``, a custom tag call and a chain of attribute lookups per
+item, each a Python-level variable resolution.
+
+Views render those partials with ``render_partial`` and insert the HTML
+in the page. With settings.PARTIALS_ENGINE = 'jinja2' (the default when
+Jinja2 is installed) they come from the Jinja2 copies of the templates
+(``<app>/jinja2/...``, environment in bookmarks/jinja2.py), compiled to
+Python code; otherwise from the Django templates of the same name. Both
+produce the same HTML (see ``manage.py bench_templates``), so either
+template must be changed along with the other.
+
+Partials:
+    images/image/list_images.html: ``images``, a list of image cards.
+    images/image/ranking_list.html: ``most_viewed`` (card, score) pairs, ``by``.
+    actions/action/list.html: ``actions``.
+"""
+
+from django.conf import settings
+from django.template import engines
+from django.utils.safestring import mark_safe
+
+
+def render_partial(template_name, context, request=None, engine=None):
+    """
+    Render a partial with ``engine`` ('django' or 'jinja2', defaults to
+    settings.PARTIALS_ENGINE).
+
+    Returns:
+        The HTML, marked safe to insert in a page.
+    """
+    template = engines[engine or settings.PARTIALS_ENGINE].get_template(template_name)
+    return mark_safe(template.render(context, request))
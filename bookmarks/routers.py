@@ -0,0 +1,157 @@
+"""
+Read-replica routing.
+
+Views opt in with ``@read_replica``: while they run, reads go to one of
+settings.REPLICA_DATABASES (picked at random per query). Everything else,
+all writes and any read inside a transaction stays on ``default``.
+
+Replicas lag behind the primary, so a user who just wrote (liked,
+followed, bookmarked...) must not read from them for a while:
+ReplicaStickinessMiddleware notices writes made while handling a request
+and sets a cookie pinning that user's reads to the primary for
+settings.REPLICA_STICKY_SECONDS.
+"""
+
+import random
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+PRIMARY = 'default'
+
+# Models that must always be read where they were just written
+PRIMARY_ONLY_MODELS = {'sessions.session'}
+
+STICKY_COOKIE = 'primary_pin'
+
+
+class RequestState:
+    """
+    Replica routing state of one request; mutable so that copies of the
+    context (sync_to_async threads) share it.
+    """
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+_request_state = ContextVar('replica_request_state', default=None)
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+class ReplicaRouter:
+    """
+    Database router sending the reads of ``@read_replica`` views to replicas.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get() or not settings.REPLICA_DATABASES:
+            return PRIMARY
+        if model._meta.label_lower in PRIMARY_ONLY_MODELS:
+            return PRIMARY
+        state = _request_state.get()
+        if state is not None and (state.pinned or state.wrote):
+            return PRIMARY
+        if connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        return random.choice(settings.REPLICA_DATABASES)
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None and model._meta.label_lower not in PRIMARY_ONLY_MODELS:
+            state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *settings.REPLICA_DATABASES}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema and rows from the primary
+        if db in settings.REPLICA_DATABASES:
+            return False
+        return None
+
+
+def read_replica(view_func):
+    """
+    Decorator letting a read-only view (sync or async) read from replicas.
+
+    Put it under ``login_required``, so the session and user are still
+    loaded from the primary, and above ``conditional_page``, so the ETag
+    and the page come from the same database.
+    """
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def _wrapped_view(request, *args, **kwargs):
+            token = _replica_reads.set(True)
+            try:
+                return await view_func(request, *args, **kwargs)
+            finally:
+                _replica_reads.reset(token)
+    else:
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            token = _replica_reads.set(True)
+            try:
+                return view_func(request, *args, **kwargs)
+            finally:
+                _replica_reads.reset(token)
+    return _wrapped_view
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Pin a client's reads to the primary for a while after it writes.
+
+    The pin is a cookie holding its expiry time, so it works on every web
+    node without shared state; a forged cookie only forces primary reads.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = self.start(request)
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        return self.finish(state, response)
+
+    async def __acall__(self, request):
+        state = self.start(request)
+        token = _request_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        return self.finish(state, response)
+
+    def start(self, request):
+        try:
+            pinned_until = float(request.COOKIES.get(STICKY_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        return RequestState(pinned=pinned_until > time.time())
+
+    def finish(self, state, response):
+        if state.wrote:
+            seconds = settings.REPLICA_STICKY_SECONDS
+            response.set_cookie(STICKY_COOKIE, str(int(time.time() + seconds)),
+                                max_age=seconds, httponly=True, samesite='Lax')
+        return response
@@ -13,6 +13,8 @@ This file contains all the configuration for the Django project including:
 Generated by 'django-admin startproject' using Django 4.2.1.
 """
 
+import importlib.util
+import os
 from pathlib import Path
 from django.urls import reverse_lazy
 
@@ -23,8 +25,8 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # Secret key for cryptographic signing – keep this safe in production!
 SECRET_KEY = 'django-insecure-5_v*(mu&$)zpxejdae2l@l)$p&u0y$n!d3(dj-#$5#!4p0fz3('
 
-# Debug mode – should be False in production
-DEBUG = True
+# Debug mode – should be False in production (BOOKMARKS_DEBUG=0)
+DEBUG = os.environ.get('BOOKMARKS_DEBUG', '1') == '1'
 
 # Hosts/domain names that can serve this project
 ALLOWED_HOSTS = ['mysite.com', 'localhost', '127.0.0.1']
@@ -35,6 +37,11 @@ INSTALLED_APPS = [
     'account.apps.AccountConfig',
     'images.apps.ImagesConfig',
     'actions.apps.ActionsConfig',
+    'benchmarks.apps.BenchmarksConfig',
+    'live.apps.LiveConfig',
+    'api.apps.ApiConfig',
+    'tasks.apps.TasksConfig',
+    'profiling.apps.ProfilingConfig',
     
     # Django default apps
     'django.contrib.admin',
@@ -48,30 +55,40 @@ INSTALLED_APPS = [
     'social_django',          # Social authentication
     'django_extensions',      # Extra management commands
     'easy_thumbnails',        # Image thumbnailing
-    'debug_toolbar'           # Debugging toolbar
 ]
 
 # MIDDLEWARE
 MIDDLEWARE = [
-    'debug_toolbar.middleware.DebugToolbarMiddleware',  # Adds debug toolbar to all responses
+    'bookmarks.instrumentation.InstrumentationMiddleware',  # Server-Timing, /metrics, query budgets
     'django.middleware.security.SecurityMiddleware',    # Security-related middleware
+    'bookmarks.bots.BotFilterMiddleware',               # Tags crawlers/prefetches, serves them cached pages
     'django.contrib.sessions.middleware.SessionMiddleware',  # Session management
+    'bookmarks.routers.ReplicaStickinessMiddleware',    # Read-your-writes for replica reads
     'django.middleware.common.CommonMiddleware',        # Common HTTP functionalities
     'django.middleware.csrf.CsrfViewMiddleware',        # CSRF protection
     'django.contrib.auth.middleware.AuthenticationMiddleware',  # Authentication
     'django.contrib.messages.middleware.MessageMiddleware',  # Flash messages
     'django.middleware.clickjacking.XFrameOptionsMiddleware',  # Protects against clickjacking
+    'profiling.middleware.ProfilingMiddleware',         # Profiles requests on demand (last: sees request.user)
 ]
 
+# Debug toolbar (development only)
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.insert(1, 'debug_toolbar.middleware.DebugToolbarMiddleware')
+
+# Test runner (development behaviours that make regressions fail the tests)
+TEST_RUNNER = 'bookmarks.testing.TestRunner'
+
 # ROOT URL Configuration
 ROOT_URLCONF = 'bookmarks.urls'
 
 # TEMPLATE SETTINGS
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'NAME': 'django',
+        'BACKEND': 'bookmarks.instrumentation.DjangoTemplates',  # DjangoTemplates, timed
         'DIRS': [],  # Project-level template directories
-        'APP_DIRS': True,  # Include app-level templates automatically
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',      # Add debug context variables
@@ -79,21 +96,61 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',   # Add user auth context
                 'django.contrib.messages.context_processors.messages',  # Add messages context
             ],
+            # Parse each template once per process (the autoreloader resets it on changes)
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',  # app-level templates
+                ]),
+            ],
         },
     },
 ]
 
+# FAST PARTIALS (see bookmarks/partials.py): the hot partials are rendered
+# with Jinja2, from the <app>/jinja2/ copies of their templates, if installed
+PARTIALS_ENGINE = 'jinja2' if importlib.util.find_spec('jinja2') else 'django'
+if PARTIALS_ENGINE == 'jinja2':
+    TEMPLATES.append({
+        'NAME': 'jinja2',
+        'BACKEND': 'bookmarks.instrumentation.Jinja2',  # Jinja2, timed
+        'DIRS': [],
+        'APP_DIRS': True,  # <app>/jinja2/ directories
+        'OPTIONS': {
+            'environment': 'bookmarks.jinja2.environment',
+        },
+    })
+
 # WSGI Application
 WSGI_APPLICATION = 'bookmarks.wsgi.application'
 
+# Serve the AJAX endpoints with async views (set by bookmarks/asgi.py)
+ASYNC_AJAX_VIEWS = os.environ.get('BOOKMARKS_ASYNC_VIEWS') == '1'
+
 # DATABASE CONFIGURATION
+# Connections are kept open across requests (CONN_MAX_AGE) and checked
+# before reuse; behind PgBouncer in transaction mode also set
+# DISABLE_SERVER_SIDE_CURSORS = True
+DATABASE_CONN_MAX_AGE = int(os.environ.get('BOOKMARKS_DB_CONN_MAX_AGE', 60))
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',  # Using SQLite for development
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('BOOKMARKS_DB', BASE_DIR / 'db.sqlite3'),
+        'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# READ REPLICAS (see bookmarks/routers.py)
+# Each comma-separated BOOKMARKS_REPLICA_DBS entry adds a 'replica_N' database
+REPLICA_DATABASES = []
+for index, name in enumerate(filter(None, os.environ.get('BOOKMARKS_REPLICA_DBS', '').split(','))):
+    alias = f'replica_{index}'
+    DATABASES[alias] = dict(DATABASES['default'], NAME=name, TEST={'MIRROR': 'default'})
+    REPLICA_DATABASES.append(alias)
+DATABASE_ROUTERS = ['bookmarks.routers.ReplicaRouter']
+REPLICA_STICKY_SECONDS = 10  # Reads stay on the primary this long after a client's write (> replica lag)
+
 # PASSWORD VALIDATION
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -114,18 +171,78 @@ STATIC_URL = 'static/'
 # DEFAULT PRIMARY KEY FIELD TYPE
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# THUMBNAILS AND RESPONSIVE IMAGES (see images/derivatives.py)
+# Aliases per model field; each is also rendered as AVIF/WebP at every density
+THUMBNAIL_ALIASES = {
+    'images.Image.image': {
+        'grid': {'size': (300, 300), 'crop': 'smart'},   # image lists and profile pages
+        'detail': {'size': (300, 0)},                    # image detail page
+        'avatar': {'size': (80, 80), 'crop': '100%'},    # activity stream targets
+    },
+    'account.Profile.photo': {
+        'people': {'size': (180, 180)},                  # people list and profile page
+        'avatar': {'size': (80, 80), 'crop': '100%'},    # activity stream actors
+    },
+}
+RESPONSIVE_IMAGE_DENSITIES = [1, 2]           # srcset 1x/2x variants
+IMAGE_DERIVATIVE_FORMATS = ['avif', 'webp']   # Preference order; skipped if Pillow can't encode them
+IMAGE_DERIVATIVE_QUALITY = {'avif': 55, 'webp': 75}  # Same visual quality as the q85 JPEGs at fewer bytes
+IMAGE_MAX_DIMENSION = 2048                    # Originals are downsized to fit at ingest
+IMAGE_INGEST_QUALITY = 90                     # JPEG quality when an original is re-encoded
+# Decode sources at reduced size (JPEG draft mode / reduce), see images/thumbnails.py
+THUMBNAIL_SOURCE_GENERATORS = (
+    'images.thumbnails.reduced_image',
+    'easy_thumbnails.source_generators.vil_image',
+)
+IMAGE_DECODE_REDUCING_GAP = 2.0               # Keep at least this multiple of the thumbnail size before resizing
+# Thumbnails of files without stored derivatives, memoized (see images/thumbnail_urls.py)
+THUMBNAIL_URLS_LRU_SIZE = 10000               # Entries kept in each process
+THUMBNAIL_URLS_TTL = 7 * 24 * 3600            # Seconds kept in Redis
+
 # LOGIN REDIRECTION
 LOGIN_REDIRECT_URL = 'dashboard'  # Redirect after successful login
 LOGIN_URL = 'login'
 LOGOUT_URL = 'logout'
 
-# EMAIL BACKEND (console backend for development)
-EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+# EMAIL BACKEND (queued, sent by the task worker; console backend for development)
+EMAIL_BACKEND = 'tasks.mail.QueuedEmailBackend'
+TASKS_EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
 # MEDIA FILES
 MEDIA_URL = 'media/'  # URL prefix for media files
 MEDIA_ROOT = BASE_DIR / 'media'  # Filesystem location
 
+# MEDIA STORAGE (see bookmarks/storage.py)
+STORAGES = {
+    'default': {'BACKEND': 'bookmarks.storage.ObjectStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+# 'local' keeps objects under MEDIA_ROOT, 's3' uses an S3-compatible store (requires boto3)
+MEDIA_STORAGE_BACKEND = os.environ.get('BOOKMARKS_MEDIA_BACKEND', 'local')
+MEDIA_S3_BUCKET = os.environ.get('BOOKMARKS_S3_BUCKET', 'bookmarks-media')
+MEDIA_S3_ENDPOINT_URL = os.environ.get('BOOKMARKS_S3_ENDPOINT_URL')  # e.g. http://127.0.0.1:9000 for MinIO
+MEDIA_S3_REGION = os.environ.get('BOOKMARKS_S3_REGION')
+MEDIA_S3_PUBLIC_URL = os.environ.get('BOOKMARKS_S3_PUBLIC_URL')  # CDN/bucket URL for unsigned links
+# Signed URLs let a private bucket serve media directly to browsers
+MEDIA_SIGNED_URLS = os.environ.get('BOOKMARKS_SIGNED_MEDIA_URLS', '1' if MEDIA_STORAGE_BACKEND == 's3' else '') == '1'
+MEDIA_SIGNED_URL_TTL = 60 * 60 * 6  # URLs are stable for a period and valid for one to two periods
+MEDIA_MULTIPART_THRESHOLD = 8 * 1024 * 1024  # Larger uploads are sent in parts...
+MEDIA_MULTIPART_CHUNK_SIZE = 8 * 1024 * 1024  # ...of this size (S3 requires at least 5 MB)
+MEDIA_UPLOAD_WORKERS = 8  # Parallel uploads of thumbnail variants
+MEDIA_CACHE_DIR = BASE_DIR / 'media-cache'  # Read-through cache of remote objects (thumbnailing reads)
+MEDIA_CACHE_MAX_BYTES = 1024 * 1024 * 1024  # LRU-evicted above this size; 0 disables the cache
+
+# MEDIA SERVING (see bookmarks/media.py)
+# 'python' streams with FileResponse (sendfile through wsgi.file_wrapper),
+# 'x-accel-redirect' hands off to nginx, 'x-sendfile' to Apache/lighttpd
+MEDIA_SERVE_MODE = 'python'
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'  # nginx "internal" location aliasing MEDIA_ROOT
+MEDIA_MAX_AGE = 60 * 60 * 24  # Originals and profile photos: one day
+MEDIA_IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365  # Files whose name never maps to new bytes
+MEDIA_IMMUTABLE_PATTERNS = [
+    r'\.\d+x\d+_q\d+[^/]*$',  # easy_thumbnails names, e.g. photo.jpg.300x300_q85_crop-smart.jpg
+]
+
 # AUTHENTICATION BACKENDS
 AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',  # Default backend
@@ -167,3 +284,114 @@ INTERNAL_IPS = ['127.0.0.1']
 REDIS_HOST = 'localhost'
 REDIS_PORT = 6379
 REDIS_DB = 0
+
+# BACKGROUND TASKS (see tasks/queue.py, run with manage.py run_tasks)
+# Run tasks inline (on commit) instead of queueing them: on in tests (see bookmarks.testing), or set
+# BOOKMARKS_TASKS_EAGER=1 to develop without a worker
+TASKS_EAGER = os.environ.get('BOOKMARKS_TASKS_EAGER', '0') == '1'
+TASKS_QUEUES = ['default', 'images', 'mail']  # Queues run_tasks takes tasks from by default
+TASKS_MAX_BACKOFF = 3600        # Seconds; retries wait backoff * 2**(attempt - 1), up to this
+TASKS_TIMEOUT = 1800            # Seconds after which a running task's worker is presumed dead
+TASKS_MAINTENANCE_INTERVAL = 15  # Seconds between periodic task scheduling/recovery passes
+TASKS_KEEP_DONE = 86400         # Seconds finished tasks are kept (latency metrics, debugging)
+TASKS_KEEP_FAILED = 7 * 86400   # Seconds failed tasks are kept
+TASKS_METRICS_WINDOW = 300      # Seconds of finished tasks summarized at /metrics
+
+# DELETION (soft delete, purged in the background; see images/deletion.py, account/deletion.py)
+DELETION_BATCH_SIZE = 1000      # Rows deleted per transaction
+DELETION_TASK_SECONDS = 10      # A purge task queues its continuation after running this long
+
+# REMOTE IMAGES (bookmarked image downloads, see images/remote.py)
+REMOTE_TIMEOUT = 20                       # Seconds to connect and between bytes
+REMOTE_MAX_BYTES = 20 * 1024 * 1024       # Larger images are refused
+REMOTE_POOL_HOSTS = 32                    # Hosts with a pool of kept-alive connections
+REMOTE_CONNECTIONS_PER_HOST = 8           # Kept-alive connections per host; more are opened and closed
+REMOTE_CACHE_DIR = BASE_DIR / 'remote-cache'  # HTTP cache of downloaded images
+REMOTE_CACHE_MAX_BYTES = 512 * 1024 * 1024    # LRU-evicted above this size; 0 disables the cache
+REMOTE_CACHE_FRESH = 600                  # Seconds a response without max-age is used unrevalidated
+REMOTE_HOST_FAILURES = 3                  # Consecutive failures before a host is skipped...
+REMOTE_HOST_DOWN_SECONDS = 60             # ...for this long
+
+# DATA EXPORT (see account/export.py)
+EXPORT_CHUNK_SIZE = 2000          # Rows fetched per query round trip
+EXPORT_READ_SIZE = 256 * 1024     # Bytes read from an image file at a time
+EXPORT_YIELD_SIZE = 256 * 1024    # Bytes of zip buffered before they are sent
+
+# ACTIONS FIREHOSE (dashboard of users following nobody, see actions/firehose.py)
+ACTIONS_FIREHOSE_SIZE = 2000  # Newest actions kept in Redis; 0 queries the table instead
+
+# IMAGE CARDS (grid read model in Redis, see images/cards.py; requires msgpack)
+IMAGE_CARDS = True
+IMAGE_CARDS_TTL = 7 * 86400  # Seconds a card nobody reads is kept
+
+# HASHTAGS (see images/tags.py)
+TAGS_PER_IMAGE = 20         # Hashtags of a description indexed at most
+TAGS_TRENDING_HOURS = 24    # Hours of tagging counted by the trending tags
+TAGS_TRENDING_DECAY = 0.9   # Weight of each hour relative to the next one
+TAGS_TRENDING_CACHE = 60    # Seconds the merged trending ranking is kept
+
+# UNIQUE VIEWERS (HyperLogLog sketches, see images/uniques.py)
+UNIQUE_VIEWERS_BACKEND = 'images.uniques.RedisUniqueViewers'  # 'images.uniques.LocalUniqueViewers' for tests/single process
+# Sketches kept per image: 1 + RETENTION_DAYS + rollups (~110, at most 12KB each, see images/uniques.py)
+UNIQUE_VIEWERS_RETENTION_DAYS = 35          # Per-day sketches (30 day rankings, monthly rollups)
+UNIQUE_VIEWERS_ROLLUP_RETENTION_DAYS = 400  # Weekly and monthly rollups
+
+# BOT FILTERING (see bookmarks/bots.py)
+# User agents (regular expressions, case insensitive) of crawlers, link previewers and tools
+BOT_USER_AGENTS = [
+    r'bot\b', 'crawl', 'spider', 'slurp', 'facebookexternalhit', 'embedly', 'preview',
+    'headless', 'phantomjs', 'curl/', 'wget/', 'python-requests', 'python-urllib', 'aiohttp',
+    'go-http-client', 'java/', 'okhttp', 'httpclient', 'scrapy',
+]
+BOT_RATE_LIMIT = 120           # Page requests per window above which a client address is treated as a bot
+BOT_RATE_WINDOW = 60           # Seconds of the sliding window
+# Never rate-tagged (load tests, health checks), comma-separated; see TRUSTED_PROXY_COUNT behind a proxy
+BOT_RATE_EXEMPT_IPS = [ip for ip in os.environ.get('BOOKMARKS_BOT_RATE_EXEMPT_IPS', '').split(',') if ip]
+# Reverse proxies (nginx...) in front of Django appending to X-Forwarded-For; 0 uses REMOTE_ADDR as the client
+TRUSTED_PROXY_COUNT = int(os.environ.get('BOOKMARKS_TRUSTED_PROXIES', '0'))
+BOT_CACHE = 'default'          # Cache alias of the rate counters and of pages served to bots
+BOT_CACHE_SECONDS = 300        # Seconds anonymous pages are served to bots from the cache; 0 disables
+
+# INSTRUMENTATION (see bookmarks/instrumentation.py)
+# Per-request db/redis/template/thumbnail timings in a Server-Timing header (every client sees them)
+SERVER_TIMING = os.environ.get('BOOKMARKS_SERVER_TIMING', '1' if DEBUG else '0') == '1'
+METRICS_TOKEN = os.environ.get('BOOKMARKS_METRICS_TOKEN')  # /metrics needs "Authorization: Bearer <token>"...
+# ...or a client address in this comma-separated list. Opt-in: behind a proxy on the same host every
+# client is 127.0.0.1, so only list addresses that reach the server directly
+METRICS_ALLOWED_IPS = [ip for ip in os.environ.get('BOOKMARKS_METRICS_ALLOWED_IPS', '').split(',') if ip]
+# Maximum queries per view (URL name); anything above is an N+1 regression
+QUERY_BUDGETS = {
+    'dashboard': 12,
+    'user_list': 8,
+    'user_detail': 12,
+    'edit': 8,
+    'images:list': 8,
+    'images:detail': 8,
+    'images:ranking': 6,
+    'images:like': 12,
+    'user_follow': 12,
+}
+# 'log' a warning or 'raise' QueryBudgetExceeded, which fails the request after the view ran (and
+# committed): the test runner raises (see bookmarks/testing.py), so an N+1 regression fails the tests
+QUERY_BUDGET_ACTION = os.environ.get('BOOKMARKS_QUERY_BUDGET_ACTION', 'log')
+
+# PROFILING (see profiling/)
+PROFILING_MODE = 'sample'          # 'sample' (stack sampler, collapsed stacks) or 'cprofile' (pstats)
+PROFILING_INTERVAL = 0.005         # Seconds between two stack samples
+PROFILING_SAMPLE_EVERY = int(os.environ.get('BOOKMARKS_PROFILE_EVERY', 0))  # Profile 1 request in N (0: on demand only)
+PROFILING_TOKEN_MAX_AGE = 3600     # Seconds an X-Profile token from the admin page is valid
+PROFILING_RATE_LIMIT = 20          # Captures a minute per staff user (sampled requests share one limit)
+PROFILING_DIR = BASE_DIR / 'profiles'  # Captures of this server
+PROFILING_KEEP = 500               # Captures kept, the oldest are deleted
+PROFILING_TOP = 5                  # Slowest captures listed per view
+
+# CONDITIONAL GET (see bookmarks/conditional.py)
+CONDITIONAL_ANONYMOUS_MAX_AGE = 60  # Seconds shared caches may keep anonymous pages
+
+# LIVE UPDATES (Server-Sent Events, see live/)
+LIVE_BROKER = 'live.broker.RedisBroker'  # 'live.broker.LocalBroker' for tests/single process
+LIVE_COALESCE_INTERVAL = 1.0  # Seconds between batches sent to a subscriber
+LIVE_MAX_BATCH = 20           # Messages kept per batch (newest win)
+LIVE_KEEPALIVE = 15           # Seconds of silence before a keep-alive comment
+LIVE_STREAM_TIMEOUT = 300     # Seconds before a stream is closed (clients reconnect)
+LIVE_RETRY_MS = 3000          # Reconnect delay advertised to EventSource clients
@@ -0,0 +1,536 @@
+"""
+Object storage for user-uploaded media (images, profile photos, thumbnails).
+
+ObjectStorage is a Django storage that keeps files in an object store so
+any number of web nodes can share media without a shared disk. The store
+is a pluggable backend, chosen with settings.MEDIA_STORAGE_BACKEND:
+
+- 's3': any S3-compatible service (AWS, MinIO, Ceph...) through boto3.
+- 'local': a filesystem stand-in under MEDIA_ROOT with the same semantics
+  (multipart uploads, signed URLs), for development and tests.
+
+Large files are uploaded in parts while they are read, so memory stays
+bounded. Reads of remote objects go through a local read-through disk
+cache with LRU eviction. URLs can be signed (settings.MEDIA_SIGNED_URLS),
+so browsers fetch the bytes straight from the store, never through Django.
+"""
+
+import hashlib
+import mimetypes
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+from functools import lru_cache
+from io import BytesIO
+from itertools import chain
+from urllib.parse import quote, urlencode
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
+from django.core.files.storage import Storage
+from django.core.signals import setting_changed
+from django.core.signing import Signer
+from django.utils import timezone
+from django.utils._os import safe_join
+from django.utils.deconstruct import deconstructible
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+
+# -------------------------------
+# URL signing
+# -------------------------------
+
+url_signer = Signer(salt='bookmarks.storage.url')
+
+
+def url_expiry(now=None):
+    """
+    Expiry timestamp for URLs signed now.
+
+    Expiries are rounded up to the next settings.MEDIA_SIGNED_URL_TTL
+    boundary (at least one TTL away), so a URL stays the same for a whole
+    period and browsers and CDNs can keep caching it.
+    """
+    ttl = settings.MEDIA_SIGNED_URL_TTL
+    now = time.time() if now is None else now
+    return (int(now) // ttl + 2) * ttl
+
+
+def url_epoch():
+    """
+    Changes whenever newly rendered media URLs change (None if unsigned).
+
+    Pages answered with 304 must include it in their validators, or cached
+    HTML would keep pointing at expired URLs.
+    """
+    return url_expiry() if settings.MEDIA_SIGNED_URLS else None
+
+
+def sign_path(name, expires):
+    return url_signer.signature(f'{name}:{expires}')
+
+
+def verify_signed_path(name, params):
+    """
+    Check the ``expires``/``signature`` query parameters of a local signed URL.
+    """
+    expires = params.get('expires', '')
+    signature = params.get('signature', '')
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    return url_signer.signature(f'{name}:{expires}') == signature
+
+
+# -------------------------------
+# Backends
+# -------------------------------
+
+class LocalBackend:
+    """
+    Filesystem stand-in for an object store, rooted at ``location``.
+
+    Multipart parts are staged under ``.multipart/`` and assembled on
+    completion, so objects appear atomically like in S3.
+    """
+    is_local = True
+
+    def __init__(self, location, base_url):
+        self.location = os.path.abspath(location)
+        self.base_url = base_url
+
+    def path(self, name):
+        return safe_join(self.location, name)
+
+    def _write(self, name, fileobj):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as destination:
+                shutil.copyfileobj(fileobj, destination)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def put(self, name, fileobj, content_type=None):
+        self._write(name, fileobj)
+
+    def _parts_dir(self, upload_id):
+        return safe_join(self.location, '.multipart', upload_id)
+
+    def create_multipart(self, name, content_type=None):
+        upload_id = uuid.uuid4().hex
+        os.makedirs(self._parts_dir(upload_id))
+        return upload_id
+
+    def upload_part(self, name, upload_id, number, data):
+        with open(os.path.join(self._parts_dir(upload_id), f'{number:05d}'), 'wb') as part:
+            part.write(data)
+        return hashlib.md5(data).hexdigest()
+
+    def complete_multipart(self, name, upload_id, parts):
+        parts_dir = self._parts_dir(upload_id)
+        with tempfile.TemporaryFile() as assembled:
+            for number, etag in parts:
+                with open(os.path.join(parts_dir, f'{number:05d}'), 'rb') as part:
+                    shutil.copyfileobj(part, assembled)
+            assembled.seek(0)
+            self._write(name, assembled)
+        shutil.rmtree(parts_dir, ignore_errors=True)
+
+    def abort_multipart(self, name, upload_id):
+        shutil.rmtree(self._parts_dir(upload_id), ignore_errors=True)
+
+    def open(self, name):
+        return open(self.path(name), 'rb')
+
+    def download(self, name, fileobj):
+        with self.open(name) as source:
+            shutil.copyfileobj(source, fileobj)
+
+    def delete(self, name):
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+    def exists(self, name):
+        return os.path.isfile(self.path(name))
+
+    def size(self, name):
+        return os.path.getsize(self.path(name))
+
+    def modified_time(self, name):
+        return datetime.fromtimestamp(os.path.getmtime(self.path(name)), dt_timezone.utc)
+
+    def listdir(self, path):
+        directories, files = [], []
+        with os.scandir(self.path(path)) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                (directories if entry.is_dir() else files).append(entry.name)
+        return directories, files
+
+    def url(self, name, expires=None):
+        url = self.base_url + quote(name.replace('\\', '/'))
+        if expires is not None:
+            url += '?' + urlencode({'expires': expires, 'signature': sign_path(name, expires)})
+        return url
+
+
+class S3Backend:
+    """
+    Any S3-compatible object store (MinIO with ``endpoint_url``).
+
+    Credentials come from the usual boto3 sources (environment, config
+    files, instance roles). The boto3 client is thread-safe, so one
+    backend is shared by parallel uploads.
+    """
+    is_local = False
+
+    def __init__(self, bucket, endpoint_url=None, region_name=None, public_url=None):
+        if boto3 is None:
+            raise ImproperlyConfigured("MEDIA_STORAGE_BACKEND 's3' requires boto3 (pip install boto3)")
+        self.bucket = bucket
+        self.public_url = public_url
+        self.client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region_name)
+
+    def put(self, name, fileobj, content_type=None):
+        extra = {'ContentType': content_type} if content_type else {}
+        self.client.put_object(Bucket=self.bucket, Key=name, Body=fileobj.read(), **extra)
+
+    def create_multipart(self, name, content_type=None):
+        extra = {'ContentType': content_type} if content_type else {}
+        response = self.client.create_multipart_upload(Bucket=self.bucket, Key=name, **extra)
+        return response['UploadId']
+
+    def upload_part(self, name, upload_id, number, data):
+        response = self.client.upload_part(
+            Bucket=self.bucket, Key=name, UploadId=upload_id, PartNumber=number, Body=data
+        )
+        return response['ETag']
+
+    def complete_multipart(self, name, upload_id, parts):
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket, Key=name, UploadId=upload_id,
+            MultipartUpload={'Parts': [{'PartNumber': number, 'ETag': etag} for number, etag in parts]},
+        )
+
+    def abort_multipart(self, name, upload_id):
+        self.client.abort_multipart_upload(Bucket=self.bucket, Key=name, UploadId=upload_id)
+
+    def download(self, name, fileobj):
+        self.client.download_fileobj(self.bucket, name, fileobj)
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=name)
+
+    def _head(self, name):
+        return self.client.head_object(Bucket=self.bucket, Key=name)
+
+    def exists(self, name):
+        try:
+            self._head(name)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        return True
+
+    def size(self, name):
+        return self._head(name)['ContentLength']
+
+    def modified_time(self, name):
+        return self._head(name)['LastModified']
+
+    def listdir(self, path):
+        prefix = path.rstrip('/') + '/' if path else ''
+        directories, files = [], []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix, Delimiter='/'):
+            directories += [entry['Prefix'][len(prefix):].rstrip('/') for entry in page.get('CommonPrefixes', [])]
+            files += [entry['Key'][len(prefix):] for entry in page.get('Contents', [])]
+        return directories, files
+
+    def url(self, name, expires=None):
+        if expires is None:
+            base = self.public_url or f'{self.client.meta.endpoint_url}/{self.bucket}/'
+            return base + quote(name)
+        return self.client.generate_presigned_url(
+            'get_object', Params={'Bucket': self.bucket, 'Key': name},
+            ExpiresIn=max(int(expires - time.time()), 1),
+        )
+
+
+def get_backend():
+    """
+    Build the backend configured in settings.MEDIA_STORAGE_BACKEND.
+    """
+    if settings.MEDIA_STORAGE_BACKEND == 'local':
+        return LocalBackend(settings.MEDIA_ROOT, settings.MEDIA_URL)
+    if settings.MEDIA_STORAGE_BACKEND == 's3':
+        return S3Backend(
+            settings.MEDIA_S3_BUCKET,
+            endpoint_url=settings.MEDIA_S3_ENDPOINT_URL,
+            region_name=settings.MEDIA_S3_REGION,
+            public_url=settings.MEDIA_S3_PUBLIC_URL,
+        )
+    raise ImproperlyConfigured(f'Unknown MEDIA_STORAGE_BACKEND {settings.MEDIA_STORAGE_BACKEND!r}')
+
+
+# -------------------------------
+# Read-through disk cache
+# -------------------------------
+
+class DiskCache:
+    """
+    Local copies of remote objects, evicted least recently used first.
+
+    Hits touch the file's mtime, so eviction order survives restarts and is
+    shared by every process using the directory. The size is tracked in
+    memory and the directory is only rescanned when it may be over
+    ``max_bytes``; eviction then goes down to 90% to leave some headroom.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        self.total = None
+
+    def path(self, name):
+        digest = hashlib.sha1(name.encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest + os.path.splitext(name)[1])
+
+    def get(self, name):
+        path = self.path(name)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, name, fill):
+        """
+        Store an object; ``fill`` is called with a writable file to fetch it.
+        """
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.fetch-')
+        try:
+            with os.fdopen(fd, 'wb') as destination:
+                fill(destination)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        if self.total is None:
+            self.total = self._scan()[1]
+        else:
+            self.total += os.path.getsize(path)
+        if self.total > self.max_bytes:
+            self.evict()
+        return path
+
+    def discard(self, name):
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+    def _scan(self):
+        entries = []
+        for root, dirs, files in os.walk(self.directory):
+            for filename in files:
+                if filename.startswith('.'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, filename))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(root, filename)))
+        return entries, sum(size for mtime, size, path in entries)
+
+    def evict(self):
+        entries, total = self._scan()
+        low_watermark = self.max_bytes * 0.9
+        for mtime, size, path in sorted(entries):
+            if total <= low_watermark:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self.total = total
+
+
+# -------------------------------
+# Storage
+# -------------------------------
+
+@deconstructible
+class ObjectStorage(Storage):
+    """
+    Django storage on top of an object store backend.
+
+    Names are never overwritten (Django's usual ``_1abcXYZ`` suffixes), so
+    a URL always maps to the same bytes and thumbnails can be cached as
+    immutable.
+    """
+
+    def __init__(self, backend=None):
+        self._backend = backend
+        self._configured_backend = backend is None
+        self._cache = None
+        setting_changed.connect(self._clear_cached_properties)
+        # S3 presigned URLs embed the signing time; memoizing keeps them
+        # stable for the whole period like the local ones
+        self._signed_url = lru_cache(maxsize=4096)(lambda name, expires: self.backend.url(name, expires))
+
+    def _clear_cached_properties(self, setting, **kwargs):
+        # Like FileSystemStorage, follow setting changes (override_settings)
+        if setting.startswith('MEDIA_'):
+            if self._configured_backend:
+                self._backend = None
+            self._cache = None
+            self._signed_url.cache_clear()
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = get_backend()
+        return self._backend
+
+    @property
+    def cache(self):
+        if self._cache is None and settings.MEDIA_CACHE_MAX_BYTES:
+            self._cache = DiskCache(settings.MEDIA_CACHE_DIR, settings.MEDIA_CACHE_MAX_BYTES)
+        return self._cache
+
+    def _save(self, name, content):
+        """
+        Upload ``content``, in parts if it's bigger than one chunk.
+
+        Parts are read one at a time, so a large upload never sits in
+        memory as a whole.
+        """
+        chunk_size = settings.MEDIA_MULTIPART_CHUNK_SIZE
+        content_type = getattr(content, 'content_type', None) or mimetypes.guess_type(name)[0]
+        size = getattr(content, 'size', None)
+        if size is not None and size <= settings.MEDIA_MULTIPART_THRESHOLD:
+            if hasattr(content, 'seek'):
+                content.seek(0)
+            self.backend.put(name, content, content_type)
+            return name
+
+        chunks = iter(content.chunks(chunk_size))
+        first = next(chunks, b'')
+        second = next(chunks, None)
+        if second is None:
+            # Smaller than one part after all (size unknown upfront)
+            self.backend.put(name, BytesIO(first), content_type)
+            return name
+
+        upload_id = self.backend.create_multipart(name, content_type)
+        try:
+            parts = []
+            for number, data in enumerate(chain([first, second], chunks), start=1):
+                parts.append((number, self.backend.upload_part(name, upload_id, number, data)))
+            self.backend.complete_multipart(name, upload_id, parts)
+        except BaseException:
+            self.backend.abort_multipart(name, upload_id)
+            raise
+        return name
+
+    def replace(self, name, content):
+        """
+        Upload ``content`` as ``name``, over the existing object if any.
+
+        Backends swap the object in once it's complete (rename of a temp
+        file, S3 PUT or multipart completion), so readers get the old bytes
+        or the new ones, never a missing object, and a failed upload leaves
+        the old object in place.
+        """
+        name = self._save(name, content)
+        if self.cache is not None:
+            self.cache.discard(name)
+        return name
+
+    def _open(self, name, mode='rb'):
+        if 'w' in mode or 'a' in mode or '+' in mode:
+            raise ValueError('ObjectStorage files are read-only, save() a new file instead')
+        if self.backend.is_local:
+            return File(self.backend.open(name), name=name)
+        cache = self.cache
+        if cache is None:
+            spooled = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+            self.backend.download(name, spooled)
+            spooled.seek(0)
+            return File(spooled, name=name)
+        path = cache.get(name) or cache.put(name, lambda destination: self.backend.download(name, destination))
+        return File(open(path, 'rb'), name=name)
+
+    def delete(self, name):
+        self.backend.delete(name)
+        if self.cache is not None:
+            self.cache.discard(name)
+
+    def exists(self, name):
+        return self.backend.exists(name)
+
+    def size(self, name):
+        return self.backend.size(name)
+
+    def listdir(self, path):
+        return self.backend.listdir(path)
+
+    def path(self, name):
+        if not self.backend.is_local:
+            raise NotImplementedError("Objects in remote storage don't have a local path")
+        return self.backend.path(name)
+
+    def get_modified_time(self, name):
+        modified = self.backend.modified_time(name)
+        return modified if settings.USE_TZ else timezone.make_naive(modified)
+
+    def url(self, name):
+        if settings.MEDIA_SIGNED_URLS:
+            return self._signed_url(name, url_expiry())
+        return self.backend.url(name)
+
+
+def save_in_parallel(storage, files):
+    """
+    Save several (name, content) pairs concurrently, keeping the exact names.
+
+    Used for thumbnail variants, whose names are derived from the source
+    and options: existing files are replaced, not renamed. The new file is
+    uploaded before the old one goes, so it is never missing in between.
+    """
+    def save(item):
+        name, content = item
+        if hasattr(storage, 'replace'):
+            return storage.replace(name, content)
+        # Other storages pick a free name: move the upload over the old file
+        saved = storage.save(name, content)
+        if saved != name:
+            os.replace(storage.path(saved), storage.path(name))
+        return name
+
+    files = list(files)
+    if len(files) <= 1:
+        return [save(item) for item in files]
+    with ThreadPoolExecutor(max_workers=settings.MEDIA_UPLOAD_WORKERS) as pool:
+        return list(pool.map(save, files))
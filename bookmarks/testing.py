@@ -0,0 +1,83 @@
+"""
+Test runner and helpers for the apps' tests.
+
+``TestRunner`` (settings.TEST_RUNNER) turns on what should make a
+regression fail the tests but not a production request: views over
+their query budget raise QueryBudgetExceeded (see
+bookmarks.instrumentation). It also runs background tasks eagerly, when
+the transaction commits (captureOnCommitCallbacks(execute=True) in a
+TestCase), as no worker runs during the tests.
+
+Most modules talk to Redis through a module-level connection ``r``.
+``mock_redis`` replaces each of them with a MagicMock (and the unique
+viewer backend with the in-process one), for tests about what the code
+does in the database rather than in Redis. ``fake_redis`` replaces them
+with one in-memory server instead, for tests about what ends up in
+Redis; it needs fakeredis (and lupa for Lua scripts), which aren't
+requirements: such tests are skipped unless FAKE_REDIS (FAKE_REDIS_LUA).
+"""
+
+from importlib import import_module
+from importlib.util import find_spec
+from unittest import mock
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+FAKE_REDIS = fakeredis is not None
+FAKE_REDIS_LUA = FAKE_REDIS and find_spec('lupa') is not None
+
+# Modules holding a Redis connection ``r``
+REDIS_MODULES = [
+    'actions.firehose', 'images.cards', 'images.stats', 'images.tags',
+    'images.thumbnail_urls', 'images.versions', 'images.views',
+]
+
+
+class TestRunner(DiscoverRunner):
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        settings.QUERY_BUDGET_ACTION = 'raise'
+        settings.TASKS_EAGER = True
+
+
+def patch(testcase, target, attribute, new):
+    patcher = mock.patch.object(target, attribute, new)
+    testcase.addCleanup(patcher.stop)
+    return patcher.start()
+
+
+def mock_redis(testcase):
+    """
+    Replace the Redis connections for the rest of ``testcase``'s test.
+
+    Returns:
+        dict of the MagicMock of each module, by module name.
+    """
+    from images import uniques
+    patch(testcase, uniques, '_backend', uniques.LocalUniqueViewers())
+    return {name: patch(testcase, import_module(name), 'r', mock.MagicMock(name=f'{name}.r'))
+            for name in REDIS_MODULES}
+
+
+def fake_redis(testcase):
+    """
+    Replace the Redis connections (and the unique viewer backend's) for the
+    rest of ``testcase``'s test with clients of one new in-memory server.
+
+    Returns:
+        The FakeRedis client.
+    """
+    from images import uniques
+    client = fakeredis.FakeRedis()
+    with mock.patch.object(uniques, 'InstrumentedRedis', lambda **kwargs: client):
+        patch(testcase, uniques, '_backend', uniques.RedisUniqueViewers())
+    for name in REDIS_MODULES:
+        patch(testcase, import_module(name), 'r', client)
+    return client
@@ -0,0 +1,692 @@
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.exceptions import PermissionDenied
+from django.core.files.base import ContentFile
+from django.http import Http404, HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils.http import http_date
+
+from account.models import Profile
+from actions.models import Action
+from images.cards import ImageCard
+from images.models import Image
+from images.templatetags import responsive
+
+from . import bots, instrumentation, storage
+from .bots import BotFilterMiddleware, classify, client_address
+from .conditional import conditional_page
+from .instrumentation import InstrumentationMiddleware, QueryBudgetExceeded, Registry, uncounted
+from .media import file_etag, parse_range, serve_media
+from .partials import render_partial
+from .routers import STICKY_COOKIE, ReplicaRouter, ReplicaStickinessMiddleware, read_replica
+from .storage import DiskCache, LocalBackend, ObjectStorage, S3Backend, url_expiry, verify_signed_path
+
+
+class ParseRangeTests(SimpleTestCase):
+
+    def test_ranges(self):
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range('bytes=900-', 1000), (900, 999))
+        # The end is clamped to the file
+        self.assertEqual(parse_range('bytes=500-5000', 1000), (500, 999))
+        self.assertEqual(parse_range('bytes = 10 - 20', 1000), (10, 20))
+
+    def test_suffix_ranges(self):
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-5000', 1000), (0, 999))
+        self.assertIs(parse_range('bytes=-0', 1000), False)
+
+    def test_ignored_headers(self):
+        for header in (None, '', 'bytes=-', 'items=0-10', 'bytes=0-10,20-30', 'bytes=a-b'):
+            with self.subTest(header=header):
+                self.assertIsNone(parse_range(header, 1000))
+
+    def test_unsatisfiable(self):
+        self.assertIs(parse_range('bytes=1000-', 1000), False)
+        self.assertIs(parse_range('bytes=20-10', 1000), False)
+        self.assertIs(parse_range('bytes=0-', 0), False)
+
+
+class ServeMediaTests(SimpleTestCase):
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        override = override_settings(MEDIA_ROOT=self.root.name, MEDIA_SIGNED_URLS=False, MEDIA_SERVE_MODE='python')
+        override.enable()
+        self.addCleanup(override.disable)
+        os.makedirs(os.path.join(self.root.name, 'images'))
+        self.path = os.path.join(self.root.name, 'images', 'photo.jpg')
+        with open(self.path, 'wb') as f:
+            f.write(bytes(range(256)) * 4)
+        self.stat = os.stat(self.path)
+
+    def serve(self, **headers):
+        response = serve_media(RequestFactory().get('/media/images/photo.jpg', **headers), 'images/photo.jpg')
+        self.addCleanup(response.close)
+        return response
+
+    def test_full_file(self):
+        response = self.serve()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(256)) * 4)
+        self.assertEqual(response['ETag'], file_etag(self.stat))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_range(self):
+        response = self.serve(HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(10, 20)))
+
+    def test_unsatisfiable_range(self):
+        response = self.serve(HTTP_RANGE='bytes=2000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+    def test_stale_if_range_sends_the_whole_file(self):
+        response = self.serve(HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Length'], '1024')
+
+    def test_not_modified(self):
+        for headers in ({'HTTP_IF_NONE_MATCH': file_etag(self.stat)},
+                        {'HTTP_IF_MODIFIED_SINCE': http_date(self.stat.st_mtime)}):
+            with self.subTest(headers=headers):
+                response = self.serve(**headers)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], file_etag(self.stat))
+                self.assertIn('max-age', response['Cache-Control'])
+
+    def test_if_none_match_takes_precedence(self):
+        # A current date doesn't matter once the ETag doesn't match
+        response = self.serve(HTTP_IF_NONE_MATCH='"other"', HTTP_IF_MODIFIED_SINCE=http_date(self.stat.st_mtime))
+        self.assertEqual(response.status_code, 200)
+
+    def test_failed_if_match(self):
+        self.assertEqual(self.serve(HTTP_IF_MATCH='"other"').status_code, 412)
+
+    def test_missing_file(self):
+        with self.assertRaises(Http404):
+            serve_media(RequestFactory().get('/media/images/missing.jpg'), 'images/missing.jpg')
+        with self.assertRaises(Http404):
+            serve_media(RequestFactory().get('/media/../secret'), '../secret')
+
+
+class ConditionalPageTests(SimpleTestCase):
+
+    def setUp(self):
+        self.version = 1
+        self.modified = datetime(2026, 10, 19, 12, tzinfo=timezone.utc)
+        self.rendered = 0
+
+        def stamp(request, id):
+            return None if id == 0 else (self.version, self.modified)
+
+        @conditional_page(stamp)
+        def view(request, id):
+            self.rendered += 1
+            return HttpResponse(f'page {id}')
+
+        self.view = view
+
+    def get(self, user=None, method='get', **headers):
+        request = getattr(RequestFactory(), method)('/page/', **headers)
+        request.user = user or AnonymousUser()
+        return self.view(request, 1)
+
+    def test_etag_revalidation(self):
+        etag = self.get()['ETag']
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.rendered, 1)
+
+    def test_new_version_renders_again(self):
+        etag = self.get()['ETag']
+        self.version = 2
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.rendered, 2)
+
+    def test_last_modified_revalidation(self):
+        response = self.get()
+        self.assertEqual(response['Last-Modified'], http_date(self.modified.timestamp()))
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+    def test_etag_depends_on_the_viewer(self):
+        first, second = User(pk=1, username='first'), User(pk=2, username='second')
+        etag = self.get(user=first)['ETag']
+        self.assertEqual(self.get(user=first, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.get(user=second, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertNotEqual(self.get()['ETag'], etag)
+
+    def test_cache_control(self):
+        self.assertIn('private', self.get(user=User(pk=1))['Cache-Control'])
+        self.assertIn('public', self.get()['Cache-Control'])
+        self.assertIn('Cookie', self.get()['Vary'])
+
+    def test_only_safe_methods_are_revalidated(self):
+        etag = self.get()['ETag']
+        response = self.get(method='post', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_missing_object_runs_the_view(self):
+        request = RequestFactory().get('/page/', HTTP_IF_NONE_MATCH='*')
+        request.user = AnonymousUser()
+        response = self.view(request, 0)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+
+
+@override_settings(REPLICA_DATABASES=['replica_0'], REPLICA_STICKY_SECONDS=10)
+class ReplicaRouterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.reads = []
+
+    def request(self, write=False, cookie=None):
+        """
+        Run a ``@read_replica`` view reading (and writing) users through
+        the middleware; the databases it read from are in ``self.reads``.
+        """
+        @read_replica
+        def view(request):
+            self.reads.append(self.router.db_for_read(User))
+            if write:
+                self.router.db_for_write(User)
+                self.reads.append(self.router.db_for_read(User))
+            return HttpResponse()
+
+        request = RequestFactory().get('/')
+        if cookie is not None:
+            request.COOKIES[STICKY_COOKIE] = cookie
+        return ReplicaStickinessMiddleware(view)(request)
+
+    def test_reads_outside_replica_views_use_the_primary(self):
+        self.assertEqual(self.router.db_for_read(User), 'default')
+
+    def test_replica_view_reads_from_replicas(self):
+        response = self.request()
+        self.assertEqual(self.reads, ['replica_0'])
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+    def test_write_pins_the_rest_of_the_request_and_the_client(self):
+        response = self.request(write=True)
+        self.assertEqual(self.reads, ['replica_0', 'default'])
+        cookie = response.cookies[STICKY_COOKIE]
+        self.assertEqual(cookie['max-age'], 10)
+        self.assertAlmostEqual(float(cookie.value), time.time() + 10, delta=2)
+
+        self.reads.clear()
+        self.request(cookie=cookie.value)
+        self.assertEqual(self.reads, ['default'])
+
+    def test_expired_or_invalid_pin_is_ignored(self):
+        self.request(cookie=str(int(time.time() - 1)))
+        self.request(cookie='forever')
+        self.assertEqual(self.reads, ['replica_0', 'replica_0'])
+
+    def test_sessions_stay_on_the_primary(self):
+        @read_replica
+        def view(request):
+            return self.router.db_for_read(Session)
+
+        self.assertEqual(view(RequestFactory().get('/')), 'default')
+
+    def test_async_views(self):
+        @read_replica
+        async def view(request):
+            self.reads.append(self.router.db_for_read(User))
+            self.router.db_for_write(User)
+            return HttpResponse()
+
+        async def get_response(request):
+            return await view(request)
+
+        response = asyncio.run(ReplicaStickinessMiddleware(get_response)(RequestFactory().get('/')))
+        self.assertEqual(self.reads, ['replica_0'])
+        self.assertIn(STICKY_COOKIE, response.cookies)
+
+    @override_settings(REPLICA_DATABASES=[])
+    def test_without_replicas(self):
+        self.request()
+        self.assertEqual(self.reads, ['default'])
+
+
+class RegistryTests(SimpleTestCase):
+
+    def test_counters_and_histograms(self):
+        registry = Registry()
+        registry.describe('requests_total', 'counter', 'Requests.')
+        registry.describe('queries', 'histogram', 'Queries.')
+        registry.inc('requests_total', {'view': 'home', 'status': 200})
+        registry.inc('requests_total', {'status': 200, 'view': 'home'}, 2)
+        for value in (1, 3, 50):
+            registry.observe('queries', {'view': 'home'}, value, (1, 5, 10))
+        lines = registry.render().splitlines()
+        self.assertIn('# TYPE requests_total counter', lines)
+        self.assertIn('requests_total{status="200",view="home"} 3', lines)
+        # Buckets are cumulative
+        self.assertIn('queries_bucket{view="home",le="1"} 1', lines)
+        self.assertIn('queries_bucket{view="home",le="5"} 2', lines)
+        self.assertIn('queries_bucket{view="home",le="10"} 2', lines)
+        self.assertIn('queries_bucket{view="home",le="+Inf"} 3', lines)
+        self.assertIn('queries_sum{view="home"} 54', lines)
+
+    def test_label_values_are_escaped(self):
+        registry = Registry()
+        registry.describe('requests_total', 'counter', 'Requests.')
+        registry.inc('requests_total', {'view': 'a"b\\c\nd'})
+        self.assertIn('requests_total{view="a\\"b\\\\c\\nd"} 1', registry.render())
+
+    def test_gauges_come_from_collectors(self):
+        registry = Registry()
+        registry.describe('depth', 'gauge', 'Queue depth.')
+        registry.collector(lambda: [('depth', {'queue': 'default'}, 4)])
+        self.assertIn('depth{queue="default"} 4', registry.render())
+
+
+class InstrumentationMiddlewareTests(TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+        patcher = mock.patch.object(instrumentation, 'registry', self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def request(self, queries, uncounted_queries=0):
+        def view(request):
+            for _ in range(queries):
+                User.objects.count()
+            with uncounted():
+                for _ in range(uncounted_queries):
+                    User.objects.count()
+            return HttpResponse()
+
+        request = RequestFactory().get('/')
+        request.resolver_match = mock.Mock(view_name='home')
+        return InstrumentationMiddleware(view)(request)
+
+    def queries(self):
+        return self.registry.histograms[('bookmarks_db_queries', (('view', 'home'),))]['sum']
+
+    @override_settings(SERVER_TIMING=True)
+    def test_counts_queries(self):
+        response = self.request(2, uncounted_queries=3)
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('desc="2 queries"', response['Server-Timing'])
+        self.assertEqual(self.queries(), 2)
+        self.assertEqual(self.registry.counters[
+            ('bookmarks_requests_total', (('method', 'GET'), ('status', 200), ('view', 'home')))], 1)
+
+    @override_settings(SERVER_TIMING=False)
+    def test_server_timing_is_optional(self):
+        self.assertFalse(self.request(1).has_header('Server-Timing'))
+        self.assertEqual(self.queries(), 1)
+
+    @override_settings(QUERY_BUDGETS={'home': 1}, QUERY_BUDGET_ACTION='raise')
+    def test_over_budget_raises(self):
+        self.request(1)
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'home ran 2 queries, over its budget of 1'):
+            self.request(2)
+        self.assertEqual(self.registry.counters[('bookmarks_query_budget_exceeded_total', (('view', 'home'),))], 1)
+
+    @override_settings(QUERY_BUDGETS={'home': 1}, QUERY_BUDGET_ACTION='log')
+    def test_over_budget_logs(self):
+        with self.assertLogs('bookmarks.instrumentation', 'WARNING') as logs:
+            self.assertEqual(self.request(2).status_code, 200)
+        self.assertIn('over its budget of 1', logs.output[0])
+
+
+class MetricsAccessTests(TestCase):
+
+    def get(self, **headers):
+        return instrumentation.metrics(RequestFactory().get('/metrics', **headers))
+
+    @override_settings(METRICS_TOKEN=None, METRICS_ALLOWED_IPS=[])
+    def test_closed_by_default(self):
+        # Requests through a local proxy come from 127.0.0.1
+        with self.assertRaises(PermissionDenied):
+            self.get(REMOTE_ADDR='127.0.0.1')
+        with self.assertRaises(PermissionDenied):
+            self.get(HTTP_AUTHORIZATION='Bearer None')
+
+    @override_settings(METRICS_TOKEN='s3cret', METRICS_ALLOWED_IPS=[])
+    def test_bearer_token(self):
+        response = self.get(HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE bookmarks_requests_total counter', response.content.decode())
+        for header in ('Bearer wrong', 's3cret', 'Bearer s3cret ', 'Bearer sécret'):
+            with self.subTest(header=header), self.assertRaises(PermissionDenied):
+                self.get(HTTP_AUTHORIZATION=header)
+
+    @override_settings(METRICS_TOKEN=None, METRICS_ALLOWED_IPS=['10.0.0.5'])
+    def test_allowed_ips(self):
+        self.assertEqual(self.get(REMOTE_ADDR='10.0.0.5').status_code, 200)
+        with self.assertRaises(PermissionDenied):
+            self.get(REMOTE_ADDR='10.0.0.6')
+
+
+@override_settings(BOT_RATE_LIMIT=3, BOT_RATE_WINDOW=60, BOT_RATE_EXEMPT_IPS=[], TRUSTED_PROXY_COUNT=0,
+                   BOT_CACHE='default', BOT_CACHE_SECONDS=300)
+class ClassifyTests(SimpleTestCase):
+    browser = 'Mozilla/5.0 (X11; Linux x86_64; rv:131.0) Gecko/20100101 Firefox/131.0'
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def request(self, path='/images/', method='get', **headers):
+        headers.setdefault('HTTP_USER_AGENT', self.browser)
+        return getattr(RequestFactory(), method)(path, **headers)
+
+    def test_people(self):
+        self.assertIsNone(classify(self.request()))
+
+    def test_known_bots(self):
+        for user_agent in ('Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)',
+                           'facebookexternalhit/1.1', 'curl/8.4.0', 'python-requests/2.31', ''):
+            with self.subTest(user_agent=user_agent):
+                self.assertEqual(classify(self.request(HTTP_USER_AGENT=user_agent)), 'user-agent')
+
+    def test_prefetches(self):
+        for headers in ({'HTTP_PURPOSE': 'prefetch'}, {'HTTP_SEC_PURPOSE': 'prefetch;prerender'},
+                        {'HTTP_X_MOZ': 'prefetch'}, {'HTTP_X_PURPOSE': 'preview'}):
+            with self.subTest(headers=headers):
+                self.assertEqual(classify(self.request(**headers)), 'prefetch')
+        self.assertEqual(classify(self.request(method='head')), 'prefetch')
+
+    def test_rate_overflow(self):
+        reasons = [classify(self.request(REMOTE_ADDR='10.0.0.1')) for _ in range(5)]
+        self.assertEqual(reasons, [None, None, None, 'rate', 'rate'])
+        # Counted per address
+        self.assertIsNone(classify(self.request(REMOTE_ADDR='10.0.0.2')))
+
+    def test_previous_window_still_counts(self):
+        with mock.patch.object(bots.time, 'time', return_value=6000 - 1):
+            for _ in range(3):
+                classify(self.request(REMOTE_ADDR='10.0.0.1'))
+        # A quarter into the next window, three quarters of the previous one overlap
+        with mock.patch.object(bots.time, 'time', return_value=6000 + 15):
+            self.assertEqual(bots.request_rate('10.0.0.1'), 3 * 0.75 + 1)
+
+    def test_subresources_and_exempt_addresses_are_not_counted(self):
+        for _ in range(5):
+            self.assertIsNone(classify(self.request('/media/images/a.jpg', REMOTE_ADDR='10.0.0.1')))
+            self.assertIsNone(classify(self.request(REMOTE_ADDR='10.0.0.1', HTTP_X_REQUESTED_WITH='XMLHttpRequest')))
+            self.assertIsNone(classify(self.request(REMOTE_ADDR='10.0.0.1', HTTP_SEC_FETCH_DEST='empty')))
+        with override_settings(BOT_RATE_EXEMPT_IPS=['10.0.0.9']):
+            for _ in range(5):
+                self.assertIsNone(classify(self.request(REMOTE_ADDR='10.0.0.9')))
+
+    def test_counter_expiring_between_add_and_incr(self):
+        cache = caches['default']
+
+        def expire(key):
+            cache.delete(key)
+            raise ValueError(f'Key {key!r} not found.')
+        with mock.patch.object(cache, 'incr', side_effect=expire):
+            self.assertEqual(bots.request_rate('10.0.0.1', now=6000), 1)
+        self.assertEqual(bots.request_rate('10.0.0.1', now=6000), 2)
+
+    def test_clients_behind_a_proxy(self):
+        proxied = {'REMOTE_ADDR': '127.0.0.1', 'HTTP_X_FORWARDED_FOR': '203.0.113.9, 198.51.100.7'}
+        self.assertEqual(client_address(self.request(**proxied)), '127.0.0.1')
+        with override_settings(TRUSTED_PROXY_COUNT=1):
+            # The left entry is whatever the client sent
+            self.assertEqual(client_address(self.request(**proxied)), '198.51.100.7')
+            self.assertEqual(client_address(self.request(REMOTE_ADDR='127.0.0.1')), '127.0.0.1')
+            reasons = [classify(self.request(REMOTE_ADDR='127.0.0.1', HTTP_X_FORWARDED_FOR=f'10.0.0.{number}'))
+                       for number in range(5)]
+            self.assertEqual(reasons, [None] * 5)
+        with override_settings(TRUSTED_PROXY_COUNT=2):
+            self.assertEqual(client_address(self.request(**proxied)), '203.0.113.9')
+
+
+@override_settings(BOT_CACHE='default', BOT_CACHE_SECONDS=300, BOT_RATE_EXEMPT_IPS=[], ALLOWED_HOSTS=['*'])
+class BotCacheTests(SimpleTestCase):
+    crawler = 'Mozilla/5.0 (compatible; Googlebot/2.1)'
+
+    def setUp(self):
+        caches['default'].clear()
+        self.rendered = []
+
+        def view(request):
+            self.rendered.append(request.bot)
+            response = HttpResponse(f'page {len(self.rendered)}')
+            response.set_cookie('csrftoken', 'token')
+            return response
+
+        self.middleware = BotFilterMiddleware(view)
+
+    def get(self, path='/images/', user_agent=crawler, **headers):
+        return self.middleware(RequestFactory().get(path, HTTP_USER_AGENT=user_agent, **headers))
+
+    def test_crawlers_are_answered_from_the_cache(self):
+        first = self.get()
+        self.assertNotIn('csrftoken', first.cookies)
+        self.assertEqual(self.get().content, first.content)
+        self.assertEqual(self.rendered, ['user-agent'])
+        # Per URL and host
+        self.get('/images/?page=2')
+        self.get(HTTP_HOST='other.example.com')
+        self.assertEqual(len(self.rendered), 3)
+
+    def test_people_and_sessions_are_not_cached(self):
+        self.get(user_agent='Mozilla/5.0 Firefox')
+        self.get(user_agent='Mozilla/5.0 Firefox')
+        self.get(HTTP_COOKIE='sessionid=abc')
+        self.get(HTTP_COOKIE='sessionid=abc')
+        self.assertEqual(self.rendered, [None, None, 'user-agent', 'user-agent'])
+
+    def test_prefetches_get_a_fresh_page(self):
+        for _ in range(2):
+            response = self.get(user_agent='Mozilla/5.0 Firefox', HTTP_SEC_PURPOSE='prefetch')
+            self.assertIn('csrftoken', response.cookies)
+        self.assertEqual(self.rendered, ['prefetch', 'prefetch'])
+
+    @override_settings(BOT_CACHE_SECONDS=0)
+    def test_cache_can_be_disabled(self):
+        self.get()
+        self.get()
+        self.assertEqual(len(self.rendered), 2)
+
+
+class DiskCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = DiskCache(directory.name, 1000)
+
+    def put(self, name, size, age):
+        path = self.cache.put(name, lambda destination: destination.write(b'x' * size))
+        os.utime(path, (time.time() - age, time.time() - age))
+
+    def test_least_recently_used_are_evicted_down_to_90_percent(self):
+        for name, age in (('c', 100), ('b', 90), ('a', 80)):
+            self.put(name, 300, age)
+        # A hit makes "c" the most recently used
+        self.assertIsNotNone(self.cache.get('c'))
+        self.put('d', 400, age=0)
+        self.assertEqual([name for name in 'abcd' if self.cache.get(name)], ['c', 'd'])
+        self.assertEqual(self.cache.total, 700)
+
+    def test_size_is_scanned_by_each_process(self):
+        self.put('a', 600, age=10)
+        other = DiskCache(self.cache.directory, 1000)
+        other.put('b', lambda destination: destination.write(b'x' * 600))
+        self.assertIsNone(other.get('a'))
+        self.assertIsNotNone(other.get('b'))
+
+
+@override_settings(MEDIA_SIGNED_URLS=True, MEDIA_SIGNED_URL_TTL=3600)
+class SignedUrlTests(SimpleTestCase):
+
+    def test_expiry_is_stable_for_a_period(self):
+        # Valid for at least a full period
+        self.assertEqual(url_expiry(now=7200), 4 * 3600)
+        self.assertEqual(url_expiry(now=7200 + 3599), 4 * 3600)
+        self.assertEqual(url_expiry(now=7200 + 3600), 5 * 3600)
+
+    def test_signed_urls(self):
+        backend = LocalBackend(tempfile.gettempdir(), '/media/')
+        expires = url_expiry()
+        url = backend.url('images/a b.jpg', expires)
+        self.assertTrue(url.startswith('/media/images/a%20b.jpg?expires='))
+        params = dict(parameter.split('=') for parameter in url.split('?')[1].split('&'))
+        self.assertTrue(verify_signed_path('images/a b.jpg', params))
+
+        self.assertFalse(verify_signed_path('images/other.jpg', params))
+        self.assertFalse(verify_signed_path('images/a b.jpg', {**params, 'expires': str(expires + 3600)}))
+        self.assertFalse(verify_signed_path('images/a b.jpg', {**params, 'signature': params['signature'][:-1]}))
+        self.assertFalse(verify_signed_path('images/a b.jpg', {**params, 'expires': '-1'}))
+        self.assertFalse(verify_signed_path('images/a b.jpg', {'expires': params['expires']}))
+        with mock.patch.object(storage.time, 'time', return_value=expires + 1):
+            self.assertFalse(verify_signed_path('images/a b.jpg', params))
+
+
+@override_settings(MEDIA_MULTIPART_THRESHOLD=10, MEDIA_MULTIPART_CHUNK_SIZE=10, MEDIA_CACHE_MAX_BYTES=0)
+class ObjectStorageTests(SimpleTestCase):
+
+    def setUp(self):
+        with mock.patch.object(storage, 'boto3') as boto3:
+            self.backend = S3Backend('bucket')
+        self.client = boto3.client.return_value
+        self.client.create_multipart_upload.return_value = {'UploadId': 'upload'}
+        self.client.upload_part.side_effect = lambda **kwargs: {'ETag': f'etag{kwargs["PartNumber"]}'}
+        self.storage = ObjectStorage(self.backend)
+        # _save(): save() would first look for a free name with HEAD requests
+
+    def test_small_files_are_put_whole(self):
+        self.assertEqual(self.storage._save('images/a.jpg', ContentFile(b'0123456789')), 'images/a.jpg')
+        self.client.put_object.assert_called_once_with(Bucket='bucket', Key='images/a.jpg', Body=b'0123456789',
+                                                       ContentType='image/jpeg')
+        self.client.create_multipart_upload.assert_not_called()
+
+    def test_large_files_are_uploaded_in_parts(self):
+        self.storage._save('images/a.jpg', ContentFile(b'x' * 25))
+        parts = [(call.kwargs['PartNumber'], call.kwargs['Body']) for call in self.client.upload_part.call_args_list]
+        self.assertEqual(parts, [(1, b'x' * 10), (2, b'x' * 10), (3, b'x' * 5)])
+        self.client.complete_multipart_upload.assert_called_once_with(
+            Bucket='bucket', Key='images/a.jpg', UploadId='upload',
+            MultipartUpload={'Parts': [{'PartNumber': number, 'ETag': f'etag{number}'} for number in (1, 2, 3)]},
+        )
+
+    def test_failed_uploads_are_aborted(self):
+        self.client.upload_part.side_effect = [{'ETag': 'etag1'}, ConnectionError]
+        with self.assertRaises(ConnectionError):
+            self.storage._save('images/a.jpg', ContentFile(b'x' * 25))
+        self.client.abort_multipart_upload.assert_called_once_with(Bucket='bucket', Key='images/a.jpg',
+                                                                   UploadId='upload')
+        self.client.complete_multipart_upload.assert_not_called()
+
+
+class ReadThroughCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(MEDIA_CACHE_DIR=os.path.join(directory.name, 'cache'), MEDIA_CACHE_MAX_BYTES=1000)
+        override.enable()
+        self.addCleanup(override.disable)
+        # A remote store, as far as the storage can tell
+        self.backend = LocalBackend(os.path.join(directory.name, 'store'), '/media/')
+        self.backend.is_local = False
+        self.storage = ObjectStorage(self.backend)
+        for name in 'abcd':
+            self.storage.save(f'{name}.jpg', ContentFile(name.encode() * 400))
+
+    def read(self, name):
+        with self.storage.open(name) as f:
+            return f.read()
+
+    def test_reads_go_through_the_cache(self):
+        with mock.patch.object(self.backend, 'download', wraps=self.backend.download) as download:
+            self.assertEqual(self.read('a.jpg'), b'a' * 400)
+            self.assertEqual(self.read('a.jpg'), b'a' * 400)
+        download.assert_called_once()
+
+    def test_cache_is_evicted_at_its_size_limit(self):
+        for name in 'abcd':
+            self.read(f'{name}.jpg')
+            time.sleep(0.01)
+        cached = [name for name in 'abcd' if self.storage.cache.get(f'{name}.jpg')]
+        self.assertEqual(cached, ['c', 'd'])
+        self.assertLessEqual(self.storage.cache.total, 900)
+        # Evicted objects are downloaded again
+        self.assertEqual(self.read('a.jpg'), b'a' * 400)
+
+    def test_replaced_objects_are_dropped_from_the_cache(self):
+        self.read('a.jpg')
+        self.storage.replace('a.jpg', ContentFile(b'new'))
+        self.assertEqual(self.read('a.jpg'), b'new')
+
+
+@skipUnless(settings.PARTIALS_ENGINE == 'jinja2', 'needs Jinja2')
+class PartialsTests(TestCase):
+    title = '<script>alert("Tom & Jerry\'s")</script>'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', first_name='<b>Owner</b>', last_name='O\'Brien')
+        Profile.objects.create(user=cls.user, photo='users/owner.jpg')
+        cls.friend = User.objects.create_user('friend', first_name='Friend')
+        Profile.objects.create(user=cls.friend)
+        # bulk_create: no thumbnail or stats signals
+        cls.image, = Image.objects.bulk_create([Image(user=cls.user, title=cls.title, slug='script',
+                                                      url='https://example.com/a.jpg', image='images/a.jpg')])
+        Action.objects.bulk_create([
+            Action(user=cls.user, verb='bookmarked image', target=cls.image),
+            Action(user=cls.friend, verb='is following', target=cls.user),
+            Action(user=cls.friend, verb='has created an account'),
+        ])
+
+    def setUp(self):
+        # Stored derivatives, without files
+        patcher = mock.patch.object(responsive, 'srcset', lambda file, alias: [
+            ('webp', [(f'/media/{file.name}.{alias}.webp', 1), (f'/media/{file.name}.{alias}@2x.webp', 2)]),
+            ('fallback', [(f'/media/{file.name}.{alias}.jpg', 1), (f'/media/{file.name}.{alias}@2x.jpg', 2)]),
+        ])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        card = ImageCard.from_image(self.image)
+        actions = list(Action.objects.select_related('user', 'user__profile').prefetch_related('target'))
+        self.contexts = {
+            'images/image/list_images.html': {'images': [card]},
+            'images/image/ranking_list.html': {'most_viewed': [(card, 1), (card, 2)], 'by': 'unique'},
+            'actions/action/list.html': {'actions': actions},
+        }
+
+    def test_both_engines_render_the_same_html(self):
+        for template_name, context in self.contexts.items():
+            with self.subTest(template_name=template_name):
+                html = render_partial(template_name, context, engine='jinja2')
+                self.assertEqual(html, render_partial(template_name, context, engine='django'))
+                self.assertNotIn('<script>', html)
+                self.assertNotIn('<b>', html)
+
+    def test_values_are_escaped_like_django(self):
+        for template_name in ('images/image/list_images.html', 'actions/action/list.html'):
+            with self.subTest(template_name=template_name):
+                html = render_partial(template_name, self.contexts[template_name], engine='jinja2')
+                self.assertIn('&lt;script&gt;alert(&quot;Tom &amp; Jerry&#x27;s&quot;)&lt;/script&gt;', html)
+        html = render_partial('actions/action/list.html', self.contexts['actions/action/list.html'], engine='jinja2')
+        self.assertEqual(html.count('<div class="action">'), 3)
+        self.assertIn('&lt;b&gt;Owner&lt;/b&gt;', html)
+        # Safe markup isn't escaped twice
+        self.assertIn('<picture><source type="image/webp" srcset="/media/users/owner.jpg.avatar.webp 1x', html)
+        self.assertIn('alt="&lt;b&gt;Owner&lt;/b&gt; O&#x27;Brien"', html)
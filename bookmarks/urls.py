@@ -6,16 +6,24 @@ This file maps URL patterns to views for the project, including:
 - User account management
 - Social authentication
 - Image management
+- Live updates (Server-Sent Events, under ASGI only)
+- JSON API
+- Prometheus metrics
+- Profiled requests (admin)
 - Debug toolbar (for development)
-- Serving media files in development
+- Serving media files (with sendfile/X-Accel-Redirect in production)
 """
 
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
-from django.conf.urls.static import static
+from bookmarks.media import serve_media
+from bookmarks.instrumentation import metrics
 
 urlpatterns = [
+    # Profiled requests (staff only, see profiling/)
+    path('admin/profiles/', include('profiling.urls', namespace='profiling')),
+
     # Admin site
     path('admin/', admin.site.urls),
     
@@ -27,11 +35,25 @@ urlpatterns = [
     
     # Image app URLs (uploading, browsing, etc.)
     path('images/', include('images.urls', namespace='images')),
-    
-    # Debug toolbar URLs (only available in development)
-    path('__debug__/', include("debug_toolbar.urls"))
+
+    # JSON API (images, profiles, contacts, actions)
+    path('api/', include('api.urls', namespace='api')),
+
+    # Request metrics in the Prometheus text format
+    path('metrics', metrics, name='metrics'),
 ]
 
-# Serve media files in development (DEBUG=True)
+# Live updates over Server-Sent Events (like counts, activity feed). The
+# streams are async views: under WSGI Django would consume them whole
+# before sending anything, so they only exist when served by ASGI.
+if settings.ASYNC_AJAX_VIEWS:
+    urlpatterns += [path('live/', include('live.urls', namespace='live'))]
+
+# Debug toolbar URLs (only available in development)
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    urlpatterns += [path('__debug__/', include("debug_toolbar.urls"))]
+
+# Serve media files (see settings.MEDIA_SERVE_MODE)
+urlpatterns += [
+    re_path(rf'^{settings.MEDIA_URL.strip("/")}/(?P<path>.*)$', serve_media, name='media'),
+]
@@ -1,8 +1,27 @@
 from django.contrib import admin
-from .models import Image
+from bookmarks.admin import BackgroundDeletionAdmin
+from .deletion import soft_delete
+from .models import Image, ImageStats, Tag
 # Register your models here.
 
+
 @admin.register(Image)
-class ImageAdmin(admin.ModelAdmin):
+class ImageAdmin(BackgroundDeletionAdmin):
     list_display = ['title','slug','image','created']
-    list_filter = ['created']
\ No newline at end of file
+    list_filter = ['created']
+
+    def soft_delete(self, queryset):
+        return soft_delete(queryset)
+
+
+@admin.register(ImageStats)
+class ImageStatsAdmin(admin.ModelAdmin):
+    list_display = ['image','views','unique_viewers','likes','actions','last_activity']
+    ordering = ['-views']
+
+
+@admin.register(Tag)
+class TagAdmin(admin.ModelAdmin):
+    list_display = ['name','count']
+    search_fields = ['name']
+    ordering = ['-count']
@@ -0,0 +1,188 @@
+"""
+Image cards: the read model the image grids are rendered from.
+
+A grid cell only needs the image's id, title, URL, grid thumbnail markup
+and like count, yet rendering it from ``Image`` objects costs a model
+instance, a ``reverse()`` and a ``{% picture %}`` tag (a storage URL per
+format and density) per cell on every request. Instead each image has a
+card in Redis, ``image:{id}:card``: those five values, plus the media URL
+epoch, packed with msgpack as a plain array (no field names, ~300 bytes).
+
+- ``get_cards(ids)`` reads a page of cards with one MGET; only the missing
+  ones are built from the database (one query) and stored.
+- Cards are invalidated, not rewritten, when an image changes: on save
+  (which every like change goes through, see images.signals), on bulk
+  like count updates, new derivatives and deletion. The next read
+  rebuilds them.
+- A read may build a card from rows an update is about to replace. So an
+  invalidation also sets the image's card version, ``image:{id}:card:v``
+  (a timestamp), and a rebuilt card is only stored if the version is
+  still the one read before the rows were: a card built before the
+  update was committed is never stored after its invalidation.
+- With signed media URLs (see bookmarks.storage.url_epoch) a card built
+  in an earlier URL period counts as missing, so no page links to expired
+  thumbnails.
+
+Cards expire after IMAGE_CARDS_TTL seconds so images nobody browses don't
+hold memory. Without msgpack installed (or with IMAGE_CARDS = False)
+cards are built from the database on every read, like the grids used to.
+"""
+
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.safestring import mark_safe
+
+from bookmarks.instrumentation import InstrumentedRedis
+from bookmarks.storage import url_epoch
+
+from .models import Image
+from .templatetags.responsive import picture
+from . import versions
+from .thumbnail_urls import prefetch
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# connect redis database
+r = InstrumentedRedis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB)
+
+# Columns a card is built from
+CARD_FIELDS = ['id', 'slug', 'title', 'image', 'image_derivatives', 'total_likes']
+
+
+def card_key(image_id):
+    return f'image:{image_id}:card'
+
+
+def version_key(image_id):
+    return f'image:{image_id}:card:v'
+
+
+# Store a card (KEYS[1]) unless its version (KEYS[2]) is no longer ARGV[1]
+STORE_SCRIPT = """
+local version = redis.call('GET', KEYS[2]) or ''
+if version == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+end
+return 0
+"""
+
+
+def enabled():
+    return settings.IMAGE_CARDS and msgpack is not None
+
+
+class ImageCard:
+    """
+    What a grid shows of an image.
+
+    Attributes:
+        id (int), title (str), url (str): The image and its detail page.
+        picture (str): ``{% picture image.image 'grid' %}`` markup (safe HTML).
+        total_likes (int): Number of likes.
+        epoch (int): Media URL epoch the picture was rendered in.
+    """
+    __slots__ = ('id', 'title', 'url', 'picture', 'total_likes', 'epoch')
+
+    def __init__(self, id, title, url, picture, total_likes, epoch=None):
+        self.id = id
+        self.title = title
+        self.url = url
+        self.picture = picture
+        self.total_likes = total_likes
+        self.epoch = epoch
+
+    def __repr__(self):
+        return f'<ImageCard {self.id}: {self.title}>'
+
+    # Templates can link cards like images
+    def get_absolute_url(self):
+        return self.url
+
+    @classmethod
+    def from_image(cls, image, epoch=None):
+        return cls(image.id, image.title, image.get_absolute_url(), picture(image.image, 'grid'),
+                   image.total_likes, epoch)
+
+    def pack(self):
+        return msgpack.packb([self.id, self.title, self.url, str(self.picture), self.total_likes, self.epoch])
+
+    @classmethod
+    def unpack(cls, data):
+        id, title, url, picture, total_likes, epoch = msgpack.unpackb(data)
+        return cls(id, title, url, mark_safe(picture), total_likes, epoch)
+
+
+def build_cards(image_ids, epoch=None):
+    """
+    Cards of the (non deleted) images among ``image_ids``, from the database.
+
+    Returns:
+        dict {image id: ImageCard}.
+    """
+    images = list(Image.objects.filter(id__in=image_ids).only(*CARD_FIELDS).order_by())
+    # Images without current derivatives: their thumbnails in one go
+    prefetch((image.image, 'grid') for image in images)
+    return {image.id: ImageCard.from_image(image, epoch) for image in images}
+
+
+def get_cards(image_ids):
+    """
+    Cards of ``image_ids``, in the same order; ids of missing or deleted
+    images are left out.
+    """
+    image_ids = list(image_ids)
+    if not image_ids:
+        return []
+    if not enabled():
+        cards = build_cards(image_ids)
+    else:
+        epoch = url_epoch()
+        cards = {}
+        # The versions are read before the rows the missing cards are built from
+        values = r.mget([card_key(image_id) for image_id in image_ids] +
+                        [version_key(image_id) for image_id in image_ids])
+        card_versions = dict(zip(image_ids, values[len(image_ids):]))
+        for image_id, data in zip(image_ids, values):
+            if data is not None:
+                card = ImageCard.unpack(data)
+                if card.epoch == epoch:
+                    cards[image_id] = card
+        missing = [image_id for image_id in image_ids if image_id not in cards]
+        if missing:
+            built = build_cards(missing, epoch)
+            pipe = r.pipeline(transaction=False)
+            for image_id, card in built.items():
+                pipe.eval(STORE_SCRIPT, 2, card_key(image_id), version_key(image_id),
+                          card_versions[image_id] or b'', card.pack(), settings.IMAGE_CARDS_TTL)
+            pipe.execute()
+            cards.update(built)
+    return [cards[image_id] for image_id in image_ids if image_id in cards]
+
+
+def invalidate(image_ids):
+    """
+    Drop the cards of images that changed; they are rebuilt when next shown.
+
+    Deferred until the current transaction commits, or a concurrent read
+    could rebuild a card from the old rows. The image list version moves
+    forward too (see images.versions).
+    """
+    image_ids = list(image_ids)
+    if image_ids:
+        versions.bump(versions.LIST)
+    if image_ids and enabled():
+        transaction.on_commit(lambda: drop(image_ids))
+
+
+def drop(image_ids):
+    version = time.time_ns()
+    pipe = r.pipeline(transaction=False)
+    for image_id in image_ids:
+        pipe.set(version_key(image_id), version, ex=settings.IMAGE_CARDS_TTL)
+    pipe.delete(*[card_key(image_id) for image_id in image_ids])
+    pipe.execute()
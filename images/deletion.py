@@ -0,0 +1,132 @@
+"""
+Soft deletion of images and their purge in bounded batches.
+
+Deleting an image with ``Image.delete()`` removes its like rows and the
+stats row in the same transaction, and leaves behind the actions that
+target it (a generic relation has no cascade) and its media files.
+Instead, ``soft_delete`` only sets ``Image.deleted`` (the default manager
+hides such images at once) and queues ``images.tasks.purge_image``, which
+removes, a batch of DELETION_BATCH_SIZE rows per transaction:
+
+1. the like rows of the image
+2. the actions targeting it
+3. its Redis counters and rankings, its hashtags, then the row itself
+
+and queues the deletion of its files (original, derivatives and on-demand
+thumbnails) on the images queue. Files shared with another image (the
+benchmark data set reuses a few) are kept.
+"""
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from account.models import Profile
+from actions.models import Action
+
+from .models import Image
+from . import cards, stats, tags
+
+
+def delete_in_batches(queryset, batch_size):
+    """
+    Delete the rows of ``queryset`` ``batch_size`` at a time, each batch in
+    its own transaction; yields the number of rows of each batch.
+    """
+    model = queryset.model
+    while True:
+        ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return
+        with transaction.atomic():
+            model._base_manager.filter(pk__in=ids).delete()
+        yield len(ids)
+
+
+def soft_delete(queryset):
+    """
+    Hide the images of ``queryset`` now and queue their purge once the
+    transaction commits.
+
+    Returns:
+        Number of images deleted.
+    """
+    from .tasks import purge_image
+    image_ids = list(queryset.filter(deleted=None).values_list('id', flat=True))
+    Image.all_objects.filter(id__in=image_ids).update(deleted=timezone.now())
+    cards.invalidate(image_ids)
+
+    def purge():
+        for image_id in image_ids:
+            purge_image.enqueue(args=[image_id], dedup_key=f'purge_image:{image_id}')
+    transaction.on_commit(purge)
+    return len(image_ids)
+
+
+def recount_likes(image_ids):
+    """
+    Recompute total_likes (and the ImageStats likes) after like rows were
+    deleted in bulk, in one UPDATE.
+    """
+    likes = Image.users_like.through.objects.filter(image_id=OuterRef('pk')) \
+        .values('image_id').annotate(count=Count('*')).values('count')
+    Image.all_objects.filter(id__in=image_ids).update(total_likes=Coalesce(Subquery(likes), Value(0)))
+    stats.record_likes(dict(Image.all_objects.filter(id__in=image_ids).values_list('id', 'total_likes')))
+    cards.invalidate(image_ids)
+
+
+def media_names(file, derivatives):
+    """
+    Names of a stored file and of its rendered derivatives.
+    """
+    if not file:
+        return []
+    names = [file.name]
+    for formats in (derivatives or {}).get('aliases', {}).values():
+        for format_names in formats.values():
+            names.extend(format_names)
+    return names
+
+
+def is_shared(name):
+    """
+    Whether more than one image or profile photo uses the stored file ``name``.
+    """
+    return Image.all_objects.filter(image=name).count() + Profile.objects.filter(photo=name).count() > 1
+
+
+def purge_batches(image_id, batch_size):
+    """
+    Purge a soft-deleted image, yielding after each batch (see module).
+    """
+    from .tasks import delete_media
+    image = Image.all_objects.filter(id=image_id).exclude(deleted=None).first()
+    if image is None:
+        # Purged already (or never deleted)
+        return
+    Like = Image.users_like.through
+    yield from delete_in_batches(Like.objects.filter(image_id=image_id), batch_size)
+    image_ct = ContentType.objects.get_for_model(Image)
+    yield from delete_in_batches(Action.objects.filter(target_ct=image_ct, target_id=image_id), batch_size)
+    stats.forget(image_id)
+    # Cascading would leave the tag counts behind
+    tags.set_tags(image_id, [], trending=False)
+    names = [] if is_shared(image.image.name) else media_names(image.image, image.image_derivatives)
+    with transaction.atomic():
+        image.delete()
+        if names:
+            delete_media.enqueue(args=[names])
+    yield 1
+
+
+def delete_files(names):
+    """
+    Delete stored files and the thumbnails easy_thumbnails rendered from them.
+    """
+    from easy_thumbnails.files import get_thumbnailer
+    for name in names:
+        get_thumbnailer(Image(image=name).image).delete_thumbnails()
+        default_storage.delete(name)
@@ -0,0 +1,289 @@
+"""
+Image derivative pipeline.
+
+At ingest, uploaded and downloaded originals are normalized: EXIF metadata
+is stripped (after applying its orientation) and oversized images are
+downsized to settings.IMAGE_MAX_DIMENSION.
+
+After save, every thumbnail alias defined for the field in
+settings.THUMBNAIL_ALIASES (e.g. 'images.Image.image') is rendered at each
+density in settings.RESPONSIVE_IMAGE_DENSITIES, in every modern format
+Pillow supports (AVIF, WebP) plus the usual JPEG/PNG fallback. The resulting
+names are stored on the model (``<field>_derivatives``) so the
+``{% picture %}`` tag can emit ``<picture>``/``srcset`` markup without
+looking anything up. New variants are uploaded to storage in parallel.
+"""
+
+from functools import lru_cache
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from easy_thumbnails import signals
+from easy_thumbnails.alias import aliases
+from easy_thumbnails.engine import NoSourceGenerator
+from easy_thumbnails.exceptions import EasyThumbnailsError
+from easy_thumbnails.files import get_thumbnailer
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+from bookmarks.instrumentation import timed
+from bookmarks.storage import save_in_parallel
+
+from .thumbnails import SharedSource
+
+# Fallback format key: whatever easy_thumbnails produces by default (jpg, or png for transparency)
+FALLBACK = 'fallback'
+
+# Raised by easy_thumbnails for sources it can't read (e.g. a page saved as .jpg)
+THUMBNAIL_ERRORS = (EasyThumbnailsError, NoSourceGenerator, OSError)
+
+MIME_TYPES = {
+    'avif': 'image/avif',
+    'webp': 'image/webp',
+}
+
+
+@lru_cache()
+def modern_formats():
+    """
+    Formats from settings.IMAGE_DERIVATIVE_FORMATS that this Pillow can encode,
+    in order of preference.
+    """
+    return [fmt for fmt in settings.IMAGE_DERIVATIVE_FORMATS if features.check(fmt)]
+
+
+# easy_thumbnails passes JPEG-style integer subsampling to every encoder
+# (Pillow's AVIF encoder wants the 'J:a:b' notation) and drops the quality
+# of formats other than JPEG/WebP, so both are fixed up when saving
+AVIF_SUBSAMPLING = {0: '4:4:4', 1: '4:2:2', 2: '4:2:0'}
+
+
+def _avif_saver(save_handler):
+    def save(image, fp, filename):
+        subsampling = image.encoderinfo.get('subsampling')
+        if isinstance(subsampling, int):
+            image.encoderinfo['subsampling'] = AVIF_SUBSAMPLING.get(subsampling, '4:2:0')
+        if 'avif' in settings.IMAGE_DERIVATIVE_QUALITY:
+            image.encoderinfo.setdefault('quality', settings.IMAGE_DERIVATIVE_QUALITY['avif'])
+        save_handler(image, fp, filename)
+    return save
+
+
+Image.init()
+if 'AVIF' in Image.SAVE:
+    Image.register_save('AVIF', _avif_saver(Image.SAVE['AVIF']))
+
+
+# -------------------------------
+# Ingest normalization
+# -------------------------------
+
+def normalize_image(data):
+    """
+    Strip EXIF metadata and downsize an original image.
+
+    Images that are already small enough and carry no EXIF are returned
+    untouched to avoid a lossy re-encode, and so is anything Pillow can't
+    read (thumbnailing reports those later, as before).
+
+    Args:
+        data (bytes): Encoded image.
+
+    Returns:
+        bytes of the normalized image, in the original format.
+    """
+    try:
+        image = Image.open(BytesIO(data))
+    except (UnidentifiedImageError, OSError):
+        return data
+    image_format = image.format
+    max_dimension = settings.IMAGE_MAX_DIMENSION
+    has_exif = bool(image.getexif()) or 'exif' in image.info
+    if not has_exif and max(image.size) <= max_dimension:
+        return data
+
+    # Apply the orientation before the EXIF data holding it is dropped
+    image = ImageOps.exif_transpose(image)
+    if max(image.size) > max_dimension:
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+    options = {}
+    if image.info.get('icc_profile'):
+        options['icc_profile'] = image.info['icc_profile']
+    if image_format == 'JPEG':
+        if image.mode not in ('RGB', 'L', 'CMYK'):
+            image = image.convert('RGB')
+        options.update(quality=settings.IMAGE_INGEST_QUALITY, optimize=True, progressive=True)
+    elif image_format == 'PNG':
+        options['optimize'] = True
+
+    output = BytesIO()
+    image.save(output, format=image_format, **options)
+    return output.getvalue()
+
+
+def normalize_upload(file):
+    """
+    Normalize an uploaded file, keeping its name.
+    """
+    file.seek(0)
+    return ContentFile(normalize_image(file.read()), name=file.name)
+
+
+# -------------------------------
+# Derivatives
+# -------------------------------
+
+def _variant_options(options, density):
+    variant = dict(options)
+    variant['size'] = tuple(int(dim) * density for dim in options['size'])
+    return variant
+
+
+def _thumbnailer(file, options, fmt, source):
+    thumbnailer = get_thumbnailer(file)
+    if source is not None:
+        thumbnailer.source_generators = [source]
+    if fmt != FALLBACK:
+        if fmt in settings.IMAGE_DERIVATIVE_QUALITY:
+            options = dict(options, quality=settings.IMAGE_DERIVATIVE_QUALITY[fmt])
+        thumbnailer.thumbnail_extension = fmt
+        thumbnailer.thumbnail_transparency_extension = fmt
+        thumbnailer.thumbnail_preserve_extensions = False
+    return thumbnailer, options
+
+
+def generate_variant(file, options, fmt=FALLBACK, source=None):
+    """
+    Generate (or reuse) one thumbnail of ``file`` in ``fmt``.
+
+    Args:
+        source (SharedSource): Optional decoder shared by the variants of ``file``.
+
+    Returns:
+        The thumbnail's storage name.
+    """
+    thumbnailer, options = _thumbnailer(file, options, fmt, source)
+    with timed('thumbnail'):
+        return thumbnailer.get_thumbnail(options).name
+
+
+def save_thumbnails(pending):
+    """
+    Upload freshly generated thumbnails concurrently.
+
+    Args:
+        pending: (thumbnailer, unsaved ThumbnailFile) pairs. The uploads run
+            in parallel; easy_thumbnails' cache rows and signals are then
+            handled here, like ``Thumbnailer.save_thumbnail`` does.
+    """
+    if not pending:
+        return
+    storage = pending[0][0].thumbnail_storage
+    save_in_parallel(storage, [(thumbnail.name, thumbnail) for thumbnailer, thumbnail in pending])
+    for thumbnailer, thumbnail in pending:
+        thumbnailer.get_thumbnail_cache(thumbnail.name, create=True, update=True)
+        signals.thumbnail_created.send(sender=thumbnail)
+
+
+def generate_derivatives(file):
+    """
+    Render every thumbnail alias of ``file`` in every format and density.
+
+    Returns:
+        dict {'source': name, 'aliases': {alias: {format: [name per density]}}}.
+
+    Raises:
+        One of THUMBNAIL_ERRORS if the source can't be thumbnailed.
+    """
+    variants = {
+        alias: [_variant_options(options, density) for density in settings.RESPONSIVE_IMAGE_DENSITIES]
+        for alias, options in aliases.all(target=file, include_global=False).items()
+    }
+    # The source is decoded (at most) once for all aliases, formats and densities
+    source = SharedSource(options for alias_variants in variants.values() for options in alias_variants)
+    data = {'source': file.name, 'aliases': {}}
+    pending = []
+    for alias, alias_variants in variants.items():
+        formats = data['aliases'][alias] = {}
+        for fmt in modern_formats() + [FALLBACK]:
+            formats[fmt] = []
+            for options in alias_variants:
+                thumbnailer, fmt_options = _thumbnailer(file, options, fmt, source)
+                with timed('thumbnail'):
+                    thumbnail = thumbnailer.get_thumbnail(fmt_options, save=False)
+                if not thumbnail._committed:
+                    pending.append((thumbnailer, thumbnail))
+                formats[fmt].append(thumbnail.name)
+    save_thumbnails(pending)
+    return data
+
+
+def derivatives_for(file):
+    """
+    The stored derivatives of ``file``, if they are current.
+
+    They live in the ``<field name>_derivatives`` field of the model
+    instance owning the file.
+    """
+    instance = getattr(file, 'instance', None)
+    field = getattr(file, 'field', None)
+    if instance is None or field is None:
+        return None
+    data = getattr(instance, f'{field.name}_derivatives', None)
+    if not data or data.get('source') != file.name:
+        return None
+    return data
+
+
+def update_derivatives(instance, field_name):
+    """
+    Regenerate the derivatives of ``instance.<field_name>`` if the file changed.
+
+    Saves the new value with a queryset update, so no save signals fire again.
+    """
+    file = getattr(instance, field_name)
+    stored = getattr(instance, f'{field_name}_derivatives') or {}
+    if not file:
+        data = {}
+    elif stored.get('source') == file.name:
+        return
+    else:
+        try:
+            data = generate_derivatives(file)
+        except THUMBNAIL_ERRORS:
+            # Not an image we can read; the templates fall back to on-demand variants
+            data = {'source': file.name, 'aliases': {}}
+    if data == stored:
+        return
+    setattr(instance, f'{field_name}_derivatives', data)
+    type(instance).objects.filter(pk=instance.pk).update(**{f'{field_name}_derivatives': data})
+
+
+def srcset(file, alias):
+    """
+    Per-format srcset data for one alias of ``file``.
+
+    Stored derivatives are used when current; otherwise the variants are
+    resolved (memoized, rendered on demand like the ``{% thumbnail %}`` tag
+    does if need be) by images.thumbnail_urls, which views can also ask to
+    resolve a whole page up front.
+
+    Returns:
+        list of (format, [(url, density), ...]) with the fallback last;
+        formats that could not be generated are left out.
+    """
+    from .thumbnail_urls import resolved_names
+    storage = get_thumbnailer(file).thumbnail_storage
+    data = derivatives_for(file)
+    stored = data['aliases'].get(alias, {}) if data else {}
+    formats = modern_formats() + [FALLBACK]
+    on_demand = resolved_names(file, alias) if any(fmt not in stored for fmt in formats) else {}
+    densities = settings.RESPONSIVE_IMAGE_DENSITIES
+    result = []
+    for fmt in formats:
+        names = stored.get(fmt) or on_demand.get(fmt)
+        if names is None:
+            continue
+        result.append((fmt, [(storage.url(name), density) for name, density in zip(names, densities)]))
+    return result
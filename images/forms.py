@@ -2,7 +2,8 @@ from django import forms
 from .models import Image
 from django.core.files.base import ContentFile
 from django.utils.text import slugify
-import requests
+from .derivatives import normalize_image
+from .remote import fetch
 
 class ImageCreateForm(forms.ModelForm):
     """
@@ -36,6 +37,8 @@ class ImageCreateForm(forms.ModelForm):
             - Download the image from the provided URL
             - Save it to the model's ImageField
             - Optionally commit to the database
+
+        Raises images.remote.RemoteFetchError if the image can't be downloaded.
         """
         # Get the unsaved Image instance
         image = super().save(commit=False)
@@ -44,10 +47,11 @@ class ImageCreateForm(forms.ModelForm):
         extension = image_url.rsplit('.', 1)[1].lower()
         image_name = f'{name}.{extension}'
 
-        # Download the image from the given URL
-        response = requests.get(image_url)
+        # Download the image from the given URL (pooled, cached, see images.remote)
+        # Strip EXIF and downsize oversized originals before storing them
+        content = normalize_image(fetch(image_url))
         # Save the downloaded content to the ImageField without committing yet
-        image.image.save(image_name, ContentFile(response.content), save=False)
+        image.image.save(image_name, ContentFile(content), save=False)
 
         if commit:
             # Save the model instance to the database
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from images.stats import checkpoint, rebuild
+
+
+class Command(BaseCommand):
+    """
+    Copy the view counters buffered in Redis into ImageStats.
+
+    Run it from cron every minute, or keep it running with --interval:
+
+        python manage.py checkpoint_image_stats --interval 30
+
+    --rebuild first recomputes likes and action counts of every image from
+    the database (after bulk imports or to repair drift).
+    """
+    help = 'Checkpoint image view statistics from Redis into the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--interval', type=float, help='repeat every this many seconds')
+        parser.add_argument('--rebuild', action='store_true', help='recompute likes and actions first')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            rebuild()
+            self.stdout.write('Likes and actions recomputed')
+        while True:
+            done = checkpoint(batch_size=options['batch_size'])
+            self.stdout.write(f'{done} images checkpointed')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from account.models import Profile
+from images.derivatives import update_derivatives
+from images.models import Image
+
+
+class Command(BaseCommand):
+    """
+    Backfill the responsive derivatives (AVIF/WebP/JPEG at every density) of
+    existing images and profile photos. New uploads get them on save.
+    """
+    help = 'Generate missing responsive image derivatives'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        targets = [(Image.objects.exclude(image=''), 'image'),
+                   (Profile.objects.exclude(photo=''), 'photo')]
+        for queryset, field_name in targets:
+            done = 0
+            for instance in queryset.iterator(chunk_size=options['chunk_size']):
+                update_derivatives(instance, field_name)
+                done += 1
+            self.stdout.write(f'{queryset.model.__name__}.{field_name}: {done} checked')
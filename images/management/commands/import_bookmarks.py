@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from images.importer import Importer, chunked, read_records
+
+
+class Command(BaseCommand):
+    """
+    Bulk import a partner's users, bookmarks, likes and follow graph.
+
+        python manage.py import_bookmarks --users users.csv --bookmarks bookmarks.jsonl \\
+            --likes likes.csv --follows follows.jsonl --fetch-workers 32
+
+    Each input is a .csv with a header line or a .jsonl file:
+
+    - users: username, email, first_name, last_name, date_of_birth
+    - bookmarks: username, url, title, description
+    - likes: username, url (of a bookmarked image)
+    - follows: user_from, user_to (usernames)
+
+    Inputs are imported in that order, so later files can refer to users
+    and images created by earlier ones. See images/importer.py.
+    """
+    help = 'Import users, bookmarks, likes and follows in bulk from CSV/JSONL files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users')
+        parser.add_argument('--bookmarks')
+        parser.add_argument('--likes')
+        parser.add_argument('--follows')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='rows per transaction')
+        parser.add_argument('--fetch-workers', type=int, default=16, help='concurrent image downloads')
+        parser.add_argument('--timeout', type=float, default=20, help='per-download timeout in seconds')
+        parser.add_argument('--no-derivatives', action='store_true',
+                            help='skip thumbnail variants (run generate_derivatives later)')
+        parser.add_argument('--no-actions', action='store_true', help='do not add the imports to activity feeds')
+
+    def handle(self, *args, **options):
+        steps = [('users', 'import_users'), ('bookmarks', 'import_bookmarks'),
+                 ('likes', 'import_likes'), ('follows', 'import_follows')]
+        if not any(options[name] for name, _ in steps):
+            raise CommandError('Nothing to import: pass --users, --bookmarks, --likes and/or --follows')
+        importer = Importer(fetch_workers=options['fetch_workers'], derivatives=not options['no_derivatives'],
+                            actions=not options['no_actions'], timeout=options['timeout'])
+        for name, method in steps:
+            if not options[name]:
+                continue
+            rows = 0
+            for chunk in chunked(read_records(options[name]), options['chunk_size']):
+                getattr(importer, method)(chunk)
+                rows += len(chunk)
+                self.stdout.write(f'{name}: {rows} rows read')
+        stats = importer.finish(batch_size=options['chunk_size'])
+        self.stdout.write('Imported ' + ', '.join(f'{count} {name}' for name, count in stats.items()))
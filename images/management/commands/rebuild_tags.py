@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from images.models import Image
+from images.tags import index_images, recount
+
+
+class Command(BaseCommand):
+    """
+    Index the hashtags of every image and recompute the tag counts.
+
+    For images saved before hashtags were indexed, or without signals;
+    images already indexed are left as they are. With --recount-only the
+    counts are recomputed from the index without reading descriptions:
+
+        python manage.py rebuild_tags --batch-size 2000
+    """
+    help = 'Index the hashtags of existing images and recompute the tag counts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--recount-only', action='store_true', help='only recompute the tag counts')
+
+    def handle(self, *args, **options):
+        if not options['recount_only']:
+            images = Image.objects.filter(description__contains='#').order_by('id')
+            last_id = 0
+            tagged = 0
+            while True:
+                batch = list(images.filter(id__gt=last_id).values_list('id', 'description')[:options['batch_size']])
+                if not batch:
+                    break
+                tagged += index_images(batch)
+                last_id = batch[-1][0]
+            self.stdout.write(f'{tagged} images tagged')
+        recount()
+        self.stdout.write('Tag counts recomputed')
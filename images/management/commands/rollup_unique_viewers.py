@@ -0,0 +1,39 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from images.uniques import get_unique_viewers, month, week
+
+
+class Command(BaseCommand):
+    """
+    Merge the daily unique viewer sketches of a week or month into rollups.
+
+    Run it from cron once the period is over (daily sketches expire after
+    UNIQUE_VIEWERS_RETENTION_DAYS):
+
+        python manage.py rollup_unique_viewers --period week
+        python manage.py rollup_unique_viewers --period month --date 2026-09-01
+
+    Rollups are stored as ``image:{id}:viewers:{2026-W42|2026-10}`` with
+    their ranking in ``image_ranking:unique:{name}``. See images/uniques.py.
+    """
+    help = 'Merge daily unique viewer sketches into weekly or monthly rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', choices=['week', 'month'], default='week')
+        parser.add_argument('--date', help='any day of the period, YYYY-MM-DD (default: the previous period)')
+
+    def handle(self, *args, **options):
+        if options['date']:
+            try:
+                when = date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError(f'Invalid --date {options["date"]!r}, expected YYYY-MM-DD')
+        else:
+            today = timezone.localdate()
+            when = today - timedelta(days=7) if options['period'] == 'week' else today.replace(day=1) - timedelta(days=1)
+        name, days = (week if options['period'] == 'week' else month)(when)
+        images = get_unique_viewers().merge(days, name)
+        self.stdout.write(f'{name}: {images} images rolled up')
@@ -0,0 +1,66 @@
+import os
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from bookmarks.storage import save_in_parallel
+
+
+class Command(BaseCommand):
+    """
+    Copy the files of a local media directory into the configured storage.
+
+    Used once when moving from the 'local' backend to object storage:
+
+        BOOKMARKS_MEDIA_BACKEND=s3 BOOKMARKS_S3_BUCKET=bookmarks-media \\
+            python manage.py sync_media --source media/
+
+    Names are kept, so existing database rows and thumbnail names stay
+    valid. Objects that already exist with the same size are skipped.
+    """
+    help = 'Upload a local media directory to the configured media storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=str(settings.MEDIA_ROOT), help='directory to upload')
+        parser.add_argument('--batch-size', type=int, default=64, help='files uploaded concurrently per batch')
+
+    def pending(self, source):
+        for root, dirs, files in os.walk(source):
+            dirs[:] = [name for name in dirs if not name.startswith('.')]
+            for filename in files:
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, source).replace(os.sep, '/')
+                if default_storage.exists(name) and default_storage.size(name) == os.path.getsize(path):
+                    continue
+                yield name, path
+
+    def upload(self, batch):
+        files = [(name, File(open(path, 'rb'), name=name)) for name, path in batch]
+        try:
+            save_in_parallel(default_storage, files)
+        finally:
+            for name, file in files:
+                file.close()
+
+    def handle(self, *args, **options):
+        source = options['source']
+        if not os.path.isdir(source):
+            raise CommandError(f'{source} is not a directory')
+        if getattr(default_storage, 'backend', None) is not None and default_storage.backend.is_local \
+                and os.path.abspath(source) == default_storage.backend.location:
+            raise CommandError('The source is the storage itself; set BOOKMARKS_MEDIA_BACKEND first')
+
+        uploaded = 0
+        batch = []
+        for item in self.pending(source):
+            batch.append(item)
+            if len(batch) >= options['batch_size']:
+                self.upload(batch)
+                uploaded += len(batch)
+                batch = []
+        if batch:
+            self.upload(batch)
+            uploaded += len(batch)
+        self.stdout.write(f'{uploaded} files uploaded')
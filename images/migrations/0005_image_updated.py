@@ -0,0 +1,20 @@
+# Generated by Django 4.2.3 on 2026-10-19 12:00
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0004_image_total_likes_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
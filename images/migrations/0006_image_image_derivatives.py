@@ -0,0 +1,18 @@
+# Generated by Django 4.2.3 on 2026-10-19 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0005_image_updated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='image_derivatives',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
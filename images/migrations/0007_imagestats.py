@@ -0,0 +1,54 @@
+# Generated by Django 4.2.3 on 2026-10-19 16:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+
+def create_stats(apps, schema_editor):
+    """
+    One row per existing image, with its likes and actions; views are
+    filled in by the first checkpoint from Redis.
+    """
+    Image = apps.get_model('images', 'Image')
+    ImageStats = apps.get_model('images', 'ImageStats')
+    Action = apps.get_model('actions', 'Action')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    image_ct = ContentType.objects.filter(app_label='images', model='image').first()
+    actions = {}
+    if image_ct is not None:
+        actions = dict(Action.objects.filter(target_ct=image_ct).values('target_id')
+                       .annotate(count=Count('id')).values_list('target_id', 'count'))
+    ImageStats.objects.bulk_create(
+        [ImageStats(image_id=image_id, likes=likes, actions=actions.get(image_id, 0))
+         for image_id, likes in Image.objects.values_list('id', 'total_likes').iterator()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0006_image_image_derivatives'),
+        ('actions', '0002_rename_actions_action_and_more'),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageStats',
+            fields=[
+                ('image', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='images.image')),
+                ('views', models.PositiveBigIntegerField(default=0)),
+                ('unique_viewers', models.PositiveBigIntegerField(default=0)),
+                ('likes', models.PositiveIntegerField(default=0)),
+                ('actions', models.PositiveIntegerField(default=0)),
+                ('last_activity', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'image stats',
+                'indexes': [models.Index(fields=['-views'], name='images_imag_views_9f1e13_idx'), models.Index(fields=['-unique_viewers'], name='images_imag_unique__990ce3_idx'), models.Index(fields=['-likes'], name='images_imag_likes_ce6224_idx'), models.Index(fields=['-last_activity'], name='images_imag_last_ac_7db4b7_idx')],
+            },
+        ),
+        migrations.RunPython(create_stats, migrations.RunPython.noop),
+    ]
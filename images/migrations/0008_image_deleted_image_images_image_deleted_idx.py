@@ -0,0 +1,22 @@
+# Generated by Django 4.2.3 on 2026-10-19 16:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0007_imagestats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='deleted',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(condition=models.Q(('deleted__isnull', False)), fields=['deleted'], name='images_image_deleted_idx'),
+        ),
+    ]
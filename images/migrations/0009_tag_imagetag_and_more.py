@@ -0,0 +1,37 @@
+# Generated by Django 4.2.3 on 2026-10-19 16:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0008_image_deleted_image_images_image_deleted_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-count'], name='images_tag_count_54d0e4_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ImageTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_tags', to='images.image')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_tags', to='images.tag')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='imagetag',
+            constraint=models.UniqueConstraint(fields=('tag', 'image'), name='images_imagetag_tag_image_unique'),
+        ),
+    ]
@@ -3,6 +3,16 @@ from django.conf import settings
 from django.utils.text import slugify
 from django.urls import reverse
 
+class ImageManager(models.Manager):
+    """
+    Leaves out soft-deleted images (see images.deletion); ``all_objects``
+    includes them.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted=None)
+
+
 class Image(models.Model):
     """
     Model representing an image uploaded by a user.
@@ -15,8 +25,11 @@ class Image(models.Model):
         image (ImageField): Uploaded image file.
         description (TextField): Optional description of the image.
         created (DateField): Date the image was created. Auto-set on creation.
+        updated (DateTimeField): Last modification time, used as an HTTP validator.
         users_like (ManyToManyField): Users who have liked this image.
         total_likes (PositiveIntegerField): Cached number of likes.
+        image_derivatives (JSONField): Names of the AVIF/WebP/JPEG thumbnail variants (see images.derivatives).
+        deleted (DateTimeField): Set when the image is deleted; it is purged in the background.
     """
 
     user = models.ForeignKey(
@@ -31,18 +44,27 @@ class Image(models.Model):
     image = models.ImageField(upload_to='images/%Y/%m/%d/')  # Upload path with date-based folders
     description = models.TextField(blank=True)
     created = models.DateField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)  # Bumped on every save (including like count changes)
     users_like = models.ManyToManyField(
         settings.AUTH_USER_MODEL,
         related_name='images_liked',
         blank=True
     )
     total_likes = models.PositiveIntegerField(default=0)
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
+    deleted = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = ImageManager()
+    all_objects = models.Manager()
 
     class Meta:
         # Database indexes to optimize queries by creation date and total likes
         indexes = [
             models.Index(fields=['-created']),
-            models.Index(fields=['-total_likes'])
+            models.Index(fields=['-total_likes']),
+            # Only the few images waiting to be purged
+            models.Index(fields=['deleted'], condition=models.Q(deleted__isnull=False),
+                         name='images_image_deleted_idx'),
         ]
         # Default ordering by newest first
         ordering = ['-created']
@@ -66,3 +88,86 @@ class Image(models.Model):
         This is used in templates and views to create links to image details.
         """
         return reverse("images:detail", args=[self.id, self.slug])
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The description as loaded, so saves can tell if its hashtags changed (see images.tags)
+        instance._loaded_description = values[field_names.index('description')] \
+            if 'description' in field_names else models.DEFERRED
+        return instance
+
+
+class ImageStats(models.Model):
+    """
+    Engagement statistics of an image, maintained incrementally (see images.stats).
+
+    Attributes:
+        image (OneToOneField): The image; also the primary key.
+        views (PositiveBigIntegerField): Detail page views, checkpointed from Redis.
+        unique_viewers (PositiveBigIntegerField): Estimated distinct viewers (HyperLogLog).
+        likes (PositiveIntegerField): Number of likes.
+        actions (PositiveIntegerField): Activity stream actions targeting the image.
+        last_activity (DateTimeField): Time of the latest view, like or action.
+    """
+    image = models.OneToOneField(Image, primary_key=True, related_name='stats', on_delete=models.CASCADE)
+    views = models.PositiveBigIntegerField(default=0)
+    unique_viewers = models.PositiveBigIntegerField(default=0)
+    likes = models.PositiveIntegerField(default=0)
+    actions = models.PositiveIntegerField(default=0)
+    last_activity = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # One index per metric the image list can be sorted by
+        indexes = [
+            models.Index(fields=['-views']),
+            models.Index(fields=['-unique_viewers']),
+            models.Index(fields=['-likes']),
+            models.Index(fields=['-last_activity']),
+        ]
+        verbose_name_plural = 'image stats'
+
+    def __str__(self):
+        return f'Stats of {self.image_id}'
+
+
+class Tag(models.Model):
+    """
+    A hashtag used in image descriptions (see images.tags).
+
+    Attributes:
+        name (CharField): The tag, lowercased and without the '#'.
+        count (PositiveIntegerField): Number of images tagged, maintained incrementally.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-count']),
+        ]
+
+    def __str__(self):
+        return f'#{self.name}'
+
+    def get_absolute_url(self):
+        return reverse('images:tag', args=[self.name])
+
+
+class ImageTag(models.Model):
+    """
+    An image carrying a hashtag.
+
+    The (tag, image) index serves the tag feeds newest first, by image id
+    (keyset pagination, see images.views.image_tag).
+    """
+    tag = models.ForeignKey(Tag, related_name='image_tags', on_delete=models.CASCADE)
+    image = models.ForeignKey(Image, related_name='image_tags', on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tag', 'image'], name='images_imagetag_tag_image_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.tag_id} on {self.image_id}'
@@ -0,0 +1,284 @@
+"""
+Client for the remote images users bookmark (bookmarklet, API, importer).
+
+Every fetch goes through one ``requests.Session`` per process, whose
+connection pools keep up to REMOTE_CONNECTIONS_PER_HOST connections to
+each of REMOTE_POOL_HOSTS hosts alive. Threads beyond that open a
+connection of their own, closed after use, rather than wait for one
+without a timeout.
+
+Responses are kept in an on-disk HTTP cache (REMOTE_CACHE_DIR, LRU-evicted
+above REMOTE_CACHE_MAX_BYTES, see bookmarks.storage.DiskCache) with their
+``ETag`` and ``Last-Modified``:
+
+- while fresh (``Cache-Control: max-age``, else REMOTE_CACHE_FRESH
+  seconds) the cached body is returned without a request
+- once stale, the URL is revalidated with ``If-None-Match`` /
+  ``If-Modified-Since``; a ``304 Not Modified`` costs no body transfer
+- ``no-store`` responses are not kept
+
+Failing hosts are cached too: after REMOTE_HOST_FAILURES consecutive
+connection errors, timeouts or 5xx responses, requests to the host fail
+at once with HostUnavailable for REMOTE_HOST_DOWN_SECONDS, so a dead CDN
+doesn't hold workers for a timeout per image. This state is per process.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from io import BytesIO
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from requests.adapters import HTTPAdapter
+
+from bookmarks.storage import DiskCache
+
+USER_AGENT = 'bookmarks-image-fetcher/1.0'
+
+MAX_AGE = re.compile(r'max-age=(\d+)')
+
+# Error bodies read so the connection can be reused; longer ones close it
+ERROR_BODY_MAX_BYTES = 64 * 1024
+
+
+class RemoteFetchError(Exception):
+    """
+    A remote image could not be downloaded.
+    """
+
+
+class HostUnavailable(RemoteFetchError):
+    """
+    The image's host failed repeatedly and is skipped for a while.
+    """
+
+
+# -------------------------------
+# Connection pooling
+# -------------------------------
+
+_lock = threading.Lock()
+_session = None
+_session_pid = None
+
+
+def get_session():
+    """
+    The process's pooled session (rebuilt in processes forked after it was created).
+    """
+    global _session, _session_pid
+    with _lock:
+        if _session is None or _session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=settings.REMOTE_POOL_HOSTS,
+                                  pool_maxsize=settings.REMOTE_CONNECTIONS_PER_HOST, pool_block=False)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers['User-Agent'] = USER_AGENT
+            _session, _session_pid = session, os.getpid()
+        return _session
+
+
+# -------------------------------
+# Failing hosts
+# -------------------------------
+
+class HostHealth:
+    """
+    Consecutive failures of each host, and the hosts skipped until when.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.failures = {}
+        self.down_until = {}
+
+    def check(self, host):
+        with self.lock:
+            until = self.down_until.get(host)
+            if until is not None and until <= time.monotonic():
+                del self.down_until[host]
+                until = None
+        if until is not None:
+            raise HostUnavailable(f'{host} is failing, skipped for {until - time.monotonic():.0f}s')
+
+    def failed(self, host):
+        with self.lock:
+            failures = self.failures.get(host, 0) + 1
+            if failures >= settings.REMOTE_HOST_FAILURES:
+                self.down_until[host] = time.monotonic() + settings.REMOTE_HOST_DOWN_SECONDS
+                failures = 0
+            self.failures[host] = failures
+
+    def succeeded(self, host):
+        if host in self.failures:
+            with self.lock:
+                self.failures.pop(host, None)
+
+
+hosts = HostHealth()
+
+
+# -------------------------------
+# HTTP cache
+# -------------------------------
+
+_cache = None
+
+
+def get_cache():
+    global _cache
+    if _cache is None and settings.REMOTE_CACHE_MAX_BYTES:
+        _cache = DiskCache(settings.REMOTE_CACHE_DIR, settings.REMOTE_CACHE_MAX_BYTES)
+    return _cache
+
+
+def _reset_cache(setting, **kwargs):
+    global _cache
+    if setting.startswith('REMOTE_CACHE'):
+        _cache = None
+
+
+setting_changed.connect(_reset_cache)
+
+
+def cache_names(url):
+    digest = hashlib.sha256(url.encode()).hexdigest()
+    return f'{digest}.json', f'{digest}.body'
+
+
+def freshness(response):
+    """
+    Seconds a response may be used without revalidation, or None if it
+    must not be stored.
+    """
+    cache_control = response.headers.get('Cache-Control', '').lower()
+    if 'no-store' in cache_control:
+        return None
+    if 'no-cache' in cache_control:
+        return 0
+    match = MAX_AGE.search(cache_control)
+    return int(match.group(1)) if match else settings.REMOTE_CACHE_FRESH
+
+
+def load(cache, url):
+    """
+    The cached (metadata, body path) of ``url``, or None.
+    """
+    meta_name, body_name = cache_names(url)
+    meta_path, body_path = cache.get(meta_name), cache.get(body_name)
+    if meta_path is None or body_path is None:
+        return None
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get('url') != url:
+        return None
+    return meta, body_path
+
+
+def store_meta(cache, url, response, fresh_for, previous=None):
+    # A 304 may leave out validators that still hold
+    previous = previous or {}
+    meta = {
+        'url': url,
+        'etag': response.headers.get('ETag') or previous.get('etag'),
+        'last_modified': response.headers.get('Last-Modified') or previous.get('last_modified'),
+        'expires': time.time() + fresh_for,
+    }
+    cache.put(cache_names(url)[0], lambda destination: destination.write(json.dumps(meta).encode()))
+
+
+def read_body(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        # Evicted in the meantime
+        return None
+
+
+# -------------------------------
+# Fetching
+# -------------------------------
+
+def read_limited(response, max_bytes):
+    body = BytesIO()
+    for chunk in response.iter_content(64 * 1024):
+        body.write(chunk)
+        if body.tell() > max_bytes:
+            raise RemoteFetchError(f'{response.url} is larger than {max_bytes} bytes')
+    return body.getvalue()
+
+
+def fetch(url, timeout=None):
+    """
+    The body of ``url``, from the cache when it is fresh or not modified.
+
+    Raises:
+        RemoteFetchError: on network errors, error statuses or bodies over
+            REMOTE_MAX_BYTES; HostUnavailable if the host is being skipped.
+    """
+    host = urlsplit(url).hostname or ''
+    hosts.check(host)
+    cache = get_cache()
+    cached = load(cache, url) if cache is not None else None
+    headers = {}
+    if cached is not None:
+        meta, body_path = cached
+        if meta['expires'] > time.time():
+            body = read_body(body_path)
+            if body is not None:
+                return body
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    try:
+        with get_session().get(url, headers=headers, timeout=timeout or settings.REMOTE_TIMEOUT,
+                               stream=True) as response:
+            if response.status_code != 200:
+                # Read the (empty or short) body so the connection goes back to the pool
+                response.raw.read(ERROR_BODY_MAX_BYTES, decode_content=False)
+            if response.status_code >= 500:
+                hosts.failed(host)
+                raise RemoteFetchError(f'{url} answered {response.status_code}')
+            hosts.succeeded(host)
+            fresh_for = freshness(response)
+            not_modified = response.status_code == 304 and cached is not None
+            if not not_modified:
+                if response.status_code != 200:
+                    raise RemoteFetchError(f'{url} answered {response.status_code}')
+                body = read_limited(response, settings.REMOTE_MAX_BYTES)
+    except (requests.ConnectionError, requests.Timeout) as exc:
+        hosts.failed(host)
+        raise RemoteFetchError(f'Could not fetch {url}: {exc}') from exc
+    except requests.RequestException as exc:
+        raise RemoteFetchError(f'Could not fetch {url}: {exc}') from exc
+
+    if not_modified:
+        body = read_body(cached[1])
+        if body is None:
+            # Evicted since the lookup: fetch it whole
+            for name in cache_names(url):
+                cache.discard(name)
+            return fetch(url, timeout)
+        if fresh_for is not None:
+            store_meta(cache, url, response, fresh_for, previous=cached[0])
+        return body
+
+    if cache is not None and fresh_for is not None \
+            and (fresh_for or response.headers.get('ETag') or response.headers.get('Last-Modified')):
+        cache.put(cache_names(url)[1], lambda destination: destination.write(body))
+        store_meta(cache, url, response, fresh_for)
+    return body
+
@@ -1,6 +1,9 @@
-from django.db.models.signals import m2m_changed
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_save
 from django.dispatch import receiver
-from .models import Image
+from . import cards, tags, versions
+from .models import Image, ImageStats
+from .tasks import queue_derivatives, refresh_like_stats
 
 @receiver(m2m_changed, sender=Image.users_like.through)
 def users_like_changed(sender, instance, **kwargs):
@@ -13,7 +16,31 @@ def users_like_changed(sender, instance, **kwargs):
         instance: The Image instance being modified.
         **kwargs: Additional keyword arguments from the signal.
     """
+    # pre_add/pre_remove/pre_clear come before the change: count once, after it
+    if not kwargs['action'].startswith('post_'):
+        return
     # Count the current number of users who liked this image
     instance.total_likes = instance.users_like.count()
     # Save the updated total_likes value
     instance.save()
+    # ImageStats can lag; a burst of likes on one image collapses into one task,
+    # queued after the like is committed (outside it, no savepoint is needed)
+    image_id = instance.id
+    transaction.on_commit(lambda: refresh_like_stats.enqueue(args=[image_id], dedup_key=f'like_stats:{image_id}'))
+
+
+@receiver(post_save, sender=Image)
+def image_saved(sender, instance, **kwargs):
+    """
+    Signal handler to queue the rendering of the responsive derivatives
+    (AVIF/WebP/JPEG at each density) of a newly saved or replaced image file,
+    and to index the hashtags of a new or edited description.
+    """
+    queue_derivatives(instance, 'image')
+    tags.update_image(instance, kwargs.get('created'))
+    if kwargs.get('created'):
+        ImageStats.objects.get_or_create(image=instance)
+        versions.bump(versions.LIST)
+    else:
+        # Title, file or like count (see users_like_changed) may have changed
+        cards.invalidate([instance.id])
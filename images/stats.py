@@ -0,0 +1,198 @@
+"""
+Per-image engagement statistics (ImageStats).
+
+The counters are kept up to date incrementally, each from where the
+event happens:
+
+- views: image_detail (for people, not crawlers) increments the Redis counter ``image:{id}:views``
+  and adds the viewer to the unique viewer sketches (see uniques.py). Views
+  are far too frequent to write to the database on each hit, so the
+  image is only flagged in the ``image_stats:dirty`` sorted set (scored
+  by the time of the view); ``checkpoint`` copies the flagged counters
+  to the database in bulk (run it every minute or so, see the
+  checkpoint_image_stats command).
+- likes: the like signal and the bulk like API upsert the new count.
+- actions: create_action/create_actions bump the count of actions
+  targeting the image (bookmarking, likes).
+
+Every change also moves ``last_activity`` forward, and the stats version
+of the sorted image lists (see versions.py). Sorting images by any of
+these metrics is an indexed scan of the ImageStats table.
+"""
+
+import hashlib
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Count, F
+from django.utils import timezone
+
+from actions.models import Action
+from bookmarks.bots import client_address, is_bot
+from bookmarks.instrumentation import InstrumentedRedis
+
+from .models import Image, ImageStats
+from . import versions
+from .uniques import get_unique_viewers
+
+# connect redis database
+r = InstrumentedRedis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB)
+
+DIRTY_KEY = 'image_stats:dirty'
+
+# ?sort= values of the image list and the ImageStats column they order by
+SORTS = {
+    'views': '-views',
+    'unique': '-unique_viewers',
+    'likes': '-likes',
+    'activity': '-last_activity',
+}
+
+
+def views_key(image_id):
+    return f'image:{image_id}:views'
+
+
+def viewer_key(request):
+    """
+    Stable identifier of who is viewing: the user, else a hash of the
+    client address and user agent (anonymous visitors have no session).
+    """
+    if request.user.is_authenticated:
+        return f'u{request.user.pk}'
+    client = f'{client_address(request)}|{request.META.get("HTTP_USER_AGENT", "")}'
+    return 'a' + hashlib.blake2b(client.encode(), digest_size=8).hexdigest()
+
+
+def record_view(request, image_id):
+    """
+    Count a view of an image in Redis, in a single round trip. Requests
+    tagged as automated (see bookmarks/bots.py) are not counted.
+
+    Returns:
+        The image's total number of views.
+    """
+    if is_bot(request):
+        return int(r.get(views_key(image_id)) or 0)
+    pipe = r.pipeline(transaction=False)
+    pipe.incr(views_key(image_id))
+    pipe.zincrby('image_ranking', 1, image_id)
+    pipe.zadd(DIRTY_KEY, {image_id: time.time()})
+    get_unique_viewers().add(image_id, viewer_key(request), pipe=pipe)
+    return pipe.execute()[0]
+
+
+def record_likes(totals):
+    """
+    Store new like counts.
+
+    Args:
+        totals (dict): {image id: total_likes}.
+    """
+    now = timezone.now()
+    ImageStats.objects.bulk_create(
+        [ImageStats(image_id=image_id, likes=likes, last_activity=now) for image_id, likes in totals.items()],
+        update_conflicts=True, unique_fields=['image'], update_fields=['likes', 'last_activity'],
+    )
+    versions.bump(versions.STATS)
+
+
+def record_actions(image_ids):
+    """
+    Count one more action targeting each of ``image_ids``.
+    """
+    ImageStats.objects.filter(image_id__in=image_ids).update(
+        actions=F('actions') + 1, last_activity=timezone.now(),
+    )
+    versions.bump(versions.STATS)
+
+
+def checkpoint(batch_size=1000):
+    """
+    Copy the view counters of recently viewed images from Redis to ImageStats.
+
+    Images viewed again while the checkpoint runs keep their flag (their
+    score changed) and are picked up by the next one.
+
+    Args:
+        batch_size (int): Images read from Redis and upserted at a time.
+
+    Returns:
+        Number of images updated.
+    """
+    done = 0
+    # Images viewed after the start are left to the next checkpoint
+    started = time.time()
+    while True:
+        flagged = r.zrangebyscore(DIRTY_KEY, '-inf', started, start=0, num=batch_size, withscores=True)
+        if not flagged:
+            return done
+        image_ids = [int(member) for member, score in flagged]
+        views = r.mget([views_key(image_id) for image_id in image_ids])
+        unique_viewers = get_unique_viewers().counts(image_ids)
+
+        existing = set(Image.objects.filter(id__in=image_ids).values_list('id', flat=True))
+        # A like or action may be more recent than the last view
+        activity = dict(ImageStats.objects.filter(image_id__in=existing).exclude(last_activity=None)
+                        .values_list('image_id', 'last_activity'))
+        stats = []
+        for image_id, (member, score), count, unique in zip(image_ids, flagged, views, unique_viewers):
+            if image_id not in existing:
+                continue
+            viewed = datetime.fromtimestamp(score, dt_timezone.utc)
+            stats.append(ImageStats(
+                image_id=image_id, views=int(count or 0), unique_viewers=unique,
+                last_activity=max(viewed, activity.get(image_id, viewed)),
+            ))
+        ImageStats.objects.bulk_create(
+            stats, update_conflicts=True, unique_fields=['image'],
+            update_fields=['views', 'unique_viewers', 'last_activity'],
+        )
+        if stats:
+            versions.bump(versions.STATS)
+        # Unflag the images, unless they were viewed again in the meantime
+        r.eval(UNFLAG_SCRIPT, 1, DIRTY_KEY, *[value for member, score in flagged for value in (member, score)])
+        done += len(stats)
+
+
+# Remove members whose score is still the one that was read
+UNFLAG_SCRIPT = """
+for i = 1, #ARGV, 2 do
+    local score = redis.call('ZSCORE', KEYS[1], ARGV[i])
+    if score and tonumber(score) == tonumber(ARGV[i + 1]) then
+        redis.call('ZREM', KEYS[1], ARGV[i])
+    end
+end
+return 0
+"""
+
+
+def forget(image_id):
+    """
+    Drop the Redis counters, rankings and flags of a deleted image.
+    """
+    pipe = r.pipeline(transaction=False)
+    pipe.delete(views_key(image_id))
+    pipe.zrem('image_ranking', image_id)
+    pipe.zrem(DIRTY_KEY, image_id)
+    pipe.execute()
+    get_unique_viewers().forget(image_id)
+
+
+def rebuild():
+    """
+    Recompute likes and action counts of every image from the database,
+    creating missing ImageStats rows (views come from ``checkpoint``).
+    """
+    image_ct = ContentType.objects.get_for_model(Image)
+    actions = dict(Action.objects.filter(target_ct=image_ct).values('target_id')
+                   .annotate(count=Count('id')).values_list('target_id', 'count'))
+    ImageStats.objects.bulk_create(
+        [ImageStats(image_id=image_id, likes=likes, actions=actions.get(image_id, 0))
+         for image_id, likes in Image.objects.values_list('id', 'total_likes').iterator()],
+        update_conflicts=True, unique_fields=['image'], update_fields=['likes', 'actions'],
+        batch_size=1000,
+    )
+    versions.bump(versions.STATS)
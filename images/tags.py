@@ -0,0 +1,201 @@
+"""
+Hashtags of image descriptions: tag index, counts and trending tags.
+
+When an image is created or its description changes, the ``#tags`` in
+the description are extracted and its ImageTag rows (tag, image) brought
+in line in one transaction, Tag.count moving by the rows actually
+deleted and inserted: the number of images per tag is materialized,
+never counted. The image row is locked meanwhile, so two saves of one
+image can't both count the same change.
+
+Browsing a tag (``feed``) is a keyset scan of the (tag, image) index from
+the newest image down, so a page costs the same for a tag on ten images
+as for one on a million.
+
+Trending tags are counted in Redis: every tagging adds 1 to the tag in
+the sorted set of the current hour, ``tags:trending:{YYYYMMDDHH}``, kept
+TAGS_TRENDING_HOURS hours. ``trending`` merges the recent hours with
+ZUNIONSTORE, each hour weighing TAGS_TRENDING_DECAY times the next one,
+and keeps the result for TAGS_TRENDING_CACHE seconds.
+
+Images inserted in bulk without signals (importer, existing data) are
+indexed with ``index_images``; ``recount`` fixes the counts should they
+drift (see the rebuild_tags command). Soft-deleted images drop out of
+the feeds at once; their rows are removed by the purge (images.deletion).
+"""
+
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, DEFERRED, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from bookmarks.instrumentation import InstrumentedRedis
+
+from .models import Image, ImageTag, Tag
+
+# connect redis database
+r = InstrumentedRedis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB)
+
+# A '#' that doesn't follow a word character, '/', '&' or '#' (URL fragments,
+# entities), then up to 50 word characters or hyphens
+HASHTAG = re.compile(r'(?<![\w/&#])#(\w[\w-]{0,49})')
+
+TRENDING_KEY = 'tags:trending'
+
+
+def hour_key(when):
+    return f'{TRENDING_KEY}:{when:%Y%m%d%H}'
+
+
+def extract(text):
+    """
+    The distinct hashtags of ``text``, lowercased and in order of
+    appearance, at most settings.TAGS_PER_IMAGE.
+    """
+    names = dict.fromkeys(match.lower().rstrip('-') for match in HASHTAG.findall(text or ''))
+    return list(names)[:settings.TAGS_PER_IMAGE]
+
+
+def description_changed(image, created):
+    """
+    Whether a save of ``image`` may have changed its description (see
+    Image.from_db).
+    """
+    if created or not hasattr(image, '_loaded_description'):
+        return True
+    if image._loaded_description is DEFERRED:
+        # Only saved if it was loaded or set since
+        return 'description' in image.__dict__
+    return image._loaded_description != image.description
+
+
+def update_image(image, created=False):
+    """
+    Re-index the hashtags of a saved image if its description changed.
+    """
+    if description_changed(image, created):
+        set_tags(image.id, extract(image.description))
+        image._loaded_description = image.description
+
+
+def get_tag_ids(names):
+    """
+    Ids of the tags ``names``, creating the missing ones.
+    """
+    Tag.objects.bulk_create([Tag(name=name) for name in names], ignore_conflicts=True)
+    return dict(Tag.objects.filter(name__in=names).values_list('name', 'id'))
+
+
+def set_tags(image_id, names, trending=True):
+    """
+    Make ``names`` the tags of an image, updating the tag counts and (for
+    new taggings, once committed) the trending tags.
+    """
+    with transaction.atomic():
+        # Concurrent saves of the image wait here, so the diff below holds
+        list(Image.all_objects.select_for_update().filter(id=image_id).values_list('id'))
+        current = dict(ImageTag.objects.filter(image_id=image_id).values_list('tag__name', 'tag_id'))
+        removed = [tag_id for name, tag_id in current.items() if name not in names]
+        added = [name for name in names if name not in current]
+        if removed:
+            deleted, _ = ImageTag.objects.filter(image_id=image_id, tag_id__in=removed).delete()
+            if deleted == len(removed):
+                Tag.objects.filter(id__in=removed, count__gt=0).update(count=F('count') - 1)
+            else:
+                # Rows went away under us: count these tags again
+                recount(removed)
+        if added:
+            tag_ids = get_tag_ids(added)
+            ImageTag.objects.bulk_create([ImageTag(tag_id=tag_ids[name], image_id=image_id) for name in added],
+                                         ignore_conflicts=True)
+            # ignore_conflicts doesn't say which rows were inserted; under the
+            # lock, the rows of tags the image didn't have are this call's
+            inserted = ImageTag.objects.filter(image_id=image_id, tag_id__in=tag_ids.values()) \
+                .exclude(tag_id__in=current.values()).values('tag_id')
+            Tag.objects.filter(id__in=inserted).update(count=F('count') + 1)
+            if trending:
+                transaction.on_commit(lambda: record_trending(added))
+
+
+def index_images(images):
+    """
+    Index the hashtags of images saved without signals.
+
+    Args:
+        images: iterable of (image id, description).
+
+    Returns:
+        Number of images with at least one tag.
+    """
+    tagged = 0
+    for image_id, description in images:
+        names = extract(description)
+        if names:
+            set_tags(image_id, names, trending=False)
+            tagged += 1
+    return tagged
+
+
+def recount(tag_ids=None):
+    """
+    Recompute Tag.count from the ImageTag rows, in one UPDATE: of every
+    tag, or of ``tag_ids``.
+    """
+    counts = ImageTag.objects.filter(tag=OuterRef('pk')).order_by() \
+        .values('tag').annotate(total=Count('*')).values('total')
+    tags = Tag.objects.all() if tag_ids is None else Tag.objects.filter(id__in=list(tag_ids))
+    tags.update(count=Coalesce(Subquery(counts), Value(0)))
+
+
+# -------------------------------
+# Feeds and trending tags
+# -------------------------------
+
+def feed(tag, before=None, limit=20):
+    """
+    Ids of the newest images carrying ``tag``, below image id ``before``.
+
+    Returns:
+        (image ids, cursor of the next page or None).
+    """
+    image_tags = ImageTag.objects.filter(tag=tag, image__deleted=None)
+    if before is not None:
+        image_tags = image_tags.filter(image_id__lt=before)
+    ids = list(image_tags.order_by('-image_id').values_list('image_id', flat=True)[:limit + 1])
+    return ids[:limit], ids[limit - 1] if len(ids) > limit else None
+
+
+def record_trending(names, now=None):
+    key = hour_key(now or timezone.now())
+    pipe = r.pipeline(transaction=False)
+    for name in names:
+        pipe.zincrby(key, 1, name)
+    pipe.expire(key, settings.TAGS_TRENDING_HOURS * 3600)
+    pipe.execute()
+
+
+def trending(limit=10, now=None):
+    """
+    The most used tags of the last TAGS_TRENDING_HOURS hours.
+
+    Returns:
+        list of (tag name, decayed number of uses), most used first.
+    """
+    pipe = r.pipeline(transaction=False)
+    pipe.exists(TRENDING_KEY)
+    pipe.zrange(TRENDING_KEY, 0, limit - 1, desc=True, withscores=True)
+    cached, ranking = pipe.execute()
+    if not cached:
+        now = now or timezone.now()
+        weights = {hour_key(now - timedelta(hours=age)): settings.TAGS_TRENDING_DECAY ** age
+                   for age in range(settings.TAGS_TRENDING_HOURS)}
+        pipe = r.pipeline(transaction=False)
+        pipe.zunionstore(TRENDING_KEY, weights)
+        pipe.expire(TRENDING_KEY, settings.TAGS_TRENDING_CACHE)
+        pipe.zrange(TRENDING_KEY, 0, limit - 1, desc=True, withscores=True)
+        ranking = pipe.execute()[-1]
+    return [(name.decode(), score) for name, score in ranking]
@@ -0,0 +1,94 @@
+import time
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+
+from tasks.queue import task
+
+from . import cards, deletion
+from .derivatives import update_derivatives
+from .models import Image
+from . import stats
+
+
+def queue_derivatives(instance, field_name):
+    """
+    Queue the rendering of the derivatives of ``instance.<field_name>`` if
+    the file changed since they were last rendered.
+    """
+    file = getattr(instance, field_name)
+    stored = getattr(instance, f'{field_name}_derivatives') or {}
+    if (stored.get('source') == file.name) if file else not stored:
+        return
+    label = instance._meta.label
+    render_derivatives.enqueue(args=[label, instance.pk, field_name],
+                               dedup_key=f'derivatives:{label}:{instance.pk}:{field_name}')
+
+
+@task(queue='images', max_attempts=3)
+def render_derivatives(model_label, pk, field_name):
+    """
+    Render the responsive variants (AVIF/WebP/JPEG at each density) of an
+    image field; CPU bound, so on a queue of its own.
+    """
+    instance = apps.get_model(model_label).objects.filter(pk=pk).first()
+    if instance is not None:
+        update_derivatives(instance, field_name)
+        if isinstance(instance, Image):
+            # The grid picture can use the stored variants now
+            cards.invalidate([pk])
+
+
+@task()
+def refresh_like_stats(image_id):
+    """
+    Copy an image's like count to its ImageStats row.
+    """
+    total_likes = Image.objects.filter(id=image_id).values_list('total_likes', flat=True).first()
+    if total_likes is not None:
+        stats.record_likes({image_id: total_likes})
+
+
+@task(every=timedelta(minutes=1), max_attempts=1)
+def checkpoint_image_stats():
+    """
+    Copy the view counters buffered in Redis to ImageStats.
+    """
+    stats.checkpoint()
+
+
+# -------------------------------
+# Deletion (see images.deletion)
+# -------------------------------
+
+def run_for_a_while(batches):
+    """
+    Consume ``batches`` for at most settings.DELETION_TASK_SECONDS.
+
+    Returns:
+        True if all were done, False if time ran out first.
+    """
+    deadline = time.monotonic() + settings.DELETION_TASK_SECONDS
+    for _ in batches:
+        if time.monotonic() > deadline:
+            return False
+    return True
+
+
+@task()
+def purge_image(image_id):
+    """
+    Purge a soft-deleted image, continuing in a new run if it takes longer
+    than DELETION_TASK_SECONDS so no run holds a worker for long.
+    """
+    if not run_for_a_while(deletion.purge_batches(image_id, settings.DELETION_BATCH_SIZE)):
+        purge_image.enqueue(args=[image_id], dedup_key=f'purge_image:{image_id}')
+
+
+@task(queue='images')
+def delete_media(names):
+    """
+    Delete the files of a purged image or profile photo.
+    """
+    deletion.delete_files(names)
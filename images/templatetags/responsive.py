@@ -0,0 +1,38 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from images.derivatives import FALLBACK, MIME_TYPES, srcset
+
+register = template.Library()
+
+
+def _srcset_attr(urls):
+    return ', '.join(f'{url} {density}x' for url, density in urls)
+
+
+@register.simple_tag
+def picture(file, alias, alt='', css_class=''):
+    """
+    Render a <picture> element for a thumbnail alias of an image field.
+
+    Browsers pick the first format they support (AVIF, WebP) and the density
+    matching the screen; the <img> fallback is the same JPEG/PNG thumbnail
+    the {% thumbnail %} tag produces for the alias.
+
+    Usage:
+        {% load responsive %}
+        {% picture image.image 'grid' %}
+        {% picture user.profile.photo 'people' css_class='user-detail' %}
+    """
+    sources = srcset(file, alias) if file else []
+    fallback = dict(sources).get(FALLBACK)
+    if not fallback:
+        return format_html('<img src="" alt="{}" class="{}">', alt, css_class)
+    modern = format_html_join(
+        '', '<source type="{}" srcset="{}">',
+        ((MIME_TYPES[fmt], _srcset_attr(urls)) for fmt, urls in sources if fmt != FALLBACK)
+    )
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" alt="{}" class="{}"></picture>',
+        modern, fallback[0][0], _srcset_attr(fallback), alt, css_class
+    )
@@ -1,3 +1,1166 @@
-from django.test import TestCase
+import io
+import json
+import math
+import os
+import tempfile
+from datetime import date, timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import requests
+import urllib3
+from easy_thumbnails.processors import scale_and_crop
+from PIL import Image as PILImage
+from PIL.JpegImagePlugin import JpegImageFile
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from account.models import Contact, Profile
+from actions.models import Action
+from bookmarks.testing import FAKE_REDIS_LUA, fake_redis, mock_redis, patch
+from tasks.models import Task
+
+from . import (cards, deletion, derivatives, importer, remote, stats, tags, thumbnail_urls, thumbnails, uniques,
+               versions, views)
+from .derivatives import normalize_image, srcset
+from .models import Image, ImageStats, Tag
+from .templatetags.responsive import picture
+from .thumbnails import SharedSource, open_reduced, required_scale
+from .uniques import HyperLogLog, LocalUniqueViewers
+from .views import image_list_stamp
+
+
+class HyperLogLogTests(SimpleTestCase):
+
+    def test_estimate_within_error(self):
+        for size in (1000, 50000):
+            sketch = HyperLogLog()
+            for viewer in range(size):
+                sketch.add(f'viewer:{viewer}')
+            # Standard error 0.81%: allow a bit over three of it
+            self.assertAlmostEqual(sketch.count(), size, delta=size * 0.03)
+
+    def test_repeated_viewers_count_once(self):
+        sketch = HyperLogLog()
+        for _ in range(3):
+            for viewer in range(500):
+                sketch.add(viewer)
+        self.assertAlmostEqual(sketch.count(), 500, delta=5)
+        self.assertFalse(sketch.add(0))
+
+    def test_union_estimates_distinct_viewers(self):
+        first, second = HyperLogLog(), HyperLogLog()
+        for viewer in range(0, 3000):
+            first.add(viewer)
+        for viewer in range(2000, 5000):
+            second.add(viewer)
+        self.assertAlmostEqual(HyperLogLog.union([first, second]).count(), 5000, delta=150)
+        # The merged sketches are left unchanged
+        self.assertAlmostEqual(first.count(), 3000, delta=90)
+
+
+class PeriodTests(SimpleTestCase):
+
+    def test_week_across_new_year(self):
+        name, days = uniques.week(date(2027, 1, 1))
+        self.assertEqual(name, '2026-W53')
+        self.assertEqual(days[0], '20261228')
+        self.assertEqual(days[-1], '20270103')
+        self.assertEqual(uniques.week(date(2026, 12, 28)), (name, days))
+        self.assertEqual(uniques.week(date(2027, 1, 4))[0], '2027-W01')
+
+    def test_month_days(self):
+        name, days = uniques.month(date(2028, 2, 10))
+        self.assertEqual(name, '2028-02')
+        self.assertEqual(len(days), 29)
+        self.assertEqual((days[0], days[-1]), ('20280201', '20280229'))
+        self.assertEqual(len(uniques.month(date(2027, 2, 1))[1]), 28)
+
+    def test_last_days(self):
+        self.assertEqual(uniques.last_days(3, date(2026, 3, 1)), ['20260301', '20260228', '20260227'])
+
+
+class LocalUniqueViewersTests(SimpleTestCase):
+
+    def setUp(self):
+        self.backend = LocalUniqueViewers()
+
+    def view(self, period, image_id, viewers):
+        with mock.patch.object(uniques, 'day', return_value=period):
+            for viewer in viewers:
+                self.backend.add(image_id, viewer)
+
+    def test_top_over_several_days_ranks_the_union(self):
+        days = ['20261017', '20261018', '20261019']
+        # Image 1: the same 30 viewers every day; image 2: 50 viewers once
+        for period in days:
+            self.view(period, 1, range(30))
+        self.view(days[0], 2, range(100, 150))
+        self.view(days[1], 3, range(200, 210))
+
+        top = self.backend.top(days, limit=2)
+        self.assertEqual([image_id for image_id, _ in top], [2, 1])
+        self.assertAlmostEqual(top[0][1], 50, delta=1)
+        self.assertAlmostEqual(top[1][1], 30, delta=1)
+        # A single day is read from its ranking as is
+        self.assertEqual([image_id for image_id, _ in self.backend.top(days[1:2])], [1, 3])
+
+    def test_merge_keeps_the_union_under_the_period_name(self):
+        self.view('20261228', 1, range(40))
+        self.view('20270101', 1, range(20, 60))
+        name, days = uniques.week(date(2027, 1, 1))
+        self.assertEqual(self.backend.merge(days, name), 1)
+        self.assertAlmostEqual(self.backend.count(1, [name]), 60, delta=1)
+        self.assertEqual(self.backend.rankings([name])[0][0][0], 1)
+
+    def test_forget(self):
+        with mock.patch.object(uniques, 'timezone') as timezone:
+            timezone.localdate.return_value = date(2026, 10, 19)
+            self.backend.add(1, 'viewer')
+            self.backend.forget(1)
+        self.assertEqual(self.backend.count(1), 0)
+        self.assertEqual(self.backend.top(), [])
+
+
+class ImageListStampTests(SimpleTestCase):
+
+    def stamp(self, counters, **params):
+        with mock.patch.object(versions, 'current', side_effect=lambda *names: tuple(counters[name] for name in names)):
+            return image_list_stamp(RequestFactory().get('/images/', params))
+
+    def test_stamp_follows_the_counters(self):
+        counters = {versions.LIST: 1, versions.STATS: 1}
+        stamp = self.stamp(counters)
+        self.assertIsNone(stamp[1])
+        counters[versions.STATS] += 1
+        # Stats only reorder the sorted lists
+        self.assertEqual(self.stamp(counters), stamp)
+        counters[versions.LIST] += 1
+        self.assertNotEqual(self.stamp(counters), stamp)
+
+    def test_sorted_lists_follow_the_stats_counter(self):
+        counters = {versions.LIST: 1, versions.STATS: 1}
+        stamp = self.stamp(counters, sort='likes')
+        self.assertNotEqual(stamp, self.stamp(counters, sort='views'))
+        counters[versions.STATS] += 1
+        self.assertNotEqual(self.stamp(counters, sort='likes'), stamp)
+
+    def test_pages_have_their_own_stamp(self):
+        counters = {versions.LIST: 1}
+        self.assertNotEqual(self.stamp(counters, page='1'), self.stamp(counters, page='2'))
+        self.assertNotEqual(self.stamp(counters, page='2'), self.stamp(counters, page='2', images_only='1'))
+
+
+class ExtractTests(SimpleTestCase):
+
+    def test_distinct_lowercased_in_order(self):
+        self.assertEqual(tags.extract('#Sunset at the #beach, #sunset again (#sea-side-)'),
+                         ['sunset', 'beach', 'sea-side'])
+
+    def test_fragments_and_entities_are_not_tags(self):
+        text = 'see https://example.com/page#section, a&#35;b, word#inside, ##double and #ok'
+        self.assertEqual(tags.extract(text), ['ok'])
+
+    def test_limits(self):
+        self.assertEqual(tags.extract('#' + 'a' * 60), ['a' * 50])
+        self.assertEqual(tags.extract('# #-dash #_under'), ['_under'])
+        self.assertEqual(tags.extract(None), [])
+        with override_settings(TAGS_PER_IMAGE=2):
+            self.assertEqual(tags.extract('#one #two #three'), ['one', 'two'])
+
+
+class TagIndexTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('tagger')
+        # bulk_create: the tags are set explicitly below
+        cls.images = Image.objects.bulk_create([
+            Image(user=user, title=f'Image {number}', slug=f'image-{number}',
+                  url=f'https://example.com/{number}.jpg', image=f'images/{number}.jpg')
+            for number in range(5)
+        ])
+        cls.ids = [image.id for image in cls.images]
+        for image_id in cls.ids:
+            tags.set_tags(image_id, ['sky'], trending=False)
+        cls.sky = Tag.objects.get(name='sky')
+
+    def counts(self):
+        return dict(Tag.objects.values_list('name', 'count'))
+
+    def test_set_tags_moves_the_counts(self):
+        self.assertEqual(self.counts(), {'sky': 5})
+        tags.set_tags(self.ids[0], ['sky', 'sea'], trending=False)
+        tags.set_tags(self.ids[1], ['sea'], trending=False)
+        self.assertEqual(self.counts(), {'sky': 4, 'sea': 2})
+        # Setting the same tags again changes nothing
+        tags.set_tags(self.ids[1], ['sea'], trending=False)
+        tags.set_tags(self.ids[2], [], trending=False)
+        self.assertEqual(self.counts(), {'sky': 3, 'sea': 2})
+
+    def test_recount(self):
+        Tag.objects.update(count=42)
+        tags.recount([self.sky.id])
+        self.assertEqual(self.counts(), {'sky': 5})
+
+    def test_feed_pages_newest_first(self):
+        newest_first = sorted(self.ids, reverse=True)
+        ids, cursor = tags.feed(self.sky, limit=2)
+        self.assertEqual(ids, newest_first[:2])
+        ids, cursor = tags.feed(self.sky, before=cursor, limit=2)
+        self.assertEqual(ids, newest_first[2:4])
+        ids, cursor = tags.feed(self.sky, before=cursor, limit=2)
+        self.assertEqual((ids, cursor), (newest_first[4:], None))
+
+    def test_feed_of_exactly_one_page(self):
+        self.assertEqual(tags.feed(self.sky, limit=5), (sorted(self.ids, reverse=True), None))
+
+    def test_feed_skips_deleted_images(self):
+        Image.all_objects.filter(id=self.ids[-1]).update(deleted=timezone.now())
+        ids, cursor = tags.feed(self.sky, limit=10)
+        self.assertEqual(ids, sorted(self.ids[:-1], reverse=True))
+
+
+@override_settings(TASKS_EAGER=False)
+class ImageDeletionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner')
+        cls.fan = User.objects.create_user('fan')
+        # bulk_create: no thumbnail or stats signals
+        cls.image, cls.other = Image.objects.bulk_create([
+            Image(user=cls.owner, title='Doomed', slug='doomed', url='https://example.com/doomed.jpg',
+                  image='images/doomed.jpg', total_likes=1),
+            Image(user=cls.owner, title='Kept', slug='kept', url='https://example.com/kept.jpg',
+                  image='images/kept.jpg', total_likes=1),
+        ])
+        Like = Image.users_like.through
+        Like.objects.bulk_create([Like(image=cls.image, user=cls.fan), Like(image=cls.other, user=cls.fan)])
+        tags.set_tags(cls.image.id, ['sky'], trending=False)
+        tags.set_tags(cls.other.id, ['sky'], trending=False)
+        cls.doomed_action = Action.objects.create(user=cls.fan, verb='likes', target=cls.image)
+        cls.kept_action = Action.objects.create(user=cls.fan, verb='likes', target=cls.other)
+
+    def setUp(self):
+        self.redis = mock_redis(self)
+
+    def purge(self):
+        return sum(deletion.purge_batches(self.image.id, 1))
+
+    def test_soft_delete_hides_now_and_queues_the_purge_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(deletion.soft_delete(Image.objects.filter(id=self.image.id)), 1)
+            self.assertFalse(Task.objects.exists())
+        self.assertEqual(list(Image.objects.all()), [self.other])
+        self.assertTrue(Image.all_objects.filter(id=self.image.id).exists())
+        self.assertEqual(list(Action.objects.visible()), [self.kept_action])
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(list(Task.objects.values_list('name', 'dedup_key')),
+                         [('images.tasks.purge_image', f'purge_image:{self.image.id}')])
+        # Deleting it again queues nothing more
+        self.assertEqual(deletion.soft_delete(Image.all_objects.filter(id=self.image.id)), 0)
+
+    def test_purge(self):
+        deletion.soft_delete(Image.objects.filter(id=self.image.id))
+        self.assertEqual(self.purge(), 3)
+
+        self.assertFalse(Image.all_objects.filter(id=self.image.id).exists())
+        self.assertEqual(list(Image.users_like.through.objects.values_list('image_id', flat=True)), [self.other.id])
+        self.assertEqual(list(Action.objects.all()), [self.kept_action])
+        self.assertEqual(Tag.objects.get(name='sky').count, 1)
+        self.assertEqual(list(Task.objects.filter(name='images.tasks.delete_media').values_list('args', flat=True)),
+                         [[['images/doomed.jpg']]])
+        self.redis['images.stats'].pipeline.return_value.delete.assert_called_once_with(f'image:{self.image.id}:views')
+
+        # A second run has nothing left to do
+        self.assertEqual(self.purge(), 0)
+
+    def test_images_not_deleted_are_not_purged(self):
+        self.assertEqual(self.purge(), 0)
+        self.assertEqual(Image.users_like.through.objects.count(), 2)
+        self.assertEqual(Action.objects.count(), 2)
+
+    def test_shared_files_are_kept(self):
+        Image.objects.filter(id=self.other.id).update(image='images/doomed.jpg')
+        deletion.soft_delete(Image.objects.filter(id=self.image.id))
+        self.purge()
+        self.assertFalse(Task.objects.filter(name='images.tasks.delete_media').exists())
+
+
+@override_settings(TASKS_EAGER=False)
+class ImageAdminDeletionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        cls.images = Image.objects.bulk_create([
+            Image(user=cls.admin, title=f'Image {number}', slug=f'image-{number}',
+                  url=f'https://example.com/{number}.jpg', image=f'images/{number}.jpg')
+            for number in range(3)
+        ])
+
+    def setUp(self):
+        mock_redis(self)
+        self.client.defaults['HTTP_USER_AGENT'] = 'Mozilla/5.0 Firefox'
+        self.client.force_login(self.admin)
+
+    def test_delete_view_soft_deletes(self):
+        image = self.images[0]
+        url = f'/admin/images/image/{image.id}/delete/'
+        self.assertContains(self.client.get(url), 'Image 0')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(url, {'post': 'yes'}).status_code, 302)
+        self.assertTrue(Image.all_objects.filter(id=image.id).exclude(deleted=None).exists())
+        self.assertEqual(list(Task.objects.values_list('args', flat=True)), [[image.id]])
+
+    def test_delete_selected_soft_deletes(self):
+        ids = [image.id for image in self.images[:2]]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/admin/images/image/', {
+                'action': 'delete_selected', '_selected_action': ids, 'post': 'yes',
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(list(Image.objects.all()), [self.images[2]])
+        self.assertEqual(Image.all_objects.count(), 3)
+        self.assertEqual(sorted(Task.objects.values_list('args', flat=True)), [[ids[0]], [ids[1]]])
+
+
+class Body(io.BytesIO):
+    """
+    A response body remembering how much of it was read.
+    """
+    read_bytes = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.read_bytes += len(data)
+        return data
+
+    def readinto(self, buffer):
+        count = super().readinto(buffer)
+        self.read_bytes += count
+        return count
+
+
+class FakeAdapter(requests.adapters.BaseAdapter):
+    """
+    Answers requests with the queued (status, headers, body) or exception.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.responses = []
+        self.requests = []
+        self.bodies = []
+
+    def send(self, request, **kwargs):
+        self.requests.append(request)
+        answer = self.responses.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        status, headers, body = answer
+        self.bodies.append(Body(body))
+        raw = urllib3.HTTPResponse(body=self.bodies[-1], headers=headers, status=status, preload_content=False)
+        return requests.adapters.HTTPAdapter().build_response(request, raw)
+
+    def close(self):
+        pass
+
+
+class RemoteFetchTests(SimpleTestCase):
+    url = 'https://cdn.example.com/image.jpg'
+
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        override = override_settings(REMOTE_CACHE_DIR=cache_dir.name, REMOTE_CACHE_MAX_BYTES=10 ** 6,
+                                     REMOTE_CACHE_FRESH=600, REMOTE_HOST_FAILURES=2, REMOTE_HOST_DOWN_SECONDS=60)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.adapter = FakeAdapter()
+        session = requests.Session()
+        session.mount('https://', self.adapter)
+        for target, attribute, new in ((remote, 'get_session', lambda: session),
+                                       (remote, 'hosts', remote.HostHealth())):
+            patcher = mock.patch.object(target, attribute, new)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_fresh_responses_come_from_the_cache(self):
+        self.adapter.responses.append((200, {'Cache-Control': 'max-age=60'}, b'image'))
+        self.assertEqual(remote.fetch(self.url), b'image')
+        self.assertEqual(remote.fetch(self.url), b'image')
+        self.assertEqual(len(self.adapter.requests), 1)
+
+    def test_stale_responses_are_revalidated(self):
+        self.adapter.responses += [(200, {'Cache-Control': 'no-cache', 'ETag': '"v1"'}, b'image'),
+                                   (304, {'Cache-Control': 'max-age=60'}, b''),
+                                   (200, {'Cache-Control': 'no-cache', 'ETag': '"v2"'}, b'changed')]
+        self.assertEqual(remote.fetch(self.url), b'image')
+        self.assertEqual(remote.fetch(self.url), b'image')
+        self.assertEqual(self.adapter.requests[1].headers['If-None-Match'], '"v1"')
+        # Fresh again after the 304
+        self.assertEqual(remote.fetch(self.url), b'image')
+        self.assertEqual(len(self.adapter.requests), 2)
+
+        with mock.patch.object(remote.time, 'time', return_value=remote.time.time() + 120):
+            self.assertEqual(remote.fetch(self.url), b'changed')
+        self.assertEqual(self.adapter.requests[2].headers['If-None-Match'], '"v1"')
+
+    def test_no_store_is_not_cached(self):
+        self.adapter.responses += [(200, {'Cache-Control': 'no-store'}, b'image')] * 2
+        remote.fetch(self.url)
+        remote.fetch(self.url)
+        self.assertEqual(len(self.adapter.requests), 2)
+
+    def test_failing_hosts_are_skipped_for_a_while(self):
+        self.adapter.responses += [(503, {}, b''), requests.ConnectionError('refused'),
+                                   (200, {}, b'other'), (200, {}, b'image')]
+        for _ in range(2):
+            with self.assertRaises(remote.RemoteFetchError):
+                remote.fetch(self.url)
+        with self.assertRaises(remote.HostUnavailable):
+            remote.fetch('https://cdn.example.com/other.jpg')
+        self.assertEqual(len(self.adapter.requests), 2)
+        # Other hosts aren't affected
+        self.assertEqual(remote.fetch('https://other.example.com/image.jpg'), b'other')
+        with mock.patch.object(remote.time, 'monotonic', return_value=remote.time.monotonic() + 61):
+            self.assertEqual(remote.fetch(self.url), b'image')
+
+    def test_successes_reset_the_failure_count(self):
+        self.adapter.responses += [(503, {}, b''), (200, {}, b'image'), (503, {}, b''), (200, {}, b'image')]
+        for path in ('a', 'b', 'c', 'd'):
+            try:
+                remote.fetch(f'https://cdn.example.com/{path}.jpg')
+            except remote.RemoteFetchError:
+                pass
+        self.assertEqual(len(self.adapter.requests), 4)
+
+    @override_settings(REMOTE_MAX_BYTES=1000)
+    def test_size_limit(self):
+        self.adapter.responses.append((200, {}, b'x' * 200 * 1024))
+        with self.assertRaisesMessage(remote.RemoteFetchError, 'larger than 1000 bytes'):
+            remote.fetch(self.url)
+        # Stopped reading at the first chunk over the limit
+        self.assertLessEqual(self.adapter.bodies[0].read_bytes, 64 * 1024)
+
+    def test_error_bodies_are_not_read_whole(self):
+        self.adapter.responses.append((404, {}, b'x' * 1024 * 1024))
+        with self.assertRaisesMessage(remote.RemoteFetchError, 'answered 404'):
+            remote.fetch(self.url)
+        self.assertEqual(self.adapter.bodies[0].read_bytes, remote.ERROR_BODY_MAX_BYTES)
+
+
+class CardsTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner')
+        cls.images = Image.objects.bulk_create([
+            Image(user=cls.user, title=f'Image {number}', slug=f'image-{number}', total_likes=number,
+                  url=f'https://example.com/{number}.jpg', image=f'images/{number}.jpg')
+            for number in range(3)
+        ])
+        cls.ids = [image.id for image in cls.images]
+
+    def setUp(self):
+        # Thumbnails are another module's business
+        for attribute, new in (('picture', lambda file, alias: f'<picture {file.name}>'),
+                               ('prefetch', lambda pairs: None)):
+            patcher = mock.patch.object(cards, attribute, new)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class CardsTests(CardsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.r = mock_redis(self)['images.cards']
+        self.pipe = self.r.pipeline.return_value
+
+    def test_one_mget_and_only_misses_built(self):
+        stored = cards.ImageCard(self.ids[1], 'Stored', '/stored/', '<picture>', 7, cards.url_epoch()).pack()
+        self.r.mget.return_value = [None, stored, None, b'1', None, b'2']
+        with self.assertNumQueries(1):
+            page = cards.get_cards(self.ids)
+        self.r.mget.assert_called_once_with([cards.card_key(image_id) for image_id in self.ids] +
+                                            [cards.version_key(image_id) for image_id in self.ids])
+        self.assertEqual([card.title for card in page], ['Image 0', 'Stored', 'Image 2'])
+        self.assertEqual(page[2].picture, '<picture images/2.jpg>')
+        # Stored under the versions read before the rows
+        self.assertEqual([(call.args[2], call.args[4]) for call in self.pipe.eval.call_args_list],
+                         [(cards.card_key(self.ids[0]), b'1'), (cards.card_key(self.ids[2]), b'2')])
+
+    def test_cards_of_another_url_epoch_are_missing(self):
+        old = cards.ImageCard(self.ids[0], 'Old', '/old/', '<picture>', 0, 1).pack()
+        self.r.mget.return_value = [old, None]
+        with mock.patch.object(cards, 'url_epoch', return_value=2):
+            self.assertEqual([card.title for card in cards.get_cards(self.ids[:1])], ['Image 0'])
+
+    def test_deleted_images_are_left_out(self):
+        Image.all_objects.filter(id=self.ids[1]).update(deleted=timezone.now())
+        self.r.mget.return_value = [None] * 6
+        self.assertEqual([card.id for card in cards.get_cards(self.ids)], [self.ids[0], self.ids[2]])
+
+    @override_settings(IMAGE_CARDS=False)
+    def test_disabled(self):
+        self.assertEqual(len(cards.get_cards(self.ids)), 3)
+        self.r.mget.assert_not_called()
+
+
+@skipUnless(FAKE_REDIS_LUA, 'needs fakeredis and lupa')
+class CardsStoreTests(CardsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.r = fake_redis(self)
+
+    def titles(self):
+        return [card.title for card in cards.get_cards(self.ids)]
+
+    def test_cards_are_read_back(self):
+        self.titles()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.titles(), ['Image 0', 'Image 1', 'Image 2'])
+        self.assertGreater(self.r.ttl(cards.card_key(self.ids[0])), 0)
+
+    def test_invalidated_cards_are_rebuilt(self):
+        self.titles()
+        Image.objects.filter(id=self.ids[0]).update(title='Renamed')
+        with self.captureOnCommitCallbacks(execute=True):
+            cards.invalidate(self.ids[:1])
+        self.assertEqual(self.titles(), ['Renamed', 'Image 1', 'Image 2'])
+
+    def test_cards_built_before_an_invalidation_are_not_stored(self):
+        build_cards = cards.build_cards
+
+        def build_then_invalidated(image_ids, epoch=None):
+            built = build_cards(image_ids, epoch)
+            # An update commits while this read builds from the old rows
+            cards.drop([self.ids[0]])
+            return built
+
+        with mock.patch.object(cards, 'build_cards', build_then_invalidated):
+            self.assertEqual(self.titles(), ['Image 0', 'Image 1', 'Image 2'])
+        self.assertIsNone(self.r.get(cards.card_key(self.ids[0])))
+        self.assertIsNotNone(self.r.get(cards.card_key(self.ids[1])))
+
+
+@override_settings(MEDIA_SIGNED_URLS=False, MEDIA_URL='/media/', RESPONSIVE_IMAGE_DENSITIES=[1, 2])
+class SrcsetTests(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(derivatives, 'modern_formats', lambda: ['avif', 'webp'])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.image = Image(image='images/a.jpg', image_derivatives={'source': 'images/a.jpg', 'aliases': {
+            'grid': {
+                'avif': ['images/a.jpg.grid.avif', 'images/a.jpg.grid@2x.avif'],
+                'webp': ['images/a.jpg.grid.webp', 'images/a.jpg.grid@2x.webp'],
+                'fallback': ['images/a.jpg.grid.jpg', 'images/a.jpg.grid@2x.jpg'],
+            },
+        }})
+
+    def test_stored_derivatives_need_no_lookup(self):
+        with mock.patch.object(thumbnail_urls, 'resolved_names') as resolved_names:
+            sources = srcset(self.image.image, 'grid')
+        resolved_names.assert_not_called()
+        self.assertEqual(sources, [
+            ('avif', [('/media/images/a.jpg.grid.avif', 1), ('/media/images/a.jpg.grid%402x.avif', 2)]),
+            ('webp', [('/media/images/a.jpg.grid.webp', 1), ('/media/images/a.jpg.grid%402x.webp', 2)]),
+            ('fallback', [('/media/images/a.jpg.grid.jpg', 1), ('/media/images/a.jpg.grid%402x.jpg', 2)]),
+        ])
+
+    def test_picture_markup(self):
+        with mock.patch.object(thumbnail_urls, 'resolved_names'):
+            html = picture(self.image.image, 'grid', alt='"A"', css_class='item')
+        self.assertEqual(
+            html,
+            '<picture>'
+            '<source type="image/avif" '
+            'srcset="/media/images/a.jpg.grid.avif 1x, /media/images/a.jpg.grid%402x.avif 2x">'
+            '<source type="image/webp" '
+            'srcset="/media/images/a.jpg.grid.webp 1x, /media/images/a.jpg.grid%402x.webp 2x">'
+            '<img src="/media/images/a.jpg.grid.jpg" '
+            'srcset="/media/images/a.jpg.grid.jpg 1x, /media/images/a.jpg.grid%402x.jpg 2x" '
+            'alt="&quot;A&quot;" class="item"></picture>'
+        )
+
+    def test_missing_formats_and_stale_derivatives_are_resolved(self):
+        del self.image.image_derivatives['aliases']['grid']['avif']
+        on_demand = {'avif': ['images/a.jpg.grid.avif'], 'fallback': ['images/b.jpg']}
+        with mock.patch.object(thumbnail_urls, 'resolved_names', return_value=on_demand) as resolved_names:
+            sources = srcset(self.image.image, 'grid')
+            self.assertEqual([fmt for fmt, urls in sources], ['avif', 'webp', 'fallback'])
+            # Stored names win
+            self.assertEqual(sources[2][1][0][0], '/media/images/a.jpg.grid.jpg')
+
+            self.image.image = 'images/b.jpg'
+            self.assertEqual(srcset(self.image.image, 'grid'), [
+                ('avif', [('/media/images/a.jpg.grid.avif', 1)]), ('fallback', [('/media/images/b.jpg', 1)]),
+            ])
+        self.assertEqual(resolved_names.call_count, 2)
+
+    def test_no_file(self):
+        self.assertEqual(picture(Image().image, 'grid', alt='none'), '<img src="" alt="none" class="">')
+
+
+class NormalizeImageTests(SimpleTestCase):
+
+    def encode(self, image, image_format='JPEG', **options):
+        output = io.BytesIO()
+        image.save(output, format=image_format, **options)
+        return output.getvalue()
+
+    def decode(self, data):
+        return PILImage.open(io.BytesIO(data))
+
+    def test_small_images_without_exif_are_untouched(self):
+        data = self.encode(PILImage.new('RGB', (40, 20), 'red'))
+        self.assertIs(normalize_image(data), data)
+
+    def test_not_an_image(self):
+        self.assertEqual(normalize_image(b'<html>'), b'<html>')
+
+    def test_exif_orientation_is_applied_and_stripped(self):
+        image = PILImage.new('RGB', (40, 20), 'red')
+        exif = image.getexif()
+        exif[0x0112] = 6  # Rotated 90 degrees
+        exif[0x010F] = 'Camera maker'
+        normalized = self.decode(normalize_image(self.encode(image, exif=exif.tobytes())))
+        self.assertEqual(normalized.format, 'JPEG')
+        self.assertEqual(normalized.size, (20, 40))
+        self.assertFalse(normalized.getexif())
+
+    @override_settings(IMAGE_MAX_DIMENSION=100)
+    def test_large_images_are_downsized_in_their_format(self):
+        normalized = self.decode(normalize_image(self.encode(PILImage.new('RGBA', (400, 200)), 'PNG')))
+        self.assertEqual((normalized.format, normalized.mode, normalized.size), ('PNG', 'RGBA', (100, 50)))
+        normalized = self.decode(normalize_image(self.encode(PILImage.new('RGB', (150, 300)))))
+        self.assertEqual((normalized.format, normalized.size), ('JPEG', (50, 100)))
+
+
+class RedisUniqueViewersTestCase(SimpleTestCase):
+
+    def view(self, period, image_id, viewers):
+        with mock.patch.object(uniques, 'day', return_value=period):
+            for viewer in viewers:
+                self.backend.add(image_id, viewer)
+
+
+class RedisUniqueViewersAddTests(RedisUniqueViewersTestCase):
+
+    def setUp(self):
+        with mock.patch.object(uniques, 'InstrumentedRedis'):
+            self.backend = uniques.RedisUniqueViewers()
+        self.backend.add_script = mock.MagicMock()
+
+    @override_settings(UNIQUE_VIEWERS_RETENTION_DAYS=35)
+    def test_one_script_call_on_the_callers_pipeline(self):
+        pipe = mock.Mock()
+        with mock.patch.object(uniques, 'day', return_value='20261019'):
+            self.backend.add(7, 'viewer', pipe=pipe)
+            self.backend.add(7, 'viewer')
+        self.backend.add_script.assert_has_calls([
+            mock.call(keys=['image:7:viewers', 'image_ranking:unique',
+                            'image:7:viewers:20261019', 'image_ranking:unique:20261019'],
+                      args=['viewer', 7, 35 * 86400], client=pipe),
+            mock.call(keys=mock.ANY, args=mock.ANY, client=self.backend.redis),
+        ])
+
+
+@skipUnless(FAKE_REDIS_LUA, 'needs fakeredis and lupa')
+@override_settings(UNIQUE_VIEWERS_RETENTION_DAYS=35, UNIQUE_VIEWERS_ROLLUP_RETENTION_DAYS=400)
+class RedisUniqueViewersTests(RedisUniqueViewersTestCase):
+
+    def setUp(self):
+        self.r = fake_redis(self)
+        self.backend = uniques.get_unique_viewers()
+
+    def test_add_counts_and_ranks(self):
+        self.view('20261019', 1, range(30))
+        self.view('20261019', 2, range(10))
+        # Repeat viewers change nothing
+        self.view('20261019', 2, range(5))
+        self.assertEqual(self.backend.top(['20261019']), [(1, 30), (2, 10)])
+        self.assertEqual(self.backend.top(), [(1, 30), (2, 10)])
+        self.assertEqual(self.backend.counts([1, 2, 3]), [30, 10, 0])
+
+    def test_daily_keys_expire_and_all_time_ones_dont(self):
+        self.view('20261019', 1, ['viewer'])
+        for key in (uniques.viewers_key(1, '20261019'), uniques.ranking_key('20261019')):
+            self.assertEqual(self.r.ttl(key), 35 * 86400)
+        for key in (uniques.viewers_key(1), uniques.ranking_key()):
+            self.assertEqual(self.r.ttl(key), -1)
+
+    def test_top_over_several_days_ranks_the_union(self):
+        days = ['20261017', '20261018', '20261019']
+        for period in days:
+            self.view(period, 1, range(30))
+        self.view(days[0], 2, range(100, 150))
+        self.assertEqual(self.backend.top(days, limit=2), [(2, 50), (1, 30)])
+
+    def test_rollups_expire(self):
+        self.view('20261228', 1, range(40))
+        self.view('20270101', 1, range(20, 60))
+        name, days = uniques.week(date(2027, 1, 1))
+        self.assertEqual(self.backend.merge(days, name), 1)
+        self.assertEqual(self.backend.count(1, [name]), 60)
+        for key in (uniques.viewers_key(1, name), uniques.ranking_key(name)):
+            self.assertEqual(self.r.ttl(key), 400 * 86400)
+
+    def test_forget(self):
+        today = uniques.day()
+        self.view(today, 1, ['viewer'])
+        self.view(today, 2, ['viewer'])
+        self.backend.forget(1)
+        self.assertEqual(self.backend.counts([1, 2], [today]), [0, 1])
+        self.assertEqual(self.backend.top([today]), [(2, 1)])
+        self.assertEqual(self.backend.top(), [(2, 1)])
+
+
+class ReducedDecodingTests(SimpleTestCase):
+
+    def jpeg(self, size, orientation=None, image_format='JPEG'):
+        # Left half red, right half blue
+        image = PILImage.new('RGB', size, 'blue')
+        image.paste('red', (0, 0, size[0] // 2, size[1]))
+        options = {}
+        if orientation:
+            exif = image.getexif()
+            exif[0x0112] = orientation
+            options['exif'] = exif.tobytes()
+        output = io.BytesIO()
+        image.save(output, format=image_format, **options)
+        output.seek(0)
+        return output
+
+    @override_settings(IMAGE_DECODE_REDUCING_GAP=1.0)
+    def test_required_scale_is_what_scale_and_crop_uses(self):
+        cases = [
+            ((1000, 500), {'size': (300, 300), 'crop': 'smart'}),
+            ((500, 1000), {'size': (80, 80), 'crop': '100%'}),
+            ((1000, 500), {'size': (300, 0)}),
+            ((1000, 500), {'size': (0, 100)}),
+            ((500, 1000), {'size': (180, 180)}),
+            ((1000, 500), {'size': (100, 100), 'crop': True, 'zoom': 40}),
+        ]
+        for source_size, options in cases:
+            with self.subTest(source_size=source_size, options=options):
+                scale = required_scale(source_size, options)
+                full = scale_and_crop(PILImage.new('RGB', source_size), **options)
+                # Decoded at that scale, the thumbnail comes out the same size...
+                reduced = PILImage.new('RGB', [math.ceil(dimension * scale) for dimension in source_size])
+                self.assertEqual(scale_and_crop(reduced, **options).size, full.size)
+                if options.get('zoom'):
+                    # Zooming crops a smaller source to the same size, with fewer details
+                    continue
+                # ...but no smaller, as thumbnails are never upscaled
+                smaller = PILImage.new('RGB', [int(dimension * scale * 0.8) for dimension in source_size])
+                self.assertNotEqual(scale_and_crop(smaller, **options).size, full.size)
+
+    def test_nothing_to_save(self):
+        self.assertEqual(required_scale((100, 100), {'size': (300, 300)}), 1.0)
+        self.assertEqual(required_scale((1000, 1000), {'size': (100, 100), 'autocrop': True}), 1.0)
+        self.assertEqual(required_scale((1000, 1000), {}), 1.0)
+
+    @override_settings(IMAGE_DECODE_REDUCING_GAP=2.0)
+    def test_large_jpegs_are_decoded_in_draft_mode(self):
+        with mock.patch.object(JpegImageFile, 'draft', autospec=True,
+                               side_effect=JpegImageFile.draft) as draft:
+            image = open_reduced(self.jpeg((2000, 1000)), [{'size': (100, 100)}])
+        draft.assert_called_once_with(mock.ANY, 'RGB', (200, 100))
+        # libjpeg scales by 1/8: the closest to twice 100x50 above it
+        self.assertEqual(image.size, (250, 125))
+
+    @override_settings(IMAGE_DECODE_REDUCING_GAP=2.0)
+    def test_other_formats_are_reduced(self):
+        image = open_reduced(self.jpeg((2000, 1000), image_format='PNG'), [{'size': (100, 100)}])
+        self.assertEqual(image.size, (200, 100))
+
+    @override_settings(IMAGE_DECODE_REDUCING_GAP=2.0)
+    def test_exif_rotated_sources_come_out_upright(self):
+        # Stored landscape, shown rotated 90 degrees clockwise
+        image = open_reduced(self.jpeg((2000, 1000), orientation=6), [{'size': (100, 100)}])
+        self.assertEqual(image.size, (125, 250))
+        red, blue = image.getpixel((62, 10)), image.getpixel((62, 240))
+        self.assertGreater(red[0], 200)
+        self.assertGreater(blue[2], 200)
+        # Sized for the upright image: at least twice its 50x100 thumbnail
+        self.assertGreaterEqual(image.size[0], 100)
+        self.assertGreaterEqual(image.size[1], 200)
+
+    def test_shared_source_decodes_once(self):
+        shared = SharedSource([{'size': (300, 300)}, {'size': (80, 80), 'crop': True}])
+        source = self.jpeg((2000, 1000))
+        with mock.patch.object(thumbnails, 'open_reduced', wraps=open_reduced) as decode:
+            first = shared(source, size=(300, 300))
+            second = shared(source, size=(80, 80), crop=True)
+        decode.assert_called_once()
+        self.assertIsNot(first, second)
+        self.assertEqual(first.size, second.size)
+
+
+class ImportTests(TestCase):
+    files = {
+        'users.csv': (
+            'username,email,first_name,last_name,date_of_birth\n'
+            'ann,ann@example.com,Ann,,1990-01-02\n'
+            'bob,,Bob,,not a date\n'
+            'carol,carol@example.com,Carol,,\n'
+        ),
+        'bookmarks.jsonl': '\n'.join(json.dumps(row) for row in [
+            {'username': 'ann', 'url': 'https://img.example.com/sunset.jpg', 'title': 'Sunset',
+             'description': 'At the #beach #sunset'},
+            {'username': 'bob', 'url': 'https://img.example.com/cat.png', 'title': 'Cat', 'description': '#cats'},
+            {'username': 'carol', 'url': 'https://img.example.com/gone.jpg', 'title': 'Gone'},
+            {'username': 'ann', 'url': 'https://example.com/page.html', 'title': 'Not an image'},
+            {'username': 'nobody', 'url': 'https://img.example.com/a.jpg', 'title': 'No owner'},
+        ]) + '\n',
+        'likes.csv': (
+            'username,url\n'
+            'bob,https://img.example.com/sunset.jpg\n'
+            'carol,https://img.example.com/sunset.jpg\n'
+            'ann,https://img.example.com/cat.png\n'
+            'ann,https://img.example.com/unknown.jpg\n'
+        ),
+        'follows.jsonl': '\n'.join(json.dumps(row) for row in [
+            {'user_from': 'ann', 'user_to': 'bob'}, {'user_from': 'bob', 'user_to': 'ann'},
+            {'user_from': 'carol', 'user_to': 'ann'}, {'user_from': 'ann', 'user_to': 'ann'},
+        ]) + '\n',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.carol = User.objects.create_user('carol', first_name='Already here')
+
+    def setUp(self):
+        mock_redis(self)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(MEDIA_ROOT=os.path.join(directory.name, 'media'), MEDIA_CACHE_MAX_BYTES=0)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.paths = {}
+        for name, content in self.files.items():
+            self.paths[name] = os.path.join(directory.name, name)
+            with open(self.paths[name], 'w') as f:
+                f.write(content)
+
+        def fetch(url, timeout=None):
+            if 'gone' in url:
+                raise remote.RemoteFetchError(f'{url} answered 404')
+            output = io.BytesIO()
+            PILImage.new('RGB', (30, 20), 'red').save(output, format='PNG' if url.endswith('.png') else 'JPEG')
+            return output.getvalue()
+        patcher = mock.patch.object(importer, 'fetch', fetch)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_import(self):
+        output = io.StringIO()
+        with self.assertLogs('images.importer', 'WARNING') as logs:
+            call_command('import_bookmarks', users=self.paths['users.csv'], bookmarks=self.paths['bookmarks.jsonl'],
+                         likes=self.paths['likes.csv'], follows=self.paths['follows.jsonl'], fetch_workers=2,
+                         no_derivatives=True, stdout=output)
+        self.assertIn("Invalid date_of_birth 'not a date' for user bob", logs.output[0])
+        self.assertIn('gone.jpg answered 404', logs.output[-1])
+        return output.getvalue().splitlines()[-1]
+
+    def test_import_then_import_again(self):
+        self.assertEqual(self.run_import(), 'Imported 2 users, 2 images, 3 likes, 3 follows, 8 actions, '
+                                            '1 skipped, 5 failed')
+        ann, bob = User.objects.get(username='ann'), User.objects.get(username='bob')
+        self.assertFalse(ann.has_usable_password())
+        self.assertEqual(Profile.objects.get(user=ann).date_of_birth, date(1990, 1, 2))
+        self.assertIsNone(Profile.objects.get(user=bob).date_of_birth)
+        self.assertEqual(User.objects.get(username='carol').first_name, 'Already here')
+
+        sunset, cat = Image.objects.get(title='Sunset'), Image.objects.get(title='Cat')
+        self.assertEqual((sunset.user, cat.user), (ann, bob))
+        self.assertTrue(default_storage.exists(sunset.image.name))
+        self.assertEqual(sunset.image.name.rsplit('.', 1)[1], 'jpg')
+        self.assertEqual(set(Contact.objects.values_list('user_from__username', 'user_to__username')),
+                         {('ann', 'bob'), ('bob', 'ann'), ('carol', 'ann')})
+        self.assert_derived_data(sunset, cat)
+
+        # Everything is there already: nothing is imported twice
+        self.assertEqual(self.run_import(), 'Imported 0 users, 0 images, 0 likes, 0 follows, 0 actions, '
+                                            '11 skipped, 5 failed')
+        self.assertEqual(Image.objects.count(), 2)
+        self.assertEqual(Contact.objects.count(), 3)
+        self.assert_derived_data(sunset, cat)
+
+    def assert_derived_data(self, sunset, cat):
+        sunset.refresh_from_db()
+        cat.refresh_from_db()
+        self.assertEqual((sunset.total_likes, cat.total_likes), (2, 1))
+        self.assertEqual(sorted(Action.objects.values_list('user__username', 'verb')), [
+            ('ann', 'bookmarked image'), ('ann', 'is following'), ('ann', 'likes'),
+            ('bob', 'bookmarked image'), ('bob', 'is following'), ('bob', 'likes'),
+            ('carol', 'is following'), ('carol', 'likes'),
+        ])
+        self.assertEqual(Action.objects.get(verb='is following', user__username='carol').target.username, 'ann')
+        # Bookmarked and liked twice; bookmarked and liked once
+        stats = ImageStats.objects.order_by('image__title').values_list('image__title', 'likes', 'actions')
+        self.assertEqual(list(stats), [('Cat', 1, 2), ('Sunset', 2, 3)])
+        self.assertEqual(dict(Tag.objects.values_list('name', 'count')), {'beach': 1, 'sunset': 1, 'cats': 1})
+        self.assertEqual(set(sunset.image_tags.values_list('tag__name', flat=True)), {'beach', 'sunset'})
+
+
+class StatsTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner')
+        # bulk_create: no stats signals
+        cls.images = Image.objects.bulk_create([
+            Image(user=cls.user, title=f'Image {number}', slug=f'image-{number}',
+                  url=f'https://example.com/{number}.jpg', image=f'images/{number}.jpg')
+            for number in range(3)
+        ])
+        cls.ids = [image.id for image in cls.images]
+        cls.earlier = timezone.now() - timedelta(hours=1)
+        ImageStats.objects.create(image=cls.images[0], views=1, likes=4, actions=2, last_activity=cls.earlier)
+
+
+class StatsTests(StatsTestCase):
+
+    def setUp(self):
+        self.r = mock_redis(self)['images.stats']
+        self.viewers = uniques.get_unique_viewers()
+
+    def test_checkpoint_copies_flagged_counters(self):
+        viewed = timezone.now().timestamp()
+        flagged = [(str(self.ids[0]).encode(), viewed), (str(self.ids[1]).encode(), viewed - 10), (b'999999', viewed)]
+        self.r.zrangebyscore.side_effect = [flagged, []]
+        self.r.mget.return_value = [b'10', b'3', b'1']
+        for viewer in range(4):
+            self.viewers.add(self.ids[0], viewer)
+
+        with mock.patch.object(stats.time, 'time', return_value=viewed + 1):
+            self.assertEqual(stats.checkpoint(batch_size=3), 2)
+
+        self.assertEqual(self.r.zrangebyscore.call_args_list[0],
+                         mock.call(stats.DIRTY_KEY, '-inf', viewed + 1, start=0, num=3, withscores=True))
+        self.r.mget.assert_called_once_with([stats.views_key(image_id) for image_id in self.ids[:2] + [999999]])
+        first, second = ImageStats.objects.get(image_id=self.ids[0]), ImageStats.objects.get(image_id=self.ids[1])
+        # Likes and actions are left alone
+        self.assertEqual((first.views, first.unique_viewers, first.likes, first.actions), (10, 4, 4, 2))
+        self.assertEqual(first.last_activity.timestamp(), viewed)
+        self.assertEqual((second.views, second.unique_viewers, second.likes), (3, 0, 0))
+        self.assertFalse(ImageStats.objects.filter(image_id=999999).exists())
+        # Every image read is unflagged unless viewed again since
+        self.r.eval.assert_called_once_with(stats.UNFLAG_SCRIPT, 1, stats.DIRTY_KEY,
+                                            *[value for member, score in flagged for value in (member, score)])
+
+    def test_checkpoint_keeps_later_activity(self):
+        later = timezone.now()
+        ImageStats.objects.filter(image_id=self.ids[0]).update(last_activity=later)
+        self.r.zrangebyscore.side_effect = [[(str(self.ids[0]).encode(), self.earlier.timestamp())], []]
+        self.r.mget.return_value = [b'2']
+        stats.checkpoint()
+        self.assertEqual(ImageStats.objects.get(image_id=self.ids[0]).last_activity, later)
+
+    def test_record_likes_upserts(self):
+        stats.record_likes({self.ids[0]: 5, self.ids[1]: 1})
+        self.assertEqual(sorted(ImageStats.objects.values_list('image_id', 'views', 'likes', 'actions')),
+                         [(self.ids[0], 1, 5, 2), (self.ids[1], 0, 1, 0)])
+        self.assertGreater(ImageStats.objects.get(image_id=self.ids[0]).last_activity, self.earlier)
+
+    def test_record_actions(self):
+        stats.record_actions(self.ids[:1])
+        self.assertEqual(ImageStats.objects.get(image_id=self.ids[0]).actions, 3)
+
+    def test_record_view(self):
+        pipe = self.r.pipeline.return_value
+        pipe.execute.return_value = [7]
+        request = RequestFactory().get('/', HTTP_USER_AGENT='Mozilla/5.0 Firefox')
+        request.user = self.user
+        self.assertEqual(stats.record_view(request, self.ids[0]), 7)
+        pipe.incr.assert_called_once_with(stats.views_key(self.ids[0]))
+        pipe.zadd.assert_called_once_with(stats.DIRTY_KEY, {self.ids[0]: mock.ANY})
+        self.assertEqual(self.viewers.count(self.ids[0]), 1)
+
+        request.bot = 'user-agent'
+        self.r.get.return_value = b'7'
+        self.assertEqual(stats.record_view(request, self.ids[0]), 7)
+        pipe.incr.assert_called_once()
+
+
+@skipUnless(FAKE_REDIS_LUA, 'needs fakeredis and lupa')
+class StatsCheckpointTests(StatsTestCase):
+
+    def setUp(self):
+        self.r = fake_redis(self)
+
+    def test_images_viewed_during_a_checkpoint_stay_flagged(self):
+        self.r.set(stats.views_key(self.ids[0]), 5)
+        self.r.set(stats.views_key(self.ids[1]), 2)
+        self.r.zadd(stats.DIRTY_KEY, {self.ids[0]: 100, self.ids[1]: 100})
+        counts = uniques.get_unique_viewers().counts
+
+        def viewed_again(image_ids, periods=None):
+            self.r.zadd(stats.DIRTY_KEY, {self.ids[1]: 200})
+            return counts(image_ids, periods)
+
+        with mock.patch.object(uniques.get_unique_viewers(), 'counts', viewed_again), \
+                mock.patch.object(stats.time, 'time', return_value=150):
+            self.assertEqual(stats.checkpoint(), 2)
+        self.assertEqual(self.r.zrange(stats.DIRTY_KEY, 0, -1), [str(self.ids[1]).encode()])
+        self.assertEqual(ImageStats.objects.get(image_id=self.ids[0]).views, 5)
+
+
+@override_settings(RESPONSIVE_IMAGE_DENSITIES=[1, 2], IMAGE_DERIVATIVE_QUALITY={'webp': 75}, THUMBNAIL_URLS_TTL=60)
+class ThumbnailPrefetchTests(TestCase):
+    names = {'webp': ['a.webp', 'a@2x.webp'], 'fallback': ['a.jpg', 'a@2x.jpg']}
+
+    def setUp(self):
+        self.r = mock_redis(self)['images.thumbnail_urls']
+        self.r.mget.side_effect = lambda keys: [None] * len(keys)
+        self.rendered = []
+
+        def render_variants(file, alias):
+            self.rendered.append((file.name, alias))
+            return {} if 'broken' in file.name else self.names
+
+        patch(self, thumbnail_urls, 'lru', thumbnail_urls.LRU(100))
+        patch(self, thumbnail_urls, 'render_variants', render_variants)
+        patch(self, thumbnail_urls, 'modern_formats', lambda: ['webp'])
+        patch(self, derivatives, 'modern_formats', lambda: ['webp'])
+
+    def page(self, *names):
+        # New instances each time, like a new request
+        return [Image(id=number, image=name) for number, name in enumerate(names, start=1)]
+
+    def test_a_page_is_resolved_in_one_query_and_one_mget(self):
+        images = self.page('images/a.jpg', 'images/b.jpg', 'images/a.jpg', 'images/broken.jpg')
+        with self.assertNumQueries(2):  # Source mtimes, before and after rendering
+            thumbnail_urls.prefetch((image.image, 'grid') for image in images)
+        self.r.mget.assert_called_once()
+        self.assertEqual(len(self.r.mget.call_args.args[0]), 3)
+        # Each source once, failures included
+        self.assertEqual(sorted(self.rendered), [('images/a.jpg', 'grid'), ('images/b.jpg', 'grid'),
+                                                 ('images/broken.jpg', 'grid')])
+        self.assertEqual(self.r.pipeline.return_value.set.call_count, 3)
+        self.assertEqual([image.image.resolved_thumbnails['grid'] for image in images],
+                         [self.names, self.names, self.names, {}])
+
+        # Then from the process memo: the mtimes query only
+        with self.assertNumQueries(1):
+            images = self.page('images/a.jpg', 'images/broken.jpg')
+            thumbnail_urls.prefetch((image.image, 'grid') for image in images)
+        self.r.mget.assert_called_once()
+        self.assertEqual(len(self.rendered), 3)
+        self.assertEqual(images[1].image.resolved_thumbnails, {'grid': {}})
+
+    def test_memoized_in_redis_by_other_processes(self):
+        self.r.mget.side_effect = lambda keys: [json.dumps(self.names).encode()] * len(keys)
+        image, = self.page('images/a.jpg')
+        with self.assertNumQueries(1):
+            self.assertEqual(thumbnail_urls.resolved_names(image.image, 'grid'), self.names)
+        self.assertEqual(self.rendered, [])
+        self.r.pipeline.assert_not_called()
+
+    def test_stored_derivatives_need_nothing(self):
+        image = Image(image='images/a.jpg', image_derivatives={'source': 'images/a.jpg', 'aliases': {'grid': {
+            'webp': ['a.webp'], 'fallback': ['a.jpg']}}})
+        with self.assertNumQueries(0):
+            thumbnail_urls.prefetch([(image.image, 'grid'), (Image().image, 'grid')])
+        self.r.mget.assert_not_called()
+
+    def test_memo_keys_change_with_the_alias_options(self):
+        file = Image(image='images/a.jpg').image
+        digest = thumbnail_urls.options_digest(file, 'grid')
+        self.assertEqual(thumbnail_urls.options_digest(file, 'grid'), digest)
+        self.assertNotEqual(thumbnail_urls.options_digest(file, 'avatar'), digest)
+        with override_settings(RESPONSIVE_IMAGE_DENSITIES=[1, 2, 3]):
+            self.assertNotEqual(thumbnail_urls.options_digest(file, 'grid'), digest)
+        with override_settings(IMAGE_DERIVATIVE_QUALITY={'webp': 80}):
+            self.assertNotEqual(thumbnail_urls.options_digest(file, 'grid'), digest)
+        with mock.patch.object(thumbnail_urls, 'modern_formats', lambda: ['avif', 'webp']):
+            self.assertNotEqual(thumbnail_urls.options_digest(file, 'grid'), digest)
+        with mock.patch.object(thumbnail_urls.aliases, 'get', return_value={'size': (400, 400), 'crop': 'smart'}):
+            self.assertNotEqual(thumbnail_urls.options_digest(file, 'grid'), digest)
+
+        key = thumbnail_urls.memo_key('images/a.jpg', 0, 'grid', digest)
+        self.assertNotEqual(thumbnail_urls.memo_key('images/a.jpg', 1, 'grid', digest), key)
+        self.assertNotEqual(thumbnail_urls.memo_key('images/b.jpg', 0, 'grid', digest), key)
+
+
+@override_settings(TASKS_EAGER=False)
+class AsyncViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('fan')
+        cls.images = Image.objects.bulk_create([
+            Image(user=cls.user, title=f'Image {number}', slug=f'image-{number}',
+                  url=f'https://example.com/{number}.jpg', image=f'images/{number}.jpg')
+            for number in range(3)
+        ])
+        # Newest last
+        today = timezone.localdate()
+        for number, image in enumerate(cls.images):
+            Image.objects.filter(id=image.id).update(created=today - timedelta(days=3 - number))
+
+    def setUp(self):
+        mock_redis(self)
+        self.published = patch(self, views, 'publish_like_count', mock.MagicMock())
+
+    def request(self, method, path, data=None, user=None):
+        request = getattr(AsyncRequestFactory(), method)(path, data or {})
+        request.user = user or self.user
+        return request
+
+    async def test_anonymous_users_are_sent_to_log_in(self):
+        for view, method in ((views.image_like_async, 'post'), (views.image_list_async, 'get')):
+            response = await view(self.request(method, '/images/?page=2', user=AnonymousUser()))
+            self.assertEqual(response.status_code, 302)
+            self.assertEqual(response.url, '/account/login/?next=/images/%3Fpage%3D2')
+
+    async def test_like_only_takes_posts(self):
+        response = await views.image_like_async(self.request('get', '/images/like/'))
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(response['Allow'], 'POST')
+
+    async def test_like_and_unlike(self):
+        image = self.images[0]
+        like = {'id': image.id, 'action': 'like'}
+        response = await views.image_like_async(self.request('post', '/images/like/', like))
+        self.assertEqual(json.loads(response.content), {'status': 'ok'})
+        await image.arefresh_from_db()
+        self.assertEqual(image.total_likes, 1)
+        self.assertTrue(await image.users_like.filter(id=self.user.id).aexists())
+        self.assertEqual(await Task.objects.filter(name='actions.tasks.record_action').acount(), 1)
+        self.assertEqual(self.published.call_args.args[0].total_likes, 1)
+
+        response = await views.image_like_async(self.request('post', '/images/like/', {**like, 'action': 'unlike'}))
+        self.assertEqual(json.loads(response.content), {'status': 'ok'})
+        await image.arefresh_from_db()
+        self.assertEqual(image.total_likes, 0)
+        self.assertEqual(self.published.call_count, 2)
+
+    async def test_like_errors(self):
+        for data in ({'id': 0, 'action': 'like'}, {'id': self.images[0].id}):
+            response = await views.image_like_async(self.request('post', '/images/like/', data))
+            self.assertEqual(json.loads(response.content), {'status': 'error'})
+        self.published.assert_not_called()
+
+    async def test_list_pages(self):
+        get_cards = patch(self, views, 'get_cards', mock.MagicMock(side_effect=lambda ids: ids))
+        patch(self, views, 'render_partial', lambda template, context: f'cards {context["images"]}')
+        with mock.patch.object(views, 'IMAGES_PER_PAGE', 2):
+            response = await views.image_list_async(self.request('get', '/images/', {'images_only': 1, 'page': 2}))
+            self.assertEqual(response.content.decode(), f'cards {[self.images[0].id]}')
+            get_cards.assert_called_once_with([self.images[0].id])
+            # Past the last page, or before the first: an empty page ends the infinite scroll
+            for page in (3, 0):
+                request = self.request('get', '/images/', {'images_only': 1, 'page': page})
+                self.assertEqual((await views.image_list_async(request)).content, b'')
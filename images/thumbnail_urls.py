@@ -0,0 +1,183 @@
+"""
+Thumbnail names of images without stored derivatives, resolved in batches.
+
+``{% picture %}`` (images.derivatives.srcset) takes the thumbnail names of
+an alias from the model's ``<field>_derivatives`` when they are current.
+When they aren't (files saved before derivatives existed or whose render
+task hasn't run yet, sources easy_thumbnails can't read), every variant,
+each format at each density, went through easy_thumbnails: Source and
+Thumbnail lookups and storage checks per variant, and for broken sources
+a failed attempt on every render.
+
+``prefetch(pairs)`` resolves those for a whole page up front:
+
+1. one query reads the easy_thumbnails Source rows of all the files, for
+   the source modification time easy_thumbnails recorded
+2. the names are memoized by source name, that mtime, alias and alias
+   options, in an in-process LRU (THUMBNAIL_URLS_LRU_SIZE entries) backed
+   by Redis (one MGET, kept THUMBNAIL_URLS_TTL seconds)
+3. only what neither knows goes through easy_thumbnails (rendering the
+   variants if needed) and is memoized, failures included
+
+The names are attached to the file (``file.resolved_thumbnails``) where
+srcset finds them; files no view prefetched are resolved one by one the
+same way. Stored files are never overwritten in place (storage gives a
+new upload a new name), so the name and recorded mtime identify a source.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.db.models import Q
+from easy_thumbnails.alias import aliases
+from easy_thumbnails.models import Source
+from easy_thumbnails.utils import get_storage_hash
+
+from bookmarks.instrumentation import InstrumentedRedis
+
+from .derivatives import (FALLBACK, THUMBNAIL_ERRORS, _variant_options, derivatives_for, generate_variant,
+                          modern_formats)
+from .thumbnails import SharedSource
+
+# connect redis database
+r = InstrumentedRedis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB)
+
+
+class LRU:
+    """
+    Thread-safe mapping keeping the ``size`` most recently used entries.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.data.get(key)
+            if value is not None:
+                self.data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.size:
+                self.data.popitem(last=False)
+
+
+lru = LRU(settings.THUMBNAIL_URLS_LRU_SIZE)
+
+
+def options_digest(file, alias):
+    """
+    Digest of everything that shapes an alias' variants, so changing the
+    alias, formats, densities or qualities starts new memo entries.
+    """
+    signature = repr((sorted(aliases.get(alias, target=file).items()), modern_formats(),
+                      settings.RESPONSIVE_IMAGE_DENSITIES, sorted(settings.IMAGE_DERIVATIVE_QUALITY.items())))
+    return hashlib.sha1(signature.encode()).hexdigest()[:12]
+
+
+def memo_key(name, mtime, alias, digest):
+    return f'thumbs:{hashlib.sha1(name.encode()).hexdigest()}:{mtime}:{alias}:{digest}'
+
+
+def source_mtimes(files):
+    """
+    {source name: modification time recorded by easy_thumbnails (0 if it
+    hasn't seen the source)}, in one query.
+    """
+    by_storage = defaultdict(set)
+    for file in files:
+        by_storage[get_storage_hash(file.storage)].add(file.name)
+    condition = Q()
+    for storage_hash, names in by_storage.items():
+        condition |= Q(storage_hash=storage_hash, name__in=names)
+    mtimes = dict.fromkeys((file.name for file in files), 0)
+    mtimes.update((name, int(modified.timestamp())) for name, modified
+                  in Source.objects.filter(condition).values_list('name', 'modified'))
+    return mtimes
+
+
+def render_variants(file, alias):
+    """
+    {format: [name per density]} of one alias through easy_thumbnails;
+    formats that can't be rendered are left out.
+    """
+    variants = [_variant_options(aliases.get(alias, target=file), density)
+                for density in settings.RESPONSIVE_IMAGE_DENSITIES]
+    source = SharedSource(variants)
+    names = {}
+    for fmt in modern_formats() + [FALLBACK]:
+        try:
+            names[fmt] = [generate_variant(file, options, fmt, source) for options in variants]
+        except THUMBNAIL_ERRORS:
+            # Like {% thumbnail %}, nothing for broken sources
+            continue
+    return names
+
+
+def needs_resolving(file, alias):
+    data = derivatives_for(file)
+    stored = data['aliases'].get(alias, {}) if data else {}
+    return any(fmt not in stored for fmt in modern_formats() + [FALLBACK])
+
+
+def prefetch(pairs):
+    """
+    Resolve the thumbnails of (file, alias) pairs whose stored derivatives
+    don't cover the alias, and attach them to the files.
+    """
+    pending = defaultdict(list)
+    for file, alias in pairs:
+        if file and needs_resolving(file, alias) and alias not in getattr(file, 'resolved_thumbnails', {}):
+            pending[(file.name, alias)].append(file)
+    if not pending:
+        return
+
+    files = {name: group[0] for (name, alias), group in pending.items()}
+    mtimes = source_mtimes(files.values())
+    digests = {(name, alias): options_digest(files[name], alias) for name, alias in pending}
+    keys = {pair: memo_key(pair[0], mtimes[pair[0]], pair[1], digests[pair]) for pair in pending}
+    resolved = {}
+    for pair, key in keys.items():
+        names = lru.get(key)
+        if names is not None:
+            resolved[pair] = names
+    missing = [pair for pair in pending if pair not in resolved]
+    if missing:
+        for pair, data in zip(missing, r.mget([keys[pair] for pair in missing])):
+            if data is not None:
+                resolved[pair] = json.loads(data)
+                lru.set(keys[pair], resolved[pair])
+
+    rendered = {pair: render_variants(files[pair[0]], pair[1]) for pair in pending if pair not in resolved}
+    if rendered:
+        # Rendering records (or updates) the sources' mtimes
+        mtimes = source_mtimes([files[name] for name, alias in rendered])
+        pipe = r.pipeline(transaction=False)
+        for pair, names in rendered.items():
+            key = memo_key(pair[0], mtimes[pair[0]], pair[1], digests[pair])
+            pipe.set(key, json.dumps(names), ex=settings.THUMBNAIL_URLS_TTL)
+            lru.set(key, names)
+        pipe.execute()
+        resolved.update(rendered)
+
+    for pair, group in pending.items():
+        for file in group:
+            file.resolved_thumbnails = dict(getattr(file, 'resolved_thumbnails', {}), **{pair[1]: resolved[pair]})
+
+
+def resolved_names(file, alias):
+    """
+    {format: [name per density]} of the alias variants of a file without
+    stored derivatives.
+    """
+    prefetch([(file, alias)])
+    return getattr(file, 'resolved_thumbnails', {}).get(alias, {})
@@ -0,0 +1,139 @@
+"""
+Reduced-size decoding of thumbnail sources.
+
+easy_thumbnails decodes every source at full resolution before scaling it
+down, even for an 80x80 avatar. The source generators here decode only as
+many pixels as the thumbnail needs:
+
+- JPEGs use ``Image.draft()``, which makes libjpeg scale by 1/2, 1/4 or 1/8
+  while decoding (in the DCT domain), so most of the work is skipped.
+- Other formats are decoded fully and shrunk with ``Image.reduce()``, a
+  cheap box filter, before the LANCZOS resize of ``scale_and_crop``.
+
+Like ``Image.thumbnail()``, the reduced image is kept at least
+settings.IMAGE_DECODE_REDUCING_GAP times the final size, so the last
+resize still has enough pixels and the output looks the same.
+
+``reduced_image`` is the project's THUMBNAIL_SOURCE_GENERATORS entry;
+``SharedSource`` decodes a source once for all of its aliases.
+"""
+
+import math
+from io import BytesIO
+
+from django.conf import settings
+from easy_thumbnails import utils
+from PIL import Image, ImageFile
+
+# EXIF orientations that swap width and height
+TRANSPOSING_ORIENTATIONS = {5, 6, 7, 8}
+
+
+def required_scale(source_size, options):
+    """
+    The smallest fraction of ``source_size`` the thumbnail needs.
+
+    Mirrors the scale computed by easy_thumbnails' ``scale_and_crop``, with
+    the reducing gap applied. Returns 1.0 when nothing can be saved.
+    """
+    size = options.get('size')
+    if not size or options.get('autocrop'):
+        # autocrop trims the source first, so its final scale isn't known yet
+        return 1.0
+    source_x, source_y = source_size
+    target_x, target_y = [int(v) for v in size]
+    ratios = [target / source for target, source in ((target_x, source_x), (target_y, source_y)) if source]
+    if not ratios:
+        return 1.0
+    if options.get('crop') or not target_x or not target_y:
+        scale = max(ratios)
+    else:
+        scale = min(ratios)
+    if options.get('zoom'):
+        scale *= (100 + int(options['zoom'])) / 100.0
+    return min(scale * settings.IMAGE_DECODE_REDUCING_GAP, 1.0)
+
+
+def _oriented_size(image):
+    try:
+        orientation = image.getexif().get(0x0112)
+    except Exception:
+        orientation = None
+    width, height = image.size
+    return (height, width) if orientation in TRANSPOSING_ORIENTATIONS else (width, height)
+
+
+def open_reduced(source, options_list, exif_orientation=True):
+    """
+    Decode ``source`` with just enough pixels for every set of thumbnail options.
+
+    Args:
+        source: File-like object of the source image.
+        options_list: Thumbnail options (dicts with 'size', 'crop', ...).
+
+    Returns:
+        A loaded PIL image, EXIF orientation applied.
+    """
+    image = Image.open(BytesIO(source.read()))
+    oriented_size = _oriented_size(image)
+    scale = max(required_scale(oriented_size, options) for options in options_list)
+    # Animated images go through easy_thumbnails' frame-aware resizing untouched
+    reducible = scale < 1.0 and getattr(image, 'n_frames', 1) == 1
+
+    full_size = image.size
+    if reducible and image.format == 'JPEG':
+        image.draft(image.mode, (math.ceil(full_size[0] * scale), math.ceil(full_size[1] * scale)))
+
+    # Fully load the image now to catch any problems with the image contents
+    try:
+        ImageFile.LOAD_TRUNCATED_IMAGES = True
+        image.load()
+    finally:
+        ImageFile.LOAD_TRUNCATED_IMAGES = False
+
+    # draft() only gets within a power of two, reduce() covers the rest
+    factor = int(min(image.size[0] / (full_size[0] * scale), image.size[1] / (full_size[1] * scale)))
+
+    # Orientation is read from the decoder's EXIF, so apply it before reducing
+    if exif_orientation:
+        image = utils.exif_orientation(image)
+    if reducible and factor >= 2:
+        image = image.reduce(factor)
+    return image
+
+
+def reduced_image(source, exif_orientation=True, **options):
+    """
+    easy_thumbnails source generator decoding only the pixels one thumbnail needs.
+
+    A drop-in replacement for ``easy_thumbnails.source_generators.pil_image``.
+    """
+    if not source:
+        return None
+    return open_reduced(source, [options], exif_orientation)
+
+
+class SharedSource:
+    """
+    Source generator decoding a source once for several thumbnails.
+
+    The source is decoded on first use, at the resolution the largest of
+    ``options_list`` needs, and each thumbnail gets a copy, so rendering
+    every alias, format and density of an image costs one decode.
+    Thumbnails that already exist never trigger the decode.
+
+    Usage:
+        shared = SharedSource(options_list)
+        thumbnailer.source_generators = [shared]
+    """
+
+    def __init__(self, options_list):
+        self.options_list = list(options_list)
+        self.image = None
+
+    def __call__(self, source, exif_orientation=True, **options):
+        if not source:
+            return None
+        if self.image is None:
+            self.image = open_reduced(source, self.options_list + [options], exif_orientation)
+        return self.image.copy()
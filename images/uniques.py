@@ -0,0 +1,357 @@
+"""
+Unique viewer estimation with HyperLogLog sketches.
+
+Counting raw hits lets refreshes (and anyone scripting them) inflate the
+view counts, while keeping the exact set of viewers of every image costs
+memory linear in the audience. A HyperLogLog sketch estimates the number
+of distinct viewers within ~0.8% using a fixed 12KB at most (Redis keeps
+small sketches in an even smaller sparse encoding), however many there are.
+
+Every view is added to two sketches of the image:
+
+- ``image:{id}:viewers``: all time (copied to ImageStats.unique_viewers
+  by the stats checkpoint)
+- ``image:{id}:viewers:{YYYYMMDD}``: the day, expiring after
+  UNIQUE_VIEWERS_RETENTION_DAYS
+
+and whenever a sketch changes its new estimate is written to the matching
+ranking sorted set (``image_ranking:unique`` and
+``image_ranking:unique:{YYYYMMDD}``), so "most unique viewers today" or
+"of all time" is a single ZREVRANGE.
+
+Sketches merge losslessly: the union of several days is estimated by
+PFCOUNT over their keys (rolling 7/30 day rankings, see ``top``), and
+``merge`` stores it under a period name such as ``2026-W42`` or
+``2026-10`` (see the rollup_unique_viewers command) so weekly and monthly
+figures outlive the daily sketches.
+
+Memory grows with retention, not with the audience. An image has at most
+one all-time sketch, one per day of the last UNIQUE_VIEWERS_RETENTION_DAYS
+and the weekly and monthly rollups of the last
+UNIQUE_VIEWERS_ROLLUP_RETENTION_DAYS (about 110 sketches with the defaults). Each is at most 12KB, and a few
+hundred bytes while the period has fewer than a couple thousand viewers
+(Redis's sparse encoding), so only images viewed by thousands every day
+approach the 1.3MB bound. Lower the retentions to trade history for
+memory; the rankings need 30 days.
+
+The backend is chosen by settings.UNIQUE_VIEWERS_BACKEND, like the live
+update brokers: Redis for deployments, a pure-Python sketch held in
+process memory for tests and single-process development servers.
+"""
+
+import calendar
+import collections
+import hashlib
+import math
+import threading
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from bookmarks.instrumentation import InstrumentedRedis
+
+# Multi-day rankings re-estimate this many times more candidates than they
+# return: summed daily estimates count a viewer once per day, the union once
+CANDIDATE_FACTOR = 5
+
+
+def viewers_key(image_id, period=None):
+    return f'image:{image_id}:viewers' if period is None else f'image:{image_id}:viewers:{period}'
+
+
+def ranking_key(period=None):
+    return 'image_ranking:unique' if period is None else f'image_ranking:unique:{period}'
+
+
+# -------------------------------
+# Periods
+# -------------------------------
+
+def day(when=None):
+    """
+    Period name of a day (today by default), e.g. ``20261019``.
+    """
+    return (when or timezone.localdate()).strftime('%Y%m%d')
+
+
+def last_days(count, when=None):
+    """
+    Names of the ``count`` days up to and including ``when`` (today).
+    """
+    when = when or timezone.localdate()
+    return [day(when - timedelta(days=offset)) for offset in range(count)]
+
+
+def week(when):
+    """
+    Name and days of the ISO week containing ``when``, e.g. ``2026-W42``.
+    """
+    year, number, weekday = when.isocalendar()
+    monday = when - timedelta(days=weekday - 1)
+    return f'{year}-W{number:02d}', [day(monday + timedelta(days=offset)) for offset in range(7)]
+
+
+def month(when):
+    """
+    Name and days of the month containing ``when``, e.g. ``2026-10``.
+    """
+    days = calendar.monthrange(when.year, when.month)[1]
+    return f'{when:%Y-%m}', [day(date(when.year, when.month, number)) for number in range(1, days + 1)]
+
+
+# -------------------------------
+# Pure-Python HyperLogLog
+# -------------------------------
+
+class HyperLogLog:
+    """
+    HyperLogLog sketch with Redis' parameters: 2**14 registers and a 64-bit
+    hash, so a standard error of 1.04 / sqrt(16384) = 0.81%.
+
+    Registers are kept one per byte (16KB) rather than packed in 6 bits.
+    """
+
+    P = 14
+    M = 1 << P
+    # Bits of the hash left once the register index is taken out
+    Q = 64 - P
+    ALPHA = 0.7213 / (1 + 1.079 / M)
+
+    def __init__(self):
+        self.registers = bytearray(self.M)
+
+    def add(self, item):
+        """
+        Add an item; returns True if the estimate may have changed.
+        """
+        value = int.from_bytes(hashlib.blake2b(str(item).encode(), digest_size=8).digest(), 'big')
+        index = value & (self.M - 1)
+        # Position of the first set bit of the remaining bits (Q + 1 if none)
+        rank = self.Q - (value >> self.P).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def count(self):
+        # bytes.count per register value rather than a Python loop over all of them
+        histogram = [self.registers.count(rank) for rank in range(self.Q + 2)]
+        estimate = self.ALPHA * self.M * self.M / sum(n * 2.0 ** -rank for rank, n in enumerate(histogram))
+        if estimate <= 2.5 * self.M and histogram[0]:
+            # Small range correction: linear counting over the empty registers
+            estimate = self.M * math.log(self.M / histogram[0])
+        return round(estimate)
+
+    def update(self, *others):
+        """
+        Merge other sketches into this one (register-wise maximum).
+        """
+        for other in others:
+            self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    @classmethod
+    def union(cls, sketches):
+        return cls().update(*sketches)
+
+
+# -------------------------------
+# Backends
+# -------------------------------
+
+class BaseUniqueViewers:
+    """
+    Interface shared by the backends.
+
+    ``periods`` arguments are lists of period names (days or rollups, see
+    above); several periods mean their union. None means all time.
+
+    Methods:
+        add(image_id, viewer, pipe=None): Record a view by ``viewer``.
+        counts(image_ids, periods=None): Estimated unique viewers of each image.
+        rankings(periods, limit=None): Per period, the ranked (image id, estimate) pairs.
+        merge(periods, name): Store the union of ``periods`` as period ``name``
+            for every image viewed in them; returns the number of images.
+        forget(image_id): Drop the all-time and daily sketches and ranking
+            entries of a deleted image (rollups expire on their own).
+    """
+
+    def add(self, image_id, viewer, pipe=None):
+        raise NotImplementedError
+
+    def counts(self, image_ids, periods=None):
+        raise NotImplementedError
+
+    def rankings(self, periods, limit=None):
+        raise NotImplementedError
+
+    def merge(self, periods, name):
+        raise NotImplementedError
+
+    def forget(self, image_id):
+        raise NotImplementedError
+
+    def count(self, image_id, periods=None):
+        return self.counts([image_id], periods)[0]
+
+    def top(self, periods=None, limit=10):
+        """
+        The images with the most unique viewers over ``periods``.
+
+        Returns:
+            list of (image id, estimated unique viewers), best first.
+        """
+        periods = periods or [None]
+        if len(periods) == 1:
+            return self.rankings(periods, limit)[0]
+        # Candidates by the sum of their per-period estimates, then ranked by
+        # the estimate of the union (a viewer coming back on several days
+        # counts once)
+        summed = collections.Counter()
+        for ranking in self.rankings(periods, limit * CANDIDATE_FACTOR):
+            for image_id, estimate in ranking:
+                summed[image_id] += estimate
+        candidates = [image_id for image_id, _ in summed.most_common(limit * CANDIDATE_FACTOR)]
+        ranked = sorted(zip(candidates, self.counts(candidates, periods)), key=lambda item: -item[1])
+        return ranked[:limit]
+
+
+class RedisUniqueViewers(BaseUniqueViewers):
+    """
+    Sketches and rankings kept in Redis, shared by every web process.
+    """
+
+    def __init__(self):
+        self.redis = InstrumentedRedis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB)
+        self.add_script = self.redis.register_script(ADD_SCRIPT)
+
+    def add(self, image_id, viewer, pipe=None):
+        """
+        Queued on ``pipe`` when given, so it shares the caller's round trip.
+        """
+        today = day()
+        self.add_script(
+            keys=[viewers_key(image_id), ranking_key(), viewers_key(image_id, today), ranking_key(today)],
+            args=[viewer, image_id, settings.UNIQUE_VIEWERS_RETENTION_DAYS * 86400],
+            client=pipe if pipe is not None else self.redis,
+        )
+
+    def counts(self, image_ids, periods=None):
+        pipe = self.redis.pipeline(transaction=False)
+        for image_id in image_ids:
+            # PFCOUNT over several keys estimates their union
+            pipe.pfcount(*[viewers_key(image_id, period) for period in periods or [None]])
+        return pipe.execute()
+
+    def rankings(self, periods, limit=None):
+        pipe = self.redis.pipeline(transaction=False)
+        for period in periods:
+            pipe.zrange(ranking_key(period), 0, (limit or 0) - 1, desc=True, withscores=True)
+        return [[(int(member), int(score)) for member, score in ranking] for ranking in pipe.execute()]
+
+    def merge(self, periods, name, batch_size=500):
+        image_ids = sorted({image_id for ranking in self.rankings(periods) for image_id, _ in ranking})
+        ttl = settings.UNIQUE_VIEWERS_ROLLUP_RETENTION_DAYS * 86400
+        for start in range(0, len(image_ids), batch_size):
+            batch = image_ids[start:start + batch_size]
+            pipe = self.redis.pipeline(transaction=False)
+            for image_id in batch:
+                pipe.pfmerge(viewers_key(image_id, name), *[viewers_key(image_id, period) for period in periods])
+                pipe.expire(viewers_key(image_id, name), ttl)
+            pipe.execute()
+            estimates = self.counts(batch, [name])
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.zadd(ranking_key(name), dict(zip(batch, estimates)))
+            pipe.expire(ranking_key(name), ttl)
+            pipe.execute()
+        return len(image_ids)
+
+    def forget(self, image_id):
+        pipe = self.redis.pipeline(transaction=False)
+        for period in [None] + last_days(settings.UNIQUE_VIEWERS_RETENTION_DAYS):
+            pipe.delete(viewers_key(image_id, period))
+            pipe.zrem(ranking_key(period), image_id)
+        pipe.execute()
+
+
+# KEYS: all-time sketch, all-time ranking, day sketch, day ranking
+# ARGV: viewer, image id, seconds the day keys are kept
+ADD_SCRIPT = """
+if redis.call('PFADD', KEYS[1], ARGV[1]) == 1 then
+    redis.call('ZADD', KEYS[2], redis.call('PFCOUNT', KEYS[1]), ARGV[2])
+end
+if redis.call('PFADD', KEYS[3], ARGV[1]) == 1 then
+    redis.call('ZADD', KEYS[4], redis.call('PFCOUNT', KEYS[3]), ARGV[2])
+end
+redis.call('EXPIRE', KEYS[3], ARGV[3])
+redis.call('EXPIRE', KEYS[4], ARGV[3])
+return 0
+"""
+
+
+class LocalUniqueViewers(BaseUniqueViewers):
+    """
+    In-process sketches for tests and single-process development servers.
+
+    Nothing expires: the process is expected to be short-lived.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sketches = {}
+        self.ranked = collections.defaultdict(dict)
+
+    def add(self, image_id, viewer, pipe=None):
+        with self.lock:
+            for period in (None, day()):
+                sketch = self.sketches.setdefault(viewers_key(image_id, period), HyperLogLog())
+                if sketch.add(viewer):
+                    self.ranked[ranking_key(period)][image_id] = sketch.count()
+
+    def counts(self, image_ids, periods=None):
+        with self.lock:
+            return [
+                HyperLogLog.union(self.sketches[key] for key in
+                                  (viewers_key(image_id, period) for period in periods or [None])
+                                  if key in self.sketches).count()
+                for image_id in image_ids
+            ]
+
+    def rankings(self, periods, limit=None):
+        with self.lock:
+            return [
+                sorted(self.ranked[ranking_key(period)].items(), key=lambda item: -item[1])[:limit]
+                for period in periods
+            ]
+
+    def merge(self, periods, name):
+        image_ids = {image_id for ranking in self.rankings(periods) for image_id, _ in ranking}
+        for image_id, estimate in zip(image_ids, self.counts(image_ids, periods)):
+            with self.lock:
+                self.sketches[viewers_key(image_id, name)] = HyperLogLog.union(
+                    self.sketches[key] for key in (viewers_key(image_id, period) for period in periods)
+                    if key in self.sketches
+                )
+                self.ranked[ranking_key(name)][image_id] = estimate
+        return len(image_ids)
+
+    def forget(self, image_id):
+        with self.lock:
+            for period in [None] + last_days(settings.UNIQUE_VIEWERS_RETENTION_DAYS):
+                self.sketches.pop(viewers_key(image_id, period), None)
+                self.ranked[ranking_key(period)].pop(image_id, None)
+
+
+_backend = None
+
+
+def get_unique_viewers():
+    """
+    Return the process-wide backend configured by settings.UNIQUE_VIEWERS_BACKEND.
+    """
+    global _backend
+    if _backend is None:
+        _backend = import_string(settings.UNIQUE_VIEWERS_BACKEND)()
+    return _backend
@@ -1,4 +1,5 @@
 from django.urls import path
+from django.conf import settings
 from . import views
 
 app_name = 'images'
@@ -11,11 +12,15 @@ urlpatterns = [
     path('detail/<int:id>/<slug:slug>', views.image_detail, name='detail'),
 
     # URL to like/unlike an image via AJAX
-    path('like/', views.image_like, name='like'),
+    # (async version when served under ASGI)
+    path('like/', views.image_like_async if settings.ASYNC_AJAX_VIEWS else views.image_like, name='like'),
 
     # URL to list all images
-    path('', views.image_list, name='list'),
+    path('', views.image_list_async if settings.ASYNC_AJAX_VIEWS else views.image_list, name='list'),
 
     # URL to view the ranking of images based on total likes or other criteria
-    path("ranking/", views.image_ranking, name="ranking")
+    path("ranking/", views.image_ranking, name="ranking"),
+
+    # URL to list the images carrying a hashtag
+    path('tag/<str:tag>/', views.image_tag, name='tag'),
 ]
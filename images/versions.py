@@ -0,0 +1,83 @@
+"""
+Version counters of the image list, for its conditional GETs.
+
+The ETag of the image list used to be derived from ``Max(updated)`` and
+``Count(id)`` over the whole image table (and ``Max(last_activity)`` over
+ImageStats for the sorted lists): two full-table aggregates on every
+request, even those answered with a 304. Instead the paths that change
+what the list shows bump a counter in Redis, and the stamp is one MGET:
+
+- ``images:version:list``: images created, edited, liked or deleted
+  (wherever the image cards are invalidated, see images.cards.invalidate)
+- ``images:version:stats``: ImageStats writes, which reorder the sorted
+  lists (likes, actions, view checkpoints, rebuilds)
+
+Counters are bumped once the transaction commits, so a page rendered
+from the old rows never gets the new version. A counter missing from
+Redis (restart, eviction) starts again from the current time in
+nanoseconds, so it never returns to a value an old ETag was built from.
+
+With read replicas the list may be rendered from a replica that hasn't
+replayed the change yet. For REPLICA_STICKY_SECONDS (the replica lag
+bound) after a bump, ``current`` returns a version of its own each time,
+so no page rendered in that window is answered with 304 later.
+"""
+
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from bookmarks.instrumentation import InstrumentedRedis
+
+# connect redis database
+r = InstrumentedRedis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB)
+
+LIST = 'list'
+STATS = 'stats'
+
+
+def version_key(name):
+    return f'images:version:{name}'
+
+
+def bumped_key(name):
+    return f'images:version:{name}:bumped'
+
+
+def bump(*names):
+    """
+    Move the version counters ``names`` forward once the transaction commits.
+    """
+    def incr():
+        pipe = r.pipeline(transaction=False)
+        for name in names:
+            # A missing counter restarts from the current time, not from 1
+            pipe.set(version_key(name), time.time_ns(), nx=True)
+            pipe.incr(version_key(name))
+            pipe.set(bumped_key(name), time.time(), ex=settings.REPLICA_STICKY_SECONDS)
+        pipe.execute()
+    transaction.on_commit(incr)
+
+
+def current(*names):
+    """
+    The current values of the version counters ``names``, as a tuple.
+    """
+    keys = [version_key(name) for name in names]
+    if settings.REPLICA_DATABASES:
+        values = r.mget(keys + [bumped_key(name) for name in names])
+        if any(values[len(keys):]):
+            # Replicas may still be catching up
+            return (time.time_ns(),)
+        values = values[:len(keys)]
+    else:
+        values = r.mget(keys)
+    if None in values:
+        pipe = r.pipeline(transaction=False)
+        for key, value in zip(keys, values):
+            if value is None:
+                pipe.set(key, time.time_ns(), nx=True)
+        pipe.mget(keys)
+        values = pipe.execute()[-1]
+    return tuple(int(value) for value in values)
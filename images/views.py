@@ -1,18 +1,30 @@
+from django.conf import settings
 from django.shortcuts import render,redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from .forms import ImageCreateForm
 from django.shortcuts import get_object_or_404
-from .models import Image
-from django.http import JsonResponse,HttpResponse
+from .cards import get_cards
+from .models import Image, Tag
+from .remote import RemoteFetchError
+from .stats import SORTS, r, record_view
+from .tags import feed, trending
+from . import versions
+from .uniques import get_unique_viewers, last_days
+from django.http import JsonResponse,HttpResponse,Http404
+from django.db.models import Max
 from django.views.decorators.http import require_POST
 from django.core.paginator import Paginator,EmptyPage,PageNotAnInteger
 from actions.utils import create_action
-import redis 
-from django.conf import settings
+from asgiref.sync import sync_to_async
+from bookmarks.decorators import async_login_required, async_require_POST
+from live.utils import publish_like_count
+from bookmarks.conditional import conditional_page,not_modified,page_validators,set_validators
+from bookmarks.partials import render_partial
+from bookmarks.routers import read_replica
 
-# connect redis database
-r = redis.Redis(host=settings.REDIS_HOST,port=settings.REDIS_PORT,db=settings.REDIS_DB)
+# number of images per page in the list and its infinite scroll partial
+IMAGES_PER_PAGE = 8
 
 
 # Create your views here.
@@ -25,14 +37,18 @@ def image_create(request):
             # form data is valid
             cd = form.cleaned_data
             print(cd)
-            new_image = form.save(commit=False)
-            # assign current user to the item
-            new_image.user = request.user
-            new_image.save()
-            create_action(request.user,'bookmarked image',new_image)
-            messages.success(request, 'Image added successfully')
-            # redirect to new created image detail view
-            return redirect(new_image.get_absolute_url())
+            try:
+                new_image = form.save(commit=False)
+            except RemoteFetchError as exc:
+                form.add_error('url', f'The image could not be downloaded: {exc}')
+            else:
+                # assign current user to the item
+                new_image.user = request.user
+                new_image.save()
+                create_action(request.user,'bookmarked image',new_image)
+                messages.success(request, 'Image added successfully')
+                # redirect to new created image detail view
+                return redirect(new_image.get_absolute_url())
     else:
         form = ImageCreateForm(data=request.GET)
 
@@ -44,16 +60,30 @@ def image_create(request):
     return render(request,'images/image/create.html',context)
 
 def image_detail(request,id,slug):
+    # version stamp: the image row (saved on every like change) and the likers' profiles
+    stamp = Image.objects.filter(id=id,slug=slug) \
+                         .annotate(likers_updated=Max('users_like__profile__updated')) \
+                         .values_list('updated','total_likes','likers_updated').first()
+    if stamp is None:
+        raise Http404
+    # views are counted even when the browser revalidates its cached copy
+    total_views = record_view(request, id)
+
+    validators = page_validators(request, stamp, stamp[0])
+    response = not_modified(request, validators)
+    if response is not None:
+        return response
+
     image = get_object_or_404(Image,id=id,slug=slug)
-    total_views = r.incr(f'image:{image.id}:views')
-    r.zincrby('image_ranking', 1, image.id)
     context = {
         'secion':'images',
         'image':image,
-        'total_views':total_views
+        'total_views':total_views,
+        # the like count stream only exists under ASGI (see bookmarks/urls.py)
+        'live_updates':settings.ASYNC_AJAX_VIEWS,
     }
 
-    return render(request,'images/image/detail.html',context)
+    return set_validators(request, render(request,'images/image/detail.html',context), validators)
 
 @login_required
 @require_POST
@@ -68,15 +98,40 @@ def image_like(request):
                 create_action(request.user,'likes',image)
             else:
                 image.users_like.remove(request.user)
+            # total_likes was refreshed by the m2m_changed signal
+            publish_like_count(image)
             return JsonResponse({'status':'ok'})
         except Image.DoesNotExist:
             pass
     return JsonResponse({'status':'error'})
 
+def sorted_images(request):
+    """
+    All images, newest first or by the ImageStats metric in ?sort= (see images.stats.SORTS).
+    """
+    sort = SORTS.get(request.GET.get('sort'))
+    if sort is None:
+        return Image.objects.all()
+    # every image has stats, so this is an inner join driven by the metric's index
+    return Image.objects.filter(stats__isnull=False).order_by(f'-stats__{sort.lstrip("-")}', '-id')
+
+def image_list_stamp(request):
+    # counters bumped by every new, edited, liked or deleted image (and
+    # ImageStats write), so no query runs (see images.versions)
+    if request.GET.get('sort') in SORTS:
+        # views reorder the list without touching the images
+        version = versions.current(versions.LIST, versions.STATS) + (request.GET['sort'],)
+    else:
+        version = versions.current(versions.LIST)
+    return version + (request.GET.get('page'), request.GET.get('images_only')), None
+
 @login_required
+@read_replica
+@conditional_page(image_list_stamp)
 def image_list(request):
-    images = Image.objects.all()
-    paginator = Paginator(images,8)
+    # Only the ids: the cells are rendered from the image cards
+    images = sorted_images(request).values_list('id', flat=True)
+    paginator = Paginator(images,IMAGES_PER_PAGE)
     page = request.GET.get('page')
     images_only = request.GET.get('images_only')
 
@@ -89,29 +144,122 @@ def image_list(request):
             return HttpResponse('')
         images = paginator.page(paginator.num_pages)
 
+    images_html = render_partial('images/image/list_images.html', {'images': get_cards(images.object_list)})
+    if images_only:
+        return HttpResponse(images_html)
+
     context = {
         'section':'images',
-        'images':images
+        'images_html':images_html,
+        'sort':request.GET.get('sort') if request.GET.get('sort') in SORTS else '',
+        'sorts':SORTS,
     }
+    return render(request,'images/image/list.html',context)
 
-    if images_only:
-        return render(request,'images/image/list_images.html',context)
+@login_required
+@read_replica
+def image_tag(request, tag):
+    """
+    Images carrying a hashtag, newest first, ?before=<image id> for the
+    next page (keyset pagination, see images.tags.feed).
+    """
+    tag = get_object_or_404(Tag, name=tag.lower())
+    try:
+        before = int(request.GET['before'])
+    except (KeyError, ValueError):
+        before = None
+    ids, next_cursor = feed(tag, before, IMAGES_PER_PAGE)
+    images_html = render_partial('images/image/list_images.html', {'images': get_cards(ids)})
+    if request.GET.get('images_only'):
+        # an empty page ends the infinite scroll
+        response = HttpResponse(images_html if ids else '')
+        if next_cursor:
+            response['X-Next-Cursor'] = next_cursor
+        return response
 
-    return render(request,'images/image/list.html',context)
+    context = {
+        'section': 'images',
+        'tag': tag,
+        'images_html': images_html,
+        'next_cursor': next_cursor,
+        'trending': trending(),
+    }
+    return render(request, 'images/image/tag.html', context)
+
+# -------------------------------
+# Async AJAX endpoints (served under ASGI)
+# -------------------------------
+
+@async_login_required
+@async_require_POST
+async def image_like_async(request):
+    """
+    Async version of image_like using the async ORM methods.
+    """
+    image_id = request.POST.get('id')
+    action = request.POST.get('action')
+    if image_id and action:
+        try:
+            image = await Image.objects.aget(id=image_id)
+        except Image.DoesNotExist:
+            return JsonResponse({'status':'error'})
+        if action == 'like':
+            await image.users_like.aadd(request.user)
+            await sync_to_async(create_action)(request.user,'likes',image)
+        else:
+            await image.users_like.aremove(request.user)
+        await sync_to_async(publish_like_count)(image)
+        return JsonResponse({'status':'ok'})
+    return JsonResponse({'status':'error'})
+
+@async_login_required
+@read_replica
+async def image_list_async(request):
+    """
+    Async version of image_list for the infinite scroll partial.
+    The full page is delegated to the sync view.
+    """
+    if not request.GET.get('images_only'):
+        return await sync_to_async(image_list)(request)
+
+    try:
+        page = int(request.GET.get('page'))
+    except (TypeError, ValueError):
+        page = 1
+    if page < 1:
+        return HttpResponse('')
+
+    offset = (page - 1) * IMAGES_PER_PAGE
+    ids = [id async for id in sorted_images(request).values_list('id', flat=True)[offset:offset + IMAGES_PER_PAGE]]
+    # cards missing from Redis are built from the database and storage, so in a thread
+    images = await sync_to_async(get_cards)(ids)
+    if not images:
+        return HttpResponse('')
+    return HttpResponse(render_partial('images/image/list_images.html', {'images': images}))
+
+# ?period= of the unique viewers ranking: number of days up to today
+RANKING_PERIODS = {'day': 1, 'week': 7, 'month': 30}
 
 @login_required
+@read_replica
 def image_ranking(request):
-    image_ranking = r.zrange('image_ranking', 0, -1, desc=True)[:10]
-    image_ranking_ids = [int(id) for id in  image_ranking]
-    most_viewed = list(Image.objects.filter(id__in=image_ranking_ids))
-    most_viewed.sort(key=lambda x: image_ranking_ids.index(x.id))
+    by = 'unique' if request.GET.get('by') == 'unique' else 'views'
+    period = request.GET.get('period')
+    if by == 'unique':
+        # HyperLogLog estimates: refreshes by the same viewer count once
+        days = last_days(RANKING_PERIODS[period]) if period in RANKING_PERIODS else None
+        ranking = dict(get_unique_viewers().top(days, limit=10))
+    else:
+        ranking = {int(id): int(views) for id, views in r.zrange('image_ranking', 0, 9, desc=True, withscores=True)}
+    # (card, score) pairs, best first
+    most_viewed = [(card, ranking[card.id]) for card in get_cards(sorted(ranking, key=lambda id: -ranking[id]))]
 
     context = {
         'section': 'images',
-        'most_viewed': most_viewed
+        'ranking_list': render_partial('images/image/ranking_list.html', {'most_viewed': most_viewed, 'by': by}),
+        'by': by,
+        'period': period if by == 'unique' and period in RANKING_PERIODS else None,
+        'ranking_periods': [('day', 'today'), ('week', '7 days'), ('month', '30 days'), (None, 'all time')],
     }
 
     return render(request,'images/image/ranking.html',context)
-    
-    
-    
\ No newline at end of file
@@ -0,0 +1,178 @@
+"""
+Publish/subscribe brokers for the live update streams.
+
+Messages are small dicts with the shape::
+
+    {'event': 'likes', 'key': 'image:5', 'data': {...}}
+
+``key`` identifies what the message describes; streams coalesce bursts by
+keeping only the newest message per key (see ``coalesce``).
+"""
+
+import asyncio
+import contextlib
+import json
+import logging
+import threading
+
+import redis
+import redis.asyncio
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from bookmarks.instrumentation import InstrumentedRedis
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------------------
+# Broker backends
+# -------------------------------
+
+class BaseBroker:
+    """
+    Interface shared by the brokers.
+
+    Methods:
+        publish(channel, message): Send a message to every subscriber of channel.
+        subscribe(channels): Async iterator of (channel, message) tuples.
+    """
+
+    def publish(self, channel, message):
+        raise NotImplementedError
+
+    async def subscribe(self, channels):
+        raise NotImplementedError
+        yield
+
+
+class RedisBroker(BaseBroker):
+    """
+    Broker backed by Redis pub/sub, shared by every web process.
+
+    Publishing happens from sync views with the regular client; each
+    subscription opens its own ``redis.asyncio`` connection.
+    """
+
+    def __init__(self):
+        self.redis = InstrumentedRedis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB)
+
+    def publish(self, channel, message):
+        try:
+            self.redis.publish(channel, json.dumps(message))
+        except redis.RedisError:
+            # Live updates are best effort; never fail the request over them
+            logger.warning('Could not publish to %s', channel, exc_info=True)
+
+    async def subscribe(self, channels):
+        client = redis.asyncio.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB)
+        pubsub = client.pubsub()
+        try:
+            await pubsub.subscribe(*channels)
+            async for item in pubsub.listen():
+                if item['type'] == 'message':
+                    yield item['channel'].decode(), json.loads(item['data'])
+        finally:
+            await pubsub.aclose()
+            await client.aclose()
+
+
+class LocalBroker(BaseBroker):
+    """
+    In-process broker for tests and single-process development servers.
+
+    Publishers may run in any thread (sync views run in a thread pool under
+    ASGI), so messages are handed to each subscriber's event loop with
+    ``call_soon_threadsafe``.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = []
+
+    def publish(self, channel, message):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for loop, queue, channels in subscribers:
+            if channel in channels:
+                loop.call_soon_threadsafe(queue.put_nowait, (channel, message))
+
+    async def subscribe(self, channels):
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(), set(channels))
+        with self.lock:
+            self.subscribers.append(subscriber)
+        try:
+            while True:
+                yield await subscriber[1].get()
+        finally:
+            with self.lock:
+                self.subscribers.remove(subscriber)
+
+
+_broker = None
+
+
+def get_broker():
+    """
+    Return the process-wide broker configured by settings.LIVE_BROKER.
+    """
+    global _broker
+    if _broker is None:
+        _broker = import_string(settings.LIVE_BROKER)()
+    return _broker
+
+
+# -------------------------------
+# Burst coalescing
+# -------------------------------
+
+async def coalesce(messages, interval, max_batch):
+    """
+    Group a message stream into batches emitted at most every ``interval``.
+
+    Within a batch only the newest message per ``key`` survives, so a burst
+    of likes on one image becomes a single count update, and at most
+    ``max_batch`` (the newest) messages are kept.
+
+    Args:
+        messages: Async iterator of (channel, message) tuples.
+        interval (float): Minimum seconds between batches.
+        max_batch (int): Maximum number of messages per batch.
+
+    Yields:
+        list of messages. An empty list is yielded after ``interval`` seconds
+        without traffic so callers can send keep-alives.
+    """
+    pending = {}
+    iterator = messages.__aiter__()
+    next_message = asyncio.ensure_future(iterator.__anext__())
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            deadline = loop.time() + interval
+            while True:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                done, _ = await asyncio.wait({next_message}, timeout=timeout)
+                if not done:
+                    break
+                try:
+                    _, message = next_message.result()
+                except StopAsyncIteration:
+                    if pending:
+                        yield list(pending.values())[-max_batch:]
+                    return
+                key = message.get('key')
+                pending.pop(key, None)
+                pending[key] = message
+                next_message = asyncio.ensure_future(iterator.__anext__())
+            batch = list(pending.values())[-max_batch:]
+            pending.clear()
+            yield batch
+    finally:
+        # Cancelling the pending read runs the subscription's cleanup
+        next_message.cancel()
+        with contextlib.suppress(asyncio.CancelledError, StopAsyncIteration):
+            await next_message
+        await iterator.aclose()
@@ -0,0 +1,116 @@
+import asyncio
+import threading
+
+from django.test import SimpleTestCase
+
+from .broker import LocalBroker, coalesce
+
+
+def message(key, value):
+    return {'event': 'likes', 'key': key, 'data': value}
+
+
+async def from_list(items, delay=0):
+    for item in items:
+        if delay:
+            await asyncio.sleep(delay)
+        yield 'channel', item
+
+
+async def take(iterator, count):
+    items = []
+    async for item in iterator:
+        items.append(item)
+        if len(items) == count:
+            break
+    return items
+
+
+class CoalesceTests(SimpleTestCase):
+
+    def test_keeps_newest_message_per_key(self):
+        async def run():
+            messages = [message('image:1', 1), message('image:2', 5), message('image:1', 2)]
+            return [batch async for batch in coalesce(from_list(messages), 0.05, 20)]
+
+        batches = asyncio.run(run())
+        self.assertEqual(batches, [[message('image:2', 5), message('image:1', 2)]])
+
+    def test_batch_is_capped_to_newest_messages(self):
+        async def run():
+            messages = [message(f'image:{i}', i) for i in range(5)]
+            return [batch async for batch in coalesce(from_list(messages), 0.05, 2)]
+
+        batches = asyncio.run(run())
+        self.assertEqual(batches, [[message('image:3', 3), message('image:4', 4)]])
+
+    def test_idle_interval_yields_empty_batch(self):
+        async def run():
+            batches = coalesce(from_list([message('image:1', 1)], delay=0.2), 0.05, 20)
+            try:
+                return await take(batches, 1)
+            finally:
+                await batches.aclose()
+
+        self.assertEqual(asyncio.run(run()), [[]])
+
+    def test_closing_cancels_the_pending_read(self):
+        closed = []
+
+        async def endless():
+            try:
+                while True:
+                    await asyncio.sleep(1)
+                    yield 'channel', message('image:1', 1)
+            finally:
+                closed.append(True)
+
+        async def run():
+            batches = coalesce(endless(), 0.01, 20)
+            await take(batches, 1)
+            await batches.aclose()
+
+        asyncio.run(run())
+        self.assertEqual(closed, [True])
+
+
+class LocalBrokerTests(SimpleTestCase):
+
+    def test_delivers_subscribed_channels_only(self):
+        broker = LocalBroker()
+
+        async def run():
+            received = broker.subscribe(['image:1'])
+            reading = asyncio.ensure_future(take(received, 1))
+            # let the subscription register
+            await asyncio.sleep(0)
+            broker.publish('image:2', message('image:2', 1))
+            broker.publish('image:1', message('image:1', 7))
+            try:
+                return await asyncio.wait_for(reading, 1)
+            finally:
+                await received.aclose()
+
+        self.assertEqual(asyncio.run(run()), [('image:1', message('image:1', 7))])
+        self.assertEqual(broker.subscribers, [])
+
+    def test_publish_from_another_thread(self):
+        broker = LocalBroker()
+
+        async def run():
+            received = broker.subscribe(['actions:all'])
+            reading = asyncio.ensure_future(take(received, 2))
+            await asyncio.sleep(0)
+            publishers = [threading.Thread(target=broker.publish, args=('actions:all', message(f'action:{i}', i)))
+                          for i in range(2)]
+            for thread in publishers:
+                thread.start()
+            for thread in publishers:
+                thread.join()
+            try:
+                return await asyncio.wait_for(reading, 1)
+            finally:
+                await received.aclose()
+
+        keys = sorted(item[1]['key'] for item in asyncio.run(run()))
+        self.assertEqual(keys, ['action:0', 'action:1'])
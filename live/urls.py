@@ -0,0 +1,12 @@
+from django.urls import path
+from . import views
+
+app_name = 'live'
+
+urlpatterns = [
+    # Like-count updates for an image detail page
+    path('images/<int:id>/', views.image_likes_stream, name='image_likes'),
+
+    # New actions for the logged-in user's dashboard
+    path('feed/', views.feed_stream, name='feed'),
+]
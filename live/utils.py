@@ -0,0 +1,47 @@
+from .broker import get_broker
+
+# Channel that receives every new action (used by users who follow nobody)
+ALL_ACTIONS_CHANNEL = 'actions:all'
+
+
+def image_channel(image_id):
+    """Channel carrying like-count updates for one image."""
+    return f'image:{image_id}'
+
+
+def user_actions_channel(user_id):
+    """Channel carrying new actions performed by one user."""
+    return f'actions:user:{user_id}'
+
+
+def publish_like_count(image):
+    """
+    Notify subscribers of an image's detail page about its new like count.
+
+    Args:
+        image: Image instance whose total_likes was just updated.
+    """
+    get_broker().publish(image_channel(image.id), {
+        'event': 'likes',
+        'key': f'image:{image.id}',
+        'data': {'id': image.id, 'total_likes': image.total_likes},
+    })
+
+
+def publish_action(action):
+    """
+    Notify dashboards about a newly created action.
+
+    Only the action id is sent; streams hydrate and render each batch once.
+
+    Args:
+        action: The Action instance that was just created.
+    """
+    message = {
+        'event': 'action',
+        'key': f'action:{action.id}',
+        'data': {'id': action.id, 'user_id': action.user_id},
+    }
+    broker = get_broker()
+    broker.publish(user_actions_channel(action.user_id), message)
+    broker.publish(ALL_ACTIONS_CHANNEL, message)
@@ -0,0 +1,114 @@
+import asyncio
+import contextlib
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+from actions.models import Action
+from actions.utils import prefetch_pictures
+from bookmarks.decorators import async_login_required
+from bookmarks.partials import render_partial
+from .broker import coalesce, get_broker
+from .utils import ALL_ACTIONS_CHANNEL, image_channel, user_actions_channel
+
+
+# -------------------------------
+# Server-Sent Events helpers
+# -------------------------------
+
+def sse_event(event, data):
+    """Format one Server-Sent Event."""
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+async def event_stream(channels, render_batch):
+    """
+    Subscribe to ``channels`` and yield SSE frames for coalesced batches.
+
+    The stream ends after settings.LIVE_STREAM_TIMEOUT seconds; browsers
+    reconnect automatically, which also releases connections whose client
+    went away without the server noticing.
+
+    Args:
+        channels (list): Broker channels to subscribe to.
+        render_batch: Async callable turning a list of messages into SSE frames.
+    """
+    loop = asyncio.get_running_loop()
+    started = last_sent = loop.time()
+    yield f'retry: {settings.LIVE_RETRY_MS}\n\n'
+
+    batches = coalesce(get_broker().subscribe(channels),
+                       settings.LIVE_COALESCE_INTERVAL, settings.LIVE_MAX_BATCH)
+    async with contextlib.aclosing(batches):
+        async for batch in batches:
+            now = loop.time()
+            if batch:
+                for frame in await render_batch(batch):
+                    yield frame
+                last_sent = now
+            elif now - last_sent >= settings.LIVE_KEEPALIVE:
+                yield ': keepalive\n\n'
+                last_sent = now
+            if now - started >= settings.LIVE_STREAM_TIMEOUT:
+                break
+
+
+def sse_response(stream):
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Tell nginx not to buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# -------------------------------
+# Streams
+# -------------------------------
+
+async def image_likes_stream(request, id):
+    """
+    Stream like-count updates for one image to its detail page.
+    """
+    async def render_batch(batch):
+        return [sse_event(message['event'], message['data']) for message in batch]
+
+    return sse_response(event_stream([image_channel(id)], render_batch))
+
+
+def render_actions(action_ids, viewer):
+    """
+    Hydrate and render a batch of actions with the dashboard's action template.
+    """
+    actions = Action.objects.visible().filter(id__in=action_ids).exclude(user=viewer) \
+                            .select_related('user', 'user__profile') \
+                            .prefetch_related('target')
+    actions = prefetch_pictures(actions)
+    return render_partial('actions/action/list.html', {'actions': actions})
+
+
+@async_login_required
+async def feed_stream(request):
+    """
+    Stream new actions for the logged-in user's dashboard.
+
+    Mirrors the dashboard query: actions by followed users, or every action
+    when the user follows nobody.
+    """
+    viewer = request.user
+    following_ids = [user_id async for user_id in viewer.following.values_list('id', flat=True)]
+    if following_ids:
+        channels = [user_actions_channel(user_id) for user_id in following_ids]
+    else:
+        channels = [ALL_ACTIONS_CHANNEL]
+
+    async def render_batch(batch):
+        action_ids = [message['data']['id'] for message in batch
+                      if message['data']['user_id'] != viewer.id]
+        if not action_ids:
+            return []
+        html = await sync_to_async(render_actions)(action_ids, viewer)
+        return [sse_event('actions', {'html': html})] if html else []
+
+    return sse_response(event_stream(channels, render_batch))
@@ -0,0 +1,91 @@
+"""
+Profiled requests stored on disk, in settings.PROFILING_DIR.
+
+Each capture is two files named after its id (``YYYYmmdd-HHMMSS-<random>``,
+so names sort by time): ``<id>.json``, what the admin page lists (view,
+path, status, duration, time per category and the request's instrumented
+db/Redis/template/thumbnail figures), and the profile itself,
+``<id>.folded`` (collapsed stacks) or ``<id>.prof`` (pstats).
+
+Only the newest PROFILING_KEEP captures are kept. The directory is local
+to the host: each server lists the captures of its own workers.
+"""
+
+import json
+import re
+import uuid
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+CAPTURE_ID = re.compile(r'^\d{8}-\d{6}-[0-9a-f]{8}$')
+
+
+def capture_dir():
+    return Path(settings.PROFILING_DIR)
+
+
+def save(profiler, info):
+    """
+    Store a finished profile and its ``info`` dict; returns the capture id.
+    """
+    directory = capture_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    capture_id = f'{timezone.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}'
+    info = dict(info, id=capture_id, mode=profiler.mode, file=f'{capture_id}.{profiler.suffix}',
+                samples=profiler.samples, breakdown=profiler.breakdown())
+    profiler.dump(directory / info['file'])
+    (directory / f'{capture_id}.json').write_text(json.dumps(info))
+    prune(directory)
+    return capture_id
+
+
+def prune(directory, keep=None):
+    keep = settings.PROFILING_KEEP if keep is None else keep
+    for path in sorted(directory.glob('*.json'), reverse=True)[keep:]:
+        for stale in directory.glob(f'{path.stem}.*'):
+            stale.unlink(missing_ok=True)
+
+
+def load_all():
+    """
+    The info of every capture, newest first.
+    """
+    captures = []
+    for path in sorted(capture_dir().glob('*.json'), reverse=True):
+        try:
+            captures.append(json.loads(path.read_text()))
+        except (OSError, ValueError):
+            # Pruned or being written by another worker
+            continue
+    return captures
+
+
+def slowest_per_view(captures, limit):
+    """
+    The ``limit`` slowest captures of each view, the views with the
+    slowest requests first.
+
+    Returns:
+        list of (view, number of captures, slowest captures).
+    """
+    by_view = defaultdict(list)
+    for capture in captures:
+        by_view[capture['view']].append(capture)
+    views = []
+    for view, view_captures in by_view.items():
+        view_captures.sort(key=lambda capture: capture['duration'], reverse=True)
+        views.append((view, len(view_captures), view_captures[:limit]))
+    views.sort(key=lambda entry: entry[2][0]['duration'], reverse=True)
+    return views
+
+
+def profile_path(capture_id):
+    """
+    Path of the profile of a capture, or None if there is no such capture.
+    """
+    if not CAPTURE_ID.match(capture_id):
+        return None
+    return next(capture_dir().glob(f'{capture_id}.[fp]*'), None)
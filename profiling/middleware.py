@@ -0,0 +1,161 @@
+"""
+On-demand profiling of production requests (see profiling.profilers).
+
+A request is profiled when:
+
+- a staff user adds ``?profile=1`` to the URL
+- it bears ``X-Profile: <token>``, a token the admin page signs for the
+  staff user viewing it, valid PROFILING_TOKEN_MAX_AGE seconds, for
+  clients without a staff session (curl, load tests). Only the header is
+  read, so tokens don't end up in access logs or Referer headers, and a
+  token stops working when its user is no longer active staff.
+- it is drawn for sampling: one request in PROFILING_SAMPLE_EVERY at
+  random (0 disables it)
+
+Captures are rate limited to PROFILING_RATE_LIMIT a minute per staff
+user (sampled requests share one limit); over it, requests run
+unprofiled.
+
+The capture (see profiling.captures) gets its id in the ``X-Profile-Id``
+response header and is listed, slowest first per view, at
+/admin/profiles/.
+
+The middleware goes last in MIDDLEWARE, after authentication: the view,
+its templates and the response are profiled, the outer middleware isn't.
+Requests handled asynchronously (async views under ASGI) are not
+profiled: their work is spread over the event loop and executor threads.
+"""
+
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.cache import cache
+
+from bookmarks.instrumentation import current_metrics, view_name
+
+from . import captures
+from .profilers import PROFILERS
+
+logger = logging.getLogger(__name__)
+
+TOKEN_SALT = 'profiling.token'
+
+
+def make_token(user):
+    """
+    A profiling token issued to the staff ``user``.
+    """
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(str(user.pk))
+
+
+def token_user(token):
+    """
+    The active staff user a valid token was issued to, or None.
+    """
+    try:
+        user_id = signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=settings.PROFILING_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    return get_user_model().objects.filter(pk=user_id, is_active=True, is_staff=True).first()
+
+
+def within_rate(subject, now=None):
+    """
+    Count a capture for ``subject``; False once PROFILING_RATE_LIMIT
+    captures were counted in the current minute.
+    """
+    key = f'profiling:captures:{subject}:{int((now or time.time()) // 60)}'
+    # add() is a no-op if another request created the counter first
+    cache.add(key, 0, timeout=120)
+    try:
+        count = cache.incr(key)
+    except ValueError:
+        # Expired (or evicted) between the two calls: start it again
+        cache.add(key, 1, timeout=120)
+        count = 1
+    return count <= settings.PROFILING_RATE_LIMIT
+
+
+def trigger(request):
+    """
+    Why ``request`` is to be profiled ('staff', 'token' or 'sampled') and
+    for whom, or (None, None).
+    """
+    user = getattr(request, 'user', None)
+    if request.GET.get('profile') == '1' and user is not None and user.is_staff:
+        return 'staff', user
+    token = request.headers.get('X-Profile')
+    if token:
+        user = token_user(token)
+        if user is not None:
+            return 'token', user
+    if settings.PROFILING_SAMPLE_EVERY and random.randrange(settings.PROFILING_SAMPLE_EVERY) == 0:
+        return 'sampled', None
+    return None, None
+
+
+class ProfilingMiddleware:
+    """
+    Profile the requests selected by ``trigger`` and store their captures.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.get_response(request)
+        reason, user = trigger(request)
+        if reason is None:
+            return self.get_response(request)
+        if not within_rate(user.pk if user is not None else 'sampled'):
+            logger.info('Request not profiled: over PROFILING_RATE_LIMIT')
+            return self.get_response(request)
+        profiler = PROFILERS[settings.PROFILING_MODE]()
+        try:
+            profiler.start()
+        except ValueError:
+            # cProfile: another profiler is active in this process
+            logger.warning('Request not profiled: %s profiler unavailable', profiler.mode)
+            return self.get_response(request)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.stop()
+        info = self.describe(request, response, reason, user, time.perf_counter() - started)
+        response['X-Profile-Id'] = captures.save(profiler, info)
+        return response
+
+    def describe(self, request, response, reason, user, elapsed):
+        # Whoever asked for the capture (the token's user), else the request's
+        user = user or getattr(request, 'user', None)
+        info = {
+            'view': view_name(request),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'trigger': reason,
+            'user': user.get_username() if user is not None else '',
+            'duration': elapsed * 1000,
+        }
+        metrics = current_metrics()
+        if metrics is not None:
+            # Inclusive figures of the whole request (see bookmarks.instrumentation)
+            info.update(
+                duration=metrics.total_time * 1000,
+                db_queries=metrics.db_queries, db_time=metrics.db_time * 1000,
+                redis_calls=metrics.redis_calls, redis_time=metrics.redis_time * 1000,
+                template_time=metrics.template_time * 1000,
+                thumbnails=metrics.thumbnails, thumbnail_time=metrics.thumbnail_time * 1000,
+            )
+        return info
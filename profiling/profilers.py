@@ -0,0 +1,150 @@
+"""
+Profilers of a single request.
+
+``StackSampler`` (the default, settings.PROFILING_MODE = 'sample') is a
+thread that reads the stack of the request's thread every
+PROFILING_INTERVAL seconds (``sys._current_frames``) and counts identical
+stacks. The request itself runs untouched, so the overhead is a few
+percent at 5 ms, and the output is in the collapsed-stack format
+(``module:function;module:function count`` per line) that flamegraph.pl,
+speedscope or inferno render as is.
+
+``CProfiler`` ('cprofile') traces every call with cProfile: exact call
+counts, but the request runs noticeably slower. It writes a pstats dump
+(snakeviz, gprof2dot, ``python -m pstats``).
+
+Both attribute the time to what it was spent on: a sample counts for the
+innermost of the database (``django.db``), Redis, thumbnail
+(easy_thumbnails, Pillow) or template (Django, Jinja2) code on its stack,
+else for 'python' (views, forms, middleware...). cProfile counts the own
+time of the functions of those packages.
+"""
+
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+# Module prefixes per category, innermost first wins
+CATEGORIES = [
+    ('db', ('django.db.',)),
+    ('redis', ('redis.',)),
+    ('thumbnail', ('easy_thumbnails.', 'PIL.')),
+    ('template', ('django.template.', 'jinja2.')),
+]
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f'{frame.f_globals.get("__name__", "?")}:{getattr(code, "co_qualname", code.co_name)}'
+
+
+def categorize(modules):
+    """
+    Category of a stack, given its module names innermost first.
+    """
+    for module in modules:
+        for category, prefixes in CATEGORIES:
+            if module.startswith(prefixes):
+                return category
+    return 'python'
+
+
+def categorize_file(filename):
+    for category, prefixes in CATEGORIES:
+        if any(f'{os.sep}{prefix.replace(".", os.sep)}' in filename for prefix in prefixes):
+            return category
+    return 'python'
+
+
+class StackSampler:
+    """
+    Sample the stacks of the calling thread below the caller of ``start``.
+    """
+    mode = 'sample'
+    suffix = 'folded'
+
+    def __init__(self, interval=None):
+        self.interval = interval or settings.PROFILING_INTERVAL
+        self.stacks = Counter()
+        self.categories = Counter()
+        self.stopped = threading.Event()
+
+    def start(self):
+        self.thread_id = threading.get_ident()
+        # Frames from the server down to the profiling middleware are left out
+        self.root = sys._getframe(1)
+        self.thread = threading.Thread(target=self.run, name='profiling-sampler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.root = None
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and frame is not self.root:
+                stack.append(frame)
+                frame = frame.f_back
+            if frame is None or not stack:
+                # Not (or no longer) below the middleware
+                continue
+            self.stacks[';'.join(frame_label(frame) for frame in reversed(stack))] += 1
+            self.categories[categorize(frame.f_globals.get('__name__', '') for frame in stack)] += 1
+            del frame, stack
+
+    @property
+    def samples(self):
+        return sum(self.stacks.values())
+
+    def breakdown(self):
+        """
+        Milliseconds per category.
+        """
+        return {category: count * self.interval * 1000 for category, count in self.categories.most_common()}
+
+    def dump(self, path):
+        with open(path, 'w') as output:
+            for stack, count in self.stacks.most_common():
+                output.write(f'{stack} {count}\n')
+
+
+class CProfiler:
+    """
+    cProfile of the calling thread.
+    """
+    mode = 'cprofile'
+    suffix = 'prof'
+
+    def __init__(self):
+        self.profile = cProfile.Profile(time.perf_counter)
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    @property
+    def samples(self):
+        return sum(calls for _, calls, _, _, _ in pstats.Stats(self.profile).stats.values())
+
+    def breakdown(self):
+        totals = Counter()
+        for (filename, _, _), (_, _, own_time, _, _) in pstats.Stats(self.profile).stats.items():
+            totals[categorize_file(filename)] += own_time * 1000
+        return dict(totals.most_common())
+
+    def dump(self, path):
+        self.profile.dump_stats(path)
+
+
+PROFILERS = {profiler.mode: profiler for profiler in (StackSampler, CProfiler)}
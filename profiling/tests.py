@@ -0,0 +1,145 @@
+import json
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+from . import captures
+from .middleware import ProfilingMiddleware, make_token, token_user, trigger, within_rate
+
+
+class ProfilingTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='secret', is_staff=True)
+        cls.user = User.objects.create_user('user', password='secret')
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        override = override_settings(PROFILING_DIR=self.directory, PROFILING_SAMPLE_EVERY=0, PROFILING_RATE_LIMIT=2,
+                                     PROFILING_TOKEN_MAX_AGE=3600, PROFILING_MODE='sample')
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def request(self, user=None, path='/images/', **headers):
+        request = RequestFactory().get(path, **headers)
+        request.user = user or AnonymousUser()
+        return request
+
+
+class TokenTests(ProfilingTestCase):
+
+    def test_valid_for_active_staff(self):
+        token = make_token(self.staff)
+        self.assertEqual(token_user(token), self.staff)
+        self.assertIsNone(token_user(token + 'x'))
+        self.assertIsNone(token_user(token.replace(str(self.staff.pk), str(self.user.pk), 1)))
+        self.assertIsNone(token_user(make_token(self.user)))
+        User.objects.filter(pk=self.staff.pk).update(is_staff=False)
+        self.assertIsNone(token_user(token))
+
+    def test_expiry(self):
+        token = make_token(self.staff)
+        with mock.patch('django.core.signing.time.time', return_value=time.time() + 3601):
+            self.assertIsNone(token_user(token))
+
+
+class TriggerTests(ProfilingTestCase):
+
+    def test_staff_only(self):
+        self.assertEqual(trigger(self.request(self.staff, '/images/?profile=1')), ('staff', self.staff))
+        self.assertEqual(trigger(self.request(self.user, '/images/?profile=1')), (None, None))
+        self.assertEqual(trigger(self.request(path='/images/?profile=1')), (None, None))
+        self.assertEqual(trigger(self.request(self.staff)), (None, None))
+
+    def test_token_header(self):
+        token = make_token(self.staff)
+        self.assertEqual(trigger(self.request(HTTP_X_PROFILE=token)), ('token', self.staff))
+        self.assertEqual(trigger(self.request(HTTP_X_PROFILE='forged')), (None, None))
+        # Never from the query string
+        self.assertEqual(trigger(self.request(path=f'/images/?token={token}')), (None, None))
+
+    @override_settings(PROFILING_SAMPLE_EVERY=1)
+    def test_sampled(self):
+        self.assertEqual(trigger(self.request()), ('sampled', None))
+
+
+class MiddlewareTests(ProfilingTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.middleware = ProfilingMiddleware(lambda request: HttpResponse('ok'))
+
+    def test_capture(self):
+        response = self.middleware(self.request(self.staff, '/images/?profile=1'))
+        capture_id = response['X-Profile-Id']
+        info = json.loads((self.directory / f'{capture_id}.json').read_text())
+        self.assertEqual((info['path'], info['status'], info['trigger'], info['user'], info['mode']),
+                         ('/images/?profile=1', 200, 'staff', 'staff', 'sample'))
+        self.assertEqual(captures.profile_path(capture_id), self.directory / f'{capture_id}.folded')
+
+    def test_not_profiled(self):
+        response = self.middleware(self.request(self.user, '/images/?profile=1'))
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(list(self.directory.iterdir()), [])
+
+    def test_rate_limit(self):
+        with self.assertLogs('profiling.middleware', 'INFO'):
+            responses = [self.middleware(self.request(self.staff, '/images/?profile=1')) for _ in range(3)]
+        self.assertEqual(['X-Profile-Id' in response for response in responses], [True, True, False])
+        # Per user
+        other = User.objects.create_user('other', is_staff=True)
+        self.assertIn('X-Profile-Id', self.middleware(self.request(HTTP_X_PROFILE=make_token(other))))
+
+    def test_rate_counter_expiring_between_add_and_incr(self):
+        def expire(key):
+            cache.delete(key)
+            raise ValueError(f'Key {key!r} not found.')
+        with mock.patch.object(cache, 'incr', side_effect=expire):
+            self.assertTrue(within_rate('staff', now=600))
+        self.assertTrue(within_rate('staff', now=600))
+        self.assertFalse(within_rate('staff', now=600))
+
+
+class CaptureTests(ProfilingTestCase):
+
+    def capture(self, capture_id):
+        (self.directory / f'{capture_id}.json').write_text(json.dumps({'id': capture_id}))
+        (self.directory / f'{capture_id}.folded').write_text('views:image_list 1\n')
+
+    def test_prune_keeps_the_newest(self):
+        ids = [f'20261019-12000{second}-0000000{second}' for second in range(4)]
+        for capture_id in ids:
+            self.capture(capture_id)
+        captures.prune(self.directory, keep=2)
+        self.assertEqual(sorted(path.name for path in self.directory.iterdir()),
+                         [f'{ids[2]}.folded', f'{ids[2]}.json', f'{ids[3]}.folded', f'{ids[3]}.json'])
+        self.assertEqual([capture['id'] for capture in captures.load_all()], ids[:1:-1])
+
+    def test_profile_path_only_takes_capture_ids(self):
+        self.capture('20261019-120000-0123abcd')
+        self.assertEqual(captures.profile_path('20261019-120000-0123abcd'),
+                         self.directory / '20261019-120000-0123abcd.folded')
+        for capture_id in ('20261019-120000-0123abce', '../20261019-120000-0123abcd', '20261019-120000-*',
+                           '20261019-120000-0123abcd.json', '20261019-120000-0123ABCD'):
+            with self.subTest(capture_id=capture_id):
+                self.assertIsNone(captures.profile_path(capture_id))
+
+    def test_downloads_are_for_staff(self):
+        self.capture('20261019-120000-0123abcd')
+        url = '/admin/profiles/20261019-120000-0123abcd/'
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(self.staff)
+        response = self.client.get(url)
+        self.assertEqual(b''.join(response.streaming_content), b'views:image_list 1\n')
+        self.assertEqual(self.client.get('/admin/profiles/20261019-120000-0123abce/').status_code, 404)
@@ -0,0 +1,13 @@
+from django.contrib import admin
+from django.urls import path
+from . import views
+
+app_name = 'profiling'
+
+urlpatterns = [
+    # Profiled requests, slowest first per view (staff only)
+    path('', admin.site.admin_view(views.capture_list), name='list'),
+
+    # Download the profile of a capture
+    path('<str:capture_id>/', admin.site.admin_view(views.capture_file), name='file'),
+]
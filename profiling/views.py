@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.contrib import admin
+from django.http import FileResponse, Http404
+from django.shortcuts import render
+
+from . import captures
+from .middleware import make_token
+
+
+def capture_list(request):
+    """
+    Admin page of the profiled requests: the slowest captures of each view
+    (or every capture of ?view=), and a token to profile requests with.
+    """
+    all_captures = captures.load_all()
+    view = request.GET.get('view')
+    if view:
+        all_captures = [capture for capture in all_captures if capture['view'] == view]
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Profiled requests',
+        'views': captures.slowest_per_view(all_captures, len(all_captures) if view else settings.PROFILING_TOP),
+        'view': view,
+        'count': len(all_captures),
+        'token': make_token(request.user),
+        'token_max_age': settings.PROFILING_TOKEN_MAX_AGE,
+        'sample_every': settings.PROFILING_SAMPLE_EVERY,
+    }
+    return render(request, 'admin/profiling/captures.html', context)
+
+
+def capture_file(request, capture_id):
+    """
+    Download the profile of a capture.
+    """
+    path = captures.profile_path(capture_id)
+    if path is None:
+        raise Http404
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=path.name,
+                        content_type='text/plain' if path.suffix == '.folded' else 'application/octet-stream')
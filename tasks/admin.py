@@ -0,0 +1,29 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import Schedule, Task
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['name', 'queue', 'status', 'attempts', 'run_at', 'started', 'finished', 'worker']
+    list_filter = ['status', 'queue', 'name']
+    search_fields = ['name', 'dedup_key']
+    date_hierarchy = 'created'
+    actions = ['retry']
+    # Arguments may be personal data; the admin only manages the runs
+    exclude = ['args', 'kwargs']
+    readonly_fields = ['name', 'queue', 'status', 'dedup_key', 'run_at', 'attempts', 'max_attempts',
+                       'worker', 'last_error', 'created', 'started', 'finished']
+
+    @admin.action(description='Run the selected tasks again')
+    def retry(self, request, queryset):
+        count = queryset.exclude(status=Task.RUNNING).update(
+            status=Task.QUEUED, run_at=timezone.now(), attempts=0, worker='', dedup_key=None,
+        )
+        self.message_user(request, f'{count} tasks queued again')
+
+
+@admin.register(Schedule)
+class ScheduleAdmin(admin.ModelAdmin):
+    list_display = ['name', 'next_run']
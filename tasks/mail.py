@@ -0,0 +1,54 @@
+"""
+Email backend queueing messages as background tasks.
+
+With EMAIL_BACKEND = 'tasks.mail.QueuedEmailBackend' sending an email
+(password resets, notifications) only writes a task; a worker sends it
+through settings.TASKS_EMAIL_BACKEND, retrying if the server is down.
+
+The message itself is stored in a QueuedEmail row, deleted once sent, and
+the task only carries its id: Task rows are listed in the admin and kept
+after they ran, which reset links must not be.
+"""
+
+import base64
+
+from django.core.mail import EmailMessage, EmailMultiAlternatives
+from django.core.mail.backends.base import BaseEmailBackend
+
+from .models import QueuedEmail
+
+FIELDS = ('subject', 'body', 'from_email', 'to', 'cc', 'bcc', 'reply_to', 'extra_headers')
+
+
+def serialize(message):
+    data = {field: getattr(message, field) for field in FIELDS}
+    data['alternatives'] = list(getattr(message, 'alternatives', []))
+    data['attachments'] = []
+    for attachment in message.attachments:
+        # MIMEBase instances can't be serialized; (filename, content, mimetype) tuples can
+        filename, content, mimetype = attachment
+        if isinstance(content, str):
+            content = content.encode()
+        data['attachments'].append((filename, base64.b64encode(content).decode(), mimetype))
+    return data
+
+
+def deserialize(data):
+    message_class = EmailMultiAlternatives if data['alternatives'] else EmailMessage
+    message = message_class(**{field: data[field] for field in FIELDS if field != 'extra_headers'},
+                            headers=data['extra_headers'])
+    for content, mimetype in data['alternatives']:
+        message.attach_alternative(content, mimetype)
+    for filename, content, mimetype in data['attachments']:
+        message.attach(filename, base64.b64decode(content), mimetype)
+    return message
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+
+    def send_messages(self, email_messages):
+        from .tasks import send_email
+        for message in email_messages:
+            email = QueuedEmail.objects.create(message=serialize(message))
+            send_email.delay(email.id)
+        return len(email_messages)
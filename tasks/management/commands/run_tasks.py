@@ -0,0 +1,36 @@
+import logging
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tasks.worker import Worker
+
+
+class Command(BaseCommand):
+    """
+    Run background tasks (see tasks/queue.py) until stopped.
+
+        python manage.py run_tasks --concurrency 8
+        python manage.py run_tasks --queue default --processes --concurrency 4
+
+    Run one per box under a process supervisor (systemd, supervisord);
+    several workers, on one box or many, can share the queues. --burst
+    runs the due tasks and exits, e.g. from cron or a deploy script.
+    """
+    help = 'Run queued background tasks in a thread or process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue', action='append',
+                            help='queue to take tasks from, may be given several times (default: TASKS_QUEUES)')
+        parser.add_argument('--concurrency', type=int, default=4, help='tasks run at the same time')
+        parser.add_argument('--processes', action='store_true', help='run tasks in processes instead of threads')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='seconds between polls when idle')
+        parser.add_argument('--burst', action='store_true', help='exit once no task is due')
+
+    def handle(self, *args, **options):
+        if options['verbosity'] > 1:
+            logging.getLogger('tasks').setLevel(logging.INFO)
+        worker = Worker(queues=options['queue'] or settings.TASKS_QUEUES, concurrency=options['concurrency'],
+                        processes=options['processes'], poll_interval=options['poll_interval'])
+        done = worker.run(burst=options['burst'])
+        self.stdout.write(f'{done} tasks run')
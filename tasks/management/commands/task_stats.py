@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from tasks.metrics import stats
+
+
+class Command(BaseCommand):
+    """
+    Print the depth and latency of the task queues (see tasks/metrics.py).
+
+        python manage.py task_stats --window 3600
+    """
+    help = 'Show queued, running and failed tasks and recent wait/run time percentiles per queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window', type=int, default=300, help='seconds of finished tasks to summarize')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{"queue":<12}{"due":>8}{"sched":>8}{"running":>8}{"failed":>8}{"oldest":>9}'
+                          f'{"done":>8}{"wait p50/p95":>16}{"run p50/p95":>16}')
+        for queue, figures in sorted(stats(options['window']).items()):
+            wait, run = figures['wait'], figures['run']
+            self.stdout.write(
+                f'{queue:<12}{figures["due"]:>8}{figures["scheduled"]:>8}{figures["running"]:>8}'
+                f'{figures["failed"]:>8}{figures["oldest_due"]:>8.1f}s{figures["finished"]:>8}'
+                f'{wait.get(0.5, 0):>8.2f}/{wait.get(0.95, 0):<7.2f}{run.get(0.5, 0):>8.2f}/{run.get(0.95, 0):<7.2f}'
+            )
@@ -0,0 +1,91 @@
+"""
+Queue depth and latency of the background tasks, read from the Task table.
+
+Workers run in their own processes, so rather than in-process counters
+the figures are computed from the rows when /metrics is scraped (see
+bookmarks.instrumentation) or ``manage.py task_stats`` runs:
+
+- tasks due, scheduled (run_at in the future), running and failed, per queue
+- age of the oldest due task: how far behind the workers are
+- wait (run_at to start) and run (start to finish) time percentiles of the
+  tasks finished over the last TASKS_METRICS_WINDOW seconds
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from bookmarks.instrumentation import registry
+
+from .models import Task
+
+registry.describe('bookmarks_tasks', 'gauge', 'Background tasks by queue and state (due, scheduled, running, failed).')
+registry.describe('bookmarks_task_oldest_due_seconds', 'gauge', 'Age of the oldest task waiting for a worker, by queue.')
+registry.describe('bookmarks_task_wait_seconds', 'gauge', 'Wait before a worker started recent tasks, by queue.')
+registry.describe('bookmarks_task_run_seconds', 'gauge', 'Run time of recent tasks, by queue.')
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def percentile(values, quantile):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(quantile * len(values)))] if values else 0
+
+
+def stats(window=None):
+    """
+    Figures of every queue; ``failed`` and ``finished`` count the tasks
+    that ended within the last ``window`` seconds.
+
+    Returns:
+        {queue: {'due', 'scheduled', 'running', 'failed', 'oldest_due', 'finished',
+        'wait': {quantile: seconds}, 'run': {quantile: seconds}}}
+    """
+    now = timezone.now()
+    window = window or settings.TASKS_METRICS_WINDOW
+    result = {}
+
+    def queue_stats(queue):
+        return result.setdefault(queue, {'due': 0, 'scheduled': 0, 'running': 0, 'failed': 0, 'oldest_due': 0,
+                                         'finished': 0, 'wait': {}, 'run': {}})
+
+    since = now - timedelta(seconds=window)
+    counts = {
+        'due': Task.objects.filter(status=Task.QUEUED, run_at__lte=now),
+        'scheduled': Task.objects.filter(status=Task.QUEUED, run_at__gt=now),
+        'running': Task.objects.filter(status=Task.RUNNING),
+        'failed': Task.objects.filter(status=Task.FAILED, finished__gte=since),
+    }
+    for state, queryset in counts.items():
+        for queue, count, oldest in queryset.values_list('queue').annotate(count=Count('id'), oldest=Min('run_at')) \
+                .values_list('queue', 'count', 'oldest'):
+            queue_stats(queue)[state] = count
+            if state == 'due':
+                queue_stats(queue)['oldest_due'] = (now - oldest).total_seconds()
+
+    finished = {}
+    for queue, run_at, started, ended in Task.objects.filter(status=Task.DONE, finished__gte=since) \
+            .values_list('queue', 'run_at', 'started', 'finished').iterator():
+        waits, runs = finished.setdefault(queue, ([], []))
+        waits.append(max(0, (started - run_at).total_seconds()))
+        runs.append((ended - started).total_seconds())
+    for queue, (waits, runs) in finished.items():
+        queue_stats(queue).update(
+            finished=len(runs),
+            wait={quantile: percentile(waits, quantile) for quantile in QUANTILES},
+            run={quantile: percentile(runs, quantile) for quantile in QUANTILES},
+        )
+    return result
+
+
+@registry.collector
+def collect():
+    for queue, figures in stats().items():
+        for state in ('due', 'scheduled', 'running', 'failed'):
+            yield 'bookmarks_tasks', {'queue': queue, 'state': state}, figures[state]
+        yield 'bookmarks_task_oldest_due_seconds', {'queue': queue}, figures['oldest_due']
+        for kind in ('wait', 'run'):
+            for quantile, seconds in figures[kind].items():
+                yield f'bookmarks_task_{kind}_seconds', {'queue': queue, 'quantile': f'{quantile:g}'}, seconds
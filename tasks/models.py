@@ -0,0 +1,84 @@
+from django.db import models
+from django.db.models import Q
+
+
+class Task(models.Model):
+    """
+    A unit of background work, run by ``manage.py run_tasks`` (see tasks.queue).
+
+    Attributes:
+        name (CharField): Registered name of the @task function.
+        args (JSONField): Positional arguments.
+        kwargs (JSONField): Keyword arguments.
+        queue (CharField): Queue the task is waiting in; workers pick queues.
+        status (CharField): queued, running, done or failed.
+        dedup_key (CharField): Optional; at most one queued task per key.
+        run_at (DateTimeField): Earliest time to run (scheduled tasks, retry backoff).
+        attempts (PositiveIntegerField): Runs started so far.
+        max_attempts (PositiveIntegerField): Runs before the task is marked failed.
+        worker (CharField): Worker running (or that last ran) the task.
+        last_error (TextField): Traceback of the last failed run.
+        created, started, finished (DateTimeField): Lifecycle timestamps.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    queue = models.CharField(max_length=50, default='default')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    dedup_key = models.CharField(max_length=255, null=True, blank=True)
+    run_at = models.DateTimeField()
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    worker = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Workers poll the due tasks of their queues
+            models.Index(fields=['status', 'queue', 'run_at']),
+            # Purging old finished tasks
+            models.Index(fields=['status', 'finished']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['dedup_key'], condition=Q(status='queued'),
+                                    name='tasks_unique_queued_dedup_key'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.status})'
+
+
+class QueuedEmail(models.Model):
+    """
+    A message waiting for the send_email task.
+
+    Messages (password reset links among them) are kept out of the Task
+    rows, which the admin shows and keeps for a day: the task only gets
+    this row's id, and the row is deleted once the message is sent.
+    """
+    message = models.JSONField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'Email #{self.pk}'
+
+
+class Schedule(models.Model):
+    """
+    Next run of a periodic task; workers claim a run by moving ``next_run``
+    forward with a conditional UPDATE, so only one of them enqueues it.
+    """
+    name = models.CharField(max_length=200, primary_key=True)
+    next_run = models.DateTimeField()
+
+    def __str__(self):
+        return f'{self.name} at {self.next_run}'
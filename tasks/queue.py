@@ -0,0 +1,277 @@
+"""
+Durable background tasks stored in the database.
+
+Functions become tasks with the ``@task`` decorator (in an app's tasks.py
+module, imported when the app registry is ready) and are queued with
+``.delay(*args, **kwargs)`` or ``.enqueue(...)``; arguments must be JSON
+serializable, so pass ids rather than model instances::
+
+    @task(max_attempts=3)
+    def send_welcome(user_id):
+        ...
+
+    send_welcome.delay(user.id)
+    send_welcome.enqueue(args=[user.id], countdown=3600, dedup_key=f'welcome:{user.id}')
+
+Tasks are rows of the Task table, so they are written in the same
+transaction as the data they refer to, survive restarts and need no
+broker: ``manage.py run_tasks`` runs them in a thread or process pool.
+
+- dedup keys: at most one *queued* task per key (a unique partial index);
+  enqueueing a duplicate is a no-op, so bursts of identical work collapse.
+  A running task doesn't block a new one, which sees the latest data.
+- retries: a task raising an exception is run again after an exponential
+  backoff (with jitter) until it has run ``max_attempts`` times.
+- scheduling: ``run_at``/``countdown`` delay a task; ``@task(every=...)``
+  makes it periodic (see ``schedule_periodic``).
+- crashes: a task still running TASKS_TIMEOUT seconds after it started
+  is considered lost with its worker and retried.
+
+With settings.TASKS_EAGER (set by the test runner, BOOKMARKS_TASKS_EAGER
+elsewhere) tasks run in the caller instead, when its transaction commits:
+once per dedup key, failures logged rather than raised, and their
+queries left out of the request's query budget, as with a worker.
+"""
+
+import json
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from bookmarks.instrumentation import uncounted
+
+from .models import Schedule, Task
+
+logger = logging.getLogger(__name__)
+
+# Registered task functions by name
+TASKS = {}
+
+
+class TaskFunction:
+    """
+    A function registered with ``@task``; calling it runs it inline.
+    """
+
+    def __init__(self, func, name, queue, max_attempts, backoff, every, keep):
+        self.func = func
+        self.name = name
+        self.queue = queue
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.every = every
+        self.keep = keep
+        self.__doc__ = func.__doc__
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def __repr__(self):
+        return f'<task {self.name}>'
+
+    def delay(self, *args, **kwargs):
+        return self.enqueue(args=args, kwargs=kwargs)
+
+    def enqueue(self, args=(), kwargs=None, queue=None, run_at=None, countdown=None, dedup_key=None):
+        """
+        Queue a run of the task.
+
+        Args:
+            args (list), kwargs (dict): JSON serializable arguments.
+            queue (str): Defaults to the task's queue.
+            run_at (datetime): Earliest time to run it...
+            countdown (float): ...or a delay in seconds.
+            dedup_key (str): Skip if a task with this key is already queued.
+
+        Returns:
+            The Task, or None if a duplicate was queued already. Eager runs
+            return an unsaved Task, its status set once it has run.
+        """
+        if run_at is None:
+            run_at = timezone.now() + timedelta(seconds=countdown or 0)
+        task = Task(
+            name=self.name, args=as_json(list(args)), kwargs=as_json(kwargs or {}),
+            queue=queue or self.queue, run_at=run_at, max_attempts=self.max_attempts, dedup_key=dedup_key,
+        )
+        if settings.TASKS_EAGER:
+            return self.run_eager(task)
+        if dedup_key is None:
+            task.save()
+            return task
+        try:
+            if transaction.get_connection().in_atomic_block:
+                # Keep the caller's transaction usable if the key is taken
+                with transaction.atomic():
+                    task.save()
+            else:
+                task.save()
+        except IntegrityError:
+            return None
+        return task
+
+
+    def run_eager(self, task):
+        """
+        Run ``task`` in the caller once its transaction commits, as a
+        worker would see it, logging rather than raising failures.
+        """
+        connection = transaction.get_connection()
+        if task.dedup_key is not None and any(
+                getattr(entry[1], 'dedup_key', None) == task.dedup_key for entry in connection.run_on_commit):
+            return None
+
+        def run():
+            # Not the request's own queries: a worker would run them
+            with uncounted():
+                try:
+                    self.func(*task.args, **task.kwargs)
+                except Exception:
+                    logger.exception('Task %s failed', task)
+                    task.status, task.last_error = Task.FAILED, traceback.format_exc()
+                else:
+                    task.status = Task.DONE
+        run.dedup_key = task.dedup_key
+        transaction.on_commit(run)
+        return task
+
+
+def as_json(value):
+    # Round trip through JSON so the caller sees what the worker will get
+    # (dates become strings, tuples lists)
+    return json.loads(json.dumps(value, cls=DjangoJSONEncoder))
+
+
+def task(name=None, queue='default', max_attempts=5, backoff=10, every=None, keep=True):
+    """
+    Register a function as a task.
+
+    Args:
+        name (str): Defaults to ``module.function``.
+        queue (str): Queue its runs wait in.
+        max_attempts (int): Runs before giving up (1 disables retries).
+        backoff (float): Seconds before the first retry, doubled each time.
+        every (timedelta): Run it periodically.
+        keep (bool): Keep the finished rows TASKS_KEEP_DONE seconds; False
+            deletes a run as soon as it is done.
+    """
+    def decorator(func):
+        task_function = TaskFunction(func, name or f'{func.__module__}.{func.__name__}',
+                                     queue, max_attempts, backoff, every, keep)
+        TASKS[task_function.name] = task_function
+        return task_function
+    return decorator
+
+
+# -------------------------------
+# Running tasks (see tasks.worker)
+# -------------------------------
+
+def claim(worker, queues, limit):
+    """
+    Mark up to ``limit`` due tasks of ``queues`` as running by ``worker``.
+
+    Each task is claimed with a conditional UPDATE, so concurrent workers
+    never get the same task, on any database backend.
+
+    Returns:
+        list of claimed task ids, oldest first.
+    """
+    now = timezone.now()
+    candidates = Task.objects.filter(status=Task.QUEUED, queue__in=queues, run_at__lte=now) \
+        .order_by('run_at', 'id').values_list('id', flat=True)[:limit * 2]
+    claimed = []
+    for task_id in candidates:
+        if len(claimed) == limit:
+            break
+        if Task.objects.filter(id=task_id, status=Task.QUEUED).update(
+                status=Task.RUNNING, worker=worker, started=now, attempts=F('attempts') + 1):
+            claimed.append(task_id)
+    return claimed
+
+
+def execute(task_id):
+    """
+    Run a claimed task and record the outcome; runs in a pool worker.
+    """
+    try:
+        task = Task.objects.get(id=task_id)
+        function = TASKS.get(task.name)
+        try:
+            if function is None:
+                raise LookupError(f'No task registered as {task.name!r}')
+            function.func(*task.args, **task.kwargs)
+        except Exception:
+            logger.exception('Task %s failed', task)
+            retry(task, function, traceback.format_exc())
+        else:
+            # Unless it was given up as lost (see recover) in the meantime
+            finished = Task.objects.filter(id=task_id, status=Task.RUNNING)
+            if function.keep:
+                finished.update(status=Task.DONE, finished=timezone.now())
+            else:
+                finished.delete()
+    finally:
+        close_old_connections()
+
+
+def retry(task, function, error):
+    """
+    Queue a failed run again after its backoff, or mark the task failed.
+    """
+    now = timezone.now()
+    if task.attempts >= task.max_attempts:
+        Task.objects.filter(id=task.id).update(status=Task.FAILED, finished=now, last_error=error)
+        return
+    base = function.backoff if function is not None else 10
+    delay = min(base * 2 ** (task.attempts - 1), settings.TASKS_MAX_BACKOFF) * random.uniform(0.5, 1)
+    try:
+        with transaction.atomic():
+            Task.objects.filter(id=task.id).update(
+                status=Task.QUEUED, run_at=now + timedelta(seconds=delay), last_error=error,
+            )
+    except IntegrityError:
+        # A newer run with the same dedup key is queued and will do the work
+        Task.objects.filter(id=task.id).update(status=Task.FAILED, finished=now,
+                                               last_error=error + '\nSuperseded by a queued duplicate')
+
+
+def recover(timeout=None):
+    """
+    Retry the tasks whose worker died: running for longer than ``timeout``
+    (settings.TASKS_TIMEOUT) seconds.
+
+    Returns:
+        Number of tasks recovered.
+    """
+    cutoff = timezone.now() - timedelta(seconds=timeout or settings.TASKS_TIMEOUT)
+    lost = list(Task.objects.filter(status=Task.RUNNING, started__lt=cutoff))
+    for task in lost:
+        retry(task, TASKS.get(task.name), f'Still running after {settings.TASKS_TIMEOUT}s, worker lost')
+    return len(lost)
+
+
+def schedule_periodic():
+    """
+    Queue the periodic (``every=``) tasks that are due.
+
+    Returns:
+        Number of tasks queued.
+    """
+    now = timezone.now()
+    queued = 0
+    for function in TASKS.values():
+        if function.every is None:
+            continue
+        Schedule.objects.get_or_create(name=function.name, defaults={'next_run': now})
+        # Whoever moves next_run forward queues the run
+        if Schedule.objects.filter(name=function.name, next_run__lte=now).update(next_run=now + function.every):
+            function.enqueue(dedup_key=f'periodic:{function.name}')
+            queued += 1
+    return queued
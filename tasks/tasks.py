@@ -0,0 +1,36 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.utils import timezone
+
+from .mail import deserialize
+from .models import QueuedEmail, Task
+from .queue import task
+
+
+@task(queue='mail', max_attempts=8, backoff=30, keep=False)
+def send_email(email_id):
+    """
+    Send a message queued by QueuedEmailBackend, then forget it.
+
+    A message already sent (a task run again from the admin) or expired
+    is not sent.
+    """
+    email = QueuedEmail.objects.filter(id=email_id).first()
+    if email is None:
+        return
+    get_connection(settings.TASKS_EMAIL_BACKEND, fail_silently=False).send_messages([deserialize(email.message)])
+    email.delete()
+
+
+@task(every=timedelta(hours=1), max_attempts=1)
+def purge_tasks():
+    """
+    Delete finished tasks older than TASKS_KEEP_DONE / TASKS_KEEP_FAILED
+    seconds, and the emails that could not be sent in TASKS_KEEP_DONE.
+    """
+    now = timezone.now()
+    QueuedEmail.objects.filter(created__lt=now - timedelta(seconds=settings.TASKS_KEEP_DONE)).delete()
+    Task.objects.filter(status=Task.DONE, finished__lt=now - timedelta(seconds=settings.TASKS_KEEP_DONE)).delete()
+    Task.objects.filter(status=Task.FAILED, finished__lt=now - timedelta(seconds=settings.TASKS_KEEP_FAILED)).delete()
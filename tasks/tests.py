@@ -0,0 +1,181 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from . import queue
+from .models import Task
+from .queue import claim, execute, recover, task
+
+calls = []
+
+
+@task(name='tasks.tests.record', backoff=60, max_attempts=2)
+def record(value):
+    calls.append(value)
+
+
+@task(name='tasks.tests.fail', backoff=60, max_attempts=2)
+def fail():
+    raise ValueError('broken')
+
+
+@task(name='tasks.tests.discard', keep=False)
+def discard():
+    pass
+
+
+@override_settings(TASKS_EAGER=False)
+class TaskQueueTestCase(TestCase):
+
+    def setUp(self):
+        calls.clear()
+        # Workers close their connection after a task; not the test's
+        patcher = mock.patch.object(queue, 'close_old_connections')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_task(self, function, *args):
+        queued = function.delay(*args)
+        self.assertEqual(claim('worker', ['default'], 1), [queued.id])
+        execute(queued.id)
+        return Task.objects.filter(id=queued.id).first()
+
+
+class ClaimTests(TaskQueueTestCase):
+
+    def test_claims_due_tasks_oldest_first(self):
+        now = timezone.now()
+        later = record.enqueue(args=[1], run_at=now - timedelta(minutes=1))
+        oldest = record.enqueue(args=[2], run_at=now - timedelta(minutes=5))
+        record.enqueue(args=[3], countdown=3600)
+        record.enqueue(args=[4], queue='other')
+
+        self.assertEqual(claim('worker-1', ['default'], 1), [oldest.id])
+        self.assertEqual(claim('worker-2', ['default'], 5), [later.id])
+        self.assertEqual(claim('worker-3', ['default'], 5), [])
+
+        oldest.refresh_from_db()
+        self.assertEqual((oldest.status, oldest.worker, oldest.attempts), (Task.RUNNING, 'worker-1', 1))
+
+    def test_task_claimed_meanwhile_is_skipped(self):
+        first, second = record.delay(1), record.delay(2)
+        Task.objects.filter(id=first.id).update(status=Task.RUNNING)
+        self.assertEqual(claim('worker', ['default'], 2), [second.id])
+
+
+class ExecuteTests(TaskQueueTestCase):
+
+    def test_success(self):
+        done = self.run_task(record, 'value')
+        self.assertEqual(calls, ['value'])
+        self.assertEqual(done.status, Task.DONE)
+        self.assertIsNotNone(done.finished)
+
+    def test_runs_not_kept_are_deleted(self):
+        self.assertIsNone(self.run_task(discard))
+
+    def test_failure_is_retried_after_backoff(self):
+        before = timezone.now()
+        with self.assertLogs('tasks.queue', 'ERROR'):
+            failed = self.run_task(fail)
+        self.assertEqual(failed.status, Task.QUEUED)
+        self.assertIn('ValueError: broken', failed.last_error)
+        # backoff * 2 ** (attempts - 1), with up to 50% jitter
+        self.assertGreaterEqual(failed.run_at, before + timedelta(seconds=30))
+        self.assertLessEqual(failed.run_at, timezone.now() + timedelta(seconds=60))
+        self.assertEqual(claim('worker', ['default'], 1), [])
+
+    def test_gives_up_after_max_attempts(self):
+        with self.assertLogs('tasks.queue', 'ERROR'):
+            failed = self.run_task(fail)
+            Task.objects.filter(id=failed.id).update(run_at=timezone.now())
+            self.assertEqual(claim('worker', ['default'], 1), [failed.id])
+            execute(failed.id)
+        failed.refresh_from_db()
+        self.assertEqual((failed.status, failed.attempts), (Task.FAILED, 2))
+
+    def test_unknown_task_fails(self):
+        unknown = Task.objects.create(name='tasks.tests.missing', run_at=timezone.now(), max_attempts=1)
+        claim('worker', ['default'], 1)
+        with self.assertLogs('tasks.queue', 'ERROR'):
+            execute(unknown.id)
+        unknown.refresh_from_db()
+        self.assertEqual(unknown.status, Task.FAILED)
+        self.assertIn("No task registered as 'tasks.tests.missing'", unknown.last_error)
+
+    def test_failed_run_superseded_by_a_queued_duplicate(self):
+        running = fail.enqueue(dedup_key='fail')
+        claim('worker', ['default'], 1)
+        # A running task doesn't block a new one with its key
+        self.assertIsNotNone(fail.enqueue(dedup_key='fail'))
+        with self.assertLogs('tasks.queue', 'ERROR'):
+            execute(running.id)
+        running.refresh_from_db()
+        self.assertEqual(running.status, Task.FAILED)
+        self.assertIn('Superseded by a queued duplicate', running.last_error)
+
+    def test_lost_tasks_are_recovered(self):
+        lost = record.delay(1)
+        claim('worker', ['default'], 1)
+        Task.objects.filter(id=lost.id).update(started=timezone.now() - timedelta(hours=1))
+        self.assertEqual(recover(timeout=60), 1)
+        lost.refresh_from_db()
+        self.assertEqual(lost.status, Task.QUEUED)
+        self.assertIn('worker lost', lost.last_error)
+
+
+class DedupTests(TaskQueueTestCase):
+
+    def test_one_queued_task_per_key(self):
+        first = record.enqueue(args=[1], dedup_key='record')
+        self.assertIsNone(record.enqueue(args=[2], dedup_key='record'))
+        self.assertIsNotNone(record.enqueue(args=[3], dedup_key='other'))
+        self.assertEqual(list(Task.objects.filter(dedup_key='record')), [first])
+
+    def test_duplicate_keeps_the_callers_transaction_usable(self):
+        with transaction.atomic():
+            record.enqueue(dedup_key='record')
+            self.assertIsNone(record.enqueue(dedup_key='record'))
+            record.delay(2)
+        self.assertEqual(Task.objects.count(), 2)
+
+
+@override_settings(TASKS_EAGER=True)
+class EagerTests(TaskQueueTestCase):
+
+    def test_runs_once_the_transaction_commits(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            eager = record.enqueue(args=['now'])
+            self.assertEqual(calls, [])
+            self.assertEqual(eager.status, Task.QUEUED)
+        self.assertEqual(calls, ['now'])
+        self.assertEqual(eager.status, Task.DONE)
+        self.assertFalse(Task.objects.exists())
+
+    def test_not_run_on_rollback(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ValueError), transaction.atomic():
+                record.delay('rolled back')
+                raise ValueError
+        self.assertEqual(calls, [])
+
+    def test_once_per_dedup_key(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertIsNotNone(record.enqueue(args=[1], dedup_key='record'))
+            self.assertIsNone(record.enqueue(args=[2], dedup_key='record'))
+            record.enqueue(args=[3], dedup_key='other')
+            record.delay(4)
+            record.delay(5)
+        self.assertEqual(calls, [1, 3, 4, 5])
+
+    def test_failures_are_logged(self):
+        with self.assertLogs('tasks.queue', 'ERROR') as logs, self.captureOnCommitCallbacks(execute=True):
+            failed = fail.delay()
+            record.delay('after')
+        self.assertIn('Task', logs.output[0])
+        self.assertEqual(failed.status, Task.FAILED)
+        self.assertIn('ValueError: broken', failed.last_error)
+        self.assertEqual(calls, ['after'])
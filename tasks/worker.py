@@ -0,0 +1,105 @@
+"""
+The task worker: polls the database for due tasks and runs them in a pool.
+
+One worker process claims tasks (see tasks.queue.claim) as long as its
+pool has free slots, so a task is only marked running once a thread or
+process is ready for it. Every TASKS_MAINTENANCE_INTERVAL seconds it also
+queues due periodic tasks and retries the tasks of dead workers.
+
+Threads suit I/O bound tasks (downloads, emails, Redis); ``processes``
+uses separate interpreters (spawned, each setting Django up) for CPU bound
+work such as rendering image derivatives.
+
+SIGTERM/SIGINT stop claiming; the tasks already running are finished.
+"""
+
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import django
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import queue
+
+logger = logging.getLogger(__name__)
+
+
+class Worker:
+    """
+    Args:
+        queues (list): Queue names to take tasks from.
+        concurrency (int): Tasks run at the same time.
+        processes (bool): Use a process pool instead of threads.
+        poll_interval (float): Seconds between polls when idle.
+    """
+
+    def __init__(self, queues=('default',), concurrency=4, processes=False, poll_interval=1.0):
+        self.queues = list(queues)
+        self.concurrency = concurrency
+        self.processes = processes
+        self.poll_interval = poll_interval
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = threading.Event()
+
+    def stop(self, *args):
+        self.stopping.set()
+
+    def make_pool(self):
+        if self.processes:
+            return ProcessPoolExecutor(self.concurrency, mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=django.setup)
+        return ThreadPoolExecutor(self.concurrency, thread_name_prefix='task')
+
+    def maintenance(self):
+        recovered = queue.recover()
+        if recovered:
+            logger.warning('%s tasks of lost workers queued again', recovered)
+        queue.schedule_periodic()
+
+    def run(self, burst=False):
+        """
+        Run tasks until stopped; with ``burst``, until no task is due.
+
+        Returns:
+            Number of tasks run.
+        """
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self.stop)
+            signal.signal(signal.SIGINT, self.stop)
+        logger.info('Worker %s running queues %s', self.name, ', '.join(self.queues))
+        running = set()
+        done = 0
+        next_maintenance = 0
+        with self.make_pool() as pool:
+            while not self.stopping.is_set():
+                if time.monotonic() >= next_maintenance:
+                    self.maintenance()
+                    next_maintenance = time.monotonic() + settings.TASKS_MAINTENANCE_INTERVAL
+                claimed = queue.claim(self.name, self.queues, self.concurrency - len(running)) \
+                    if len(running) < self.concurrency else []
+                close_old_connections()
+                running.update(pool.submit(queue.execute, task_id) for task_id in claimed)
+                if not running:
+                    if burst:
+                        break
+                    self.stopping.wait(self.poll_interval)
+                    continue
+                if claimed and len(running) < self.concurrency:
+                    # More may be due right away
+                    continue
+                finished, running = wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                running = set(running)
+                for future in finished:
+                    # execute() records task errors; this is the pool itself failing
+                    if future.exception() is not None:
+                        logger.error('Task execution failed', exc_info=future.exception())
+                done += len(finished)
+            # Leaving the with block waits for the running tasks
+        return done + len(running)